@@ -1,20 +1,64 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
-import sqlite3
+from flask import (Flask, Response, render_template, request, redirect, url_for, flash, jsonify, session,
+                   stream_with_context)
+import io
 import os
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 
+import db_pool
+from db_pool import get_db
+from money import format_money, to_cents
+from pagination import DEFAULT_PAGE_SIZE
+from autocomplete import SOURCES as AUTOCOMPLETE_SOURCES, complete
+import cart_store
+import exports
+import idempotency
+import importers
+import queries
+import repository
+import search as fts
+from repository import OutOfStock, get_repository, run_write
+
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-here')
 
 # Поддержка Docker - используем переменную окружения для пути к БД
 DATABASE = os.environ.get('DATABASE_PATH', 'music_store.db')
+app.config['DATABASE'] = DATABASE
+
+# Пул соединений: одно соединение на контекст приложения, возврат в пул при teardown
+db_pool.init_app(app)
+
+# Размер страницы списков (постраничный вывод по ключу)
+app.config.setdefault('PAGE_SIZE', int(os.environ.get('PAGE_SIZE', DEFAULT_PAGE_SIZE)))
+
+# Процессов разбора загружаемых прайс-листов (0 - по числу ядер)
+app.config.setdefault('IMPORT_WORKERS', int(os.environ.get('IMPORT_WORKERS', 0)))
+
+# Каталог архива покупок по годам (None - archive рядом с файлом базы)
+app.config.setdefault('ARCHIVE_DIR', os.environ.get('ARCHIVE_DIR'))
+
+# Хранилище данных маршрутов: sqlite или memory (для замеров)
+repository.init_app(app)
+
+# Хранилище корзин: main (таблица рабочей базы), sqlite (отдельный файл) или memory
+cart_store.init_app(app)
+
+# Повтор покупки или оформления с тем же ключом возвращает сохраненный результат
+idempotency.init_app(app)
+
+# Суммы в копейках в шаблонах: {{ record.retail_price_cents|money }}
+app.add_template_filter(format_money, 'money')
+
+def list_page(page, *args):
+    """Страница списка хранилища по параметрам sort и after текущего запроса"""
+    return page(*args, sort=request.args.get('sort'), cursor=request.args.get('after'),
+                limit=app.config['PAGE_SIZE'])
 
 def get_db_connection():
-    """Получение соединения с базой данных"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Получение отдельного настроенного соединения с базой данных (вне запроса)"""
+    return db_pool.connect(app.config['DATABASE'], app.config['DB_PRAGMAS'],
+                           app.config['DB_STATEMENT_CACHE_SIZE'])
 
 def login_required(f):
     """Декоратор для проверки авторизации"""
@@ -34,11 +78,9 @@ def role_required(required_roles):
                 flash('Необходимо войти в систему', 'error')
                 return redirect(url_for('login'))
             
-            conn = get_db_connection()
-            user = conn.execute('SELECT role FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-            conn.close()
+            role = get_repository().users.role(session['user_id'])
             
-            if not user or user['role'] not in required_roles:
+            if role not in required_roles:
                 flash('Недостаточно прав доступа', 'error')
                 return redirect(url_for('index'))
             
@@ -50,22 +92,16 @@ def role_required(required_roles):
 @app.route('/')
 def index():
     """Главная страница"""
-    conn = get_db_connection()
+    repo = get_repository()
     
     # Получаем статистику
-    stats = {
-        'total_ensembles': conn.execute('SELECT COUNT(*) FROM ensembles').fetchone()[0],
-        'total_compositions': conn.execute('SELECT COUNT(*) FROM compositions').fetchone()[0],
-        'total_records': conn.execute('SELECT COUNT(*) FROM records').fetchone()[0],
-        'total_musicians': conn.execute('SELECT COUNT(*) FROM musicians').fetchone()[0]
-    }
+    stats = repo.stats()
     
     # Получаем информацию о текущем пользователе
     current_user = None
     if 'user_id' in session:
-        current_user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
+        current_user = repo.users.get(session['user_id'])
     
-    conn.close()
     return render_template('index.html', stats=stats, current_user=current_user)
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -75,9 +111,7 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
-        conn = get_db_connection()
-        user = conn.execute('SELECT * FROM users WHERE username = ? AND is_active = 1', (username,)).fetchone()
-        conn.close()
+        user = get_repository().users.active_by_username(username)
         
         if user and check_password_hash(user['password_hash'], password):
             session['user_id'] = user['id']
@@ -107,101 +141,73 @@ def register():
         email = request.form.get('email')
         phone = request.form.get('phone')
         
-        conn = get_db_connection()
-        
-        # Проверяем, существует ли пользователь
-        existing_user = conn.execute('SELECT id FROM users WHERE username = ?', (username,)).fetchone()
+        # Хэш пароля считается до транзакции: запись не ждет его вычисления
+        password_hash = generate_password_hash(password)
         
-        if existing_user:
+        if not run_write(lambda repo: add_user_account(repo, username, password_hash, 'buyer',
+                                                       full_name, email, phone)):
             flash('Пользователь с таким именем уже существует', 'error')
-            conn.close()
             return render_template('register.html')
         
-        # Создаем нового пользователя
-        password_hash = generate_password_hash(password)
-        conn.execute('''
-            INSERT INTO users (username, password_hash, role, full_name, email, phone)
-            VALUES (?, ?, 'buyer', ?, ?, ?)
-        ''', (username, password_hash, full_name, email, phone))
-        
-        conn.commit()
-        conn.close()
-        
         flash('Регистрация прошла успешно! Теперь вы можете войти в систему.', 'success')
         return redirect(url_for('login'))
     
     return render_template('register.html')
 
+def add_user_account(repo, username, password_hash, role, full_name, email, phone):
+    """Создание пользователя в транзакции записи; False, если имя уже занято"""
+    if repo.users.exists(username):
+        return False
+    repo.users.add(username, password_hash, role, full_name, email, phone)
+    return True
+
 @app.route('/compositions_count')
 @login_required
 def compositions_count():
     """Функционал 1: Количество музыкальных произведений заданного ансамбля"""
-    conn = get_db_connection()
-    
-    # Получаем список всех ансамблей
-    ensembles = conn.execute('SELECT * FROM ensembles ORDER BY name').fetchall()
+    repo = get_repository()
     
+    # Ансамбль выбирается через автодополнение (/autocomplete/ensembles)
     ensemble_id = request.args.get('ensemble_id')
     compositions = []
     selected_ensemble = None
+    page = None
     
     if ensemble_id:
         # Получаем информацию об ансамбле
-        selected_ensemble = conn.execute(
-            'SELECT * FROM ensembles WHERE id = ?', (ensemble_id,)
-        ).fetchone()
+        selected_ensemble = repo.ensembles.get(ensemble_id)
         
         # Получаем количество произведений ансамбля
-        compositions = conn.execute('''
-            SELECT DISTINCT c.title, c.genre, c.year_composed, m.name as composer_name
-            FROM compositions c
-            JOIN performances p ON c.id = p.composition_id
-            JOIN ensemble_members em ON p.ensemble_id = em.ensemble_id
-            LEFT JOIN musicians m ON c.composer_id = m.id
-            WHERE p.ensemble_id = ?
-            ORDER BY c.title
-        ''', (ensemble_id,)).fetchall()
-    
-    conn.close()
+        compositions = repo.ensembles.compositions(ensemble_id)
+    else:
+        # Сводка по всем ансамблям одним запросом (из кэша), постранично
+        page = list_page(repo.ensembles.composition_counts_page)
+    
     return render_template('compositions_count.html', 
-                         ensembles=ensembles, 
                          compositions=compositions,
-                         selected_ensemble=selected_ensemble)
+                         selected_ensemble=selected_ensemble,
+                         counts=page.rows if page else [],
+                         page=page)
 
 @app.route('/ensemble_records')
 @login_required
 def ensemble_records():
     """Функционал 2: Названия всех компакт-дисков заданного ансамбля"""
-    conn = get_db_connection()
-    
-    # Получаем список всех ансамблей
-    ensembles = conn.execute('SELECT * FROM ensembles ORDER BY name').fetchall()
+    repo = get_repository()
     
+    # Ансамбль выбирается через автодополнение (/autocomplete/ensembles)
     ensemble_id = request.args.get('ensemble_id')
     records = []
     selected_ensemble = None
     
     if ensemble_id:
         # Получаем информацию об ансамбле
-        selected_ensemble = conn.execute(
-            'SELECT * FROM ensembles WHERE id = ?', (ensemble_id,)
-        ).fetchone()
+        selected_ensemble = repo.ensembles.get(ensemble_id)
         
         # Получаем все пластинки ансамбля
-        records = conn.execute('''
-            SELECT DISTINCT r.catalog_number, r.title, r.release_date, 
-                   r.retail_price, comp.name as company_name
-            FROM records r
-            JOIN record_tracks rt ON r.id = rt.record_id
-            JOIN performances p ON rt.performance_id = p.id
-            JOIN companies comp ON r.company_id = comp.id
-            WHERE p.ensemble_id = ?
-            ORDER BY r.title
-        ''', (ensemble_id,)).fetchall()
-    
-    conn.close()
+        records = repo.ensembles.discography(ensemble_id)
+    
     return render_template('ensemble_records.html', 
-                         ensembles=ensembles, 
                          records=records,
                          selected_ensemble=selected_ensemble)
 
@@ -209,222 +215,185 @@ def ensemble_records():
 @login_required
 def sales_leaders():
     """Функционал 3: Лидеры продаж текущего года"""
-    conn = get_db_connection()
-    
     # Получаем текущий год
     current_year = datetime.now().year
     
     # Получаем лидеров продаж текущего года
-    leaders = conn.execute('''
-        SELECT r.catalog_number, r.title, r.sold_this_year, 
-               comp.name as company_name, r.retail_price
-        FROM records r
-        JOIN companies comp ON r.company_id = comp.id
-        WHERE r.sold_this_year > 0
-        ORDER BY r.sold_this_year DESC
-        LIMIT 10
-    ''').fetchall()
-    
-    conn.close()
+    leaders = get_repository().records.sales_leaders()
+    
     return render_template('sales_leaders.html', leaders=leaders, current_year=current_year)
 
+@app.route('/export/<name>')
+@role_required(['director'])
+def export(name):
+    """Потоковая выгрузка покупок, остатков или сводки продаж в CSV/JSONL"""
+    fmt = request.args.get('format', 'csv')
+    if name not in exports.EXPORTS or fmt not in exports.FORMATS:
+        return jsonify({'error': 'Неизвестная выгрузка или формат'}), 404
+    try:
+        filters = exports.parse_filters(request.args)
+    except ValueError as e:
+        flash(f'Ошибка в параметрах выгрузки: {str(e)}', 'error')
+        return redirect(url_for('sales_leaders'))
+    
+    # Контекст запроса (и соединение из пула) живет, пока генератор отдает строки
+    chunks = exports.stream(get_db(), name, fmt, filters, app.config['ARCHIVE_DIR'])
+    filename = f"{name}_{datetime.now().strftime('%Y%m%d')}.{fmt}"
+    return Response(stream_with_context(chunks), mimetype=exports.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
 @app.route('/manage_records')
 @role_required(['seller', 'director'])
 def manage_records():
     """Функционал 4: Управление данными о компакт-дисках"""
-    conn = get_db_connection()
+    # Страница пластинок с информацией о компаниях;
+    # компания в форме выбирается через автодополнение (/autocomplete/companies)
+    page = list_page(get_repository().records.page)
     
-    # Получаем все пластинки с информацией о компаниях
-    records = conn.execute('''
-        SELECT r.*, comp.name as company_name
-        FROM records r
-        JOIN companies comp ON r.company_id = comp.id
-        ORDER BY r.title
-    ''').fetchall()
-    
-    # Получаем список компаний для формы
-    companies = conn.execute('SELECT * FROM companies ORDER BY name').fetchall()
-    
-    conn.close()
-    return render_template('manage_records.html', records=records, companies=companies)
+    return render_template('manage_records.html', records=page.rows, page=page,
+                           sort_orders=queries.RECORDS_WITH_COMPANY.orders.values())
 
 @app.route('/add_record', methods=['POST'])
 def add_record():
     """Добавление новой пластинки"""
-    conn = get_db_connection()
-    
     try:
-        conn.execute('''
-            INSERT INTO records (catalog_number, title, company_id, release_date, 
-                               wholesale_price, retail_price, current_stock, 
-                               sold_last_year, sold_this_year)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            request.form['catalog_number'],
-            request.form['title'],
-            request.form['company_id'],
-            request.form['release_date'],
-            float(request.form['wholesale_price']),
-            float(request.form['retail_price']),
-            int(request.form['current_stock']),
-            int(request.form['sold_last_year']),
-            int(request.form['sold_this_year'])
-        ))
-        conn.commit()
+        values = record_form()
+        run_write(lambda repo: repo.records.add(*values))
         flash('Пластинка успешно добавлена!', 'success')
     except Exception as e:
         flash(f'Ошибка при добавлении пластинки: {str(e)}', 'error')
-    finally:
-        conn.close()
     
     return redirect(url_for('manage_records'))
 
+def record_form():
+    """Поля пластинки из формы в порядке параметров хранилища (цены - в копейках)"""
+    return (
+        request.form['catalog_number'],
+        request.form['title'],
+        request.form['company_id'],
+        request.form['release_date'],
+        to_cents(request.form['wholesale_price']),
+        to_cents(request.form['retail_price']),
+        int(request.form['current_stock'])
+    )
+
 @app.route('/edit_record/<int:record_id>')
 def edit_record(record_id):
     """Страница редактирования пластинки"""
-    conn = get_db_connection()
+    repo = get_repository()
     
-    record = conn.execute('SELECT * FROM records WHERE id = ?', (record_id,)).fetchone()
-    companies = conn.execute('SELECT * FROM companies ORDER BY name').fetchall()
+    record = repo.records.get(record_id)
+    company_name = repo.records.company_name(record['company_id']) if record else None
     
-    conn.close()
-    return render_template('edit_record.html', record=record, companies=companies)
+    return render_template('edit_record.html', record=record, company_name=company_name)
 
 @app.route('/update_record/<int:record_id>', methods=['POST'])
 def update_record(record_id):
     """Обновление данных пластинки"""
-    conn = get_db_connection()
-    
     try:
-        conn.execute('''
-            UPDATE records 
-            SET catalog_number = ?, title = ?, company_id = ?, release_date = ?,
-                wholesale_price = ?, retail_price = ?, current_stock = ?,
-                sold_last_year = ?, sold_this_year = ?
-            WHERE id = ?
-        ''', (
-            request.form['catalog_number'],
-            request.form['title'],
-            request.form['company_id'],
-            request.form['release_date'],
-            float(request.form['wholesale_price']),
-            float(request.form['retail_price']),
-            int(request.form['current_stock']),
-            int(request.form['sold_last_year']),
-            int(request.form['sold_this_year']),
-            record_id
-        ))
-        conn.commit()
+        values = record_form()
+        run_write(lambda repo: repo.records.update(record_id, *values))
         flash('Пластинка успешно обновлена!', 'success')
     except Exception as e:
         flash(f'Ошибка при обновлении пластинки: {str(e)}', 'error')
-    finally:
-        conn.close()
     
     return redirect(url_for('manage_records'))
 
 @app.route('/delete_record/<int:record_id>')
 def delete_record(record_id):
     """Удаление пластинки"""
-    conn = get_db_connection()
-    
     try:
-        conn.execute('DELETE FROM records WHERE id = ?', (record_id,))
-        conn.commit()
+        run_write(lambda repo: repo.records.delete(record_id))
         flash('Пластинка успешно удалена!', 'success')
     except Exception as e:
         flash(f'Ошибка при удалении пластинки: {str(e)}', 'error')
-    finally:
-        conn.close()
     
     return redirect(url_for('manage_records'))
 
+@app.route('/import_records', methods=['POST'])
+@role_required(['director'])
+def import_records():
+    """Синхронизация пластинок с прайс-листом компании (CSV или JSONL)"""
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Выберите файл прайс-листа', 'error')
+        return redirect(url_for('manage_records'))
+    
+    try:
+        fmt = importers.format_for(upload.filename)
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        # Каждый пакет - отдельная короткая транзакция: покупки не ждут весь импорт
+        summary = importers.import_records(stream, fmt, db_pool.write_transaction,
+                                           queries.COMPANY_NAMES.all(get_db()),
+                                           workers=app.config['IMPORT_WORKERS'] or None)
+    except (ValueError, UnicodeDecodeError) as e:
+        flash(f'Ошибка импорта: {str(e)}', 'error')
+        return redirect(url_for('manage_records'))
+    
+    flash(f"Импорт завершен: добавлено {summary['inserted']}, обновлено {summary['updated']}, "
+          f"без изменений {summary['unchanged']}", 'success')
+    if summary['rejected']:
+        details = '; '.join(f'строка {line_no}: {message}' for line_no, message in summary['errors'][:5])
+        flash(f"Отклонено строк: {summary['rejected']} ({details})", 'error')
+    return redirect(url_for('manage_records'))
+
 @app.route('/manage_ensembles')
 @role_required(['director'])
 def manage_ensembles():
     """Функционал 5: Управление данными об ансамблях"""
-    conn = get_db_connection()
+    page = list_page(get_repository().ensembles.page)
     
-    ensembles = conn.execute('SELECT * FROM ensembles ORDER BY name').fetchall()
-    
-    conn.close()
-    return render_template('manage_ensembles.html', ensembles=ensembles)
+    return render_template('manage_ensembles.html', ensembles=page.rows, page=page)
 
 @app.route('/add_ensemble', methods=['POST'])
 def add_ensemble():
     """Добавление нового ансамбля"""
-    conn = get_db_connection()
-    
     try:
-        conn.execute('''
-            INSERT INTO ensembles (name, type, founded_year, country, description)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            request.form['name'],
-            request.form['type'],
-            request.form['founded_year'] if request.form['founded_year'] else None,
-            request.form['country'],
-            request.form['description']
-        ))
-        conn.commit()
+        values = ensemble_form()
+        run_write(lambda repo: repo.ensembles.add(*values))
         flash('Ансамбль успешно добавлен!', 'success')
     except Exception as e:
         flash(f'Ошибка при добавлении ансамбля: {str(e)}', 'error')
-    finally:
-        conn.close()
     
     return redirect(url_for('manage_ensembles'))
 
+def ensemble_form():
+    """Поля ансамбля из формы в порядке параметров хранилища"""
+    return (
+        request.form['name'],
+        request.form['type'],
+        request.form['founded_year'] if request.form['founded_year'] else None,
+        request.form['country'],
+        request.form['description']
+    )
+
 @app.route('/edit_ensemble/<int:ensemble_id>')
 def edit_ensemble(ensemble_id):
     """Страница редактирования ансамбля"""
-    conn = get_db_connection()
+    ensemble = get_repository().ensembles.get(ensemble_id)
     
-    ensemble = conn.execute('SELECT * FROM ensembles WHERE id = ?', (ensemble_id,)).fetchone()
-    
-    conn.close()
     return render_template('edit_ensemble.html', ensemble=ensemble)
 
 @app.route('/update_ensemble/<int:ensemble_id>', methods=['POST'])
 def update_ensemble(ensemble_id):
     """Обновление данных ансамбля"""
-    conn = get_db_connection()
-    
     try:
-        conn.execute('''
-            UPDATE ensembles 
-            SET name = ?, type = ?, founded_year = ?, country = ?, description = ?
-            WHERE id = ?
-        ''', (
-            request.form['name'],
-            request.form['type'],
-            request.form['founded_year'] if request.form['founded_year'] else None,
-            request.form['country'],
-            request.form['description'],
-            ensemble_id
-        ))
-        conn.commit()
+        values = ensemble_form()
+        run_write(lambda repo: repo.ensembles.update(ensemble_id, *values))
         flash('Ансамбль успешно обновлен!', 'success')
     except Exception as e:
         flash(f'Ошибка при обновлении ансамбля: {str(e)}', 'error')
-    finally:
-        conn.close()
     
     return redirect(url_for('manage_ensembles'))
 
 @app.route('/delete_ensemble/<int:ensemble_id>')
 def delete_ensemble(ensemble_id):
     """Удаление ансамбля"""
-    conn = get_db_connection()
-    
     try:
-        conn.execute('DELETE FROM ensembles WHERE id = ?', (ensemble_id,))
-        conn.commit()
+        run_write(lambda repo: repo.ensembles.delete(ensemble_id))
         flash('Ансамбль успешно удален!', 'success')
     except Exception as e:
         flash(f'Ошибка при удалении ансамбля: {str(e)}', 'error')
-    finally:
-        conn.close()
     
     return redirect(url_for('manage_ensembles'))
 
@@ -432,19 +401,14 @@ def delete_ensemble(ensemble_id):
 @role_required(['director'])
 def manage_users():
     """Управление пользователями (только для директора)"""
-    conn = get_db_connection()
-    
-    users = conn.execute('SELECT * FROM users ORDER BY created_at DESC').fetchall()
+    page = list_page(get_repository().users.page)
     
-    conn.close()
-    return render_template('manage_users.html', users=users)
+    return render_template('manage_users.html', users=page.rows, page=page)
 
 @app.route('/add_user', methods=['POST'])
 @role_required(['director'])
 def add_user():
     """Добавление нового пользователя"""
-    conn = get_db_connection()
-    
     try:
         username = request.form['username']
         password = request.form['password']
@@ -453,27 +417,15 @@ def add_user():
         email = request.form.get('email')
         phone = request.form.get('phone')
         
-        # Проверяем, существует ли пользователь
-        existing_user = conn.execute('SELECT id FROM users WHERE username = ?', (username,)).fetchone()
-        
-        if existing_user:
+        password_hash = generate_password_hash(password)
+        if not run_write(lambda repo: add_user_account(repo, username, password_hash, role,
+                                                       full_name, email, phone)):
             flash('Пользователь с таким именем уже существует', 'error')
-            conn.close()
             return redirect(url_for('manage_users'))
         
-        # Создаем нового пользователя
-        password_hash = generate_password_hash(password)
-        conn.execute('''
-            INSERT INTO users (username, password_hash, role, full_name, email, phone)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (username, password_hash, role, full_name, email, phone))
-        
-        conn.commit()
         flash('Пользователь успешно добавлен!', 'success')
     except Exception as e:
         flash(f'Ошибка при добавлении пользователя: {str(e)}', 'error')
-    finally:
-        conn.close()
     
     return redirect(url_for('manage_users'))
 
@@ -481,23 +433,15 @@ def add_user():
 @role_required(['director'])
 def toggle_user_status(user_id):
     """Активация/деактивация пользователя"""
-    conn = get_db_connection()
-    
     try:
-        user = conn.execute('SELECT is_active FROM users WHERE id = ?', (user_id,)).fetchone()
-        if user:
-            new_status = not user['is_active']
-            conn.execute('UPDATE users SET is_active = ? WHERE id = ?', (new_status, user_id))
-            conn.commit()
-            
+        new_status = run_write(lambda repo: repo.users.toggle_active(user_id))
+        if new_status is not None:
             status_text = 'активирован' if new_status else 'деактивирован'
             flash(f'Пользователь {status_text}!', 'success')
         else:
             flash('Пользователь не найден', 'error')
     except Exception as e:
         flash(f'Ошибка при изменении статуса пользователя: {str(e)}', 'error')
-    finally:
-        conn.close()
     
     return redirect(url_for('manage_users'))
 
@@ -505,190 +449,164 @@ def toggle_user_status(user_id):
 @login_required
 def catalog():
     """Каталог товаров для покупателей"""
-    conn = get_db_connection()
+    # Страница пластинок в наличии с информацией о компаниях
+    page = list_page(get_repository().records.catalog_page)
     
-    # Получаем все пластинки с информацией о компаниях
-    records = conn.execute('''
-        SELECT r.*, comp.name as company_name
-        FROM records r
-        JOIN companies comp ON r.company_id = comp.id
-        WHERE r.current_stock > 0
-        ORDER BY r.title
-    ''').fetchall()
+    return render_template('catalog.html', records=page.rows, page=page,
+                           sort_orders=queries.CATALOG.orders.values())
+
+@app.route('/search')
+@login_required
+def search():
+    """Полнотекстовый поиск по пластинкам, произведениям, музыкантам, ансамблям и компаниям"""
+    query = request.args.get('q', '').strip()
+    page = fts.search(get_db(), query, cursor=request.args.get('after'))
     
-    conn.close()
-    return render_template('catalog.html', records=records)
+    return render_template('search.html', query=query, results=page.rows, page=page,
+                           kind_labels=fts.KIND_LABELS)
+
+@app.route('/autocomplete/<source>')
+@login_required
+def autocomplete(source):
+    """Варианты автодополнения ансамблей или компаний по началу слова (JSON)"""
+    if source not in AUTOCOMPLETE_SOURCES:
+        return jsonify({'error': 'Неизвестный источник'}), 404
+    return jsonify(complete(get_db(), source, request.args.get('q', ''), app.config['DATABASE']))
 
 @app.route('/buy_record/<int:record_id>', methods=['POST'])
 @role_required(['buyer'])
 def buy_record(record_id):
     """Покупка пластинки"""
-    conn = get_db_connection()
+    user_id = session['user_id']
     
     try:
         quantity = int(request.form['quantity'])
-        
-        # Получаем информацию о пластинке
-        record = conn.execute('SELECT * FROM records WHERE id = ?', (record_id,)).fetchone()
-        
-        if not record:
-            flash('Пластинка не найдена', 'error')
-            return redirect(url_for('catalog'))
-        
-        if record['current_stock'] < quantity:
-            flash('Недостаточно товара на складе', 'error')
-            return redirect(url_for('catalog'))
-        
-        # Создаем запись о покупке
-        total_price = record['retail_price'] * quantity
-        conn.execute('''
-            INSERT INTO purchases (user_id, record_id, quantity, price, seller_id)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (session['user_id'], record_id, quantity, total_price, None))
-        
-        # Обновляем остаток
-        conn.execute('''
-            UPDATE records 
-            SET current_stock = current_stock - ?, 
-                sold_this_year = sold_this_year + ?
-            WHERE id = ?
-        ''', (quantity, quantity, record_id))
-        
-        conn.commit()
-        flash(f'Покупка успешно оформлена! Сумма: {total_price:.2f} ₽', 'success')
+        category, message, endpoint = idempotency.once(user_id, lambda guard: run_write(
+            lambda repo: guard(repo, lambda: purchase_record(repo, user_id, record_id, quantity))))
     except Exception as e:
         flash(f'Ошибка при оформлении покупки: {str(e)}', 'error')
-    finally:
-        conn.close()
+        return redirect(url_for('personal_cabinet'))
+    
+    flash(message, category)
+    return redirect(url_for(endpoint))
+
+def purchase_record(repo, user_id, record_id, quantity):
+    """Покупка пластинки в транзакции записи; возвращает (категория, сообщение, страница)"""
+    if quantity <= 0:
+        return 'error', 'Количество должно быть больше нуля', 'catalog'
+    # Заказ из одной пластинки: условный UPDATE остатка и две вставки
+    try:
+        order = repo.orders.place(user_id, [(record_id, quantity)])
+    except OutOfStock:
+        return 'error', 'Недостаточно товара на складе', 'catalog'
+    if order is None:
+        return 'error', 'Пластинка не найдена', 'catalog'
     
-    return redirect(url_for('personal_cabinet'))
+    return ('success', f'Покупка успешно оформлена! Сумма: {format_money(order["total_cents"])} ₽',
+            'personal_cabinet')
 
 @app.route('/personal_cabinet')
 @role_required(['buyer'])
 def personal_cabinet():
     """Личный кабинет покупателя"""
-    conn = get_db_connection()
+    repo = get_repository()
     
     # Получаем информацию о пользователе
-    user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    
-    # Получаем историю покупок
-    purchases = conn.execute('''
-        SELECT p.*, r.title, r.catalog_number, comp.name as company_name
-        FROM purchases p
-        JOIN records r ON p.record_id = r.id
-        JOIN companies comp ON r.company_id = comp.id
-        WHERE p.user_id = ?
-        ORDER BY p.purchase_date DESC
-    ''', (session['user_id'],)).fetchall()
-    
-    # Подсчитываем статистику
-    total_purchases = len(purchases)
-    total_spent = sum(p['price'] for p in purchases) if purchases else 0
-    
-    conn.close()
+    user = repo.users.get(session['user_id'])
+    
+    # Получаем страницу истории покупок (рабочая база, затем архив по годам)
+    page = list_page(repo.purchases.page, session['user_id'])
+    
+    # Статистика - по всем покупкам, а не только по странице
+    totals = repo.purchases.totals(session['user_id'])
+    
     return render_template('personal_cabinet.html', 
                          user=user, 
-                         purchases=purchases,
-                         total_purchases=total_purchases,
-                         total_spent=total_spent)
+                         purchases=page.rows,
+                         page=page,
+                         total_purchases=totals['total_purchases'],
+                         total_spent_cents=totals['total_spent_cents'])
+
+@app.route('/order/<int:order_id>')
+@role_required(['buyer'])
+def order_details(order_id):
+    """Заказ покупателя: сумма и купленные пластинки"""
+    repo = get_repository()
+    order = repo.orders.get(order_id, session['user_id'])
+    if not order:
+        flash('Заказ не найден', 'error')
+        return redirect(url_for('personal_cabinet'))
+    
+    return render_template('order.html', order=order, items=repo.orders.items(order))
 
 @app.route('/add_to_cart/<int:record_id>', methods=['POST'])
 @role_required(['buyer'])
 def add_to_cart(record_id):
     """Добавление товара в корзину"""
-    conn = get_db_connection()
+    user_id = session['user_id']
     
     try:
         quantity = int(request.form['quantity'])
-        
-        # Получаем информацию о пластинке
-        record = conn.execute('SELECT * FROM records WHERE id = ?', (record_id,)).fetchone()
-        
-        if not record:
-            flash('Пластинка не найдена', 'error')
-            return redirect(url_for('catalog'))
-        
-        if record['current_stock'] < quantity:
-            flash('Недостаточно товара на складе', 'error')
-            return redirect(url_for('catalog'))
-        
-        # Проверяем, есть ли уже этот товар в корзине
-        existing_item = conn.execute('''
-            SELECT * FROM cart WHERE user_id = ? AND record_id = ?
-        ''', (session['user_id'], record_id)).fetchone()
-        
-        if existing_item:
-            # Обновляем количество
-            conn.execute('''
-                UPDATE cart SET quantity = quantity + ? WHERE user_id = ? AND record_id = ?
-            ''', (quantity, session['user_id'], record_id))
-        else:
-            # Добавляем новый товар
-            conn.execute('''
-                INSERT INTO cart (user_id, record_id, quantity)
-                VALUES (?, ?, ?)
-            ''', (session['user_id'], record_id, quantity))
-        
-        conn.commit()
-        flash(f'Товар добавлен в корзину!', 'success')
+        category, message = add_cart_item(get_repository(), user_id, record_id, quantity)
+        flash(message, category)
     except Exception as e:
         flash(f'Ошибка при добавлении в корзину: {str(e)}', 'error')
-    finally:
-        conn.close()
     
     return redirect(url_for('catalog'))
 
+def add_cart_item(repo, user_id, record_id, quantity):
+    """Добавление товара в корзину; возвращает (категория, сообщение)
+
+    Корзина не резервирует товар, поэтому остаток проверяется чтением, без
+    транзакции записи рабочей базы; при оформлении он проверяется снова.
+    """
+    if quantity <= 0:
+        return 'error', 'Количество должно быть больше нуля'
+    
+    # Получаем информацию о пластинке
+    record = repo.records.get(record_id)
+    
+    if not record:
+        return 'error', 'Пластинка не найдена'
+    
+    if record['current_stock'] < quantity:
+        return 'error', 'Недостаточно товара на складе'
+    
+    # Новый товар или увеличение количества уже добавленного
+    cart_store.add(user_id, record_id, quantity)
+    
+    return 'success', 'Товар добавлен в корзину!'
+
 @app.route('/cart')
 @role_required(['buyer'])
 def cart():
     """Корзина покупок"""
-    conn = get_db_connection()
-    
     # Получаем товары в корзине
-    cart_items = conn.execute('''
-        SELECT c.*, r.title, r.catalog_number, r.retail_price, r.current_stock,
-               comp.name as company_name
-        FROM cart c
-        JOIN records r ON c.record_id = r.id
-        JOIN companies comp ON r.company_id = comp.id
-        WHERE c.user_id = ?
-        ORDER BY c.added_at DESC
-    ''', (session['user_id'],)).fetchall()
-    
-    # Подсчитываем общую сумму
-    total_amount = sum(item['retail_price'] * item['quantity'] for item in cart_items) if cart_items else 0
-    
-    conn.close()
-    return render_template('cart.html', cart_items=cart_items, total_amount=total_amount)
+    cart_items = cart_store.items(session['user_id'])
+    
+    # Общая сумма в копейках (целые числа складываются точно)
+    total_cents = sum(item['retail_price_cents'] * item['quantity'] for item in cart_items)
+    
+    return render_template('cart.html', cart_items=cart_items, total_cents=total_cents)
 
 @app.route('/decrease_cart_item/<int:cart_id>')
 @role_required(['buyer'])
 def decrease_cart_item(cart_id):
     """Уменьшение количества товара в корзине"""
-    conn = get_db_connection()
+    user_id = session['user_id']
     
     try:
-        # Получаем текущее количество
-        cart_item = conn.execute('SELECT quantity FROM cart WHERE id = ? AND user_id = ?', (cart_id, session['user_id'])).fetchone()
+        # Количество уменьшается на 1; при количестве 1 товар удаляется полностью
+        remaining = cart_store.decrease(cart_id, user_id)
         
-        if cart_item:
-            if cart_item['quantity'] > 1:
-                # Уменьшаем количество
-                conn.execute('UPDATE cart SET quantity = quantity - 1 WHERE id = ? AND user_id = ?', (cart_id, session['user_id']))
-                flash('Количество товара уменьшено', 'success')
-            else:
-                # Если количество = 1, удаляем товар полностью
-                conn.execute('DELETE FROM cart WHERE id = ? AND user_id = ?', (cart_id, session['user_id']))
-                flash('Товар удален из корзины', 'success')
-            
-            conn.commit()
+        if remaining:
+            flash('Количество товара уменьшено', 'success')
+        elif remaining == 0:
+            flash('Товар удален из корзины', 'success')
         else:
             flash('Товар не найден в корзине', 'error')
     except Exception as e:
         flash(f'Ошибка при изменении количества: {str(e)}', 'error')
-    finally:
-        conn.close()
     
     return redirect(url_for('cart'))
 
@@ -696,16 +614,13 @@ def decrease_cart_item(cart_id):
 @role_required(['buyer'])
 def remove_from_cart(cart_id):
     """Удаление товара из корзины"""
-    conn = get_db_connection()
+    user_id = session['user_id']
     
     try:
-        conn.execute('DELETE FROM cart WHERE id = ? AND user_id = ?', (cart_id, session['user_id']))
-        conn.commit()
+        cart_store.remove(cart_id, user_id)
         flash('Товар удален из корзины', 'success')
     except Exception as e:
         flash(f'Ошибка при удалении товара: {str(e)}', 'error')
-    finally:
-        conn.close()
     
     return redirect(url_for('cart'))
 
@@ -713,16 +628,13 @@ def remove_from_cart(cart_id):
 @role_required(['buyer'])
 def clear_cart():
     """Очистка всей корзины"""
-    conn = get_db_connection()
+    user_id = session['user_id']
     
     try:
-        conn.execute('DELETE FROM cart WHERE user_id = ?', (session['user_id'],))
-        conn.commit()
+        cart_store.clear(user_id)
         flash('Корзина успешно очищена!', 'success')
     except Exception as e:
         flash(f'Ошибка при очистке корзины: {str(e)}', 'error')
-    finally:
-        conn.close()
     
     return redirect(url_for('cart'))
 
@@ -730,63 +642,70 @@ def clear_cart():
 @role_required(['buyer'])
 def checkout():
     """Оформление заказа из корзины"""
-    conn = get_db_connection()
+    user_id = session['user_id']
     
     try:
-        # Получаем товары в корзине
-        cart_items = conn.execute('''
-            SELECT c.*, r.title, r.retail_price, r.current_stock
-            FROM cart c
-            JOIN records r ON c.record_id = r.id
-            WHERE c.user_id = ?
-        ''', (session['user_id'],)).fetchall()
-        
-        if not cart_items:
-            flash('Корзина пуста', 'error')
-            return redirect(url_for('cart'))
-        
-        # Проверяем наличие товаров
-        for item in cart_items:
-            if item['current_stock'] < item['quantity']:
-                flash(f'Недостаточно товара "{item["title"]}" на складе', 'error')
-                return redirect(url_for('cart'))
-        
-        # Создаем покупки
-        total_amount = 0
-        for item in cart_items:
-            price = item['retail_price'] * item['quantity']
-            total_amount += price
-            
-            conn.execute('''
-                INSERT INTO purchases (user_id, record_id, quantity, price, seller_id)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (session['user_id'], item['record_id'], item['quantity'], price, None))
-            
-            # Обновляем остаток
-            conn.execute('''
-                UPDATE records 
-                SET current_stock = current_stock - ?, 
-                    sold_this_year = sold_this_year + ?
-                WHERE id = ?
-            ''', (item['quantity'], item['quantity'], item['record_id']))
-        
-        # Очищаем корзину
-        conn.execute('DELETE FROM cart WHERE user_id = ?', (session['user_id'],))
-        
-        conn.commit()
-        flash(f'Заказ успешно оформлен! Общая сумма: {total_amount:.2f} ₽', 'success')
+        category, message, endpoint = idempotency.once(user_id, lambda guard: cart_store.checkout(
+            user_id, lambda repo, cart_items, placed: guard(
+                repo, lambda: place_order(repo, user_id, cart_items, placed))))
     except Exception as e:
         flash(f'Ошибка при оформлении заказа: {str(e)}', 'error')
-    finally:
-        conn.close()
+        return redirect(url_for('personal_cabinet'))
     
-    return redirect(url_for('personal_cabinet'))
+    flash(message, category)
+    return redirect(url_for(endpoint))
+
+def place_order(repo, user_id, cart_items, placed):
+    """Оформление товаров корзины в транзакции записи; возвращает (категория, сообщение, страница)
+
+    Заказ (заголовок, списание остатков и покупки) пишется целиком или
+    никак, товары удаленных пластинок пропускаются. placed() сообщает
+    cart_store.checkout(), что заказ оформлен и корзину можно очистить.
+    """
+    try:
+        order = repo.orders.place(user_id, [(item['record_id'], item['quantity']) for item in cart_items])
+    except OutOfStock as e:
+        record = repo.records.get(e.record_id)
+        return 'error', f'Недостаточно товара "{record["title"]}" на складе', 'cart'
+    if order is None:
+        return 'error', 'Корзина пуста', 'cart'
+    placed()
+    
+    return ('success', f'Заказ №{order["id"]} успешно оформлен! '
+                       f'Общая сумма: {format_money(order["total_cents"])} ₽', 'personal_cabinet')
+
+@app.route('/query_stats')
+@role_required(['director'])
+def query_stats():
+    """Статистика выполнения SQL-запросов (только для директора)"""
+    if request.args.get('reset'):
+        queries.reset_stats()
+    return jsonify(queries.stats())
+
+@app.route('/lock_stats')
+@role_required(['director'])
+def lock_stats():
+    """Время ожидания соединений на путях чтения и записи (только для директора)
+
+    Ожидание отдельного файла корзин (CART_STORE=sqlite или memory) - в ключе carts.
+    """
+    stats = db_pool.lock_stats()
+    carts = cart_store.lock_stats()
+    if carts is not None:
+        stats['carts'] = carts
+    return jsonify(stats)
 
 if __name__ == '__main__':
     # Инициализируем базу данных если её нет
     if not os.path.exists(DATABASE):
         from database import init_database
         init_database()
+    else:
+        # Доводим схему существующей базы до актуальной версии
+        import migrations
+        conn = get_db_connection()
+        migrations.upgrade(conn, log=print)
+        conn.close()
     
     # Поддержка Docker - запуск на всех интерфейсах
     app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_ENV') == 'development')
@@ -0,0 +1,273 @@
+"""
+Архив старых покупок: по файлу SQLite на год
+
+Покупки старше границы переносятся из purchases в файлы
+<каталог архива>/purchases_ГГГГ.db с той же таблицей и индексами, поэтому
+рабочая таблица остается маленькой и помещается в кэш страниц.
+
+Архивный год читается отдельным соединением: файл года открывается как main,
+а рабочая база подключается к нему (ATTACH) только для чтения. Соединения
+годов берутся из пулов процесса (db_pool.get_readonly_pool), поэтому запрос
+личного кабинета не открывает файлы заново. Неуточненные
+имена ищутся сначала в main, поэтому те же запросы из queries.py читают
+purchases года, а users, records и companies - из рабочей базы. Результаты
+по годам объединяются здесь: выгрузки идут по годам по порядку дат, итоги
+и сводки по нескольким годам считаются параллельно в потоках (sqlite3
+отпускает GIL на время выполнения запроса).
+
+Граница архива - не позже начала прошлого учетного года (sales_period):
+счетчики продаж, перевод года и пересчет читают покупки только этих двух
+лет, поэтому перенос их не меняет. Граница округляется до начала месяца,
+чтобы помесячная сводка продаж не делила месяц между архивом и рабочей базой.
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import db_pool
+import queries
+from pagination import DEFAULT_PAGE_SIZE, Page, decode_cursor, encode_cursor
+
+THREADS = 4
+
+_FILENAME_RE = re.compile(r'^purchases_(\d{4})\.db$')
+
+
+def directory(db_path):
+    """Каталог архива: ARCHIVE_DIR или archive рядом с файлом базы"""
+    return os.environ.get('ARCHIVE_DIR') or os.path.join(os.path.dirname(os.path.abspath(db_path)), 'archive')
+
+
+def database_path(conn):
+    """Путь к файлу схемы main соединения"""
+    return conn.execute('PRAGMA database_list').fetchone()[2]
+
+
+def year_path(archive_dir, year):
+    return os.path.join(archive_dir, f'purchases_{year}.db')
+
+
+def years(archive_dir, start='', end='9999-12-31'):
+    """Архивные годы по возрастанию, пересекающиеся с полуинтервалом дат [start, end)"""
+    if not os.path.isdir(archive_dir):
+        return []
+    found = []
+    for filename in os.listdir(archive_dir):
+        match = _FILENAME_RE.match(filename)
+        if match and f'{match.group(1)}-01-01' < end and start < f'{int(match.group(1)) + 1}-01-01':
+            found.append(int(match.group(1)))
+    return sorted(found)
+
+
+def year_pool(db_path, year, archive_dir=None):
+    """Пул процесса соединений только для чтения: main - архив года, store - рабочая база"""
+    return db_pool.get_readonly_pool(year_path(archive_dir or directory(db_path), year),
+                                     attach=(('store', os.path.abspath(db_path)),))
+
+
+@contextmanager
+def year_connection(db_path, year, archive_dir=None):
+    """Соединение архивного года из пула (открытие и ATTACH - один раз на соединение пула)"""
+    pool = year_pool(db_path, year, archive_dir)
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+def gather(db_path, years_list, fn, archive_dir=None):
+    """Результаты fn(соединение года) по каждому году в порядке years_list
+
+    Несколько лет читаются параллельно, каждый своим соединением.
+    """
+    def run(year):
+        with year_connection(db_path, year, archive_dir) as conn:
+            return fn(conn)
+
+    if len(years_list) < 2:
+        return [run(year) for year in years_list]
+    with ThreadPoolExecutor(max_workers=min(THREADS, len(years_list))) as executor:
+        return list(executor.map(run, years_list))
+
+
+def cutoff_limit(conn):
+    """Самая поздняя допустимая граница архива: начало прошлого учетного года"""
+    period = conn.execute('SELECT year FROM sales_period WHERE id = 1').fetchone()[0]
+    return date(period - 1, 1, 1)
+
+
+# Столбцы, которые миграция заполнила по другим столбцам рабочей базы: в файлах
+# года они заполняются тем же выражением при добавлении
+DERIVED_COLUMNS = {'price_cents': 'CAST(ROUND(price * 100) AS INTEGER)'}
+
+
+def _columns(conn, schema):
+    return {row[1]: row[2] for row in conn.execute(f'PRAGMA {schema}.table_info(purchases)')}
+
+
+def _prepare(conn):
+    """Таблица и индексы покупок в подключенном файле archive (как в рабочей базе)"""
+    table_sql = conn.execute('''
+        SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = 'purchases'
+    ''').fetchone()[0]
+    conn.execute(re.sub(r'^CREATE TABLE\s+"?purchases"?', 'CREATE TABLE IF NOT EXISTS archive.purchases', table_sql))
+    # Столбцы, добавленные миграциями после создания файла года
+    existing = _columns(conn, 'archive')
+    for name, type_ in _columns(conn, 'main').items():
+        if name not in existing:
+            conn.execute(f'ALTER TABLE archive.purchases ADD COLUMN "{name}" {type_}')
+            if name in DERIVED_COLUMNS:
+                conn.execute(f'UPDATE archive.purchases SET "{name}" = {DERIVED_COLUMNS[name]}')
+    if conn.in_transaction:
+        conn.commit()
+    for (index_sql,) in conn.execute('''
+        SELECT sql FROM main.sqlite_master
+        WHERE type = 'index' AND tbl_name = 'purchases' AND sql IS NOT NULL
+    ''').fetchall():
+        conn.execute(re.sub(r'^CREATE INDEX\s+(IF NOT EXISTS\s+)?', 'CREATE INDEX IF NOT EXISTS archive.',
+                            index_sql))
+    return list(_columns(conn, 'main'))
+
+
+@contextmanager
+def _attached(conn, path):
+    conn.execute('ATTACH DATABASE ? AS archive', (path,))
+    try:
+        yield
+    finally:
+        conn.execute('DETACH DATABASE archive')
+
+
+def sync(conn, archive_dir=None):
+    """Схема purchases во всех файлах архива - как в рабочей базе
+
+    Нужна после миграций, добавляющих столбцы в purchases: запросы из
+    queries.py выполняются над файлами годов без изменений.
+    """
+    archive_dir = archive_dir or directory(database_path(conn))
+    for year in years(archive_dir):
+        with _attached(conn, year_path(archive_dir, year)):
+            _prepare(conn)
+
+
+def archive(conn, before, archive_dir=None, log=None):
+    """Перенос покупок раньше даты before в архивные файлы по годам
+
+    conn - соединение с рабочей базой без открытой транзакции. Каждый месяц
+    переносится отдельной транзакцией (INSERT в архив и DELETE из purchases),
+    чтобы приложение не ждало записи дольше одного месяца. Повторный запуск
+    после сбоя безопасен: строки в архиве заменяются по id.
+    Возвращает {год: перенесено строк}.
+    """
+    log = log or (lambda message: None)
+    limit = cutoff_limit(conn)
+    if before > limit:
+        raise ValueError(f'Граница архива не может быть позже {limit.isoformat()}: '
+                         f'покупки прошлого и текущего года нужны счетчикам продаж')
+    before = before.replace(day=1)
+    archive_dir = archive_dir or directory(database_path(conn))
+    sync(conn, archive_dir)
+    first = conn.execute('SELECT MIN(purchase_date) FROM purchases').fetchone()[0]
+    if first is None or first >= before.isoformat():
+        return {}
+    os.makedirs(archive_dir, exist_ok=True)
+
+    moved = {}
+    for year in range(int(first[:4]), (before - timedelta(days=1)).year + 1):
+        year_end = min(date(year + 1, 1, 1), before).isoformat()
+        if not conn.execute('SELECT 1 FROM purchases WHERE purchase_date >= ? AND purchase_date < ? LIMIT 1',
+                            (f'{year}-01-01', year_end)).fetchone():
+            continue
+        with _attached(conn, year_path(archive_dir, year)):
+            columns = ', '.join(f'"{name}"' for name in _prepare(conn))
+            moved[year] = 0
+            for month in range(1, 13):
+                start = date(year, month, 1)
+                if start >= before:
+                    break
+                end = date(year + month // 12, month % 12 + 1, 1).isoformat()
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    conn.execute(f'''
+                        INSERT OR REPLACE INTO archive.purchases ({columns})
+                        SELECT {columns} FROM main.purchases
+                        WHERE purchase_date >= ? AND purchase_date < ?
+                    ''', (start.isoformat(), end))
+                    moved[year] += conn.execute('''
+                        DELETE FROM main.purchases WHERE purchase_date >= ? AND purchase_date < ?
+                    ''', (start.isoformat(), end)).rowcount
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+            conn.execute('ANALYZE archive')
+        log(f'{year}: перенесено {moved[year]} покупок в {year_path(archive_dir, year)}')
+    return moved
+
+
+# --- Чтение с архивом ---
+
+def _sources(conn, archive_dir, start='', end='9999-12-31'):
+    """Рабочая база и архивные годы, пересекающиеся с [start, end), от новых к старым"""
+    yield conn
+    db_path = database_path(conn)
+    for year in reversed(years(archive_dir or directory(db_path), start, end)):
+        with year_connection(db_path, year, archive_dir) as year_conn:
+            yield year_conn
+
+
+def user_purchases_page(conn, user_id, sort=None, cursor=None, limit=DEFAULT_PAGE_SIZE, archive_dir=None):
+    """Страница истории покупок пользователя по рабочей базе и архиву (от новых к старым)
+
+    Архивные покупки старше всех рабочих, поэтому страница добирается из
+    следующего источника с тем же курсором. Годы новее даты курсора не
+    читаются; заполнив страницу, источники дальше проверяются только до
+    первой строки (есть ли следующая страница).
+    """
+    rows, sort = [], queries.USER_PURCHASES.sort_key(sort)
+    position = decode_cursor(cursor, sort, 2)
+    newest = position[0] if position and isinstance(position[0], str) else '9999-12-31'
+    sources = _sources(conn, archive_dir, end=newest)
+    try:
+        for source in sources:
+            if len(rows) == limit:
+                # Страница заполнена: следующая есть, если в источнике остались строки
+                if queries.USER_PURCHASES.page(source, (user_id,), sort, cursor, limit=1).rows:
+                    return Page(rows, encode_cursor(sort, [rows[-1]['_sort_0'], rows[-1]['_sort_1']]), sort)
+                continue
+            page = queries.USER_PURCHASES.page(source, (user_id,), sort, cursor, limit=limit - len(rows))
+            rows.extend(page.rows)
+            if page.next_cursor:
+                return Page(rows, page.next_cursor, sort)
+    finally:
+        sources.close()
+    return Page(rows, None, sort)
+
+
+def order_items(conn, order, archive_dir=None):
+    """Покупки заказа: из рабочей базы, а если они перенесены - из архива года заказа"""
+    rows = queries.ORDER_ITEMS.all(conn, (order['id'],))
+    if rows:
+        return rows
+    db_path = database_path(conn)
+    year = int(order['created_at'][:4])
+    # Заказ в последнюю секунду года мог получить покупки следующего
+    found = gather(db_path, years(archive_dir or directory(db_path), f'{year}-01-01', f'{year + 2}-01-01'),
+                   lambda year_conn: queries.ORDER_ITEMS.all(year_conn, (order['id'],)), archive_dir)
+    return [row for year_rows in found for row in year_rows]
+
+
+def user_purchase_totals(conn, user_id, archive_dir=None):
+    """Число покупок и сумма в копейках пользователя по рабочей базе и всем архивным годам"""
+    db_path = database_path(conn)
+    archive_dir = archive_dir or directory(db_path)
+    totals = [queries.USER_PURCHASE_TOTALS.one(conn, (user_id,))]
+    totals += gather(db_path, years(archive_dir),
+                     lambda year_conn: queries.USER_PURCHASE_TOTALS.one(year_conn, (user_id,)), archive_dir)
+    return {
+        'total_purchases': sum(row['total_purchases'] for row in totals),
+        'total_spent_cents': sum(row['total_spent_cents'] for row in totals),
+    }
@@ -0,0 +1,71 @@
+"""
+Автодополнение названий ансамблей и компаний
+
+Индекс - отсортированный в памяти список пар (нормализованный хвост
+названия с начала каждого слова, id); поиск префикса - два bisect, без
+обращения к базе. Индекс перестраивается при смене версии в cache_versions
+(миграция 0008), поэтому на каждое нажатие клавиши база получает только
+проверку версии по первичному ключу.
+"""
+import bisect
+import re
+
+import queries
+from cache import VersionedCache
+
+DEFAULT_LIMIT = 10
+
+_WORD_START = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Регистр и ё/е не различаются"""
+    return text.lower().replace('ё', 'е')
+
+
+class PrefixIndex:
+    """Поиск по началу любого слова названия"""
+
+    def __init__(self, items):
+        self.labels = {}
+        keys = []
+        for item_id, label in items:
+            self.labels[item_id] = label
+            name = normalize(label)
+            for word in _WORD_START.finditer(name):
+                keys.append((name[word.start():], item_id))
+        keys.sort()
+        self._keys = keys
+
+    def search(self, prefix, limit=DEFAULT_LIMIT):
+        """Не более limit элементов {'id', 'label'} по алфавиту совпавшего слова"""
+        prefix = normalize(prefix.strip())
+        if not prefix:
+            return []
+        found = []
+        for key, item_id in self._keys[bisect.bisect_left(self._keys, (prefix,)):]:
+            if not key.startswith(prefix) or len(found) == limit:
+                break
+            if item_id not in found:
+                found.append(item_id)
+        return [{'id': item_id, 'label': self.labels[item_id]} for item_id in found]
+
+
+def _ensembles(conn):
+    return PrefixIndex((row['id'], f"{row['name']} ({row['type']})" if row['type'] else row['name'])
+                       for row in queries.ENSEMBLES_LIST.all(conn))
+
+
+def _companies(conn):
+    return PrefixIndex((row['id'], row['name']) for row in queries.COMPANIES_LIST.all(conn))
+
+
+SOURCES = {
+    'ensembles': VersionedCache('autocomplete_ensembles', _ensembles),
+    'companies': VersionedCache('autocomplete_companies', _companies),
+}
+
+
+def complete(conn, source, prefix, key=None, limit=DEFAULT_LIMIT):
+    """Варианты для источника source ('ensembles' или 'companies')"""
+    return SOURCES[source].get(conn, key).search(prefix, limit)
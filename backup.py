@@ -0,0 +1,111 @@
+"""
+Горячее резервное копирование базы через SQLite backup API
+
+Копия снимается, пока приложение работает: sqlite3 backup() копирует
+ограниченное число страниц за шаг, а между шагами делается пауза, чтобы
+писатель (покупки, оформление заказов) не ждал. Источник держит открытую
+транзакцию чтения: в режиме WAL она не мешает записи, но закрепляет снимок,
+иначе каждая запись другого соединения перезапускала бы копирование с начала.
+
+Готовая копия проверяется PRAGMA integrity_check, по желанию сжимается
+gzip, и в каталоге остаются только последние keep копий.
+"""
+import glob
+import gzip
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+
+DEFAULT_PAGES = 256        # страниц за шаг (1 МБ при странице 4 КБ)
+DEFAULT_SLEEP = 0.05       # пауза между шагами, с
+DEFAULT_KEEP = 7
+
+PREFIX = 'music_store-'
+
+
+def backup_name(now=None):
+    """Имя файла копии по времени создания: music_store-ГГГГММДД-ЧЧММСС.db"""
+    return f"{PREFIX}{(now or datetime.now()).strftime('%Y%m%d-%H%M%S')}.db"
+
+
+def verify(path):
+    """Проверка целостности копии; возвращает список ошибок (пустой - копия цела)"""
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        problems = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+    finally:
+        conn.close()
+    return [] if problems == ['ok'] else problems
+
+
+def _compress(path):
+    with open(path, 'rb') as source, gzip.open(path + '.gz', 'wb', compresslevel=6) as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    os.remove(path)
+    return path + '.gz'
+
+
+def rotate(directory, keep):
+    """Удаление старых копий, кроме последних keep; возвращает удаленные пути"""
+    backups = sorted(glob.glob(os.path.join(directory, f'{PREFIX}*.db')) +
+                     glob.glob(os.path.join(directory, f'{PREFIX}*.db.gz')),
+                     key=os.path.basename)
+    removed = backups[:-keep] if keep > 0 else []
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def backup(db_path, directory, pages=DEFAULT_PAGES, sleep=DEFAULT_SLEEP, compress=False,
+           check=True, keep=DEFAULT_KEEP, log=None):
+    """Резервная копия db_path в каталог directory; возвращает путь к копии"""
+    log = log or (lambda message: None)
+    os.makedirs(directory, exist_ok=True)
+    target = os.path.join(directory, backup_name())
+    partial = target + '.partial'
+    started = time.perf_counter()
+    steps = []
+
+    def progress(status, remaining, total):
+        steps.append(total)
+        if remaining:
+            time.sleep(sleep)
+
+    source = sqlite3.connect(db_path, isolation_level=None)
+    destination = sqlite3.connect(partial)
+    try:
+        source.execute('PRAGMA busy_timeout = 5000')
+        # Снимок на все время копирования (см. описание модуля)
+        source.execute('BEGIN')
+        source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        source.backup(destination, pages=pages, progress=progress)
+        source.execute('COMMIT')
+        # Копия - отдельный файл без журнала WAL рядом с ним
+        destination.execute('PRAGMA journal_mode = DELETE')
+    except Exception:
+        destination.close()
+        os.remove(partial)
+        raise
+    finally:
+        source.close()
+    destination.close()
+    log(f'скопировано {os.path.getsize(partial) / 2 ** 20:.1f} МБ за {time.perf_counter() - started:.1f} с, '
+        f'шагов: {len(steps)}')
+
+    if check:
+        problems = verify(partial)
+        if problems:
+            os.remove(partial)
+            raise RuntimeError(f'Копия не прошла проверку целостности: {"; ".join(problems[:5])}')
+        log('проверка целостности: ok')
+
+    os.replace(partial, target)
+    if compress:
+        target = _compress(target)
+        log(f'сжато до {os.path.getsize(target) / 2 ** 20:.1f} МБ')
+
+    for path in rotate(directory, keep):
+        log(f'удалена старая копия {os.path.basename(path)}')
+    return target
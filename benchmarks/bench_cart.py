@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Корзины в рабочей базе и в отдельном хранилище: операций корзины в секунду и p99 оформления
+
+Одни потоки непрерывно добавляют и убирают товары корзины, другие
+оформляют заказы (товар в корзину, затем /checkout). Для каждого
+CART_STORE (main, sqlite, memory) печатаются пропускная способность
+корзины и задержки оформления.
+
+Использование:
+    python benchmarks/bench_cart.py [--cart-threads 8] [--checkout-threads 2] [--seconds 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import cart_store  # noqa: E402
+import db_pool  # noqa: E402
+from app import app  # noqa: E402
+from database import init_database  # noqa: E402
+
+
+def add_buyers(path, count):
+    """Покупатели bench<N>; возвращает их id"""
+    conn = db_pool.connect(path)
+    conn.executemany("INSERT INTO users (username, password_hash, role, full_name) VALUES (?, '-', 'buyer', ?)",
+                     [(f'bench{i}', f'Покупатель {i}') for i in range(count)])
+    conn.execute('UPDATE records SET current_stock = 10000000')
+    conn.commit()
+    ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE username LIKE 'bench%' ORDER BY id")]
+    conn.close()
+    return ids
+
+
+def client_for(user_id):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['role'] = 'buyer'
+    return client
+
+
+def run(buyers, cart_threads, checkout_threads, seconds):
+    """Возвращает (операций корзины в секунду, задержки оформления в мс)"""
+    stop = threading.Event()
+    cart_ops = []
+    checkouts = []
+    errors = []
+
+    def cart_worker(user_id):
+        client = client_for(user_id)
+        ops = 0
+        while not stop.is_set():
+            client.post('/add_to_cart/1', data={'quantity': '1'})
+            response = client.get('/clear_cart')
+            if response.status_code != 302:
+                errors.append(response.status_code)
+            ops += 2
+        cart_ops.append(ops)
+
+    def checkout_worker(user_id):
+        client = client_for(user_id)
+        while not stop.is_set():
+            client.post('/add_to_cart/2', data={'quantity': '1'})
+            started = time.perf_counter()
+            response = client.post('/checkout')
+            checkouts.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 302:
+                errors.append(response.status_code)
+
+    workers = [threading.Thread(target=cart_worker, args=(buyers[i],)) for i in range(cart_threads)]
+    workers += [threading.Thread(target=checkout_worker, args=(buyers[cart_threads + i],))
+                for i in range(checkout_threads)]
+    for w in workers:
+        w.start()
+    time.sleep(seconds)
+    stop.set()
+    for w in workers:
+        w.join()
+    if errors:
+        raise RuntimeError(f'Ошибки запросов: {errors[:5]}')
+    return sum(cart_ops) / seconds, checkouts
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер отдельного хранилища корзин')
+    parser.add_argument('--cart-threads', type=int, default=8)
+    parser.add_argument('--checkout-threads', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'bench.db')
+    os.environ['DATABASE_PATH'] = path
+    try:
+        init_database(force_recreate=True)
+        buyers = add_buyers(path, args.cart_threads + args.checkout_threads)
+        app.config['DATABASE'] = path
+        app.config['SECRET_KEY'] = 'bench'
+
+        print(f"\nПотоков корзины: {args.cart_threads}, оформления: {args.checkout_threads}, "
+              f"{args.seconds:.0f} с на режим")
+        print(f"{'CART_STORE':<12}{'корзина, оп/с':>16}{'заказов':>10}{'p50 заказа':>14}{'p99 заказа':>14}")
+        for kind in cart_store.STORES:
+            app.config['CART_STORE'] = kind
+            cart_ops, checkouts = run(buyers, args.cart_threads, args.checkout_threads, args.seconds)
+            cart_store.close_stores()
+            print(f'{kind:<12}{cart_ops:>16.0f}{len(checkouts):>10}'
+                  f'{statistics.median(checkouts) if checkouts else 0:>11.1f} мс'
+                  f'{percentile(checkouts, 99):>11.1f} мс')
+    finally:
+        cart_store.close_stores()
+        db_pool.close_pools()
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Потоковая выгрузка покупок через /export/purchases: скорость и пиковая память
+
+База заполняется генератором seed.py (масштаб 1 - 100 тыс. покупок,
+100 - 10 млн). Пиковая память процесса (ru_maxrss) не должна расти
+с числом строк.
+
+Использование:
+    python benchmarks/bench_export.py [--scale 10] [--format csv]
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db_pool  # noqa: E402
+import seed  # noqa: E402
+from app import app  # noqa: E402
+from database import init_database  # noqa: E402
+
+
+def peak_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер потоковой выгрузки покупок')
+    parser.add_argument('--scale', type=float, default=10)
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    parser.add_argument('--mmap-size', type=int, default=None, help="PRAGMA mmap_size читающих соединений")
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.environ['DATABASE_PATH'] = path
+    try:
+        init_database(force_recreate=True)
+        # Генерация - в отдельном процессе, чтобы не влиять на пиковую память замера
+        loader = multiprocessing.Process(target=seed.seed, args=(path, args.scale))
+        loader.start()
+        loader.join()
+        app.config['DATABASE'] = path
+        if args.mmap_size is not None:
+            app.config['DB_PRAGMAS'] = dict(db_pool.DEFAULT_PRAGMAS, mmap_size=args.mmap_size)
+        app.config['SECRET_KEY'] = 'bench'
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['role'] = 'director'
+
+        before = peak_mb()
+        started = time.perf_counter()
+        response = client.get(f'/export/purchases?format={args.format}', buffered=False)
+        size = lines = 0
+        for chunk in response.response:
+            size += len(chunk)
+            lines += chunk.count(b'\n') if isinstance(chunk, bytes) else chunk.count('\n')
+        response.close()
+        elapsed = time.perf_counter() - started
+
+        print(f"\nСтрок выгрузки: {lines}, {size / 2 ** 20:.0f} МБ")
+        print(f"Время: {elapsed:.1f} с ({lines / elapsed:.0f} строк/с)")
+        print(f"Пиковая память процесса: до выгрузки {before:.0f} МБ, после {peak_mb():.0f} МБ")
+    finally:
+        db_pool.close_pools()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Пропускная способность покупок (покупок/с) с групповой фиксацией и без нее
+
+Использование:
+    python benchmarks/bench_group_commit.py [--threads 16] [--purchases 50] [--window-ms 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db_pool  # noqa: E402
+from app import app  # noqa: E402
+from database import init_database  # noqa: E402
+
+BUYER_ID = 3
+
+
+def run(threads, purchases_per_thread):
+    """Параллельные покупки через тестовый клиент; возвращает покупок/с"""
+    barrier = threading.Barrier(threads)
+    errors = []
+
+    def worker():
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = BUYER_ID
+            sess['role'] = 'buyer'
+        barrier.wait()
+        for _ in range(purchases_per_thread):
+            response = client.post('/buy_record/1', data={'quantity': '1'})
+            if response.status_code != 302:
+                errors.append(response.status_code)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise RuntimeError(f'Ошибки запросов: {errors[:5]}')
+    return threads * purchases_per_thread / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер групповой фиксации покупок')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--purchases', type=int, default=50, help='покупок на поток')
+    parser.add_argument('--window-ms', type=float, default=3.0)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.environ['DATABASE_PATH'] = path
+    try:
+        init_database(force_recreate=True)
+        app.config['DATABASE'] = path
+        app.config['SECRET_KEY'] = 'bench'
+
+        print(f"\nПотоков: {args.threads}, покупок: {args.threads * args.purchases}")
+        print(f"{'synchronous':<14}{'без группировки':>18}{'с группировкой':>18}")
+        for synchronous in ('FULL', 'NORMAL'):
+            app.config['DB_PRAGMAS'] = dict(db_pool.DEFAULT_PRAGMAS, synchronous=synchronous)
+            results = []
+            for window in (0, args.window_ms):
+                db_pool.close_pools()
+                conn = db_pool.connect(path)
+                conn.execute('UPDATE records SET current_stock = 1000000 WHERE id = 1')
+                conn.commit()
+                conn.close()
+                app.config['GROUP_COMMIT_WINDOW_MS'] = window
+                results.append(run(args.threads, args.purchases))
+            print(f'{synchronous:<14}{results[0]:>14.0f} п/с{results[1]:>14.0f} п/с')
+    finally:
+        db_pool.close_pools()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
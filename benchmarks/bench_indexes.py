@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Замер запросов маршрутов app.py до и после создания индексов
+
+Использование:
+    python benchmarks/bench_indexes.py [--records 100000] [--purchases 1000000]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import init_database, create_indexes, drop_indexes  # noqa: E402
+
+# Запросы маршрутов: (название, SQL, функция выбора параметров)
+QUERIES = [
+    ('compositions_count', '''
+        SELECT c.title, c.genre, c.year_composed, m.name as composer_name
+        FROM compositions c
+        LEFT JOIN musicians m ON c.composer_id = m.id
+        WHERE c.id IN (SELECT composition_id FROM performances WHERE ensemble_id = ?1)
+          AND EXISTS (SELECT 1 FROM ensemble_members WHERE ensemble_id = ?1)
+        ORDER BY c.title
+    ''', lambda rnd, n: (rnd.randint(1, n['ensembles']),)),
+    ('compositions_count (all)', '''
+        SELECT e.id, e.name, e.type, COALESCE(pc.compositions_count, 0) AS compositions_count
+        FROM ensembles e
+        LEFT JOIN (SELECT ensemble_id, COUNT(DISTINCT composition_id) AS compositions_count
+                   FROM performances
+                   GROUP BY ensemble_id) pc ON pc.ensemble_id = e.id
+        WHERE EXISTS (SELECT 1 FROM ensemble_members em WHERE em.ensemble_id = e.id)
+        ORDER BY e.name
+    ''', lambda rnd, n: ()),
+    ('ensemble_records', '''
+        SELECT DISTINCT r.catalog_number, r.title, r.release_date,
+               r.retail_price, comp.name as company_name
+        FROM records r
+        JOIN record_tracks rt ON r.id = rt.record_id
+        JOIN performances p ON rt.performance_id = p.id
+        JOIN companies comp ON r.company_id = comp.id
+        WHERE p.ensemble_id = ?
+        ORDER BY r.title
+    ''', lambda rnd, n: (rnd.randint(1, n['ensembles']),)),
+    ('ensemble_records (materialized)', '''
+        SELECT r.catalog_number, r.title, r.release_date,
+               r.retail_price, comp.name as company_name
+        FROM ensemble_discography ed
+        JOIN records r ON ed.record_id = r.id
+        JOIN companies comp ON r.company_id = comp.id
+        WHERE ed.ensemble_id = ?
+        ORDER BY r.title
+    ''', lambda rnd, n: (rnd.randint(1, n['ensembles']),)),
+    ('sales_leaders', '''
+        SELECT r.catalog_number, r.title, r.sold_this_year,
+               comp.name as company_name, r.retail_price
+        FROM records r
+        JOIN companies comp ON r.company_id = comp.id
+        WHERE r.sold_this_year > 0
+        ORDER BY r.sold_this_year DESC
+        LIMIT 10
+    ''', lambda rnd, n: ()),
+    ('personal_cabinet', '''
+        SELECT p.*, r.title, r.catalog_number, comp.name as company_name
+        FROM purchases p
+        JOIN records r ON p.record_id = r.id
+        JOIN companies comp ON r.company_id = comp.id
+        WHERE p.user_id = ?
+        ORDER BY p.purchase_date DESC
+    ''', lambda rnd, n: (rnd.randint(1, n['users']),)),
+    ('cart', '''
+        SELECT c.*, r.title, r.catalog_number, r.retail_price, r.current_stock,
+               comp.name as company_name
+        FROM cart c
+        JOIN records r ON c.record_id = r.id
+        JOIN companies comp ON r.company_id = comp.id
+        WHERE c.user_id = ?
+        ORDER BY c.added_at DESC
+    ''', lambda rnd, n: (rnd.randint(1, n['users']),)),
+    ('add_to_cart lookup', '''
+        SELECT * FROM cart WHERE user_id = ? AND record_id = ?
+    ''', lambda rnd, n: (rnd.randint(1, n['users']), rnd.randint(1, n['records']))),
+    ('catalog first page', '''
+        SELECT r.*, comp.name as company_name
+        FROM records r
+        JOIN companies comp ON r.company_id = comp.id
+        WHERE r.current_stock > 0
+        ORDER BY r.title
+        LIMIT 50
+    ''', lambda rnd, n: ()),
+]
+
+
+def populate(conn, sizes, rnd):
+    """Заполнение базы синтетическими данными заданного объема"""
+    n = sizes
+    conn.executemany('INSERT INTO companies (name) VALUES (?)',
+                     [(f'Компания {i}',) for i in range(n['companies'])])
+    conn.executemany('INSERT INTO musicians (name, role) VALUES (?, ?)',
+                     [(f'Музыкант {i}', 'исполнитель') for i in range(n['musicians'])])
+    conn.executemany('INSERT INTO ensembles (name, type) VALUES (?, ?)',
+                     [(f'Ансамбль {i}', 'оркестр') for i in range(n['ensembles'])])
+    conn.executemany(
+        'INSERT INTO ensemble_members (ensemble_id, musician_id) VALUES (?, ?)',
+        ((rnd.randint(1, n['ensembles']), rnd.randint(1, n['musicians']))
+         for _ in range(n['members'])))
+    conn.executemany(
+        'INSERT INTO compositions (title, composer_id) VALUES (?, ?)',
+        ((f'Произведение {i}', rnd.randint(1, n['musicians'])) for i in range(n['compositions'])))
+    conn.executemany(
+        'INSERT INTO performances (composition_id, ensemble_id) VALUES (?, ?)',
+        ((rnd.randint(1, n['compositions']), rnd.randint(1, n['ensembles']))
+         for _ in range(n['performances'])))
+    conn.executemany(
+        '''INSERT INTO records (catalog_number, title, company_id, retail_price,
+                                current_stock, sold_this_year)
+           VALUES (?, ?, ?, ?, ?, ?)''',
+        ((f'BENCH-{i}', f'Пластинка {rnd.random():.8f}', rnd.randint(1, n['companies']),
+          round(rnd.uniform(5, 50), 2), rnd.choice((0, rnd.randint(1, 100))),
+          rnd.choice((0, 0, rnd.randint(1, 500))))
+         for i in range(n['records'])))
+    conn.executemany(
+        'INSERT INTO record_tracks (record_id, performance_id, track_number) VALUES (?, ?, ?)',
+        ((rnd.randint(1, n['records']), rnd.randint(1, n['performances']), 1)
+         for _ in range(n['tracks'])))
+    conn.executemany(
+        "INSERT INTO users (username, password_hash, full_name) VALUES (?, '-', ?)",
+        ((f'bench_user_{i}', f'Покупатель {i}') for i in range(n['users'])))
+    conn.executemany(
+        '''INSERT INTO purchases (user_id, record_id, quantity, price, purchase_date)
+           VALUES (?, ?, 1, ?, datetime('now', ?))''',
+        ((rnd.randint(1, n['users']), rnd.randint(1, n['records']),
+          round(rnd.uniform(5, 50), 2), f'-{rnd.randint(0, 1000)} days')
+         for _ in range(n['purchases'])))
+    conn.executemany(
+        'INSERT INTO cart (user_id, record_id, quantity) VALUES (?, ?, 1)',
+        ((rnd.randint(1, n['users']), rnd.randint(1, n['records']))
+         for _ in range(n['carts'])))
+    conn.commit()
+
+
+def run_queries(conn, sizes, iterations, seed):
+    """Среднее время выполнения каждого запроса, мс"""
+    results = {}
+    for name, sql, params in QUERIES:
+        rnd = random.Random(seed)
+        started = time.perf_counter()
+        for _ in range(iterations):
+            conn.execute(sql, params(rnd, sizes)).fetchall()
+        results[name] = (time.perf_counter() - started) * 1000 / iterations
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер запросов до и после индексов')
+    parser.add_argument('--records', type=int, default=100_000)
+    parser.add_argument('--purchases', type=int, default=1_000_000)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    sizes = {
+        'companies': 50,
+        'musicians': 20_000,
+        'ensembles': 2_000,
+        'members': 40_000,
+        'compositions': 50_000,
+        'performances': 200_000,
+        'records': args.records,
+        'tracks': args.records * 3,
+        'users': 50_000,
+        'purchases': args.purchases,
+        'carts': 100_000,
+    }
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.environ['DATABASE_PATH'] = path
+    try:
+        init_database(force_recreate=True)
+        conn = sqlite3.connect(path)
+        drop_indexes(conn)
+        print('Заполнение базы...')
+        populate(conn, sizes, random.Random(42))
+
+        before = run_queries(conn, sizes, args.iterations, seed=1)
+        started = time.perf_counter()
+        create_indexes(conn)
+        conn.execute('ANALYZE')
+        conn.commit()
+        build_time = time.perf_counter() - started
+        after = run_queries(conn, sizes, args.iterations, seed=1)
+        conn.close()
+
+        print(f"\nЗаписей: {sizes['records']}, покупок: {sizes['purchases']}")
+        print(f'Создание индексов: {build_time:.1f} с\n')
+        print(f"{'Запрос':<32}{'до, мс':>12}{'после, мс':>12}{'ускорение':>12}")
+        for name in before:
+            speedup = before[name] / after[name] if after[name] else float('inf')
+            print(f'{name:<32}{before[name]:>12.2f}{after[name]:>12.2f}{speedup:>11.0f}x')
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Стоимость страницы каталога: OFFSET против постраничного вывода по ключу
+
+Использование:
+    python benchmarks/bench_pagination.py [--records 1000000] [--page-size 50]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db_pool  # noqa: E402
+import queries  # noqa: E402
+from database import init_database  # noqa: E402
+from pagination import encode_cursor  # noqa: E402
+
+
+def populate(conn, count, rnd):
+    conn.executemany(
+        '''INSERT INTO records (catalog_number, title, company_id, release_date,
+                                retail_price, current_stock, sold_this_year)
+           VALUES (?, ?, 1, ?, ?, ?, ?)''',
+        ((f'BENCH-{i}', f'Пластинка {rnd.random():.8f}',
+          f'{rnd.randint(1950, 2024)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}',
+          round(rnd.uniform(5, 50), 2), rnd.choice((0, rnd.randint(1, 100))), rnd.randint(0, 500))
+         for i in range(count)))
+    conn.execute('ANALYZE')
+    conn.commit()
+
+
+def timed(fn, repeat=5):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер постраничного вывода каталога')
+    parser.add_argument('--records', type=int, default=1_000_000)
+    parser.add_argument('--page-size', type=int, default=50)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.environ['DATABASE_PATH'] = path
+    try:
+        init_database(force_recreate=True)
+        conn = db_pool.connect(path)
+        print('Заполнение базы...')
+        populate(conn, args.records, random.Random(42))
+        in_stock = conn.execute('SELECT COUNT(*) FROM records WHERE current_stock > 0').fetchone()[0]
+
+        print(f'\nПластинок: {args.records}, в наличии: {in_stock}, страница: {args.page_size}')
+        print(f"{'Сортировка':<14}{'Страница':>10}{'OFFSET, мс':>14}{'по ключу, мс':>16}")
+        for sort, order in queries.CATALOG.orders.items():
+            offset_sql = f'''
+                SELECT r.*, comp.name as company_name
+                FROM records r JOIN companies comp ON r.company_id = comp.id
+                WHERE r.current_stock > 0
+                ORDER BY {order.order_by()}
+                LIMIT ? OFFSET ?
+            '''
+            for fraction in (0, 0.5, 0.99):
+                skip = int(in_stock * fraction)
+                number = skip // args.page_size + 1
+                # Курсор - последняя строка предыдущей страницы
+                cursor = None
+                if skip:
+                    prev = conn.execute(offset_sql.replace('r.*, comp.name as company_name', ', '.join(
+                        f'{c} AS _sort_{i}' for i, c in enumerate(order.columns))),
+                        (1, skip - 1)).fetchone()
+                    cursor = encode_cursor(sort, list(prev))
+                offset_ms = timed(lambda: conn.execute(offset_sql, (args.page_size, skip)).fetchall())
+                keyset_ms = timed(lambda: queries.CATALOG.page(conn, sort=sort, cursor=cursor,
+                                                               limit=args.page_size))
+                print(f'{sort:<14}{number:>10}{offset_ms:>14.2f}{keyset_ms:>16.2f}')
+        conn.close()
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
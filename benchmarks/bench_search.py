@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Поиск по названию: LIKE '%...%' против FTS5 (search.py)
+
+Использование:
+    python benchmarks/bench_search.py [--records 1000000] [--iterations 20]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db_pool  # noqa: E402
+import search  # noqa: E402
+from database import init_database  # noqa: E402
+
+GENRES = ['симфония', 'концерт', 'соната', 'квартет', 'ноктюрн', 'прелюдия', 'фуга', 'сюита']
+SYLLABLES = ['ба', 'ве', 'ги', 'до', 'ёж', 'жу', 'зо', 'ки', 'ла', 'ми', 'но', 'пе', 'ру', 'со',
+             'ти', 'фа', 'ха', 'це', 'ша', 'щу', 'эм', 'юл', 'яр', 'ор', 'ан', 'ин', 'ст', 'ск']
+
+
+def vocabulary(rnd, size):
+    """Синтетические слова (фамилии, названия), каждое встречается в немногих записях"""
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(3, 5))))
+    return sorted(words)
+
+
+def populate(conn, count, rnd, words):
+    conn.executemany(
+        'INSERT INTO records (catalog_number, title, company_id, retail_price) VALUES (?, ?, 1, 10)',
+        ((f'BENCH-{i}', f'{rnd.choice(GENRES)} {rnd.choice(words)} {rnd.choice(words)} №{rnd.randint(1, 99)}')
+         for i in range(count)))
+    conn.commit()
+
+
+def timed(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) * 1000 / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер полнотекстового поиска')
+    parser.add_argument('--records', type=int, default=1_000_000)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.environ['DATABASE_PATH'] = path
+    try:
+        init_database(force_recreate=True)
+        conn = db_pool.connect(path)
+        print('Заполнение базы...')
+        rnd = random.Random(42)
+        words = vocabulary(rnd, max(args.records // 50, 100))
+        populate(conn, args.records, rnd, words)
+        # Редкие слова, префикс, два слова, частое слово жанра
+        sample = rnd.sample(words, 3)
+        queries = [sample[0], sample[1][:4], f'{sample[2]} соната', 'симфония']
+
+        print(f'\nПластинок: {args.records}, первая страница из {search.DEFAULT_LIMIT} строк')
+        print(f"{'Запрос':<24}{'LIKE, мс':>12}{'FTS5, мс':>12}")
+        for text in queries:
+            words = search.normalize(text).split()
+            like_sql = ('SELECT * FROM records WHERE '
+                        + ' AND '.join("replace(title, 'ё', 'е') LIKE ?" for _ in words)
+                        + ' ORDER BY title LIMIT ?')
+            like_params = [f'%{w}%' for w in words] + [search.DEFAULT_LIMIT]
+            like_ms = timed(lambda: conn.execute(like_sql, like_params).fetchall(), args.iterations)
+            fts_ms = timed(lambda: search.search(conn, text), args.iterations)
+            print(f'{text:<24}{like_ms:>12.2f}{fts_ms:>12.2f}')
+        conn.close()
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
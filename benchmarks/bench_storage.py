@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Доля хранилища во времени маршрутов: SQLite против хранилища в памяти
+
+Одни и те же страницы запрашиваются через тестовый клиент с STORAGE=sqlite
+и STORAGE=memory. В памяти запросы к данным почти ничего не стоят, поэтому
+время маршрута на нем - Flask и шаблоны, а разница - доля SQLite.
+
+Использование:
+    python benchmarks/bench_storage.py [--scale 1] [--requests 200]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db_pool  # noqa: E402
+import repository  # noqa: E402
+import seed  # noqa: E402
+from app import app  # noqa: E402
+from database import init_database  # noqa: E402
+
+# (роль, id пользователя, адрес)
+ROUTES = [
+    ('buyer', 3, '/'),
+    ('buyer', 3, '/catalog'),
+    ('buyer', 3, '/catalog?sort=popularity'),
+    ('buyer', 3, '/cart'),
+    ('buyer', 3, '/personal_cabinet'),
+    ('buyer', 3, '/compositions_count'),
+    ('buyer', 3, '/compositions_count?ensemble_id=1'),
+    ('buyer', 3, '/ensemble_records?ensemble_id=1'),
+    ('buyer', 3, '/sales_leaders'),
+    ('director', 1, '/manage_records'),
+    ('director', 1, '/manage_ensembles'),
+    ('director', 1, '/manage_users'),
+]
+
+
+def client_for(role, user_id):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['role'] = role
+    return client
+
+
+def measure(storage, requests):
+    """Среднее время каждого маршрута в мс"""
+    app.config['STORAGE'] = storage
+    clients = {}
+    results = []
+    for role, user_id, url in ROUTES:
+        client = clients.setdefault(role, client_for(role, user_id))
+        # Прогрев: пул соединений, кэши, загрузка хранилища в память
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f'{url}: {response.status_code}')
+        started = time.perf_counter()
+        for _ in range(requests):
+            client.get(url)
+        results.append((time.perf_counter() - started) * 1000 / requests)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер доли хранилища во времени маршрутов')
+    parser.add_argument('--scale', type=float, default=1)
+    parser.add_argument('--requests', type=int, default=200, help='запросов на маршрут')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.environ['DATABASE_PATH'] = path
+    try:
+        init_database(force_recreate=True)
+        loader = multiprocessing.Process(target=seed.seed, args=(path, args.scale))
+        loader.start()
+        loader.join()
+        app.config['DATABASE'] = path
+        app.config['SECRET_KEY'] = 'bench'
+
+        sqlite_ms = measure('sqlite', args.requests)
+        memory_ms = measure('memory', args.requests)
+
+        print(f"\nМасштаб: {args.scale}, запросов на маршрут: {args.requests}")
+        print(f"{'маршрут':<36}{'sqlite':>10}{'память':>10}{'хранилище':>12}")
+        for (_, _, url), sqlite_time, memory_time in zip(ROUTES, sqlite_ms, memory_ms):
+            share = max(sqlite_time - memory_time, 0) / sqlite_time * 100
+            print(f'{url:<36}{sqlite_time:>7.2f} мс{memory_time:>7.2f} мс{share:>11.0f}%')
+    finally:
+        repository.reset_memory()
+        db_pool.close_pools()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Кэш результатов запросов в памяти процесса
+
+Кэш действителен, пока не изменилась версия в таблице cache_versions
+(миграция 0005). Версию увеличивают триггеры по исходным таблицам, поэтому
+проверка - один поиск по первичному ключу, а изменения, сделанные другим
+процессом или вручную в базе, тоже сбрасывают кэш.
+"""
+import threading
+
+import queries
+
+
+class VersionedCache:
+    """Результат loader(conn), перезагружаемый при смене версии name"""
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, conn, key=None):
+        """Значение из кэша или заново загруженное при смене версии
+
+        key отделяет кэши разных баз (например, путь к БД).
+        """
+        version = queries.CACHE_VERSION.scalar(conn, (self.name,))
+        with self._lock:
+            entry = self._entries.get(key)
+            if version is not None and entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+        value = self.loader(conn)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (version, value)
+        return value
+
+    def invalidate(self):
+        """Принудительный сброс кэша этого процесса"""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,355 @@
+"""
+Хранилище корзин покупателей
+
+Каждое изменение корзины - транзакция записи. В рабочей базе такие
+транзакции стоят в одной очереди к писателю с покупками и оформлением
+заказов. Хранилище выбирается app.config['CART_STORE']:
+
+  main   - таблица cart рабочей базы (по умолчанию);
+  sqlite - отдельный файл CART_DB_PATH (carts.db рядом с базой) со своим
+           WAL и своим писателем: корзины не ждут покупок, покупки - корзин;
+  memory - корзины в памяти процесса с отложенной записью в тот же файл
+           раз в CART_FLUSH_INTERVAL секунд (при сбое теряются изменения
+           корзин за последний интервал; только для одного процесса).
+
+В режимах sqlite и memory рабочая база затрагивается только при
+оформлении: товары читаются из хранилища корзин, покупки и остатки
+пишутся одной транзакцией рабочей базы, после фиксации оформленные товары
+удаляются из корзины. Пластинки для показа корзины читаются из рабочей
+базы соединением чтения. При первом открытии файла корзин в него
+переносится содержимое таблицы cart рабочей базы.
+"""
+import atexit
+import logging
+import os
+import threading
+
+from flask import current_app
+
+import db_pool
+import queries
+from repository import MemoryCarts, SqliteCarts, get_repository, run_write
+
+logger = logging.getLogger(__name__)
+
+STORES = ('main', 'sqlite', 'memory')
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+# Отдельные операторы, а не скрипт: executescript фиксирует открытую транзакцию
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS cart (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        record_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 1,
+        added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_cart_user_record ON cart (user_id, record_id)',
+)
+
+
+class SqliteCartStore:
+    """Корзины в отдельном файле SQLite со своим писателем"""
+
+    def __init__(self, path, main_path, pragmas=None):
+        self.path = path
+        conn = db_pool.connect(path, pragmas)
+        try:
+            # Проверка, создание и перенос - одна транзакция записи: второй процесс,
+            # открывающий файл одновременно, ждет ее и видит уже созданную таблицу
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'cart'").fetchone():
+                    self._create(conn, main_path)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        finally:
+            conn.close()
+        # Ожидание писателя и пула файла корзин копится отдельно от рабочей базы
+        self.read_stats = db_pool.LockStats()
+        self.write_stats = db_pool.LockStats()
+        self.writer = db_pool.Writer(path, pragmas, stats=self.write_stats)
+        self.readers = db_pool.ConnectionPool(path, pragmas, readonly=True, stats=self.read_stats)
+
+    @staticmethod
+    def _create(conn, main_path):
+        """Создание таблицы и перенос корзин из рабочей базы"""
+        for statement in SCHEMA:
+            conn.execute(statement)
+        main = db_pool.connect(main_path, readonly=True)
+        try:
+            rows = queries.CART_ALL.all(main)
+        finally:
+            main.close()
+        queries.CART_RESTORE.executemany(conn, [
+            (row['id'], row['user_id'], row['record_id'], row['quantity'], row['added_at'])
+            for row in rows])
+
+    def write(self, fn):
+        """Выполнение fn(соединение) в транзакции файла корзин"""
+        conn = self.writer.acquire()
+        try:
+            result = fn(conn)
+            conn.commit()
+        finally:
+            self.writer.release(conn)
+        return result
+
+    def _read(self, fn):
+        conn = self.readers.acquire()
+        try:
+            return fn(conn)
+        finally:
+            self.readers.release(conn)
+
+    def rows(self, user_id):
+        return [dict(row) for row in self._read(lambda conn: queries.CART_ROWS.all(conn, (user_id,)))]
+
+    def all_rows(self):
+        return [dict(row) for row in self._read(queries.CART_ALL.all)]
+
+    def add(self, user_id, record_id, quantity):
+        self.write(lambda conn: SqliteCarts(conn).add(user_id, record_id, quantity))
+
+    def decrease(self, cart_id, user_id):
+        return self.write(lambda conn: SqliteCarts(conn).decrease(cart_id, user_id))
+
+    def remove(self, cart_id, user_id):
+        self.write(lambda conn: SqliteCarts(conn).remove(cart_id, user_id))
+
+    def remove_ordered(self, user_id, ordered):
+        """Снятие оформленного: ordered - пары (строка корзины, количество)"""
+        def subtract_all(conn):
+            carts = SqliteCarts(conn)
+            for cart_id, quantity in ordered:
+                carts.subtract(cart_id, user_id, quantity)
+        self.write(subtract_all)
+
+    def clear(self, user_id):
+        self.write(lambda conn: SqliteCarts(conn).clear(user_id))
+
+    def lock_stats(self):
+        return {'read': self.read_stats.as_dict(), 'write': self.write_stats.as_dict()}
+
+    def close(self):
+        self.writer.close_all()
+        self.readers.close_all()
+
+
+class MemoryCartStore:
+    """Корзины в памяти процесса с отложенной записью в файл корзин
+
+    Поток записи раз в interval секунд переписывает в файле корзины
+    пользователей, измененные с прошлой записи.
+    """
+
+    def __init__(self, file, interval=DEFAULT_FLUSH_INTERVAL):
+        self.file = file
+        self.lock = threading.Lock()
+        self.tables = {'cart': {row['id']: row for row in file.all_rows()}}
+        self._next_id = max(self.tables['cart'], default=0) + 1
+        self.carts = MemoryCarts(self)
+        self._dirty = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+        self._thread.start()
+
+    def next_id(self, table):
+        value = self._next_id
+        self._next_id += 1
+        return value
+
+    def _change(self, user_id, fn):
+        with self.lock:
+            self._dirty.add(user_id)
+            return fn(self.carts)
+
+    def rows(self, user_id):
+        with self.lock:
+            return [dict(row) for row in self.carts.rows(user_id)]
+
+    def add(self, user_id, record_id, quantity):
+        self._change(user_id, lambda carts: carts.add(user_id, record_id, quantity))
+
+    def decrease(self, cart_id, user_id):
+        return self._change(user_id, lambda carts: carts.decrease(cart_id, user_id))
+
+    def remove(self, cart_id, user_id):
+        self._change(user_id, lambda carts: carts.remove(cart_id, user_id))
+
+    def remove_ordered(self, user_id, ordered):
+        def subtract_all(carts):
+            for cart_id, quantity in ordered:
+                carts.subtract(cart_id, user_id, quantity)
+        self._change(user_id, subtract_all)
+
+    def clear(self, user_id):
+        self._change(user_id, lambda carts: carts.clear(user_id))
+
+    def flush(self):
+        """Запись в файл корзин, измененных с прошлой записи"""
+        with self.lock:
+            dirty, self._dirty = self._dirty, set()
+            snapshot = {user_id: [dict(row) for row in self.carts.rows(user_id)] for user_id in dirty}
+        if not snapshot:
+            return
+
+        def save(conn):
+            for user_id, rows in snapshot.items():
+                queries.CART_CLEAR.execute(conn, (user_id,))
+                queries.CART_RESTORE.executemany(conn, [
+                    (row['id'], row['user_id'], row['record_id'], row['quantity'], row['added_at'])
+                    for row in rows])
+
+        try:
+            self.file.write(save)
+        except Exception:
+            # Следующая запись повторит этих пользователей
+            with self.lock:
+                self._dirty |= dirty
+            raise
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Корзины не записаны в %s', self.file.path)
+
+    def lock_stats(self):
+        return self.file.lock_stats()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        self.file.close()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def database_path(app):
+    """Файл корзин: CART_DB_PATH или carts.db рядом с рабочей базой"""
+    return app.config.get('CART_DB_PATH') or os.path.join(
+        os.path.dirname(os.path.abspath(app.config['DATABASE'])), 'carts.db')
+
+
+def get_store(app=None):
+    """Отдельное хранилище корзин процесса или None для режима main"""
+    app = app or current_app
+    kind = app.config['CART_STORE']
+    if kind == 'main':
+        return None
+    if kind not in STORES:
+        raise ValueError(f'Неизвестное хранилище корзин: {kind} (варианты: {", ".join(STORES)})')
+    key = (os.getpid(), kind, database_path(app))
+    with _stores_lock:
+        if key not in _stores:
+            file = SqliteCartStore(database_path(app), app.config['DATABASE'], app.config.get('DB_PRAGMAS'))
+            _stores[key] = file if kind == 'sqlite' else MemoryCartStore(
+                file, app.config['CART_FLUSH_INTERVAL'])
+        return _stores[key]
+
+
+def lock_stats(app=None):
+    """Ожидание соединений файла корзин или None в режиме main (корзины ждут писателя рабочей базы)"""
+    store = get_store(app)
+    return None if store is None else store.lock_stats()
+
+
+def close_stores():
+    """Закрытие хранилищ корзин (корзины в памяти перед этим записываются в файл)"""
+    with _stores_lock:
+        for key, store in list(_stores.items()):
+            if key[0] == os.getpid():
+                store.close()
+        _stores.clear()
+
+
+atexit.register(close_stores)
+
+
+def _with_records(rows, records):
+    """Строки корзины с данными пластинки и компании (как CART_ITEMS), новые первыми"""
+    items = []
+    for row in sorted(rows, key=lambda row: (row['added_at'], row['id']), reverse=True):
+        record = records.get(row['record_id'])
+        if record:
+            items.append(dict(row, title=record['title'], catalog_number=record['catalog_number'],
+                              retail_price=record['retail_price'], retail_price_cents=record['retail_price_cents'],
+                              current_stock=record['current_stock'],
+                              company_name=records.company_name(record['company_id'])))
+    return items
+
+
+def items(user_id):
+    """Товары корзины с пластинкой и компанией, новые первыми"""
+    store = get_store()
+    if store is None:
+        return get_repository().carts.items(user_id)
+    return _with_records(store.rows(user_id), get_repository().records)
+
+
+def add(user_id, record_id, quantity):
+    store = get_store()
+    if store is None:
+        return run_write(lambda repo: repo.carts.add(user_id, record_id, quantity))
+    return store.add(user_id, record_id, quantity)
+
+
+def decrease(cart_id, user_id):
+    """Уменьшение количества на 1 (при 1 - удаление); остаток или None, если товара нет"""
+    store = get_store()
+    if store is None:
+        return run_write(lambda repo: repo.carts.decrease(cart_id, user_id))
+    return store.decrease(cart_id, user_id)
+
+
+def remove(cart_id, user_id):
+    store = get_store()
+    if store is None:
+        return run_write(lambda repo: repo.carts.remove(cart_id, user_id))
+    return store.remove(cart_id, user_id)
+
+
+def clear(user_id):
+    store = get_store()
+    if store is None:
+        return run_write(lambda repo: repo.carts.clear(user_id))
+    return store.clear(user_id)
+
+
+def checkout(user_id, order):
+    """Оформление корзины: order(хранилище, товары, placed) в транзакции записи рабочей базы
+
+    order возвращает (категория, сообщение, страница) и вызывает placed(),
+    если заказ оформлен в этой транзакции: тогда оформленные товары
+    удаляются из корзины. В режиме main - в той же транзакции, иначе после
+    ее фиксации. Повтор с сохраненным результатом (idempotency.py) placed()
+    не вызывает, и корзина, собранная после заказа, остается. Вне рабочей
+    базы товары читаются до транзакции, поэтому снимается только оформленное
+    количество: добавленное за время оформления остается в корзине.
+    """
+    store = get_store()
+    if store is None:
+        return run_write(lambda repo: order(repo, repo.carts.checkout_items(user_id),
+                                            lambda: repo.carts.clear(user_id)))
+
+    cart_items = store.rows(user_id)
+    placed = []
+    result = run_write(lambda repo: order(repo, cart_items, lambda: placed.append(True)))
+    if placed:
+        store.remove_ordered(user_id, [(item['id'], item['quantity']) for item in cart_items])
+    return result
+
+
+def init_app(app):
+    """Выбор хранилища корзин: CART_STORE=main (по умолчанию), sqlite или memory"""
+    app.config.setdefault('CART_STORE', os.environ.get('CART_STORE', 'main'))
+    app.config.setdefault('CART_DB_PATH', os.environ.get('CART_DB_PATH'))
+    app.config.setdefault('CART_FLUSH_INTERVAL',
+                          float(os.environ.get('CART_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)))
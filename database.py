@@ -1,6 +1,8 @@
 import sqlite3
 import os
 
+import migrations
+
 def init_database(force_recreate=False):
     """Инициализация базы данных с созданием всех необходимых таблиц"""
     
@@ -25,6 +27,10 @@ def init_database(force_recreate=False):
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
     
+    # Свободные страницы возвращаются файлу по частям (manage_db.py vacuum --incremental);
+    # режим задается до создания первой таблицы
+    cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    
     # Таблица музыкантов
     cursor.execute('''
         CREATE TABLE musicians (
@@ -180,9 +186,61 @@ def init_database(force_recreate=False):
     insert_test_data(cursor)
     
     conn.commit()
+    
+    # Индексы и последующие изменения схемы - через версионированные миграции
+    migrations.upgrade(conn)
+    
     conn.close()
     print("База данных успешно создана!")
 
+# Индексы по внешним ключам и горячим фильтрам маршрутов app.py
+INDEXES = [
+    # compositions_count, ensemble_records: исполнения ансамбля
+    ('idx_performances_ensemble', 'performances (ensemble_id, composition_id)'),
+    ('idx_performances_composition', 'performances (composition_id)'),
+    # ensemble_records: треки пластинки и пластинки исполнения
+    ('idx_record_tracks_record', 'record_tracks (record_id, performance_id)'),
+    ('idx_record_tracks_performance', 'record_tracks (performance_id, record_id)'),
+    ('idx_ensemble_members_ensemble', 'ensemble_members (ensemble_id, musician_id)'),
+    ('idx_ensemble_members_musician', 'ensemble_members (musician_id)'),
+    ('idx_compositions_composer', 'compositions (composer_id)'),
+    ('idx_records_company', 'records (company_id)'),
+    # manage_records: сортировка по названию
+    ('idx_records_title', 'records (title)'),
+    # manage_records: сортировка по цене (в копейках), дате выпуска и популярности
+    ('idx_records_price_cents', 'records (COALESCE(retail_price_cents, 0))'),
+    ('idx_records_release', "records (COALESCE(release_date, ''))"),
+    ('idx_records_popularity', 'records (sold_this_year)'),
+    # catalog: только товары в наличии, те же порядки (частичные индексы)
+    ('idx_records_in_stock_title', 'records (title) WHERE current_stock > 0'),
+    ('idx_records_in_stock_price_cents', 'records (COALESCE(retail_price_cents, 0)) WHERE current_stock > 0'),
+    ('idx_records_in_stock_release', "records (COALESCE(release_date, '')) WHERE current_stock > 0"),
+    ('idx_records_in_stock_popularity', 'records (sold_this_year) WHERE current_stock > 0'),
+    # sales_leaders: только проданные в этом году (частичный индекс)
+    ('idx_records_sold_this_year', 'records (sold_this_year DESC) WHERE sold_this_year > 0'),
+    # personal_cabinet: история покупок пользователя по дате (обратный проход)
+    ('idx_purchases_user_date', 'purchases (user_id, purchase_date)'),
+    ('idx_purchases_record', 'purchases (record_id)'),
+    # перевод учетного года и пересчет счетчиков продаж
+    ('idx_purchases_date', 'purchases (purchase_date)'),
+    # cart, add_to_cart, checkout: корзина пользователя
+    ('idx_cart_user_record', 'cart (user_id, record_id)'),
+    ('idx_ensembles_name', 'ensembles (name)'),
+    ('idx_companies_name', 'companies (name)'),
+    # manage_users: сначала новые (обратный проход)
+    ('idx_users_created_at', 'users (created_at)'),
+]
+
+def create_indexes(cursor):
+    """Создание вторичных индексов (идемпотентно, можно выполнять на рабочей БД)"""
+    for name, definition in INDEXES:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {definition}')
+
+def drop_indexes(cursor):
+    """Удаление вторичных индексов (для массовой загрузки и замеров)"""
+    for name, _ in INDEXES:
+        cursor.execute(f'DROP INDEX IF EXISTS {name}')
+
 def insert_test_data(cursor):
     """Вставка тестовых данных в базу"""
     
@@ -0,0 +1,311 @@
+"""
+Пул соединений SQLite, привязанный к контексту приложения Flask
+
+SQLite допускает много читателей и одного писателя, поэтому соединения
+разделены на два пути:
+  get_db()    - соединение только для чтения (URI mode=ro) из пула;
+  run_write() - транзакция на единственном на процесс пишущем соединении:
+                оно выдается под блокировкой с открытой транзакцией
+                BEGIN IMMEDIATE и освобождается сразу после фиксации или
+                отката, а не в конце запроса.
+Время ожидания на каждом пути копится отдельно (lock_stats()).
+"""
+import os
+import pathlib
+import queue
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g
+
+from group_commit import GroupCommitter
+
+# Профиль PRAGMA, применяемый один раз при открытии каждого соединения.
+# Переопределяется через app.config['DB_PRAGMAS'].
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,      # отрицательное значение - размер в КиБ (~20 МБ)
+    'mmap_size': 268435456,    # 256 МБ
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,      # мс
+}
+
+# Эти PRAGMA меняют файл базы и не применяются к соединениям только для чтения
+_WRITE_ONLY_PRAGMAS = {'journal_mode'}
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_STATEMENT_CACHE_SIZE = 256
+
+
+def connect(path, pragmas=None, cached_statements=DEFAULT_STATEMENT_CACHE_SIZE,
+            readonly=False, isolation_level=''):
+    """Открытие настроенного соединения с базой данных"""
+    if readonly:
+        uri = pathlib.Path(path).resolve().as_uri() + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, cached_statements=cached_statements,
+                               check_same_thread=False)
+    else:
+        conn = sqlite3.connect(path, cached_statements=cached_statements,
+                               check_same_thread=False, isolation_level=isolation_level)
+    conn.row_factory = sqlite3.Row
+    pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+    if readonly:
+        pragmas = {k: v for k, v in pragmas.items() if k not in _WRITE_ONLY_PRAGMAS}
+    apply_pragmas(conn, pragmas)
+    return conn
+
+
+def apply_pragmas(conn, pragmas):
+    """Применение профиля PRAGMA к соединению"""
+    for name, value in pragmas.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+
+
+class LockStats:
+    """Статистика ожидания на пути чтения или записи"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait):
+        with self._lock:
+            self.count += 1
+            self.total_wait += wait
+            if wait > self.max_wait:
+                self.max_wait = wait
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total_wait_ms': round(self.total_wait * 1000, 3),
+            'avg_wait_ms': round(self.total_wait * 1000 / self.count, 3) if self.count else 0.0,
+            'max_wait_ms': round(self.max_wait * 1000, 3),
+        }
+
+
+READ_STATS = LockStats()
+WRITE_STATS = LockStats()
+
+
+def lock_stats():
+    """Время ожидания соединения: чтение - получение из пула, запись - блокировка писателя и BEGIN IMMEDIATE"""
+    return {'read': READ_STATS.as_dict(), 'write': WRITE_STATS.as_dict()}
+
+
+class ConnectionPool:
+    """Пул переиспользуемых соединений с одной базой данных"""
+
+    def __init__(self, path, pragmas=None, max_size=DEFAULT_POOL_SIZE,
+                 cached_statements=DEFAULT_STATEMENT_CACHE_SIZE, readonly=False, attach=(), stats=None):
+        self.path = path
+        # Ожидание копится в stats (по умолчанию - путь чтения рабочей базы)
+        self.stats = READ_STATS if stats is None else stats
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self.cached_statements = cached_statements
+        self.readonly = readonly
+        # (схема, путь): базы, подключаемые к новому соединению только для чтения
+        self.attach = tuple(attach)
+        self._idle = queue.LifoQueue(maxsize=max_size)
+
+    def acquire(self):
+        """Получение соединения из пула (или открытие нового)"""
+        started = time.perf_counter()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = connect(self.path, self.pragmas, self.cached_statements,
+                           readonly=self.readonly)
+            for schema, path in self.attach:
+                conn.execute(f'ATTACH DATABASE ? AS {schema}', (pathlib.Path(path).resolve().as_uri() + '?mode=ro',))
+        self.stats.record(time.perf_counter() - started)
+        return conn
+
+    def release(self, conn):
+        """Возврат соединения в пул"""
+        # Незавершенная транзакция не должна перейти к следующему запросу
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        """Закрытие всех простаивающих соединений"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class Writer:
+    """Единственное пишущее соединение процесса, выдаваемое по очереди"""
+
+    def __init__(self, path, pragmas=None, cached_statements=DEFAULT_STATEMENT_CACHE_SIZE, stats=None):
+        self.path = path
+        self.stats = WRITE_STATS if stats is None else stats
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self.cached_statements = cached_statements
+        self.conn = None
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Захват писателя и открытие транзакции BEGIN IMMEDIATE"""
+        started = time.perf_counter()
+        self._lock.acquire()
+        try:
+            if self.conn is None:
+                # isolation_level IMMEDIATE - и неявные транзакции после commit()
+                # тоже сразу берут блокировку записи
+                self.conn = connect(self.path, self.pragmas, self.cached_statements,
+                                    isolation_level='IMMEDIATE')
+            self.conn.execute('BEGIN IMMEDIATE')
+        except Exception:
+            self._lock.release()
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return self.conn
+
+    def release(self, conn):
+        """Откат незавершенной транзакции и освобождение писателя"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        finally:
+            self._lock.release()
+
+    def close_all(self):
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_or_create(key, factory):
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = factory()
+                _pools[key] = pool
+    return pool
+
+
+def get_pool(app=None):
+    """Пул соединений только для чтения для текущего процесса и пути к БД"""
+    app = app or current_app
+    # Соединения SQLite нельзя переносить через fork, поэтому пул - на процесс
+    key = (os.getpid(), app.config['DATABASE'], 'read')
+    return _get_or_create(key, lambda: ConnectionPool(
+        app.config['DATABASE'],
+        pragmas=app.config.get('DB_PRAGMAS'),
+        max_size=app.config.get('DB_POOL_SIZE', DEFAULT_POOL_SIZE),
+        cached_statements=app.config.get('DB_STATEMENT_CACHE_SIZE', DEFAULT_STATEMENT_CACHE_SIZE),
+        readonly=True,
+    ))
+
+
+def get_readonly_pool(path, attach=()):
+    """Пул соединений только для чтения с файлом path вне конфигурации приложения
+
+    attach - пары (схема, путь) баз, подключаемых к каждому соединению
+    (архив покупок: файл года - main, рабочая база - store).
+    """
+    key = (os.getpid(), path, 'read', tuple(attach))
+    return _get_or_create(key, lambda: ConnectionPool(path, readonly=True, attach=attach))
+
+
+def get_writer(app=None):
+    """Пишущее соединение для текущего процесса и пути к БД"""
+    app = app or current_app
+    key = (os.getpid(), app.config['DATABASE'], 'write')
+    return _get_or_create(key, lambda: Writer(
+        app.config['DATABASE'],
+        pragmas=app.config.get('DB_PRAGMAS'),
+        cached_statements=app.config.get('DB_STATEMENT_CACHE_SIZE', DEFAULT_STATEMENT_CACHE_SIZE),
+    ))
+
+
+def get_group_committer(app=None):
+    """Групповой фиксатор записей для текущего процесса и пути к БД"""
+    app = app or current_app
+    window = app.config['GROUP_COMMIT_WINDOW_MS'] / 1000
+    key = (os.getpid(), app.config['DATABASE'], 'group', window)
+    writer = get_writer(app)
+    return _get_or_create(key, lambda: GroupCommitter(writer, window))
+
+
+def get_db():
+    """Соединение для чтения текущего контекста (открывается при первом запросе)"""
+    if 'db' not in g:
+        g.db = get_pool().acquire()
+    return g.db
+
+
+def run_write(fn):
+    """Выполнение fn(conn) в транзакции записи с фиксацией; возвращает результат fn
+
+    При включенной групповой фиксации (GROUP_COMMIT_WINDOW_MS > 0) операция
+    объединяется с параллельными записями в одну транзакцию. Иначе писатель
+    освобождается сразу после фиксации или отката (write_transaction).
+    """
+    if current_app.config.get('GROUP_COMMIT_WINDOW_MS'):
+        return get_group_committer().submit(fn)
+    return write_transaction(fn)
+
+
+def write_transaction(fn):
+    """Выполнение fn(conn) в отдельной транзакции записи; писатель освобождается сразу
+
+    Исключение fn откатывает транзакцию (Writer.release). Длинные операции
+    пакетами (импорт) вызывают ее на каждый пакет: между пакетами писатель
+    достается другим запросам, а не удерживается до конца запроса.
+    """
+    writer = get_writer()
+    conn = writer.acquire()
+    try:
+        result = fn(conn)
+        conn.commit()
+    finally:
+        writer.release(conn)
+    return result
+
+
+def release_db(exception=None):
+    """Возврат соединения чтения при завершении контекста"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().release(conn)
+
+
+def close_pools():
+    """Закрытие всех пулов (например, при смене пути к БД)"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_all()
+        _pools.clear()
+
+
+def init_app(app):
+    """Регистрация пула соединений в приложении Flask"""
+    app.config.setdefault('DATABASE', os.environ.get('DATABASE_PATH', 'music_store.db'))
+    app.config.setdefault('DB_PRAGMAS', dict(DEFAULT_PRAGMAS))
+    app.config.setdefault('DB_POOL_SIZE', int(os.environ.get('DB_POOL_SIZE', DEFAULT_POOL_SIZE)))
+    app.config.setdefault('DB_STATEMENT_CACHE_SIZE', DEFAULT_STATEMENT_CACHE_SIZE)
+    # Окно групповой фиксации покупок и корзины, мс (0 - выключено)
+    app.config.setdefault('GROUP_COMMIT_WINDOW_MS', float(os.environ.get('GROUP_COMMIT_WINDOW_MS', 0)))
+    app.teardown_appcontext(release_db)
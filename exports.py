@@ -0,0 +1,136 @@
+"""
+Потоковая выгрузка данных в CSV и JSONL (для директора)
+
+Строки читаются курсором пакетами (Query.iterate) и сразу форматируются
+в текстовые куски, которые веб-ответ отдает клиенту по мере готовности,
+поэтому память не зависит от числа строк. Запросы выгрузок идут в порядке
+индексов и не сортируют результат целиком; сводка продаж агрегируется
+помесячно. Суммы читаются в копейках и выводятся в рублях с двумя знаками.
+Покупки и сводка продаж включают архивные годы (archive.py):
+архив старше рабочей базы, поэтому годы выгружаются по порядку перед ней.
+"""
+import csv
+import io
+import json
+from datetime import date, timedelta
+
+import archive
+import queries
+from money import format_money
+
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+BATCH_SIZE = 1000
+
+
+def _date(value):
+    return date.fromisoformat(value) if value else None
+
+
+def _int(value):
+    return int(value) if value else None
+
+
+def parse_filters(args):
+    """Фильтры выгрузки из параметров запроса (или argparse): ValueError при ошибке"""
+    return {
+        'date_from': _date(args.get('date_from')),
+        'date_to': _date(args.get('date_to')),
+        'company_id': _int(args.get('company_id')),
+        'user_id': _int(args.get('user_id')),
+    }
+
+
+def _date_range(filters):
+    """Полуинтервал дат покупок [начало, конец) - дата окончания включительно"""
+    start = filters['date_from'].isoformat() if filters['date_from'] else ''
+    end = (filters['date_to'] + timedelta(days=1)).isoformat() if filters['date_to'] else '9999-12-31'
+    return start, end
+
+
+def _purchases(conn, filters, archive_dir):
+    start, end = _date_range(filters)
+    params = (start, end, filters['company_id'], filters['user_id'])
+    db_path = archive.database_path(conn)
+    for year in archive.years(archive_dir or archive.directory(db_path), start, end):
+        with archive.year_connection(db_path, year, archive_dir) as year_conn:
+            yield from queries.EXPORT_PURCHASES.iterate(year_conn, params, BATCH_SIZE)
+    yield from queries.EXPORT_PURCHASES.iterate(conn, params, BATCH_SIZE)
+
+
+def _records(conn, filters, archive_dir):
+    return queries.EXPORT_RECORDS.iterate(conn, (filters['company_id'],), BATCH_SIZE)
+
+
+def _monthly_sales(conn, start, end, company_id):
+    first, last = queries.PURCHASE_DATE_RANGE.one(conn, (start, end))
+    if first is None:
+        return
+    month = date(int(first[:4]), int(first[5:7]), 1)
+    while month.isoformat() <= last:
+        next_month = (month + timedelta(days=32)).replace(day=1)
+        month_start = max(month.isoformat(), start)
+        month_end = min(next_month.isoformat(), end)
+        yield from queries.EXPORT_SALES.iterate(conn, (month_start, month_end, company_id), BATCH_SIZE)
+        month = next_month
+
+
+def _sales(conn, filters, archive_dir):
+    start, end = _date_range(filters)
+    company_id = filters['company_id']
+    db_path = archive.database_path(conn)
+    # Сводка архивного года - не больше 12 месяцев на компанию; годы считаются параллельно
+    years = archive.years(archive_dir or archive.directory(db_path), start, end)
+    for batches in archive.gather(db_path, years,
+                                  lambda year_conn: list(_monthly_sales(year_conn, start, end, company_id)),
+                                  archive_dir):
+        yield from batches
+    yield from _monthly_sales(conn, start, end, company_id)
+
+
+# Имя выгрузки: (заголовок столбцов, источник пакетов строк)
+EXPORTS = {
+    'purchases': (['id', 'purchase_date', 'username', 'catalog_number', 'title', 'company_name',
+                   'quantity', 'price'], _purchases),
+    'records': (['catalog_number', 'title', 'company_name', 'release_date', 'wholesale_price',
+                 'retail_price', 'current_stock', 'sold_this_year', 'sold_last_year'], _records),
+    'sales': (['month', 'company_name', 'purchases', 'quantity', 'revenue'], _sales),
+}
+
+# Столбцы сумм: запросы отдают копейки
+MONEY_COLUMNS = {'price', 'wholesale_price', 'retail_price', 'revenue'}
+
+
+def _formatted(batches, columns):
+    positions = [i for i, column in enumerate(columns) if column in MONEY_COLUMNS]
+    for batch in batches:
+        rows = []
+        for row in batch:
+            row = list(row)
+            for i in positions:
+                if row[i] is not None:
+                    row[i] = format_money(row[i])
+            rows.append(row)
+        yield rows
+
+
+def stream(conn, name, fmt, filters, archive_dir=None):
+    """Генератор текстовых кусков выгрузки name в формате fmt ('csv' или 'jsonl')
+
+    archive_dir - каталог архива покупок (None - каталог по умолчанию для базы conn).
+    """
+    columns, source = EXPORTS[name]
+    batches = _formatted(source(conn, filters, archive_dir), columns)
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        yield buffer.getvalue()
+        for batch in batches:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(batch)
+            yield buffer.getvalue()
+    else:
+        for batch in batches:
+            yield ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in batch)
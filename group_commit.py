@@ -0,0 +1,108 @@
+"""
+Групповая фиксация транзакций записи
+
+Запросы на запись, пришедшие в пределах короткого окна, выполняются в
+одной транзакции и фиксируются одним COMMIT (один fsync на группу).
+Каждая операция выполняется внутри своей точки сохранения (SAVEPOINT),
+поэтому ошибка одной операции откатывает только ее, а остальные
+фиксируются; каждый запрос получает собственный результат или исключение.
+
+Схема "лидер-последователи": первый запрос без активного лидера сам
+становится лидером, ждет окно, забирает накопленные операции и выполняет
+их на пишущем соединении; остальные ждут готовности своего результата.
+"""
+import threading
+import time
+
+
+class _Operation:
+    """Операция записи и ее результат"""
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.done = False
+        self.result = None
+        self.error = None
+
+
+class GroupCommitter:
+    """Объединение параллельных операций записи в общие транзакции"""
+
+    def __init__(self, writer, window):
+        self.writer = writer
+        self.window = window
+        self._cond = threading.Condition()
+        self._pending = []
+        self._leader_active = False
+        self.batches = 0
+        self.operations = 0
+
+    def submit(self, fn):
+        """Выполнение fn(conn) в групповой транзакции; возвращает результат fn"""
+        op = _Operation(fn)
+        with self._cond:
+            self._pending.append(op)
+            while not op.done and self._leader_active:
+                self._cond.wait()
+            if not op.done:
+                self._leader_active = True
+                lead = True
+            else:
+                lead = False
+
+        if lead:
+            try:
+                if self.window:
+                    time.sleep(self.window)
+                with self._cond:
+                    batch, self._pending = self._pending, []
+                self._run(batch)
+            finally:
+                with self._cond:
+                    self._leader_active = False
+                    self._cond.notify_all()
+
+        if op.error is not None:
+            raise op.error
+        return op.result
+
+    def _run(self, batch):
+        """Выполнение пакета операций в одной транзакции"""
+        try:
+            conn = self.writer.acquire()
+        except Exception as e:
+            self._finish(batch, error=e)
+            return
+        succeeded = []
+        try:
+            for op in batch:
+                conn.execute('SAVEPOINT group_op')
+                try:
+                    op.result = op.fn(conn)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO group_op')
+                    op.error = e
+                else:
+                    succeeded.append(op)
+                conn.execute('RELEASE group_op')
+            conn.commit()
+            self.batches += 1
+            self.operations += len(batch)
+        except Exception as e:
+            # Группа не зафиксирована: успешные операции тоже получают ошибку
+            for op in batch:
+                if op in succeeded or op.error is None:
+                    op.result, op.error = None, e
+        finally:
+            self.writer.release(conn)
+            self._finish(batch)
+
+    def close_all(self):
+        """Соединением владеет писатель; закрывать нечего"""
+
+    def _finish(self, batch, error=None):
+        with self._cond:
+            for op in batch:
+                if error is not None:
+                    op.error = error
+                op.done = True
@@ -0,0 +1,135 @@
+"""
+Ключи идемпотентности покупки и оформления заказа
+
+Двойной клик и повтор запроса прокси (nginx.conf) присылают тот же POST
+/buy_record/<id> или /checkout еще раз. Форма передает ключ в скрытом поле
+idempotency_key (новый при каждом показе страницы), клиент API - в
+заголовке Idempotency-Key. Результат операции (категория, сообщение,
+страница) записывается в таблицу idempotency_keys (миграция 0011) в той же
+транзакции, что и покупки, и в LRU-кэш процесса. Повтор с тем же ключом
+получает сохраненный результат: из кэша - без обращения к базе, из
+таблицы - одним чтением, без транзакции записи. Запросы без ключа
+выполняются как раньше.
+
+Ключ действует IDEMPOTENCY_TTL секунд; просроченные строки удаляются не
+чаще раза в PURGE_INTERVAL секунд в транзакции очередной операции.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import current_app, request
+
+from repository import get_repository
+
+DEFAULT_TTL = 3600
+DEFAULT_CACHE_SIZE = 10000
+PURGE_INTERVAL = 60
+MAX_KEY_LENGTH = 100
+
+
+class OutcomeCache:
+    """LRU-кэш результатов по (пользователь, ключ) с ограничением возраста"""
+
+    def __init__(self, size=DEFAULT_CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name, ttl):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or time.monotonic() - entry[0] > ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, name, outcome):
+        with self._lock:
+            self._entries[name] = (time.monotonic(), outcome)
+            self._entries.move_to_end(name)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+cache = OutcomeCache()
+_last_purge = 0.0
+
+
+def new_key():
+    """Ключ для скрытого поля формы"""
+    return uuid.uuid4().hex
+
+
+def request_key():
+    """Ключ текущего запроса (заголовок Idempotency-Key или поле формы) или None"""
+    key = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key')
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return None
+    return key
+
+
+def _purge_due():
+    global _last_purge
+    now = time.monotonic()
+    if now - _last_purge < PURGE_INTERVAL:
+        return False
+    _last_purge = now
+    return True
+
+
+def once(user_id, run):
+    """Результат операции запроса, выполненной не более одного раза на ключ
+
+    run(guard) выполняет операцию в транзакции записи и вызывает в ней
+    guard(хранилище, action): action() возвращает (категория, сообщение,
+    страница) и выполняется, только если ключа еще нет в базе; результат
+    записывается с ключом в той же транзакции. Операция, завершившаяся
+    исключением, откатывается вместе с ключом, и повтор выполнит ее заново.
+    """
+    key = request_key()
+    if key is None:
+        return run(lambda repo, action: action())
+    ttl = current_app.config['IDEMPOTENCY_TTL']
+    outcome = cache.get((user_id, key), ttl)
+    if outcome:
+        return outcome
+    # Ключ мог сохранить другой процесс
+    outcome = get_repository().idempotency.get(user_id, key, ttl)
+    if outcome:
+        cache.put((user_id, key), outcome)
+        return outcome
+
+    def guard(repo, action):
+        # Повтор, пришедший, пока первый запрос ждал писателя или выполнялся
+        stored = repo.idempotency.get(user_id, key, ttl)
+        if stored:
+            return stored
+        result = action()
+        repo.idempotency.add(user_id, key, result)
+        if _purge_due():
+            repo.idempotency.purge(ttl)
+        return result
+
+    outcome = tuple(run(guard))
+    cache.put((user_id, key), outcome)
+    return outcome
+
+
+def init_app(app):
+    """Время жизни ключа (IDEMPOTENCY_TTL, с) и размер кэша; new_key() - в шаблонах как idempotency_key()"""
+    app.config.setdefault('IDEMPOTENCY_TTL', int(os.environ.get('IDEMPOTENCY_TTL', DEFAULT_TTL)))
+    app.config.setdefault('IDEMPOTENCY_CACHE_SIZE',
+                          int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', DEFAULT_CACHE_SIZE)))
+    cache.size = app.config['IDEMPOTENCY_CACHE_SIZE']
+    app.context_processor(lambda: {'idempotency_key': new_key})
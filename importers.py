@@ -0,0 +1,478 @@
+"""
+Массовый импорт: прайс-листы пластинок и граф музыкальных данных
+
+import_records - синхронизация пластинок с прайс-листом (CSV или JSONL)
+по catalog_number.
+
+Файл читается потоком и делится на пакеты строк; пакеты разбираются
+и проверяются в пуле процессов, а основной процесс сравнивает их с
+существующими пластинками (поиск по UNIQUE catalog_number) и записывает
+только новые и изменившиеся строки - одна короткая транзакция на пакет.
+
+Столбцы: catalog_number (обязателен), title, company_id или company
+(название компании), release_date (ГГГГ-ММ-ДД), wholesale_price,
+retail_price, current_stock. Отсутствующее или пустое поле сохраняет
+текущее значение; для новой пластинки обязательны title и компания.
+
+import_graph - загрузка связанных сущностей (музыканты, ансамбли,
+произведения, исполнения, пластинки, дорожки) из JSONL: ссылки по
+естественным ключам разрешаются через словари в памяти, каждая таблица
+вставляется одним executemany.
+"""
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+from datetime import date
+
+import queries
+from money import to_cents, to_rubles
+
+CHUNK_SIZE = 5000
+
+# Сколько сообщений об ошибках строк сохраняется в итоге
+MAX_ERRORS = 20
+
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+# Цены - в копейках (money.to_cents), как в столбцах *_cents
+FIELDS = ('title', 'company_id', 'release_date', 'wholesale_price_cents', 'retail_price_cents', 'current_stock')
+REQUIRED_FOR_INSERT = ('title', 'company_id')
+
+
+def format_for(filename):
+    """Формат файла по расширению ('csv' или 'jsonl')"""
+    fmt = FORMATS.get(os.path.splitext(filename)[1].lower())
+    if fmt is None:
+        raise ValueError(f'Неизвестный формат файла: {filename} (ожидается .csv или .jsonl)')
+    return fmt
+
+
+def connection_writer(conn):
+    """Функция записи для отдельного соединения: write(fn) выполняет fn(conn) в транзакции"""
+    def write(fn):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = fn(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return result
+    return write
+
+
+# --- Разбор (выполняется в процессах пула) ---
+
+_companies = {}
+
+
+def _init_worker(companies):
+    """companies: {название в нижнем регистре: id} и {id: id} для проверки ссылок"""
+    global _companies
+    _companies = companies
+
+
+def _number(value, convert):
+    if isinstance(value, str):
+        value = value.strip().replace(',', '.')
+    number = convert(value)
+    if number < 0:
+        raise ValueError('отрицательное значение')
+    return number
+
+
+def _parse_row(raw):
+    """Проверка и приведение строки; возвращает (catalog_number, {поле: значение})"""
+    raw = {key.strip(): value.strip() if isinstance(value, str) else value
+           for key, value in raw.items() if key is not None}
+    catalog_number = raw.get('catalog_number')
+    if not catalog_number:
+        raise ValueError('не указан catalog_number')
+    values = {}
+    for field in ('title', 'company_id', 'company', 'release_date',
+                  'wholesale_price', 'retail_price', 'current_stock'):
+        value = raw.get(field)
+        if value is None or value == '':
+            continue
+        if field == 'title':
+            values['title'] = str(value)
+        elif field == 'company_id':
+            company_id = int(value)
+            if company_id not in _companies:
+                raise ValueError(f'компания {company_id} не найдена')
+            values['company_id'] = company_id
+        elif field == 'company':
+            company_id = _companies.get(str(value).lower())
+            if company_id is None:
+                raise ValueError(f'компания «{value}» не найдена')
+            values.setdefault('company_id', company_id)
+        elif field == 'release_date':
+            values['release_date'] = date.fromisoformat(str(value)).isoformat()
+        elif field == 'current_stock':
+            values['current_stock'] = _number(value, int)
+        else:
+            values[f'{field}_cents'] = _number(value, to_cents)
+    return str(catalog_number), values
+
+
+def _parse_chunk(task):
+    """Разбор пакета: task = (формат, заголовок CSV, строки, номер первой строки)
+
+    Возвращает ([(номер строки, catalog_number, значения)], [(номер строки, ошибка)]).
+    """
+    fmt, header, lines, first_line = task
+    if fmt == 'csv':
+        reader = csv.DictReader(lines, fieldnames=header)
+        numbered = ((first_line + reader.line_num - 1, raw) for raw in reader)
+    else:
+        numbered = ((first_line + i, line) for i, line in enumerate(lines) if line.strip())
+    rows, errors = [], []
+    for line_no, raw in numbered:
+        try:
+            if fmt == 'jsonl':
+                raw = json.loads(raw)
+                if not isinstance(raw, dict):
+                    raise ValueError('ожидается объект JSON')
+            rows.append((line_no, *_parse_row(raw)))
+        except (TypeError, ValueError) as e:
+            errors.append((line_no, str(e)))
+    return rows, errors
+
+
+# --- Чтение и запись (основной процесс) ---
+
+def _tasks(stream, fmt, chunk_size):
+    """Пакеты строк файла; в CSV пакет не разрывает поле в кавычках с переводом строки"""
+    header = None
+    line_no = 1
+    if fmt == 'csv':
+        header = [name.strip() for name in next(csv.reader([stream.readline()]), [])]
+        if 'catalog_number' not in header:
+            raise ValueError('В заголовке CSV нет столбца catalog_number')
+        line_no = 2
+    lines, first_line, quoted = [], line_no, False
+    for line in stream:
+        lines.append(line)
+        line_no += 1
+        if fmt == 'csv' and line.count('"') % 2:
+            quoted = not quoted
+        if len(lines) >= chunk_size and not quoted:
+            yield fmt, header, lines, first_line
+            lines, first_line = [], line_no
+    if lines:
+        yield fmt, header, lines, first_line
+
+
+def _apply(conn, rows, summary):
+    """Запись пакета: новые пластинки - INSERT, изменившиеся - UPDATE"""
+    latest = {}
+    for line_no, catalog_number, values in rows:
+        latest[catalog_number] = (line_no, values)
+    # Строка: id, catalog_number и значения FIELDS по порядку
+    existing = {row[1]: row for row in
+                queries.RECORDS_BY_CATALOG.all(conn, (json.dumps(list(latest), ensure_ascii=False),))}
+    inserts, updates = [], []
+    for catalog_number, (line_no, values) in latest.items():
+        current = existing.get(catalog_number)
+        if current is None:
+            if any(field not in values for field in REQUIRED_FOR_INSERT):
+                _error(summary, line_no, f'новая пластинка {catalog_number}: нужны название и компания')
+                continue
+            inserts.append((catalog_number, values['title'], values['company_id'],
+                            values.get('release_date'), values.get('wholesale_price_cents'),
+                            values.get('retail_price_cents'), values.get('current_stock', 0)))
+            continue
+        stored = list(current[2:])
+        merged = [values.get(field, value) for field, value in zip(FIELDS, stored)]
+        if merged == stored:
+            summary['unchanged'] += 1
+        else:
+            updates.append((catalog_number, *merged, current[0]))
+    if inserts:
+        queries.INSERT_RECORD.executemany(conn, inserts)
+    if updates:
+        # В порядке id - соседние строки таблицы обновляются подряд
+        updates.sort(key=lambda row: row[-1])
+        queries.UPDATE_RECORD.executemany(conn, updates)
+    summary['inserted'] += len(inserts)
+    summary['updated'] += len(updates)
+
+
+def _error(summary, line_no, message):
+    summary['rejected'] += 1
+    if len(summary['errors']) < MAX_ERRORS:
+        summary['errors'].append((line_no, message))
+
+
+def import_records(stream, fmt, write, companies, workers=None, chunk_size=CHUNK_SIZE, log=None):
+    """Синхронизация пластинок с прайс-листом
+
+    stream - текстовый поток файла, fmt - 'csv' или 'jsonl', write(fn) -
+    выполнение fn(conn) в транзакции записи (connection_writer или
+    db_pool.write_transaction), companies - строки (id, name) компаний.
+    Возвращает {'inserted', 'updated', 'unchanged', 'rejected', 'errors'}.
+    """
+    log = log or (lambda message: None)
+    lookup = {}
+    for company_id, name in companies:
+        lookup.setdefault(name.lower(), company_id)
+        lookup[company_id] = company_id
+    workers = workers or multiprocessing.cpu_count()
+    summary = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0, 'errors': []}
+
+    tasks = _tasks(stream, fmt, chunk_size)
+    pool = None
+    _init_worker(lookup)
+    try:
+        while True:
+            # Окно из нескольких пакетов на процесс: файл читается потоком,
+            # а не целиком в очередь пула
+            window = list(itertools.islice(tasks, workers * 2))
+            if not window:
+                break
+            if pool is None and workers > 1 and len(window) > 1:
+                # spawn - пул безопасно создается и из многопоточного веб-сервера
+                pool = multiprocessing.get_context('spawn').Pool(
+                    workers, initializer=_init_worker, initargs=(lookup,))
+            for rows, errors in (pool.imap if pool else map)(_parse_chunk, window):
+                for line_no, message in errors:
+                    _error(summary, line_no, message)
+                if rows:
+                    write(lambda conn: _apply(conn, rows, summary))
+            log(f"добавлено {summary['inserted']}, обновлено {summary['updated']}, "
+                f"без изменений {summary['unchanged']}, отклонено {summary['rejected']}")
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    summary['errors'].sort()
+    return summary
+
+
+# --- Граф музыкальных данных ---
+
+# Виды строк JSONL графа в порядке загрузки (сначала те, на кого ссылаются)
+GRAPH_ORDER = ('company', 'musician', 'ensemble', 'member', 'composition', 'performance', 'record', 'track')
+
+
+def _field(obj, name, convert=str):
+    value = obj.get(name)
+    if value is None or value == '':
+        raise ValueError(f'не указано поле {name}')
+    return convert(value)
+
+
+def _optional(obj, name, convert):
+    value = obj.get(name)
+    return None if value is None or value == '' else convert(value)
+
+
+def _ref(ids, obj, name, what, required=True):
+    """id сущности по естественному ключу из поля name (или None для необязательной ссылки)"""
+    value = obj.get(name)
+    if value is None or value == '':
+        if required:
+            raise ValueError(f'не указано поле {name}')
+        return None
+    entity_id = ids.get((value,))
+    if entity_id is None:
+        raise ValueError(f'не найден(а) {what} «{value}»')
+    return entity_id
+
+
+def _release_date(value):
+    return date.fromisoformat(str(value)).isoformat()
+
+
+def _price(value):
+    return _number(value, to_cents)
+
+
+def _stock(value):
+    return _number(value, int)
+
+
+def _load_table(conn, kind, table, columns, items, resolve, existing_sql, summary, referenced=()):
+    """Загрузка строк одного вида; возвращает {естественный ключ: id}
+
+    resolve(obj) -> (ключ, значения столбцов) или ValueError. Существующие
+    строки читаются одним запросом по первым компонентам ключей строк и
+    ссылок на этот вид из других строк файла (referenced) - existing_sql
+    с json_each возвращает строки (id, *ключ); новым строкам id
+    назначаются подряд после MAX(id), поэтому ссылки на них разрешаются
+    без lastrowid, а вся таблица вставляется одним executemany.
+    """
+    resolved = []
+    for line_no, obj in items:
+        try:
+            resolved.append((line_no, *resolve(obj)))
+        except (TypeError, ValueError) as e:
+            _error(summary, line_no, str(e))
+
+    ids = {}
+    lookup = {key[0] for _, key, _ in resolved} | set(referenced)
+    if existing_sql and lookup:
+        lookup = json.dumps(sorted(lookup, key=str), ensure_ascii=False)
+        for row in conn.execute(existing_sql, (lookup,)):
+            # При совпадении естественных ключей в базе берется строка с меньшим id
+            ids.setdefault(tuple(row[1:]), row[0])
+        summary['statements'] += 1
+
+    next_id = conn.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {table}').fetchone()[0]
+    rows = []
+    for line_no, key, values in resolved:
+        if key in ids:
+            summary['existing'][kind] += 1
+            continue
+        ids[key] = next_id
+        rows.append((next_id, *values))
+        next_id += 1
+    if rows:
+        conn.executemany(f"INSERT INTO {table} (id, {', '.join(columns)}) "
+                         f"VALUES ({', '.join('?' * (len(columns) + 1))})", rows)
+    summary['inserted'][kind] += len(rows)
+    summary['statements'] += 2
+    return ids
+
+
+def _referenced(items, *fields):
+    """Значения полей-ссылок строк файла: _referenced(items, ('record', 'company'), ...)"""
+    return {obj[field] for kind, field in fields for _, obj in items[kind] if obj.get(field)}
+
+
+def _load_graph(conn, items, summary):
+    def company(obj):
+        name = _field(obj, 'name')
+        return (name,), (name, obj.get('address'), obj.get('phone'), obj.get('email'),
+                         bool(obj.get('is_wholesaler')))
+
+    companies = _load_table(conn, 'company', 'companies', ('name', 'address', 'phone', 'email', 'is_wholesaler'),
+                            items['company'], company,
+                            'SELECT id, name FROM companies WHERE name IN (SELECT value FROM json_each(?)) ORDER BY id',
+                            summary, _referenced(items, ('record', 'company')))
+
+    def musician(obj):
+        name = _field(obj, 'name')
+        return (name,), (name, _field(obj, 'role'), obj.get('instruments'),
+                         _optional(obj, 'birth_year', int), obj.get('country'))
+
+    musicians = _load_table(conn, 'musician', 'musicians', ('name', 'role', 'instruments', 'birth_year', 'country'),
+                            items['musician'], musician,
+                            'SELECT id, name FROM musicians WHERE name IN (SELECT value FROM json_each(?)) ORDER BY id',
+                            summary, _referenced(items, ('member', 'musician'), ('composition', 'composer'),
+                                                 ('performance', 'composer'), ('performance', 'conductor')))
+
+    def ensemble(obj):
+        name = _field(obj, 'name')
+        return (name,), (name, _field(obj, 'type'), _optional(obj, 'founded_year', int),
+                         obj.get('country'), obj.get('description'))
+
+    ensembles = _load_table(conn, 'ensemble', 'ensembles', ('name', 'type', 'founded_year', 'country', 'description'),
+                            items['ensemble'], ensemble,
+                            'SELECT id, name FROM ensembles WHERE name IN (SELECT value FROM json_each(?)) ORDER BY id',
+                            summary, _referenced(items, ('member', 'ensemble'), ('performance', 'ensemble')))
+
+    def member(obj):
+        ensemble_id = _ref(ensembles, obj, 'ensemble', 'ансамбль')
+        musician_id = _ref(musicians, obj, 'musician', 'музыкант')
+        return ((ensemble_id, musician_id),
+                (ensemble_id, musician_id, obj.get('role_in_ensemble'), _optional(obj, 'joined_year', int)))
+
+    _load_table(conn, 'member', 'ensemble_members', ('ensemble_id', 'musician_id', 'role_in_ensemble', 'joined_year'),
+                items['member'], member,
+                '''SELECT id, ensemble_id, musician_id FROM ensemble_members
+                   WHERE ensemble_id IN (SELECT value FROM json_each(?)) ORDER BY id''', summary)
+
+    def composition(obj):
+        composer_id = _ref(musicians, obj, 'composer', 'композитор', required=False)
+        title = _field(obj, 'title')
+        return ((title, composer_id),
+                (title, composer_id, obj.get('genre'), _optional(obj, 'year_composed', int),
+                 _optional(obj, 'duration_minutes', int)))
+
+    compositions = _load_table(conn, 'composition', 'compositions',
+                               ('title', 'composer_id', 'genre', 'year_composed', 'duration_minutes'),
+                               items['composition'], composition,
+                               '''SELECT id, title, composer_id FROM compositions
+                                  WHERE title IN (SELECT value FROM json_each(?)) ORDER BY id''',
+                               summary, _referenced(items, ('performance', 'composition')))
+
+    def performance(obj):
+        composer_id = _ref(musicians, obj, 'composer', 'композитор', required=False)
+        composition_id = compositions.get((_field(obj, 'composition'), composer_id))
+        if composition_id is None:
+            raise ValueError(f"не найдено произведение «{obj['composition']}»")
+        # У исполнения нет естественного ключа - дорожки ссылаются на key строки файла
+        return ((_field(obj, 'key'),),
+                (composition_id, _ref(ensembles, obj, 'ensemble', 'ансамбль'),
+                 _ref(musicians, obj, 'conductor', 'дирижер', required=False),
+                 _optional(obj, 'recording_date', _release_date), obj.get('venue')))
+
+    performances = _load_table(conn, 'performance', 'performances',
+                               ('composition_id', 'ensemble_id', 'conductor_id', 'recording_date', 'venue'),
+                               items['performance'], performance, None, summary)
+
+    def record(obj):
+        catalog_number = _field(obj, 'catalog_number')
+        # Цены - в копейках и их зеркало в рублях для столбцов DECIMAL
+        wholesale_cents = _optional(obj, 'wholesale_price', _price)
+        retail_cents = _optional(obj, 'retail_price', _price)
+        return (catalog_number,), (
+            catalog_number, _field(obj, 'title'), _ref(companies, obj, 'company', 'компания'),
+            _optional(obj, 'release_date', _release_date), wholesale_cents, retail_cents,
+            _optional(obj, 'current_stock', _stock) or 0, to_rubles(wholesale_cents), to_rubles(retail_cents))
+
+    records = _load_table(conn, 'record', 'records', ('catalog_number', 'title', 'company_id', 'release_date',
+                                                      'wholesale_price_cents', 'retail_price_cents', 'current_stock',
+                                                      'wholesale_price', 'retail_price'),
+                          items['record'], record,
+                          'SELECT id, catalog_number FROM records WHERE catalog_number IN (SELECT value FROM json_each(?))',
+                          summary, _referenced(items, ('track', 'record')))
+
+    def track(obj):
+        record_id = _ref(records, obj, 'record', 'пластинка')
+        track_number = _field(obj, 'track_number', int)
+        return ((record_id, track_number),
+                (record_id, _ref(performances, obj, 'performance', 'исполнение'), track_number))
+
+    _load_table(conn, 'track', 'record_tracks', ('record_id', 'performance_id', 'track_number'),
+                items['track'], track,
+                '''SELECT id, record_id, track_number FROM record_tracks
+                   WHERE record_id IN (SELECT value FROM json_each(?)) ORDER BY id''', summary)
+
+
+def import_graph(stream, write, log=None):
+    """Загрузка графа компании -> музыканты -> ансамбли -> составы -> произведения ->
+    исполнения -> пластинки -> дорожки из JSONL за один проход
+
+    Каждая строка - объект с полем kind (см. GRAPH_ORDER); ссылки задаются
+    естественными ключами: названиями, именами, каталожными номерами и key
+    исполнения. Существующие сущности переиспользуются, строки с
+    неразрешенными ссылками отклоняются; все таблицы загружаются в одной
+    транзакции write(fn). Возвращает {'inserted': {вид: n}, 'existing': {вид: n},
+    'rejected', 'errors', 'statements'}.
+    """
+    log = log or (lambda message: None)
+    summary = {'inserted': dict.fromkeys(GRAPH_ORDER, 0), 'existing': dict.fromkeys(GRAPH_ORDER, 0),
+               'rejected': 0, 'errors': [], 'statements': 0}
+    items = {kind: [] for kind in GRAPH_ORDER}
+    for line_no, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+            if not isinstance(obj, dict):
+                raise ValueError('ожидается объект JSON')
+            if obj.get('kind') not in items:
+                raise ValueError(f"неизвестный kind: {obj.get('kind')!r}")
+        except ValueError as e:
+            _error(summary, line_no, str(e))
+            continue
+        items[obj['kind']].append((line_no, obj))
+    log(', '.join(f'{kind}: {len(rows)}' for kind, rows in items.items()))
+
+    write(lambda conn: _load_graph(conn, items, summary))
+    summary['errors'].sort()
+    return summary
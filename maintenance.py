@@ -0,0 +1,154 @@
+"""
+Состояние и обслуживание файла базы данных
+
+Сводка для manage_db.py status (страницы, свободный список, размер WAL,
+строки таблиц и размеры индексов) и команды обслуживания: ANALYZE,
+выборочный пересбор статистики, VACUUM и проверка целостности.
+
+Статистика планировщика (sqlite_stat1) не хранит дату сбора, поэтому ее
+свежесть оценивается по числу строк: статистика устарела, если таблица
+с тех пор выросла или уменьшилась больше чем в STALE_RATIO раз или ни разу
+не анализировалась.
+"""
+import os
+import sqlite3
+from itertools import islice
+
+STALE_RATIO = 2
+# Строк индекса, просматриваемых ANALYZE при выборочном пересборе (PRAGMA analysis_limit)
+ANALYSIS_LIMIT = 1000
+
+AUTO_VACUUM = {0: 'none', 1: 'full', 2: 'incremental'}
+
+
+def _pragma(conn, name):
+    return conn.execute(f'PRAGMA {name}').fetchone()[0]
+
+
+def _tables(conn):
+    """Обычные таблицы схемы main без служебных и теневых таблиц FTS"""
+    return sorted(row[1] for row in conn.execute('PRAGMA main.table_list')
+                  if row[2] == 'table' and not row[1].startswith('sqlite_'))
+
+
+def _object_sizes(conn):
+    """Размер в байтах каждой таблицы и индекса по dbstat; None, если dbstat недоступен"""
+    try:
+        return dict(conn.execute("SELECT name, pgsize FROM dbstat WHERE aggregate = TRUE"))
+    except sqlite3.OperationalError:
+        return None
+
+
+def _estimated_rows(conn):
+    """Число строк таблиц по sqlite_stat1 на момент последнего ANALYZE"""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        return {}
+    estimated = {}
+    for table, stat in conn.execute('SELECT tbl, stat FROM sqlite_stat1'):
+        rows = int(stat.split()[0])
+        estimated[table] = max(rows, estimated.get(table, 0))
+    return estimated
+
+
+def _is_stale(estimated, actual):
+    if estimated is None:
+        return actual > 0
+    return max(estimated, actual) > STALE_RATIO * max(min(estimated, actual), 1)
+
+
+def stats(conn, db_path):
+    """Сводка о файле базы: страницы, WAL, таблицы и индексы"""
+    page_size = _pragma(conn, 'page_size')
+    wal_path = db_path + '-wal'
+    sizes = _object_sizes(conn)
+    estimated = _estimated_rows(conn)
+
+    tables = []
+    for name in _tables(conn):
+        rows = conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+        tables.append({
+            'name': name,
+            'rows': rows,
+            'bytes': sizes.get(name) if sizes is not None else None,
+            'analyzed_rows': estimated.get(name),
+            'stale': _is_stale(estimated.get(name), rows),
+        })
+    indexes = [{'name': name, 'table': table, 'bytes': sizes.get(name) if sizes is not None else None}
+               for name, table in conn.execute('''
+                   SELECT name, tbl_name FROM sqlite_master
+                   WHERE type = 'index' ORDER BY tbl_name, name
+               ''')]
+
+    return {
+        'page_size': page_size,
+        'page_count': _pragma(conn, 'page_count'),
+        'freelist_count': _pragma(conn, 'freelist_count'),
+        'auto_vacuum': AUTO_VACUUM[_pragma(conn, 'auto_vacuum')],
+        'journal_mode': _pragma(conn, 'journal_mode'),
+        'wal_bytes': os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+        'analyzed': bool(estimated),
+        'tables': tables,
+        'indexes': indexes,
+    }
+
+
+def stale_tables(conn):
+    """Таблицы, статистика планировщика которых устарела"""
+    estimated = _estimated_rows(conn)
+    stale = []
+    for name in _tables(conn):
+        rows = conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+        if _is_stale(estimated.get(name), rows):
+            stale.append(name)
+    return stale
+
+
+def analyze(conn):
+    """Полный ANALYZE всех таблиц"""
+    conn.execute('ANALYZE')
+    conn.commit()
+
+
+def optimize(conn):
+    """Пересбор статистики только устаревших таблиц (с ограничением просмотра) и PRAGMA optimize
+
+    Возвращает список пересобранных таблиц.
+    """
+    tables = stale_tables(conn)
+    conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+    for name in tables:
+        conn.execute(f'ANALYZE "{name}"')
+    conn.execute('PRAGMA optimize')
+    conn.commit()
+    return tables
+
+
+def vacuum(conn, incremental=False, pages=0):
+    """Возврат свободных страниц файлу; возвращает число страниц файла до и после
+
+    Полный VACUUM переписывает весь файл (запись в это время ждет) и заодно
+    включает auto_vacuum = INCREMENTAL, после чего свободные страницы можно
+    возвращать по частям: incremental=True освобождает до pages страниц
+    (0 - все) без перезаписи файла.
+    """
+    before = _pragma(conn, 'page_count')
+    if incremental:
+        if _pragma(conn, 'auto_vacuum') != 2:
+            raise ValueError('Режим auto_vacuum не incremental: сначала выполните полный VACUUM')
+        # Каждый шаг оператора освобождает одну страницу, а execute() делает только
+        # один шаг для PRAGMA без результата; executescript выполняет его до конца
+        conn.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+    else:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+    return before, _pragma(conn, 'page_count')
+
+
+def integrity_check(conn, quick=False, max_errors=100):
+    """Проверка целостности и внешних ключей; возвращает список ошибок (пустой - все в порядке)"""
+    pragma = 'quick_check' if quick else 'integrity_check'
+    problems = [row[0] for row in conn.execute(f'PRAGMA {pragma}({int(max_errors)})')]
+    problems = [] if problems == ['ok'] else problems
+    for table, rowid, parent, _ in islice(conn.execute('PRAGMA foreign_key_check'), max_errors):
+        problems.append(f'{table} rowid {rowid}: нет строки в {parent}')
+    return problems
@@ -3,51 +3,445 @@
 Скрипт для управления базой данных музыкального магазина
 """
 
-import sys
+import argparse
 import os
+import sqlite3
+import sys
+import time
+from datetime import date
+
+import archive
+import backup
+import exports
+import importers
+import maintenance
+import materialized
+import migrations
+import queries
+import sales
+import seed
 from database import init_database
 
-def main():
-    if len(sys.argv) < 2:
-        print("Использование:")
-        print("  python manage_db.py init     - создать базу данных (если не существует)")
-        print("  python manage_db.py recreate - пересоздать базу данных (удалить все данные)")
-        print("  python manage_db.py status   - проверить статус базы данных")
-        return
-    
-    command = sys.argv[1]
-    db_path = os.environ.get('DATABASE_PATH', 'music_store.db')
-    
-    if command == "init":
-        print("Инициализация базы данных...")
-        init_database(force_recreate=False)
-        print("✅ База данных готова к работе")
-        
-    elif command == "recreate":
-        print("⚠️  ВНИМАНИЕ: Это удалит все данные!")
-        confirm = input("Вы уверены? Введите 'yes' для подтверждения: ")
-        if confirm.lower() == 'yes':
-            print("Пересоздание базы данных...")
-            init_database(force_recreate=True)
-            print("✅ База данных пересоздана")
+
+def connect(db_path):
+    """Соединение для служебных команд"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA busy_timeout = 5000')
+    return conn
+
+
+def cmd_init(args):
+    print("Инициализация базы данных...")
+    init_database(force_recreate=False)
+    print("✅ База данных готова к работе")
+
+
+def cmd_recreate(args):
+    print("⚠️  ВНИМАНИЕ: Это удалит все данные!")
+    confirm = input("Вы уверены? Введите 'yes' для подтверждения: ")
+    if confirm.lower() == 'yes':
+        print("Пересоздание базы данных...")
+        init_database(force_recreate=True)
+        print("✅ База данных пересоздана")
+    else:
+        print("❌ Операция отменена")
+
+
+def _size(value):
+    if value is None:
+        return '—'
+    return f"{value / 2 ** 20:.1f} МБ" if value >= 2 ** 20 else f"{value / 1024:.0f} КБ"
+
+
+def cmd_status(args):
+    if not os.path.exists(args.db_path):
+        print(f"❌ База данных не найдена: {args.db_path}")
+        return
+    size = os.path.getsize(args.db_path)
+    print(f"✅ База данных существует: {args.db_path}")
+    print(f"📊 Размер: {size} байт")
+    conn = connect(args.db_path)
+    try:
+        info = maintenance.stats(conn, args.db_path)
+    finally:
+        conn.close()
+
+    free = info['freelist_count']
+    print(f"   страниц: {info['page_count']} по {info['page_size']} байт, "
+          f"свободных: {free} ({free / max(info['page_count'], 1):.1%})")
+    print(f"   журнал: {info['journal_mode']}, WAL: {_size(info['wal_bytes'])}, "
+          f"auto_vacuum: {info['auto_vacuum']}")
+
+    print("\nТаблицы (строк / размер / строк при последнем ANALYZE):")
+    for table in info['tables']:
+        mark = '⚠️ ' if table['stale'] else '  '
+        analyzed = '—' if table['analyzed_rows'] is None else table['analyzed_rows']
+        print(f"{mark} {table['name']:<28} {table['rows']:>10} {_size(table['bytes']):>10} {analyzed:>10}")
+    print("\nИндексы:")
+    for index in info['indexes']:
+        print(f"   {index['name']:<40} {index['table']:<20} {_size(index['bytes']):>10}")
+
+    stale = [table['name'] for table in info['tables'] if table['stale']]
+    if not info['analyzed']:
+        print("\n⚠️  Статистика планировщика не собиралась: python manage_db.py analyze")
+    elif stale:
+        print(f"\n⚠️  Статистика устарела ({', '.join(stale)}): python manage_db.py optimize")
+    if free > info['page_count'] // 4:
+        print("⚠️  Больше четверти страниц свободно: python manage_db.py vacuum"
+              + (" --incremental" if info['auto_vacuum'] == 'incremental' else ""))
+
+
+def cmd_migrate(args):
+    if not os.path.exists(args.db_path):
+        print(f"❌ База данных не найдена: {args.db_path}")
+        return
+    conn = connect(args.db_path)
+    try:
+        if args.action == 'status':
+            for migration, applied in migrations.status(conn):
+                mark = '✅' if applied else '⏳'
+                print(f"{mark} {migration.version:04d}_{migration.name}")
+            for task, last_rowid, rows_done in conn.execute(
+                    'SELECT task, last_rowid, rows_done FROM migration_progress ORDER BY task'):
+                print(f"   заполнение {task}: rowid <= {last_rowid}, строк: {rows_done}")
         else:
-            print("❌ Операция отменена")
-            
-    elif command == "status":
-        if os.path.exists(db_path):
-            size = os.path.getsize(db_path)
-            print(f"✅ База данных существует: {db_path}")
-            print(f"📊 Размер: {size} байт")
+            done = migrations.upgrade(conn, target=args.to, log=print)
+            if done:
+                print(f"✅ Применено миграций: {len(done)}")
+            else:
+                print("ℹ️  Схема актуальна")
+    finally:
+        conn.close()
+
+
+def cmd_sales(args):
+    if not os.path.exists(args.db_path):
+        print(f"❌ База данных не найдена: {args.db_path}")
+        return
+    conn = connect(args.db_path)
+    try:
+        if args.action == 'rollover':
+            year = sales.rollover(conn, args.year)
+            if year:
+                print(f"✅ Учетный год продаж переведен на {year}")
+            else:
+                print(f"ℹ️  Учетный год уже {sales.current_period(conn)}, перевод не нужен")
         else:
-            print(f"❌ База данных не найдена: {db_path}")
-            
+            sales.recount(conn)
+            print(f"✅ Счетчики продаж пересчитаны по покупкам ({sales.current_period(conn)} год)")
+    finally:
+        conn.close()
+
+
+def cmd_discography(args):
+    if not os.path.exists(args.db_path):
+        print(f"❌ База данных не найдена: {args.db_path}")
+        return
+    conn = connect(args.db_path)
+    try:
+        pairs = materialized.rebuild_discography(conn)
+        print(f"✅ Дискография ансамблей перестроена: {pairs} связей")
+    finally:
+        conn.close()
+
+
+def cmd_analyze(args):
+    if not os.path.exists(args.db_path):
+        print(f"❌ База данных не найдена: {args.db_path}")
+        return
+    conn = connect(args.db_path)
+    try:
+        maintenance.analyze(conn)
+        print("✅ Статистика планировщика собрана (ANALYZE)")
+    finally:
+        conn.close()
+
+
+def cmd_optimize(args):
+    if not os.path.exists(args.db_path):
+        print(f"❌ База данных не найдена: {args.db_path}")
+        return
+    conn = connect(args.db_path)
+    try:
+        tables = maintenance.optimize(conn)
+        if tables:
+            print(f"✅ Статистика пересобрана: {', '.join(tables)}")
+        else:
+            print("ℹ️  Статистика актуальна")
+    finally:
+        conn.close()
+
+
+def cmd_vacuum(args):
+    if not os.path.exists(args.db_path):
+        print(f"❌ База данных не найдена: {args.db_path}")
+        return
+    conn = connect(args.db_path)
+    try:
+        if not args.incremental:
+            print("⚠️  Полный VACUUM переписывает файл, запись на это время блокируется")
+        before, after = maintenance.vacuum(conn, incremental=args.incremental, pages=args.pages)
+        print(f"✅ Страниц в файле: {before} → {after}")
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+def cmd_integrity_check(args):
+    if not os.path.exists(args.db_path):
+        print(f"❌ База данных не найдена: {args.db_path}")
+        return
+    conn = connect(args.db_path)
+    try:
+        problems = maintenance.integrity_check(conn, quick=args.quick)
+    finally:
+        conn.close()
+    if not problems:
+        print("✅ Проверка целостности: ok")
+        return
+    print(f"❌ Найдено ошибок: {len(problems)}")
+    for problem in problems:
+        print(f"   {problem}")
+    sys.exit(1)
+
+
+def cmd_seed(args):
+    if os.path.exists(args.db_path) and not args.force:
+        print(f"❌ База данных уже существует: {args.db_path} (--force - пересоздать)")
+        return
+    print(f"Генерация данных: масштаб {args.scale}, seed {args.seed}...")
+
+    def init(path):
+        os.environ['DATABASE_PATH'] = path
+        try:
+            init_database(force_recreate=True)
+        finally:
+            os.environ['DATABASE_PATH'] = args.db_path
+
+    try:
+        counts = seed.build(args.db_path, args.scale, init, seed=args.seed, workers=args.workers,
+                            log=lambda message: print(f"   {message}"))
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    print(f"✅ Сгенерировано строк: {sum(counts.values())}")
+
+
+def cmd_import_records(args):
+    if not os.path.exists(args.db_path):
+        print(f"❌ База данных не найдена: {args.db_path}")
+        return
+    try:
+        fmt = args.format or importers.format_for(args.file)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    conn = connect(args.db_path)
+    conn.execute('PRAGMA cache_size = -200000')
+    try:
+        companies = queries.COMPANY_NAMES.all(conn)
+        with open(args.file, encoding='utf-8-sig', newline='') as stream:
+            summary = importers.import_records(stream, fmt, importers.connection_writer(conn), companies,
+                                               workers=args.workers, log=lambda message: print(f"   {message}"))
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    finally:
+        conn.close()
+    print(f"✅ Добавлено: {summary['inserted']}, обновлено: {summary['updated']}, "
+          f"без изменений: {summary['unchanged']}")
+    if summary['rejected']:
+        print(f"⚠️  Отклонено строк: {summary['rejected']}")
+        for line_no, message in summary['errors']:
+            print(f"   строка {line_no}: {message}")
+
+
+def cmd_import_graph(args):
+    if not os.path.exists(args.db_path):
+        print(f"❌ База данных не найдена: {args.db_path}")
+        return
+    conn = connect(args.db_path)
+    conn.execute('PRAGMA cache_size = -200000')
+    try:
+        with open(args.file, encoding='utf-8-sig') as stream:
+            summary = importers.import_graph(stream, importers.connection_writer(conn),
+                                             log=lambda message: print(f"   {message}"))
+    finally:
+        conn.close()
+    for kind in importers.GRAPH_ORDER:
+        print(f"   {kind}: добавлено {summary['inserted'][kind]}, уже было {summary['existing'][kind]}")
+    print(f"✅ Граф загружен, запросов к базе: {summary['statements']}")
+    if summary['rejected']:
+        print(f"⚠️  Отклонено строк: {summary['rejected']}")
+        for line_no, message in summary['errors']:
+            print(f"   строка {line_no}: {message}")
+
+
+def cmd_export(args):
+    if not os.path.exists(args.db_path):
+        print(f"❌ База данных не найдена: {args.db_path}")
+        return
+    try:
+        filters = exports.parse_filters(vars(args))
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    conn = connect(args.db_path)
+    try:
+        out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+        try:
+            for chunk in exports.stream(conn, args.name, args.format, filters):
+                out.write(chunk)
+        finally:
+            if args.output:
+                out.close()
+    finally:
+        conn.close()
+    if args.output:
+        print(f"✅ Выгрузка сохранена: {args.output}")
+
+
+def cmd_archive(args):
+    if not os.path.exists(args.db_path):
+        print(f"❌ База данных не найдена: {args.db_path}")
+        return
+    conn = connect(args.db_path)
+    try:
+        before = date.fromisoformat(args.before) if args.before else archive.cutoff_limit(conn)
+        print(f"Архивирование покупок раньше {before.replace(day=1).isoformat()}...")
+        moved = archive.archive(conn, before, args.dir, log=lambda message: print(f"   {message}"))
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+    if moved:
+        print(f"✅ Перенесено в архив покупок: {sum(moved.values())}")
     else:
-        print(f"❌ Неизвестная команда: {command}")
-        print("Доступные команды: init, recreate, status")
+        print("ℹ️  Нет покупок для архивирования")
 
-if __name__ == "__main__":
-    main()
 
+def cmd_backup(args):
+    if not os.path.exists(args.db_path):
+        print(f"❌ База данных не найдена: {args.db_path}")
+        return
+    while True:
+        print(f"Резервное копирование {args.db_path} в {args.dir}...")
+        try:
+            path = backup.backup(args.db_path, args.dir, pages=args.pages, sleep=args.sleep,
+                                 compress=args.gzip, check=not args.no_verify, keep=args.keep,
+                                 log=lambda message: print(f"   {message}"))
+            print(f"✅ Копия создана: {path}")
+        except (sqlite3.Error, OSError, RuntimeError) as e:
+            print(f"❌ Ошибка резервного копирования: {e}")
+            if not args.every:
+                sys.exit(1)
+        if not args.every:
+            return
+        time.sleep(args.every * 60)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Управление базой данных музыкального магазина")
+    parser.add_argument('--db', dest='db_path',
+                        default=os.environ.get('DATABASE_PATH', 'music_store.db'),
+                        help="путь к базе данных (по умолчанию DATABASE_PATH)")
+    commands = parser.add_subparsers(dest='command', metavar='команда')
+
+    commands.add_parser('init', help="создать базу данных (если не существует)").set_defaults(func=cmd_init)
+    commands.add_parser('recreate', help="пересоздать базу данных (удалить все данные)").set_defaults(func=cmd_recreate)
+    commands.add_parser('status', help="проверить статус базы данных").set_defaults(func=cmd_status)
+
+    commands.add_parser('analyze', help="собрать статистику планировщика (ANALYZE)").set_defaults(func=cmd_analyze)
+    commands.add_parser('optimize', help="пересобрать устаревшую статистику (PRAGMA optimize)") \
+        .set_defaults(func=cmd_optimize)
+    vacuum_cmd = commands.add_parser('vacuum', help="вернуть свободные страницы файлу (VACUUM)")
+    vacuum_cmd.add_argument('--incremental', action='store_true', help="по частям, без перезаписи файла")
+    vacuum_cmd.add_argument('--pages', type=int, default=0, help="сколько страниц освободить (0 - все)")
+    vacuum_cmd.set_defaults(func=cmd_vacuum)
+    check_cmd = commands.add_parser('integrity-check', help="проверить целостность и внешние ключи")
+    check_cmd.add_argument('--quick', action='store_true', help="PRAGMA quick_check вместо integrity_check")
+    check_cmd.set_defaults(func=cmd_integrity_check)
+
+    migrate = commands.add_parser('migrate', help="миграции схемы: up - применить, status - список")
+    migrate.add_argument('action', choices=['up', 'status'])
+    migrate.add_argument('--to', type=int, default=None, help="применить до версии включительно")
+    migrate.set_defaults(func=cmd_migrate)
+
+    sales_cmd = commands.add_parser('sales', help="счетчики продаж: rollover - перевод года, recount - пересчет")
+    sales_cmd.add_argument('action', choices=['rollover', 'recount'])
+    sales_cmd.add_argument('--year', type=int, default=None, help="новый учетный год (по умолчанию текущий)")
+    sales_cmd.set_defaults(func=cmd_sales)
+
+    discography = commands.add_parser('discography', help="rebuild - перестроить дискографию ансамблей")
+    discography.add_argument('action', choices=['rebuild'])
+    discography.set_defaults(func=cmd_discography)
+
+    import_cmd = commands.add_parser('import-records', help="синхронизировать пластинки с прайс-листом CSV/JSONL")
+    import_cmd.add_argument('file', help="файл .csv или .jsonl")
+    import_cmd.add_argument('--format', choices=['csv', 'jsonl'], default=None,
+                            help="формат (по умолчанию - по расширению файла)")
+    import_cmd.add_argument('--workers', type=int, default=None, help="число процессов разбора")
+    import_cmd.set_defaults(func=cmd_import_records)
+
+    graph_cmd = commands.add_parser('import-graph', help="загрузить музыкантов, ансамбли, произведения, "
+                                                          "исполнения и пластинки из JSONL")
+    graph_cmd.add_argument('file', help="файл .jsonl (строки с полем kind)")
+    graph_cmd.set_defaults(func=cmd_import_graph)
 
+    export_cmd = commands.add_parser('export', help="выгрузить покупки, остатки или сводку продаж")
+    export_cmd.add_argument('name', choices=sorted(exports.EXPORTS))
+    export_cmd.add_argument('--format', choices=sorted(exports.FORMATS), default='csv')
+    export_cmd.add_argument('--from', dest='date_from', default=None, help="покупки с даты ГГГГ-ММ-ДД")
+    export_cmd.add_argument('--to', dest='date_to', default=None, help="покупки по дату включительно")
+    export_cmd.add_argument('--company', dest='company_id', default=None, help="id компании")
+    export_cmd.add_argument('--user', dest='user_id', default=None, help="id покупателя")
+    export_cmd.add_argument('-o', '--output', default=None, help="файл (по умолчанию - stdout)")
+    export_cmd.set_defaults(func=cmd_export)
 
+    archive_cmd = commands.add_parser('archive', help="перенести старые покупки в архивные файлы по годам")
+    archive_cmd.add_argument('--before', default=None,
+                             help="граница ГГГГ-ММ-ДД (по умолчанию - начало прошлого учетного года)")
+    archive_cmd.add_argument('--dir', default=None,
+                             help="каталог архива (по умолчанию ARCHIVE_DIR или archive рядом с базой)")
+    archive_cmd.set_defaults(func=cmd_archive)
 
+    backup_cmd = commands.add_parser('backup', help="горячая резервная копия базы (backup API SQLite)")
+    backup_cmd.add_argument('--dir', default=os.environ.get('BACKUP_DIR', 'backups'),
+                            help="каталог копий (по умолчанию BACKUP_DIR или ./backups)")
+    backup_cmd.add_argument('--pages', type=int, default=backup.DEFAULT_PAGES, help="страниц за шаг")
+    backup_cmd.add_argument('--sleep', type=float, default=backup.DEFAULT_SLEEP, help="пауза между шагами, с")
+    backup_cmd.add_argument('--gzip', action='store_true', help="сжать копию")
+    backup_cmd.add_argument('--keep', type=int, default=backup.DEFAULT_KEEP, help="сколько последних копий хранить")
+    backup_cmd.add_argument('--no-verify', action='store_true', help="не проверять целостность копии")
+    backup_cmd.add_argument('--every', type=float, default=None,
+                            help="повторять каждые N минут (режим по расписанию)")
+    backup_cmd.set_defaults(func=cmd_backup)
+
+    seed_cmd = commands.add_parser('seed', help="пересоздать базу и заполнить синтетическими данными")
+    seed_cmd.add_argument('--scale', type=float, default=1,
+                          help="масштаб: 1 - 10 тыс. пластинок и 100 тыс. покупок")
+    seed_cmd.add_argument('--seed', type=int, default=42, help="зерно генератора (данные воспроизводимы)")
+    seed_cmd.add_argument('--workers', type=int, default=None, help="число процессов (по умолчанию - число ядер)")
+    seed_cmd.add_argument('--force', action='store_true', help="перезаписать существующую базу")
+    seed_cmd.set_defaults(func=cmd_seed)
+
+    return parser
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    if not args.command:
+        parser.print_help()
+        return
+    # init_database читает путь из DATABASE_PATH
+    os.environ['DATABASE_PATH'] = args.db_path
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Материализованные производные данные
+
+ensemble_discography - связь ансамбль -> пластинка (миграция 0004);
+search_index - полнотекстовый индекс названий (миграция 0007).
+Обе поддерживаются триггерами; здесь - полная перестройка из исходных
+таблиц (после массовой загрузки или для восстановления).
+"""
+
+# Источники search_index: вид (rowid = id * 8 + вид), таблица, столбец названия
+SEARCH_SOURCES = [
+    (1, 'records', 'title'),
+    (2, 'compositions', 'title'),
+    (3, 'musicians', 'name'),
+    (4, 'ensembles', 'name'),
+    (5, 'companies', 'name'),
+]
+
+
+def rebuild_discography(conn):
+    """Полная перестройка ensemble_discography в одной транзакции; возвращает число пар"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM ensemble_discography')
+        cursor = conn.execute('''
+            INSERT INTO ensemble_discography (ensemble_id, record_id)
+            SELECT DISTINCT p.ensemble_id, rt.record_id
+            FROM record_tracks rt
+            JOIN performances p ON rt.performance_id = p.id
+            JOIN records r ON rt.record_id = r.id
+        ''')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return cursor.rowcount
+
+
+def rebuild_search_index(conn):
+    """Полная перестройка search_index в одной транзакции; возвращает число строк"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM search_index')
+        total = 0
+        for kind, table, column in SEARCH_SOURCES:
+            total += conn.execute(f"""
+                INSERT INTO search_index (rowid, name)
+                SELECT id * 8 + {kind}, replace(replace({column}, 'ё', 'е'), 'Ё', 'Е') FROM {table}
+            """).rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return total
@@ -0,0 +1,187 @@
+"""
+Версионированные миграции схемы базы данных
+
+Миграции лежат в schema/migrations и применяются по порядку номеров:
+  NNNN_описание.sql - SQL-скрипт, выполняется в одной транзакции
+  NNNN_описание.py  - модуль с функцией upgrade(conn); для больших таблиц
+                      использует backfill(), который коммитит пакетами
+Примененные версии записываются в таблицу schema_version.
+"""
+import importlib.util
+import os
+import re
+import sqlite3
+import time
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema', 'migrations')
+
+_FILENAME_RE = re.compile(r'^(\d{4})_(\w+)\.(sql|py)$')
+
+
+class Migration:
+    """Файл миграции"""
+
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+
+    def __repr__(self):
+        return f'Migration({self.version}, {self.name!r})'
+
+
+def discover(directory=MIGRATIONS_DIR):
+    """Список миграций, упорядоченный по версии"""
+    migrations = []
+    for filename in os.listdir(directory):
+        match = _FILENAME_RE.match(filename)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2),
+                                        os.path.join(directory, filename)))
+    migrations.sort(key=lambda m: m.version)
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f'Повторяющиеся номера миграций в {directory}')
+    return migrations
+
+
+def ensure_version_table(conn):
+    """Создание служебных таблиц миграций"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Контрольные точки пакетных заполнений (для возобновления после прерывания)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS migration_progress (
+            task TEXT PRIMARY KEY,
+            last_rowid INTEGER NOT NULL,
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+
+def applied_versions(conn):
+    """Множество примененных версий"""
+    ensure_version_table(conn)
+    return {row[0] for row in conn.execute('SELECT version FROM schema_version')}
+
+
+def status(conn, directory=MIGRATIONS_DIR):
+    """Список (миграция, применена ли) для всех миграций"""
+    applied = applied_versions(conn)
+    return [(m, m.version in applied) for m in discover(directory)]
+
+
+def upgrade(conn, target=None, directory=MIGRATIONS_DIR, log=None):
+    """Применение всех неприменных миграций (до версии target включительно)"""
+    applied = applied_versions(conn)
+    done = []
+    for migration in discover(directory):
+        if migration.version in applied:
+            continue
+        if target is not None and migration.version > target:
+            break
+        if log:
+            log(f'Применение миграции {migration.version:04d}_{migration.name}...')
+        _apply(conn, migration)
+        done.append(migration)
+    return done
+
+
+def _apply(conn, migration):
+    """Применение одной миграции и запись ее версии"""
+    if migration.path.endswith('.sql'):
+        with open(migration.path, encoding='utf-8') as f:
+            script = f.read()
+        try:
+            # executescript сам завершает открытую транзакцию, поэтому
+            # BEGIN/COMMIT и запись версии - внутри скрипта
+            conn.executescript(
+                'BEGIN IMMEDIATE;\n'
+                f'{script}\n;\n'
+                'INSERT INTO schema_version (version, name) '
+                f"VALUES ({migration.version}, '{migration.name}');\n"
+                'COMMIT;'
+            )
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+    else:
+        module = _load_module(migration)
+        try:
+            module.upgrade(conn)
+            conn.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)',
+                         (migration.version, migration.name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def _load_module(migration):
+    """Загрузка python-миграции как модуля"""
+    spec = importlib.util.spec_from_file_location(
+        f'migration_{migration.version:04d}', migration.path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def column_exists(conn, table, column):
+    """Проверка наличия столбца в таблице"""
+    return any(row[1] == column for row in conn.execute(f'PRAGMA table_info({table})'))
+
+
+def backfill(conn, task, table, set_clause, where=None, params=(),
+             batch_size=10000, pause=0.0, log=None):
+    """Пакетное обновление большой таблицы по диапазонам rowid
+
+    Каждый пакет - отдельная короткая транзакция BEGIN IMMEDIATE, так что
+    блокировка записи удерживается не дольше одного пакета и покупки не
+    простаивают. Контрольная точка (последний обработанный rowid) пишется в
+    migration_progress в той же транзакции, поэтому прерванное заполнение
+    продолжается с места остановки. pause - пауза между пакетами (сек).
+    Возвращает число обновленных строк.
+    """
+    ensure_version_table(conn)
+    if conn.in_transaction:
+        conn.commit()
+
+    row = conn.execute('SELECT last_rowid, rows_done FROM migration_progress WHERE task = ?',
+                       (task,)).fetchone()
+    last_rowid, rows_done = (row[0], row[1]) if row else (0, 0)
+    max_rowid = conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {table}').fetchone()[0]
+
+    condition = f' AND ({where})' if where else ''
+    sql = f'UPDATE {table} SET {set_clause} WHERE rowid > ? AND rowid <= ?{condition}'
+
+    while last_rowid < max_rowid:
+        upper = last_rowid + batch_size
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = conn.execute(sql, (last_rowid, upper) + tuple(params))
+            rows_done += cursor.rowcount
+            conn.execute('''
+                INSERT INTO migration_progress (task, last_rowid, rows_done, updated_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (task) DO UPDATE SET last_rowid = excluded.last_rowid,
+                    rows_done = excluded.rows_done, updated_at = excluded.updated_at
+            ''', (task, upper, rows_done))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        last_rowid = upper
+        if log:
+            log(f'  {task}: {min(last_rowid, max_rowid)}/{max_rowid}')
+        if pause:
+            time.sleep(pause)
+
+    return rows_done
@@ -0,0 +1,42 @@
+"""
+Денежные суммы в целых копейках
+
+Цены и суммы хранятся в столбцах *_cents (миграция 0012) целыми числами:
+сложение и умножение на количество точны, SUM считает SQLite. Столбцы
+DECIMAL (retail_price, price, total...) остаются зеркалом в рублях для
+выгрузок, импорта и старых скриптов; записи, задающие только их, получают
+копейки от триггеров.
+"""
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+
+def to_cents(value):
+    """Копейки из строки формы, числа или Decimal (None и '' - None)
+
+    Строка разбирается как десятичное число, без двоичной погрешности float;
+    дробь копейки округляется по правилам арифметики. Неверная строка -
+    ValueError.
+    """
+    if value is None or value == '':
+        return None
+    try:
+        amount = Decimal(str(value).strip().replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError(f'Неверная сумма: {value!r}') from None
+    if not amount.is_finite():
+        raise ValueError(f'Неверная сумма: {value!r}')
+    return int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def to_rubles(cents):
+    """Значение для зеркальных столбцов DECIMAL (None - None)"""
+    return None if cents is None else cents / 100
+
+
+def format_money(cents):
+    """'1234.50' для 123450 копеек; None - пустая строка (фильтр шаблонов money)"""
+    if cents is None:
+        return ''
+    sign = '-' if cents < 0 else ''
+    rubles, kopecks = divmod(abs(int(cents)), 100)
+    return f'{sign}{rubles}.{kopecks:02d}'
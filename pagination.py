@@ -0,0 +1,72 @@
+"""
+Постраничный вывод списков по ключу (keyset / seek pagination)
+
+Следующая страница выбирается условием "строго после последней строки
+предыдущей страницы" по столбцам сортировки с id в конце для однозначности,
+а не через OFFSET. При индексе по столбцам сортировки страница N стоит
+столько же, сколько первая. Курсор - значения столбцов сортировки последней
+строки, упакованные в base64 (JSON); он не зависит от вставок и удалений
+строк до него.
+
+Сами запросы списков - KeysetQuery в реестре queries.
+"""
+import base64
+import binascii
+import json
+
+DEFAULT_PAGE_SIZE = 50
+
+
+def encode_cursor(sort_key, values):
+    """Упаковка значений последней строки в курсор для URL"""
+    data = json.dumps([sort_key, *values], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort_key, size):
+    """Значения из курсора или None, если курсор поврежден или от другой сортировки"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, binascii.Error, UnicodeError):
+        return None
+    if not isinstance(data, list) or len(data) != size + 1 or data[0] != sort_key:
+        return None
+    return data[1:]
+
+
+class SortOrder:
+    """Порядок сортировки: выражения столбцов (последнее - уникальный id) и направление"""
+
+    def __init__(self, key, label, columns, descending=False):
+        self.key = key
+        self.label = label
+        self.columns = columns
+        self.descending = descending
+
+    def order_by(self):
+        direction = ' DESC' if self.descending else ''
+        return ', '.join(column + direction for column in self.columns)
+
+    def seek(self):
+        """Условие "после курсора"
+
+        Отдельная граница по первому столбцу нужна, чтобы SQLite искал по
+        индексу и для индексов по выражениям (сравнение кортежей само по себе
+        в этом случае дает полный просмотр).
+        """
+        op = '<' if self.descending else '>'
+        placeholders = ', '.join('?' for _ in self.columns)
+        return (f'{self.columns[0]} {op}= ? AND '
+                f'({", ".join(self.columns)}) {op} ({placeholders})')
+
+
+class Page:
+    """Страница списка: строки и курсор следующей страницы (None - последняя)"""
+
+    def __init__(self, rows, next_cursor, sort):
+        self.rows = rows
+        self.next_cursor = next_cursor
+        self.sort = sort
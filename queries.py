@@ -0,0 +1,629 @@
+"""
+Реестр именованных SQL-запросов приложения со статистикой выполнения
+
+Каждый запрос - объект Query с постоянным текстом SQL, поэтому кэш
+подготовленных выражений соединения (см. db_pool) переиспользует его
+между вызовами. Для каждого запроса копятся число вызовов, суммарное и
+максимальное время и число возвращенных (или измененных) строк.
+"""
+import sqlite3
+import threading
+import time
+
+from pagination import DEFAULT_PAGE_SIZE, Page, SortOrder, decode_cursor, encode_cursor
+
+REGISTRY = {}
+
+
+class Query:
+    """Именованный параметризованный запрос"""
+
+    def __init__(self, name, sql):
+        if name in REGISTRY:
+            raise ValueError(f'Запрос {name!r} уже зарегистрирован')
+        self.name = name
+        self.sql = sql
+        self._lock = threading.Lock()
+        self.reset()
+        REGISTRY[name] = self
+
+    def reset(self):
+        """Сброс статистики"""
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+
+    def _record(self, elapsed, rows):
+        with self._lock:
+            self.calls += 1
+            self.total_time += elapsed
+            if elapsed > self.max_time:
+                self.max_time = elapsed
+            self.rows += rows
+
+    def all(self, conn, params=()):
+        """Выполнение запроса и получение всех строк"""
+        started = time.perf_counter()
+        result = conn.execute(self.sql, params).fetchall()
+        self._record(time.perf_counter() - started, len(result))
+        return result
+
+    def one(self, conn, params=()):
+        """Выполнение запроса и получение первой строки (или None)"""
+        started = time.perf_counter()
+        result = conn.execute(self.sql, params).fetchone()
+        self._record(time.perf_counter() - started, 0 if result is None else 1)
+        return result
+
+    def scalar(self, conn, params=()):
+        """Первое значение первой строки (или None)"""
+        row = self.one(conn, params)
+        return None if row is None else row[0]
+
+    def iterate(self, conn, params=(), size=1000):
+        """Потоковое чтение пакетами по size строк: результат не материализуется целиком
+
+        Статистика записывается, когда генератор исчерпан или закрыт.
+        """
+        started = time.perf_counter()
+        rows = 0
+        cursor = conn.execute(self.sql, params)
+        try:
+            while True:
+                batch = cursor.fetchmany(size)
+                if not batch:
+                    break
+                rows += len(batch)
+                yield batch
+        finally:
+            cursor.close()
+            self._record(time.perf_counter() - started, rows)
+
+    def execute(self, conn, params=()):
+        """Выполнение изменяющего запроса; возвращает курсор"""
+        started = time.perf_counter()
+        cursor = conn.execute(self.sql, params)
+        self._record(time.perf_counter() - started, max(cursor.rowcount, 0))
+        return cursor
+
+    def executemany(self, conn, seq_of_params):
+        """Пакетное выполнение изменяющего запроса; возвращает курсор"""
+        started = time.perf_counter()
+        cursor = conn.executemany(self.sql, seq_of_params)
+        self._record(time.perf_counter() - started, max(cursor.rowcount, 0))
+        return cursor
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'total_ms': round(self.total_time * 1000, 3),
+            'avg_ms': round(self.total_time * 1000 / self.calls, 3) if self.calls else 0.0,
+            'max_ms': round(self.max_time * 1000, 3),
+            'rows': self.rows,
+        }
+
+
+class KeysetQuery:
+    """Список с постраничным выводом по ключу и набором порядков сортировки
+
+    Для каждого порядка в реестре два запроса: первая страница ("имя:порядок")
+    и страница после курсора ("имя:порядок:after"). where - постоянное условие
+    с параметрами (или None).
+    """
+
+    def __init__(self, name, columns, source, orders, where=None):
+        self.name = name
+        self.orders = {order.key: order for order in orders}
+        self.default = orders[0].key
+        self._queries = {}
+        for order in orders:
+            sort_columns = ', '.join(f'{column} AS _sort_{i}' for i, column in enumerate(order.columns))
+            select = f'SELECT {columns}, {sort_columns}\n    FROM {source}'
+            first = [where] if where else []
+            self._queries[order.key] = (
+                Query(f'{name}:{order.key}', self._sql(select, first, order)),
+                Query(f'{name}:{order.key}:after', self._sql(select, first + [order.seek()], order)),
+            )
+
+    @staticmethod
+    def _sql(select, conditions, order):
+        where = f"\n    WHERE {' AND '.join(conditions)}" if conditions else ''
+        return f'{select}{where}\n    ORDER BY {order.order_by()}\n    LIMIT ?'
+
+    @property
+    def calls(self):
+        return sum(q.calls for pair in self._queries.values() for q in pair)
+
+    def reset(self):
+        for pair in self._queries.values():
+            for query in pair:
+                query.reset()
+
+    def sort_key(self, requested):
+        """Известный порядок сортировки или порядок по умолчанию"""
+        return requested if requested in self.orders else self.default
+
+    def page(self, conn, params=(), sort=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """Страница строк после курсора (первая страница - без курсора или с неверным курсором)"""
+        sort = self.sort_key(sort)
+        order = self.orders[sort]
+        first, after = self._queries[sort]
+        values = decode_cursor(cursor, sort, len(order.columns))
+        if values is None:
+            rows = first.all(conn, (*params, limit + 1))
+        else:
+            rows = after.all(conn, (*params, values[0], *values, limit + 1))
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(sort, [rows[-1][f'_sort_{i}'] for i in range(len(order.columns))])
+        return Page(rows, next_cursor, sort)
+
+
+def stats():
+    """Статистика по всем запросам, самые затратные - первыми"""
+    return sorted((q.as_dict() for q in REGISTRY.values()),
+                  key=lambda s: s['total_ms'], reverse=True)
+
+
+def reset_stats():
+    for query in REGISTRY.values():
+        query.reset()
+
+
+# --- Пользователи ---
+
+USER_ROLE = Query('user_role', 'SELECT role FROM users WHERE id = ?')
+
+USER_BY_ID = Query('user_by_id', 'SELECT * FROM users WHERE id = ?')
+
+ACTIVE_USER_BY_USERNAME = Query('active_user_by_username', '''
+    SELECT * FROM users WHERE username = ? AND is_active = 1
+''')
+
+USER_ID_BY_USERNAME = Query('user_id_by_username', 'SELECT id FROM users WHERE username = ?')
+
+INSERT_USER = Query('insert_user', '''
+    INSERT INTO users (username, password_hash, role, full_name, email, phone)
+    VALUES (?, ?, ?, ?, ?, ?)
+''')
+
+USERS_LIST = KeysetQuery('users_list', '*', 'users', [
+    SortOrder('created_at', 'Сначала новые', ['created_at', 'id'], descending=True),
+])
+
+USER_STATUS = Query('user_status', 'SELECT is_active FROM users WHERE id = ?')
+
+SET_USER_STATUS = Query('set_user_status', 'UPDATE users SET is_active = ? WHERE id = ?')
+
+# --- Главная страница ---
+
+INDEX_STATS = Query('index_stats', '''
+    SELECT (SELECT COUNT(*) FROM ensembles) AS total_ensembles,
+           (SELECT COUNT(*) FROM compositions) AS total_compositions,
+           (SELECT COUNT(*) FROM records) AS total_records,
+           (SELECT COUNT(*) FROM musicians) AS total_musicians
+''')
+
+# --- Кэш ---
+
+CACHE_VERSION = Query('cache_version', 'SELECT version FROM cache_versions WHERE name = ?')
+
+# --- Поиск ---
+
+# Страница совпадений по рангу выбирается во вложенном запросе, и только
+# для нее подтягиваются сведения из исходных таблиц (см. search.py)
+SEARCH = Query('search', '''
+    SELECT s.rank AS _sort_0, s.rowid AS _sort_1,
+           s.rowid % 8 AS kind, s.rowid / 8 AS ref_id,
+           COALESCE(r.title, c.title, m.name, e.name, comp.name) AS name,
+           r.catalog_number, r.retail_price_cents, r.current_stock,
+           rc.name AS company_name, cm.name AS composer_name,
+           m.role AS musician_role, e.type AS ensemble_type
+    FROM (SELECT rowid, rank FROM search_index
+          WHERE search_index MATCH ?
+          ORDER BY rank, rowid
+          LIMIT ?) s
+    LEFT JOIN records r ON s.rowid % 8 = 1 AND r.id = s.rowid / 8
+    LEFT JOIN companies rc ON r.company_id = rc.id
+    LEFT JOIN compositions c ON s.rowid % 8 = 2 AND c.id = s.rowid / 8
+    LEFT JOIN musicians cm ON c.composer_id = cm.id
+    LEFT JOIN musicians m ON s.rowid % 8 = 3 AND m.id = s.rowid / 8
+    LEFT JOIN ensembles e ON s.rowid % 8 = 4 AND e.id = s.rowid / 8
+    LEFT JOIN companies comp ON s.rowid % 8 = 5 AND comp.id = s.rowid / 8
+    ORDER BY s.rank, s.rowid
+''')
+
+SEARCH_AFTER = Query('search:after', '''
+    SELECT s.rank AS _sort_0, s.rowid AS _sort_1,
+           s.rowid % 8 AS kind, s.rowid / 8 AS ref_id,
+           COALESCE(r.title, c.title, m.name, e.name, comp.name) AS name,
+           r.catalog_number, r.retail_price_cents, r.current_stock,
+           rc.name AS company_name, cm.name AS composer_name,
+           m.role AS musician_role, e.type AS ensemble_type
+    FROM (SELECT rowid, rank FROM search_index
+          WHERE search_index MATCH ?
+            AND rank >= ? AND (rank, rowid) > (?, ?)
+          ORDER BY rank, rowid
+          LIMIT ?) s
+    LEFT JOIN records r ON s.rowid % 8 = 1 AND r.id = s.rowid / 8
+    LEFT JOIN companies rc ON r.company_id = rc.id
+    LEFT JOIN compositions c ON s.rowid % 8 = 2 AND c.id = s.rowid / 8
+    LEFT JOIN musicians cm ON c.composer_id = cm.id
+    LEFT JOIN musicians m ON s.rowid % 8 = 3 AND m.id = s.rowid / 8
+    LEFT JOIN ensembles e ON s.rowid % 8 = 4 AND e.id = s.rowid / 8
+    LEFT JOIN companies comp ON s.rowid % 8 = 5 AND comp.id = s.rowid / 8
+    ORDER BY s.rank, s.rowid
+''')
+
+# --- Ансамбли ---
+
+ENSEMBLES_LIST = Query('ensembles_list', 'SELECT * FROM ensembles ORDER BY name')
+
+ENSEMBLES_PAGE = KeysetQuery('ensembles_page', '*', 'ensembles', [
+    SortOrder('name', 'По названию', ['name', 'id']),
+])
+
+ENSEMBLE_BY_ID = Query('ensemble_by_id', 'SELECT * FROM ensembles WHERE id = ?')
+
+# ensemble_members - только фильтр (у ансамбля есть участники), поэтому
+# полусоединение EXISTS вместо JOIN: строки не размножаются по числу участников
+ENSEMBLE_COMPOSITIONS = Query('ensemble_compositions', '''
+    SELECT c.title, c.genre, c.year_composed, m.name as composer_name
+    FROM compositions c
+    LEFT JOIN musicians m ON c.composer_id = m.id
+    WHERE c.id IN (SELECT composition_id FROM performances WHERE ensemble_id = ?1)
+      AND EXISTS (SELECT 1 FROM ensemble_members WHERE ensemble_id = ?1)
+    ORDER BY c.title
+''')
+
+# Количество произведений каждого ансамбля одним проходом по
+# idx_performances_ensemble (ensemble_id, composition_id). Сводка кэшируется
+# целиком и выводится страницами по ENSEMBLE_COUNTS_ORDER (курсор - как у ENSEMBLES_PAGE)
+ENSEMBLE_COUNTS_ORDER = SortOrder('name', 'По названию', ['name', 'id'])
+
+ENSEMBLE_COMPOSITION_COUNTS = Query('ensemble_composition_counts', '''
+    SELECT e.id, e.name, e.type, COALESCE(pc.compositions_count, 0) AS compositions_count
+    FROM ensembles e
+    LEFT JOIN (SELECT ensemble_id, COUNT(DISTINCT composition_id) AS compositions_count
+               FROM performances
+               GROUP BY ensemble_id) pc ON pc.ensemble_id = e.id
+    WHERE EXISTS (SELECT 1 FROM ensemble_members em WHERE em.ensemble_id = e.id)
+    ORDER BY e.name, e.id
+''')
+
+# Материализованная связь ensemble_discography вместо обхода всех треков
+ENSEMBLE_DISCOGRAPHY = Query('ensemble_discography', '''
+    SELECT r.catalog_number, r.title, r.release_date,
+           r.retail_price_cents, comp.name as company_name
+    FROM ensemble_discography ed
+    JOIN records r ON ed.record_id = r.id
+    JOIN companies comp ON r.company_id = comp.id
+    WHERE ed.ensemble_id = ?
+    ORDER BY r.title
+''')
+
+INSERT_ENSEMBLE = Query('insert_ensemble', '''
+    INSERT INTO ensembles (name, type, founded_year, country, description)
+    VALUES (?, ?, ?, ?, ?)
+''')
+
+UPDATE_ENSEMBLE = Query('update_ensemble', '''
+    UPDATE ensembles
+    SET name = ?, type = ?, founded_year = ?, country = ?, description = ?
+    WHERE id = ?
+''')
+
+DELETE_ENSEMBLE = Query('delete_ensemble', 'DELETE FROM ensembles WHERE id = ?')
+
+# --- Пластинки ---
+
+SALES_LEADERS = Query('sales_leaders', '''
+    SELECT r.catalog_number, r.title, r.sold_this_year,
+           comp.name as company_name, r.retail_price, r.retail_price_cents
+    FROM records r
+    JOIN companies comp ON r.company_id = comp.id
+    WHERE r.sold_this_year > 0
+    ORDER BY r.sold_this_year DESC
+    LIMIT 10
+''')
+
+# Выгрузки (exports.py). Порядок строк совпадает с порядком индекса
+# (idx_purchases_date, rowid records), поэтому SQLite не сортирует результат
+# во временном B-дереве и отдает строки по мере чтения. CROSS JOIN закрепляет
+# главную таблицу внешним циклом при любой статистике ANALYZE. Необязательные
+# фильтры: ?3 - компания, ?4 - покупатель (NULL - без фильтра). Суммы - в копейках,
+# exports.py выводит их в рублях (money.format_money).
+EXPORT_PURCHASES = Query('export_purchases', '''
+    SELECT p.id, p.purchase_date, u.username, r.catalog_number, r.title,
+           c.name AS company_name, p.quantity, p.price_cents
+    FROM purchases p
+    CROSS JOIN users u ON p.user_id = u.id
+    CROSS JOIN records r ON p.record_id = r.id
+    CROSS JOIN companies c ON r.company_id = c.id
+    WHERE p.purchase_date >= ?1 AND p.purchase_date < ?2
+      AND (?3 IS NULL OR r.company_id = ?3)
+      AND (?4 IS NULL OR p.user_id = ?4)
+    ORDER BY p.purchase_date, p.id
+''')
+
+EXPORT_RECORDS = Query('export_records', '''
+    SELECT r.catalog_number, r.title, c.name AS company_name, r.release_date,
+           r.wholesale_price_cents, r.retail_price_cents, r.current_stock,
+           r.sold_this_year, r.sold_last_year
+    FROM records r
+    CROSS JOIN companies c ON r.company_id = c.id
+    WHERE ?1 IS NULL OR r.company_id = ?1
+    ORDER BY r.id
+''')
+
+# Сводка продаж по компаниям за один месяц [?1, ?2): exports.py выполняет ее
+# помесячно, чтобы сортировка для GROUP BY держала в памяти строки одного
+# месяца, а не всей таблицы
+EXPORT_SALES = Query('export_sales', '''
+    SELECT substr(?1, 1, 7) AS month, c.name AS company_name,
+           COUNT(*) AS purchases, SUM(p.quantity) AS quantity,
+           SUM(p.price_cents) AS revenue_cents
+    FROM purchases p
+    JOIN records r ON p.record_id = r.id
+    JOIN companies c ON r.company_id = c.id
+    WHERE p.purchase_date >= ?1 AND p.purchase_date < ?2
+      AND (?3 IS NULL OR r.company_id = ?3)
+    GROUP BY c.id
+    ORDER BY company_name
+''')
+
+# Первая и последняя покупка в диапазоне (каждый подзапрос - один шаг по индексу)
+PURCHASE_DATE_RANGE = Query('purchase_date_range', '''
+    SELECT (SELECT MIN(purchase_date) FROM purchases WHERE purchase_date >= ?1 AND purchase_date < ?2),
+           (SELECT MAX(purchase_date) FROM purchases WHERE purchase_date >= ?1 AND purchase_date < ?2)
+''')
+
+# Порядки сортировки пластинок; у каждого есть индекс (см. database.INDEXES).
+# NULL в цене и дате заменяется, чтобы строки не выпадали из сравнения с курсором.
+RECORD_ORDERS = [
+    SortOrder('title', 'По названию', ['r.title', 'r.id']),
+    SortOrder('price', 'Сначала дешевые', ['COALESCE(r.retail_price_cents, 0)', 'r.id']),
+    SortOrder('release_date', 'Сначала новые', ["COALESCE(r.release_date, '')", 'r.id'], descending=True),
+    SortOrder('popularity', 'Сначала популярные', ['r.sold_this_year', 'r.id'], descending=True),
+]
+
+RECORDS_WITH_COMPANY = KeysetQuery(
+    'records_with_company', 'r.*, comp.name as company_name',
+    'records r\n    JOIN companies comp ON r.company_id = comp.id', RECORD_ORDERS)
+
+CATALOG = KeysetQuery(
+    'catalog', 'r.*, comp.name as company_name',
+    'records r\n    JOIN companies comp ON r.company_id = comp.id', RECORD_ORDERS,
+    where='r.current_stock > 0')
+
+COMPANIES_LIST = Query('companies_list', 'SELECT * FROM companies ORDER BY name')
+
+COMPANY_NAME = Query('company_name', 'SELECT name FROM companies WHERE id = ?')
+
+RECORD_BY_ID = Query('record_by_id', 'SELECT * FROM records WHERE id = ?')
+
+# Счетчики продаж не задаются вручную - их ведут триггеры по purchases.
+# Цены - в копейках (?5, ?6) и их зеркало в рублях для столбцов DECIMAL
+INSERT_RECORD = Query('insert_record', '''
+    INSERT INTO records (catalog_number, title, company_id, release_date,
+                         wholesale_price_cents, retail_price_cents, current_stock,
+                         wholesale_price, retail_price)
+    VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?5 / 100.0, ?6 / 100.0)
+''')
+
+UPDATE_RECORD = Query('update_record', '''
+    UPDATE records
+    SET catalog_number = ?1, title = ?2, company_id = ?3, release_date = ?4,
+        wholesale_price_cents = ?5, retail_price_cents = ?6, current_stock = ?7,
+        wholesale_price = ?5 / 100.0, retail_price = ?6 / 100.0
+    WHERE id = ?8
+''')
+
+DELETE_RECORD = Query('delete_record', 'DELETE FROM records WHERE id = ?')
+
+# Пластинки пакета импорта: ? - JSON-массив каталожных номеров (один параметр
+# на любой размер пакета, поиск по UNIQUE-индексу catalog_number)
+RECORDS_BY_CATALOG = Query('records_by_catalog', '''
+    SELECT id, catalog_number, title, company_id, release_date,
+           wholesale_price_cents, retail_price_cents, current_stock
+    FROM records
+    WHERE catalog_number IN (SELECT value FROM json_each(?))
+''')
+
+COMPANY_NAMES = Query('company_names', 'SELECT id, name FROM companies')
+
+# --- Покупки ---
+
+# ?4 - сумма в копейках
+INSERT_PURCHASE = Query('insert_purchase', '''
+    INSERT INTO purchases (user_id, record_id, quantity, price_cents, price, seller_id, order_id)
+    VALUES (?1, ?2, ?3, ?4, ?4 / 100.0, ?5, ?6)
+''')
+
+# Проверка и списание остатка одним оператором: строка меняется (и цена в
+# копейках возвращается), только если товара хватает и количество положительное
+# (иначе отрицательное количество увеличило бы остаток). sold_this_year
+# увеличивает триггер trg_purchases_sales_insert
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+TAKE_STOCK = Query('take_stock', '''
+    UPDATE records SET current_stock = current_stock - ?1
+    WHERE id = ?2 AND current_stock >= ?1 AND ?1 > 0
+''' + ('RETURNING retail_price_cents' if HAS_RETURNING else ''))
+
+# Цена после списания для SQLite без RETURNING (до 3.35)
+RECORD_PRICE = Query('record_price', 'SELECT retail_price_cents FROM records WHERE id = ?')
+
+USER_PURCHASES = KeysetQuery(
+    'user_purchases', 'p.*, r.title, r.catalog_number, comp.name as company_name',
+    '''purchases p
+    JOIN records r ON p.record_id = r.id
+    JOIN companies comp ON r.company_id = comp.id''',
+    [SortOrder('date', 'Сначала новые', ['p.purchase_date', 'p.id'], descending=True)],
+    where='p.user_id = ?')
+
+USER_PURCHASE_TOTALS = Query('user_purchase_totals', '''
+    SELECT COUNT(*) AS total_purchases, COALESCE(SUM(price_cents), 0) AS total_spent_cents
+    FROM purchases WHERE user_id = ?
+''')
+
+# --- Заказы ---
+
+# ?2 - сумма в копейках
+INSERT_ORDER = Query('insert_order', '''
+    INSERT INTO orders (user_id, total_cents, total, items) VALUES (?1, ?2, ?2 / 100.0, ?3)
+''')
+
+# Оформление заказа из нескольких товаров - операторы над временной таблицей
+# строк заказа, их число не зависит от числа товаров. Таблица создается
+# один раз на соединение и очищается перед каждым заказом
+ORDER_LINES_CREATE = Query('order_lines_create', '''
+    CREATE TEMP TABLE IF NOT EXISTS order_lines (
+        record_id INTEGER PRIMARY KEY,
+        quantity INTEGER NOT NULL
+    )
+''')
+
+ORDER_LINES_CLEAR = Query('order_lines_clear', 'DELETE FROM temp.order_lines')
+
+# Повторяющаяся пластинка складывается в одну строку
+ORDER_LINES_ADD = Query('order_lines_add', '''
+    INSERT INTO temp.order_lines (record_id, quantity) VALUES (?, ?)
+    ON CONFLICT (record_id) DO UPDATE SET quantity = quantity + excluded.quantity
+''')
+
+# Товары удаленных пластинок не оформляются
+ORDER_LINES_DROP_MISSING = Query('order_lines_drop_missing', '''
+    DELETE FROM temp.order_lines WHERE record_id NOT IN (SELECT id FROM records)
+''')
+
+# Строки заказа, сложенные по пластинкам. UPDATE ... FROM меняет строку records
+# не больше одного раза, даже если ей соответствует несколько строк источника, -
+# поэтому количество одной пластинки складывается до списания
+ORDER_LINES_BY_RECORD = '''(SELECT record_id, SUM(quantity) AS quantity
+                            FROM temp.order_lines GROUP BY record_id)'''
+
+# Списание остатков всех строк одним условным UPDATE (UPDATE FROM, SQLite 3.33+):
+# изменено меньше строк, чем разных пластинок в заказе, - какой-то не хватает
+ORDER_TAKE_STOCK = Query('order_take_stock', f'''
+    UPDATE records SET current_stock = current_stock - ol.quantity
+    FROM {ORDER_LINES_BY_RECORD} ol
+    WHERE records.id = ol.record_id AND records.current_stock >= ol.quantity AND ol.quantity > 0
+''')
+
+ORDER_SHORTAGE = Query('order_shortage', f'''
+    SELECT ol.record_id FROM {ORDER_LINES_BY_RECORD} ol
+    JOIN records r ON r.id = ol.record_id
+    WHERE r.current_stock < ol.quantity OR ol.quantity <= 0
+    ORDER BY ol.record_id LIMIT 1
+''')
+
+# Сумма заказа и первая пластинка без цены (NULL - у всех цена задана)
+ORDER_LINES_TOTAL = Query('order_lines_total', f'''
+    SELECT SUM(r.retail_price_cents * ol.quantity),
+           MIN(CASE WHEN r.retail_price_cents IS NULL THEN ol.record_id END)
+    FROM {ORDER_LINES_BY_RECORD} ol
+    JOIN records r ON r.id = ol.record_id
+''')
+
+# Покупки заказа одним INSERT ... SELECT; sold_this_year увеличивает триггер
+INSERT_ORDER_PURCHASES = Query('insert_order_purchases', f'''
+    INSERT INTO purchases (user_id, record_id, quantity, price_cents, price, order_id)
+    SELECT ?1, ol.record_id, ol.quantity, r.retail_price_cents * ol.quantity,
+           r.retail_price_cents * ol.quantity / 100.0, ?2
+    FROM {ORDER_LINES_BY_RECORD} ol
+    JOIN records r ON r.id = ol.record_id
+    ORDER BY ol.record_id
+''')
+
+ORDER_BY_ID = Query('order_by_id', 'SELECT * FROM orders WHERE id = ? AND user_id = ?')
+
+ORDER_ITEMS = Query('order_items', '''
+    SELECT p.*, r.title, r.catalog_number, comp.name as company_name
+    FROM purchases p
+    JOIN records r ON p.record_id = r.id
+    JOIN companies comp ON r.company_id = comp.id
+    WHERE p.order_id = ?
+    ORDER BY p.id
+''')
+
+# --- Ключи идемпотентности ---
+
+# ?3 - возраст ключа для datetime(), например '-3600 seconds'
+IDEMPOTENCY_GET = Query('idempotency_get', '''
+    SELECT category, message, endpoint FROM idempotency_keys
+    WHERE user_id = ?1 AND key = ?2 AND created_at >= datetime('now', ?3)
+''')
+
+IDEMPOTENCY_ADD = Query('idempotency_add', '''
+    INSERT OR REPLACE INTO idempotency_keys (user_id, key, category, message, endpoint)
+    VALUES (?, ?, ?, ?, ?)
+''')
+
+IDEMPOTENCY_PURGE = Query('idempotency_purge', '''
+    DELETE FROM idempotency_keys WHERE created_at < datetime('now', ?)
+''')
+
+# --- Корзина ---
+
+CART_ITEM = Query('cart_item', 'SELECT * FROM cart WHERE user_id = ? AND record_id = ?')
+
+CART_ADD_QUANTITY = Query('cart_add_quantity', '''
+    UPDATE cart SET quantity = quantity + ? WHERE user_id = ? AND record_id = ?
+''')
+
+CART_INSERT = Query('cart_insert', '''
+    INSERT INTO cart (user_id, record_id, quantity)
+    VALUES (?, ?, ?)
+''')
+
+CART_ITEMS = Query('cart_items', '''
+    SELECT c.*, r.title, r.catalog_number, r.retail_price, r.retail_price_cents, r.current_stock,
+           comp.name as company_name
+    FROM cart c
+    JOIN records r ON c.record_id = r.id
+    JOIN companies comp ON r.company_id = comp.id
+    WHERE c.user_id = ?
+    ORDER BY c.added_at DESC
+''')
+
+CART_ITEM_QUANTITY = Query('cart_item_quantity', '''
+    SELECT quantity FROM cart WHERE id = ? AND user_id = ?
+''')
+
+CART_DECREMENT = Query('cart_decrement', '''
+    UPDATE cart SET quantity = quantity - 1 WHERE id = ? AND user_id = ?
+''')
+
+CART_DELETE_ITEM = Query('cart_delete_item', 'DELETE FROM cart WHERE id = ? AND user_id = ?')
+
+CART_CLEAR = Query('cart_clear', 'DELETE FROM cart WHERE user_id = ?')
+
+# Снятие оформленного количества: строка удаляется, только если в ней не больше оформленного
+CART_SUBTRACT = Query('cart_subtract', '''
+    UPDATE cart SET quantity = quantity - ? WHERE id = ? AND user_id = ? AND quantity > ?
+''')
+
+CART_DELETE_ORDERED = Query('cart_delete_ordered', '''
+    DELETE FROM cart WHERE id = ? AND user_id = ? AND quantity <= ?
+''')
+
+# Строки корзины без соединений - для отдельного хранилища корзин (cart_store.py)
+CART_ROWS = Query('cart_rows', 'SELECT * FROM cart WHERE user_id = ?')
+
+CART_ALL = Query('cart_all', 'SELECT * FROM cart')
+
+CART_RESTORE = Query('cart_restore', '''
+    INSERT INTO cart (id, user_id, record_id, quantity, added_at)
+    VALUES (?, ?, ?, ?, ?)
+''')
+
+CHECKOUT_ITEMS = Query('checkout_items', '''
+    SELECT c.*, r.title, r.retail_price, r.retail_price_cents, r.current_stock
+    FROM cart c
+    JOIN records r ON c.record_id = r.id
+    WHERE c.user_id = ?
+''')
@@ -0,0 +1,976 @@
+"""
+Слой хранилища: пластинки, ансамбли, пользователи, корзины, заказы, покупки
+и ключи идемпотентности
+
+Маршруты app.py работают с данными через хранилище, а не через соединение
+SQLite напрямую. Реализаций две, с одинаковыми методами и одинаковыми
+строками результата (ключи - имена столбцов запросов queries.py):
+
+  SqliteRepository - рабочая: запросы из queries.py поверх соединения пула;
+  MemoryRepository - словари и отсортированные списки ключей в памяти процесса
+                     (аналоги индексов SQLite), загружаются из файла базы.
+
+Хранилище в памяти нужно для замеров и тестов: разница времени маршрута
+на двух хранилищах - доля SQLite, остаток - Flask и шаблоны
+(benchmarks/bench_storage.py). Выбор - app.config['STORAGE'] ('sqlite' или
+'memory'). Полнотекстовый поиск, автодополнение, импорт и выгрузки работают
+только с SQLite и в режиме memory читают файл базы.
+"""
+import os
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, g
+
+import archive
+import db_pool
+import queries
+from cache import VersionedCache
+from money import to_rubles
+from pagination import DEFAULT_PAGE_SIZE, Page, decode_cursor, encode_cursor
+
+class OutOfStock(Exception):
+    """Пластинки нет или на складе меньше заказанного; остатки не изменены"""
+
+    def __init__(self, record_id):
+        super().__init__(f'Недостаточно пластинки {record_id} на складе')
+        self.record_id = record_id
+
+
+class NoPrice(Exception):
+    """У пластинки не задана розничная цена; списанное откатывает транзакция вызывающего"""
+
+    def __init__(self, record_id):
+        super().__init__(f'У пластинки {record_id} не задана цена')
+        self.record_id = record_id
+
+
+def check_quantities(items):
+    """ValueError, если в [(id пластинки, количество)] есть количество меньше единицы"""
+    for record_id, quantity in items:
+        if quantity <= 0:
+            raise ValueError(f'Неверное количество пластинки {record_id}: {quantity}')
+
+
+# Количество произведений всех ансамблей; сбрасывается триггерами при изменении исполнений
+ensemble_composition_counts = VersionedCache('ensemble_composition_counts',
+                                             queries.ENSEMBLE_COMPOSITION_COUNTS.all)
+
+
+# --- SQLite ---
+
+class SqliteUsers:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def get(self, user_id):
+        return queries.USER_BY_ID.one(self.conn, (user_id,))
+
+    def role(self, user_id):
+        """Роль пользователя или None"""
+        return queries.USER_ROLE.scalar(self.conn, (user_id,))
+
+    def active_by_username(self, username):
+        return queries.ACTIVE_USER_BY_USERNAME.one(self.conn, (username,))
+
+    def exists(self, username):
+        return queries.USER_ID_BY_USERNAME.one(self.conn, (username,)) is not None
+
+    def add(self, username, password_hash, role, full_name, email, phone):
+        queries.INSERT_USER.execute(self.conn, (username, password_hash, role, full_name, email, phone))
+
+    def page(self, sort=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        return queries.USERS_LIST.page(self.conn, (), sort, cursor, limit)
+
+    def toggle_active(self, user_id):
+        """Смена активности; возвращает новое состояние или None, если пользователя нет"""
+        user = queries.USER_STATUS.one(self.conn, (user_id,))
+        if not user:
+            return None
+        status = not user['is_active']
+        queries.SET_USER_STATUS.execute(self.conn, (status, user_id))
+        return status
+
+
+class SqliteRecords:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def get(self, record_id):
+        return queries.RECORD_BY_ID.one(self.conn, (record_id,))
+
+    def company_name(self, company_id):
+        return queries.COMPANY_NAME.scalar(self.conn, (company_id,))
+
+    def page(self, sort=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """Все пластинки с названием компании"""
+        return queries.RECORDS_WITH_COMPANY.page(self.conn, (), sort, cursor, limit)
+
+    def catalog_page(self, sort=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """Пластинки в наличии с названием компании"""
+        return queries.CATALOG.page(self.conn, (), sort, cursor, limit)
+
+    def sales_leaders(self):
+        return queries.SALES_LEADERS.all(self.conn)
+
+    def add(self, catalog_number, title, company_id, release_date, wholesale_price_cents, retail_price_cents,
+            current_stock):
+        """Новая пластинка; цены - в копейках (столбцы DECIMAL заполняются по ним)"""
+        queries.INSERT_RECORD.execute(self.conn, (catalog_number, title, company_id, release_date,
+                                                  wholesale_price_cents, retail_price_cents, current_stock))
+
+    def update(self, record_id, catalog_number, title, company_id, release_date, wholesale_price_cents,
+               retail_price_cents, current_stock):
+        queries.UPDATE_RECORD.execute(self.conn, (catalog_number, title, company_id, release_date,
+                                                  wholesale_price_cents, retail_price_cents, current_stock,
+                                                  record_id))
+
+    def delete(self, record_id):
+        queries.DELETE_RECORD.execute(self.conn, (record_id,))
+
+    def _take(self, record_id, quantity):
+        """Цена списанной пластинки (None - цена не задана) или OutOfStock"""
+        if queries.HAS_RETURNING:
+            # all() доводит оператор до конца, не оставляя его открытым в транзакции
+            rows = queries.TAKE_STOCK.all(self.conn, (quantity, record_id))
+            if not rows:
+                raise OutOfStock(record_id)
+            return rows[0]['retail_price_cents']
+        if queries.TAKE_STOCK.execute(self.conn, (quantity, record_id)).rowcount == 0:
+            raise OutOfStock(record_id)
+        return queries.RECORD_PRICE.scalar(self.conn, (record_id,))
+
+    def take_stock(self, items):
+        """Списание остатков [(id пластинки, количество)] целиком или никак
+
+        Каждая пластинка - один условный UPDATE: остаток проверяется и
+        уменьшается в одном операторе, поэтому параллельные покупки не
+        уходят в минус. Возвращает {id пластинки: цена в копейках или None,
+        если цена не задана}; если какой-то не хватает - OutOfStock, списанное
+        раньше откатывается. Количество меньше единицы - ValueError.
+        """
+        check_quantities(items)
+        if len(items) == 1:
+            record_id, quantity = items[0]
+            return {record_id: self._take(record_id, quantity)}
+        prices = {}
+        self.conn.execute('SAVEPOINT take_stock')
+        try:
+            for record_id, quantity in items:
+                prices[record_id] = self._take(record_id, quantity)
+        except Exception:
+            self.conn.execute('ROLLBACK TO take_stock')
+            raise
+        finally:
+            self.conn.execute('RELEASE take_stock')
+        return prices
+
+
+class SqliteEnsembles:
+    def __init__(self, conn, db_path):
+        self.conn = conn
+        self.db_path = db_path
+
+    def get(self, ensemble_id):
+        return queries.ENSEMBLE_BY_ID.one(self.conn, (ensemble_id,))
+
+    def compositions(self, ensemble_id):
+        """Произведения в исполнении ансамбля (если у него есть участники)"""
+        return queries.ENSEMBLE_COMPOSITIONS.all(self.conn, (ensemble_id,))
+
+    def composition_counts(self):
+        """Число произведений каждого ансамбля с участниками (из кэша)"""
+        return ensemble_composition_counts.get(self.conn, self.db_path)
+
+    def composition_counts_page(self, sort=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        return _list_page(self.composition_counts(), queries.ENSEMBLE_COUNTS_ORDER, cursor, limit)
+
+    def discography(self, ensemble_id):
+        return queries.ENSEMBLE_DISCOGRAPHY.all(self.conn, (ensemble_id,))
+
+    def page(self, sort=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        return queries.ENSEMBLES_PAGE.page(self.conn, (), sort, cursor, limit)
+
+    def add(self, name, type_, founded_year, country, description):
+        queries.INSERT_ENSEMBLE.execute(self.conn, (name, type_, founded_year, country, description))
+
+    def update(self, ensemble_id, name, type_, founded_year, country, description):
+        queries.UPDATE_ENSEMBLE.execute(self.conn, (name, type_, founded_year, country, description,
+                                                    ensemble_id))
+
+    def delete(self, ensemble_id):
+        queries.DELETE_ENSEMBLE.execute(self.conn, (ensemble_id,))
+
+
+class SqliteCarts:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def items(self, user_id):
+        """Товары корзины с пластинкой и компанией, новые первыми"""
+        return queries.CART_ITEMS.all(self.conn, (user_id,))
+
+    def checkout_items(self, user_id):
+        """Товары корзины с ценой и остатком для оформления"""
+        return queries.CHECKOUT_ITEMS.all(self.conn, (user_id,))
+
+    def add(self, user_id, record_id, quantity):
+        """Добавление пластинки; если она уже в корзине - увеличение количества"""
+        if queries.CART_ITEM.one(self.conn, (user_id, record_id)):
+            queries.CART_ADD_QUANTITY.execute(self.conn, (quantity, user_id, record_id))
+        else:
+            queries.CART_INSERT.execute(self.conn, (user_id, record_id, quantity))
+
+    def decrease(self, cart_id, user_id):
+        """Уменьшение количества на 1 (при 1 - удаление); остаток или None, если товара нет"""
+        item = queries.CART_ITEM_QUANTITY.one(self.conn, (cart_id, user_id))
+        if not item:
+            return None
+        if item['quantity'] > 1:
+            queries.CART_DECREMENT.execute(self.conn, (cart_id, user_id))
+            return item['quantity'] - 1
+        queries.CART_DELETE_ITEM.execute(self.conn, (cart_id, user_id))
+        return 0
+
+    def remove(self, cart_id, user_id):
+        queries.CART_DELETE_ITEM.execute(self.conn, (cart_id, user_id))
+
+    def subtract(self, cart_id, user_id, quantity):
+        """Снятие оформленного количества; добавленное после оформления остается в корзине"""
+        queries.CART_DELETE_ORDERED.execute(self.conn, (cart_id, user_id, quantity))
+        queries.CART_SUBTRACT.execute(self.conn, (quantity, cart_id, user_id, quantity))
+
+    def clear(self, user_id):
+        queries.CART_CLEAR.execute(self.conn, (user_id,))
+
+
+class SqlitePurchases:
+    def __init__(self, conn, archive_dir):
+        self.conn = conn
+        self.archive_dir = archive_dir
+
+    def add(self, user_id, record_id, quantity, price_cents, seller_id=None, order_id=None):
+        queries.INSERT_PURCHASE.execute(self.conn, (user_id, record_id, quantity, price_cents, seller_id,
+                                                    order_id))
+
+    def page(self, user_id, sort=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """История покупок пользователя (рабочая база, затем архив по годам)"""
+        return archive.user_purchases_page(self.conn, user_id, sort, cursor, limit, self.archive_dir)
+
+    def totals(self, user_id):
+        return archive.user_purchase_totals(self.conn, user_id, self.archive_dir)
+
+
+class SqliteOrders:
+    def __init__(self, conn, records, archive_dir):
+        self.conn = conn
+        self.records = records
+        self.archive_dir = archive_dir
+
+    def place(self, user_id, items):
+        """Заказ из товаров [(id пластинки, количество)]: списание остатков, заголовок и покупки
+
+        Товары удаленных пластинок пропускаются; если не осталось ни одного -
+        None. Если какой-то пластинки не хватает - OutOfStock, остатки не
+        меняются; количество меньше единицы - ValueError; пластинка без цены -
+        NoPrice (транзакцию откатывает вызывающий). Иначе {'id',
+        'total_cents', 'items'} заказа.
+
+        Несколько товаров оформляются операторами над временной таблицей
+        строк заказа (UPDATE ... FROM, INSERT ... SELECT): их число не
+        зависит от размера корзины.
+        """
+        check_quantities(items)
+        if len(items) == 1:
+            return self._place_one(user_id, *items[0])
+        if not items:
+            return None
+        queries.ORDER_LINES_CREATE.execute(self.conn)
+        queries.ORDER_LINES_CLEAR.execute(self.conn)
+        queries.ORDER_LINES_ADD.executemany(self.conn, items)
+        # Позиции заказа - разные пластинки: списание меняет по строке records на каждую
+        lines = len({record_id for record_id, _ in items})
+        lines -= queries.ORDER_LINES_DROP_MISSING.execute(self.conn).rowcount
+        if not lines:
+            return None
+        self.conn.execute('SAVEPOINT place_order')
+        try:
+            if queries.ORDER_TAKE_STOCK.execute(self.conn).rowcount != lines:
+                self.conn.execute('ROLLBACK TO place_order')
+                raise OutOfStock(queries.ORDER_SHORTAGE.scalar(self.conn))
+        finally:
+            self.conn.execute('RELEASE place_order')
+        total, unpriced = queries.ORDER_LINES_TOTAL.one(self.conn)
+        if unpriced is not None:
+            raise NoPrice(unpriced)
+        order_id = queries.INSERT_ORDER.execute(self.conn, (user_id, total, lines)).lastrowid
+        queries.INSERT_ORDER_PURCHASES.execute(self.conn, (user_id, order_id))
+        return {'id': order_id, 'total_cents': total, 'items': lines}
+
+    def _place_one(self, user_id, record_id, quantity):
+        """Заказ из одной пластинки: условный UPDATE и две вставки"""
+        try:
+            price = self.records.take_stock([(record_id, quantity)])[record_id]
+        except OutOfStock:
+            if not self.records.get(record_id):
+                return None
+            raise
+        if price is None:
+            raise NoPrice(record_id)
+        total = price * quantity
+        order_id = queries.INSERT_ORDER.execute(self.conn, (user_id, total, 1)).lastrowid
+        queries.INSERT_PURCHASE.execute(self.conn, (user_id, record_id, quantity, total, None, order_id))
+        return {'id': order_id, 'total_cents': total, 'items': 1}
+
+    def get(self, order_id, user_id):
+        """Заказ пользователя или None"""
+        return queries.ORDER_BY_ID.one(self.conn, (order_id, user_id))
+
+    def items(self, order):
+        """Покупки заказа с пластинкой и компанией (в том числе из архива)"""
+        return archive.order_items(self.conn, order, self.archive_dir)
+
+
+class SqliteIdempotency:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def get(self, user_id, key, ttl):
+        """Сохраненный результат (категория, сообщение, страница) ключа не старше ttl секунд или None"""
+        row = queries.IDEMPOTENCY_GET.one(self.conn, (user_id, key, f'{-int(ttl)} seconds'))
+        return tuple(row) if row else None
+
+    def add(self, user_id, key, outcome):
+        queries.IDEMPOTENCY_ADD.execute(self.conn, (user_id, key, *outcome))
+
+    def purge(self, ttl):
+        """Удаление ключей старше ttl секунд; возвращает их число"""
+        return queries.IDEMPOTENCY_PURGE.execute(self.conn, (f'{-int(ttl)} seconds',)).rowcount
+
+
+class SqliteRepository:
+    """Хранилище поверх соединения SQLite"""
+
+    def __init__(self, conn, db_path=None, archive_dir=None):
+        self.conn = conn
+        db_path = db_path or archive.database_path(conn)
+        self.users = SqliteUsers(conn)
+        self.records = SqliteRecords(conn)
+        self.ensembles = SqliteEnsembles(conn, db_path)
+        self.carts = SqliteCarts(conn)
+        self.orders = SqliteOrders(conn, self.records, archive_dir)
+        self.purchases = SqlitePurchases(conn, archive_dir)
+        self.idempotency = SqliteIdempotency(conn)
+
+    def stats(self):
+        """Число ансамблей, произведений, пластинок и музыкантов"""
+        return dict(queries.INDEX_STATS.one(self.conn))
+
+
+# --- Память ---
+
+def _now():
+    """Текущее время в формате CURRENT_TIMESTAMP SQLite (UTC)"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _coalesce(value, default):
+    return default if value is None else value
+
+
+class SortedIndex:
+    """Отсортированный список ключей (значения сортировки..., id) - аналог индекса SQLite"""
+
+    def __init__(self, key, descending=False):
+        self.key = key
+        self.descending = descending
+        self.keys = []
+
+    def add(self, row):
+        insort(self.keys, self.key(row))
+
+    def remove(self, row):
+        key = self.key(row)
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+
+    def scan(self, after=None):
+        """Ключи по порядку сортировки строго после значений курсора after"""
+        if self.descending:
+            end = len(self.keys) if after is None else bisect_left(self.keys, tuple(after))
+            return (self.keys[i] for i in range(end - 1, -1, -1))
+        start = 0 if after is None else bisect_right(self.keys, tuple(after))
+        return (self.keys[i] for i in range(start, len(self.keys)))
+
+
+def _keyset_page(keyset, indexes, build, sort, cursor, limit):
+    """Страница по ключу из indexes {порядок: SortedIndex}; build(id) - строка результата
+
+    Порядки и курсоры - те же, что у запроса keyset (KeysetQuery), поэтому
+    курсор одного хранилища подходит другому.
+    """
+    sort = keyset.sort_key(sort)
+    index = indexes[sort]
+    after = decode_cursor(cursor, sort, len(keyset.orders[sort].columns))
+    rows, last = [], None
+    for key in index.scan(after):
+        if len(rows) == limit:
+            return Page(rows, encode_cursor(sort, list(last)), sort)
+        rows.append(build(key[-1]))
+        last = key
+    return Page(rows, None, sort)
+
+
+def _list_page(rows, order, cursor, limit):
+    """Страница по ключу из готового списка rows, упорядоченного по столбцам order
+
+    Для сводок, которые кэшируются целиком: курсор тот же, что у KeysetQuery
+    с этим порядком, начало страницы ищется двоичным поиском.
+    """
+    def key(row):
+        return tuple(row[column] for column in order.columns)
+
+    after = decode_cursor(cursor, order.key, len(order.columns))
+    start = 0 if after is None else bisect_right(rows, tuple(after), key=key)
+    page = list(rows[start:start + limit])
+    next_cursor = encode_cursor(order.key, list(key(page[-1]))) if start + limit < len(rows) else None
+    return Page(page, next_cursor, order.key)
+
+
+class MemoryUsers:
+    def __init__(self, store):
+        self.store = store
+        self.table = store.tables['users']
+        self.by_username = {row['username']: user_id for user_id, row in self.table.items()}
+        self.indexes = {'created_at': SortedIndex(lambda row: (row['created_at'], row['id']), descending=True)}
+        for row in self.table.values():
+            self.indexes['created_at'].add(row)
+
+    def get(self, user_id):
+        return self.table.get(int(user_id))
+
+    def role(self, user_id):
+        user = self.table.get(int(user_id))
+        return user['role'] if user else None
+
+    def active_by_username(self, username):
+        user = self.table.get(self.by_username.get(username))
+        return user if user and user['is_active'] else None
+
+    def exists(self, username):
+        return username in self.by_username
+
+    def add(self, username, password_hash, role, full_name, email, phone):
+        if username in self.by_username:
+            raise ValueError(f'Пользователь {username!r} уже существует')
+        row = {'id': self.store.next_id('users'), 'username': username, 'password_hash': password_hash,
+               'role': role, 'full_name': full_name, 'email': email, 'phone': phone,
+               'created_at': _now(), 'is_active': 1}
+        self.table[row['id']] = row
+        self.by_username[username] = row['id']
+        self.indexes['created_at'].add(row)
+
+    def page(self, sort=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        return _keyset_page(queries.USERS_LIST, self.indexes, lambda user_id: dict(self.table[user_id]),
+                            sort, cursor, limit)
+
+    def toggle_active(self, user_id):
+        user = self.table.get(int(user_id))
+        if not user:
+            return None
+        user['is_active'] = int(not user['is_active'])
+        return bool(user['is_active'])
+
+
+class MemoryRecords:
+    # Ключи порядков queries.RECORD_ORDERS (те же выражения, что в SQL)
+    ORDERS = {
+        'title': (lambda row: (row['title'], row['id']), False),
+        'price': (lambda row: (_coalesce(row['retail_price_cents'], 0), row['id']), False),
+        'release_date': (lambda row: (_coalesce(row['release_date'], ''), row['id']), True),
+        'popularity': (lambda row: (row['sold_this_year'], row['id']), True),
+    }
+
+    def __init__(self, store):
+        self.store = store
+        self.table = store.tables['records']
+        self.companies = store.tables['companies']
+        self.by_catalog = {row['catalog_number']: record_id for record_id, row in self.table.items()}
+        # Все пластинки и только имеющиеся в наличии (как частичные индексы SQLite)
+        self.indexes = {key: SortedIndex(fn, descending) for key, (fn, descending) in self.ORDERS.items()}
+        self.in_stock = {key: SortedIndex(fn, descending) for key, (fn, descending) in self.ORDERS.items()}
+        for row in self.table.values():
+            self._index(row)
+
+    def _index(self, row):
+        for index in self.indexes.values():
+            index.add(row)
+        if row['current_stock'] > 0:
+            for index in self.in_stock.values():
+                index.add(row)
+
+    def _unindex(self, row):
+        for index in self.indexes.values():
+            index.remove(row)
+        if row['current_stock'] > 0:
+            for index in self.in_stock.values():
+                index.remove(row)
+
+    def _change(self, row, **values):
+        self._unindex(row)
+        row.update(values)
+        self._index(row)
+
+    def _with_company(self, record_id):
+        row = dict(self.table[record_id])
+        row['company_name'] = self.company_name(row['company_id'])
+        return row
+
+    def get(self, record_id):
+        return self.table.get(int(record_id))
+
+    def company_name(self, company_id):
+        company = self.companies.get(int(company_id))
+        return company['name'] if company else None
+
+    def page(self, sort=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        return _keyset_page(queries.RECORDS_WITH_COMPANY, self.indexes, self._with_company, sort,
+                            cursor, limit)
+
+    def catalog_page(self, sort=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        return _keyset_page(queries.CATALOG, self.in_stock, self._with_company, sort, cursor, limit)
+
+    def sales_leaders(self):
+        leaders = []
+        for key in self.indexes['popularity'].scan():
+            if key[0] <= 0 or len(leaders) == 10:
+                break
+            row = self.table[key[-1]]
+            leaders.append({'catalog_number': row['catalog_number'], 'title': row['title'],
+                            'sold_this_year': row['sold_this_year'],
+                            'company_name': self.company_name(row['company_id']),
+                            'retail_price': row['retail_price'],
+                            'retail_price_cents': row['retail_price_cents']})
+        return leaders
+
+    def _values(self, catalog_number, title, company_id, release_date, wholesale_price_cents,
+                retail_price_cents, current_stock):
+        return {'catalog_number': catalog_number, 'title': title, 'company_id': int(company_id),
+                'release_date': release_date, 'wholesale_price_cents': wholesale_price_cents,
+                'retail_price_cents': retail_price_cents, 'wholesale_price': to_rubles(wholesale_price_cents),
+                'retail_price': to_rubles(retail_price_cents), 'current_stock': current_stock}
+
+    def add(self, *values):
+        row = self._values(*values)
+        if row['catalog_number'] in self.by_catalog:
+            raise ValueError(f"Каталожный номер {row['catalog_number']!r} уже есть")
+        row.update(id=self.store.next_id('records'), sold_last_year=0, sold_this_year=0, rating=None)
+        self.table[row['id']] = row
+        self.by_catalog[row['catalog_number']] = row['id']
+        self._index(row)
+
+    def update(self, record_id, *values):
+        row = self.table.get(int(record_id))
+        if not row:
+            return
+        values = self._values(*values)
+        if self.by_catalog.get(values['catalog_number'], row['id']) != row['id']:
+            raise ValueError(f"Каталожный номер {values['catalog_number']!r} уже есть")
+        del self.by_catalog[row['catalog_number']]
+        self._change(row, **values)
+        self.by_catalog[row['catalog_number']] = row['id']
+
+    def delete(self, record_id):
+        row = self.table.pop(int(record_id), None)
+        if row:
+            self._unindex(row)
+            del self.by_catalog[row['catalog_number']]
+
+    def take_stock(self, items):
+        """Списание остатков целиком или никак (см. SqliteRecords.take_stock)"""
+        check_quantities(items)
+        for record_id, quantity in items:
+            row = self.table.get(int(record_id))
+            if row is None or row['current_stock'] < quantity:
+                raise OutOfStock(record_id)
+        prices = {}
+        for record_id, quantity in items:
+            row = self.table[int(record_id)]
+            self._change(row, current_stock=row['current_stock'] - quantity)
+            prices[record_id] = row['retail_price_cents']
+        return prices
+
+    def add_sold(self, record_id, quantity):
+        """Продажа текущего года (в SQLite - триггер trg_purchases_sales_insert)"""
+        row = self.table[int(record_id)]
+        self._change(row, sold_this_year=row['sold_this_year'] + quantity)
+
+
+class MemoryEnsembles:
+    def __init__(self, store):
+        self.store = store
+        self.table = store.tables['ensembles']
+        tables = store.tables
+        self.with_members = {row['ensemble_id'] for row in tables['ensemble_members'].values()}
+        self.performed = {}
+        records_by_performance = {}
+        for track in tables['record_tracks'].values():
+            records_by_performance.setdefault(track['performance_id'], set()).add(track['record_id'])
+        self.records = {}
+        for performance in tables['performances'].values():
+            ensemble_id = performance['ensemble_id']
+            self.performed.setdefault(ensemble_id, set()).add(performance['composition_id'])
+            self.records.setdefault(ensemble_id, set()).update(records_by_performance.get(performance['id'], ()))
+        self.indexes = {'name': SortedIndex(lambda row: (row['name'], row['id']))}
+        for row in self.table.values():
+            self.indexes['name'].add(row)
+        # Сводка composition_counts; сбрасывается при изменении ансамблей
+        self._counts = None
+
+    def get(self, ensemble_id):
+        return self.table.get(int(ensemble_id))
+
+    def compositions(self, ensemble_id):
+        ensemble_id = int(ensemble_id)
+        if ensemble_id not in self.with_members:
+            return []
+        compositions = self.store.tables['compositions']
+        musicians = self.store.tables['musicians']
+        rows = []
+        for composition_id in self.performed.get(ensemble_id, ()):
+            composition = compositions.get(composition_id)
+            if composition:
+                composer = musicians.get(composition['composer_id'])
+                rows.append({'title': composition['title'], 'genre': composition['genre'],
+                             'year_composed': composition['year_composed'],
+                             'composer_name': composer['name'] if composer else None})
+        return sorted(rows, key=lambda row: row['title'])
+
+    def composition_counts(self):
+        if self._counts is None:
+            rows = [{'id': row['id'], 'name': row['name'], 'type': row['type'],
+                     'compositions_count': len(self.performed.get(row['id'], ()))}
+                    for row in self.table.values() if row['id'] in self.with_members]
+            self._counts = sorted(rows, key=lambda row: (row['name'], row['id']))
+        return self._counts
+
+    def composition_counts_page(self, sort=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        return _list_page(self.composition_counts(), queries.ENSEMBLE_COUNTS_ORDER, cursor, limit)
+
+    def discography(self, ensemble_id):
+        records = self.store.records
+        rows = []
+        for record_id in self.records.get(int(ensemble_id), ()):
+            row = records.table.get(record_id)
+            if row:
+                rows.append({'catalog_number': row['catalog_number'], 'title': row['title'],
+                             'release_date': row['release_date'],
+                             'retail_price_cents': row['retail_price_cents'],
+                             'company_name': records.company_name(row['company_id'])})
+        return sorted(rows, key=lambda row: row['title'])
+
+    def page(self, sort=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        return _keyset_page(queries.ENSEMBLES_PAGE, self.indexes, lambda ensemble_id: dict(self.table[ensemble_id]),
+                            sort, cursor, limit)
+
+    def add(self, name, type_, founded_year, country, description):
+        row = {'id': self.store.next_id('ensembles'), 'name': name, 'type': type_,
+               'founded_year': founded_year, 'country': country, 'description': description}
+        self.table[row['id']] = row
+        self.indexes['name'].add(row)
+        self._counts = None
+
+    def update(self, ensemble_id, name, type_, founded_year, country, description):
+        row = self.table.get(int(ensemble_id))
+        if row:
+            self.indexes['name'].remove(row)
+            row.update(name=name, type=type_, founded_year=founded_year, country=country,
+                       description=description)
+            self.indexes['name'].add(row)
+            self._counts = None
+
+    def delete(self, ensemble_id):
+        row = self.table.pop(int(ensemble_id), None)
+        if row:
+            self.indexes['name'].remove(row)
+            self._counts = None
+
+
+class MemoryCarts:
+    def __init__(self, store):
+        self.store = store
+        self.table = store.tables['cart']
+        self.by_user = {}
+        for row in self.table.values():
+            self.by_user.setdefault(row['user_id'], {})[row['record_id']] = row['id']
+
+    def _item(self, cart_id, user_id):
+        row = self.table.get(int(cart_id))
+        return row if row and row['user_id'] == user_id else None
+
+    def rows(self, user_id):
+        """Строки корзины пользователя без данных пластинок"""
+        return [self.table[cart_id] for cart_id in self.by_user.get(user_id, {}).values()]
+
+    def items(self, user_id):
+        records = self.store.records
+        rows = []
+        for item in sorted(self.rows(user_id), key=lambda row: (row['added_at'], row['id']), reverse=True):
+            record = records.table.get(item['record_id'])
+            if record:
+                rows.append(dict(item, title=record['title'], catalog_number=record['catalog_number'],
+                                 retail_price=record['retail_price'], retail_price_cents=record['retail_price_cents'],
+                                 current_stock=record['current_stock'],
+                                 company_name=records.company_name(record['company_id'])))
+        return rows
+
+    def checkout_items(self, user_id):
+        records = self.store.records.table
+        return [dict(item, title=records[item['record_id']]['title'],
+                     retail_price=records[item['record_id']]['retail_price'],
+                     retail_price_cents=records[item['record_id']]['retail_price_cents'],
+                     current_stock=records[item['record_id']]['current_stock'])
+                for item in self.rows(user_id) if item['record_id'] in records]
+
+    def add(self, user_id, record_id, quantity):
+        items = self.by_user.setdefault(user_id, {})
+        if record_id in items:
+            self.table[items[record_id]]['quantity'] += quantity
+            return
+        row = {'id': self.store.next_id('cart'), 'user_id': user_id, 'record_id': record_id,
+               'quantity': quantity, 'added_at': _now()}
+        self.table[row['id']] = row
+        items[record_id] = row['id']
+
+    def decrease(self, cart_id, user_id):
+        item = self._item(cart_id, user_id)
+        if not item:
+            return None
+        if item['quantity'] > 1:
+            item['quantity'] -= 1
+            return item['quantity']
+        self.remove(cart_id, user_id)
+        return 0
+
+    def remove(self, cart_id, user_id):
+        item = self._item(cart_id, user_id)
+        if item:
+            del self.table[item['id']]
+            del self.by_user[user_id][item['record_id']]
+
+    def subtract(self, cart_id, user_id, quantity):
+        item = self._item(cart_id, user_id)
+        if item and item['quantity'] > quantity:
+            item['quantity'] -= quantity
+        elif item:
+            self.remove(cart_id, user_id)
+
+    def clear(self, user_id):
+        for cart_id in self.by_user.pop(user_id, {}).values():
+            del self.table[cart_id]
+
+
+class MemoryPurchases:
+    def __init__(self, store):
+        self.store = store
+        self.table = store.tables['purchases']
+        self.by_user = {}
+        for row in self.table.values():
+            self._index(row)
+
+    def _index(self, row):
+        index = self.by_user.get(row['user_id'])
+        if index is None:
+            index = self.by_user[row['user_id']] = {
+                'date': SortedIndex(lambda row: (row['purchase_date'], row['id']), descending=True)}
+        index['date'].add(row)
+
+    def add(self, user_id, record_id, quantity, price_cents, seller_id=None, order_id=None):
+        row = {'id': self.store.next_id('purchases'), 'user_id': user_id, 'record_id': record_id,
+               'quantity': quantity, 'price_cents': price_cents, 'price': to_rubles(price_cents),
+               'purchase_date': _now(), 'seller_id': seller_id, 'order_id': order_id}
+        self.table[row['id']] = row
+        self._index(row)
+        self.store.records.add_sold(record_id, quantity)
+        return row['id']
+
+    def with_record(self, purchase_id):
+        """Покупка с названием, каталожным номером и компанией пластинки (как USER_PURCHASES)"""
+        row = dict(self.table[purchase_id])
+        record = self.store.records.table.get(row['record_id'], {})
+        row.update(title=record.get('title'), catalog_number=record.get('catalog_number'),
+                   company_name=self.store.records.company_name(record.get('company_id', 0)))
+        return row
+
+    def page(self, user_id, sort=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        indexes = self.by_user.get(user_id) or {'date': SortedIndex(None)}
+        return _keyset_page(queries.USER_PURCHASES, indexes, self.with_record, sort, cursor, limit)
+
+    def totals(self, user_id):
+        index = self.by_user.get(user_id)
+        keys = index['date'].keys if index else []
+        return {'total_purchases': len(keys),
+                'total_spent_cents': sum(self.table[key[-1]]['price_cents'] for key in keys)}
+
+
+class MemoryOrders:
+    def __init__(self, store):
+        self.store = store
+        self.table = store.tables['orders']
+        self.lines = {}
+        for row in store.tables['purchases'].values():
+            if row['order_id'] is not None:
+                self.lines.setdefault(row['order_id'], []).append(row['id'])
+
+    def place(self, user_id, items):
+        """Заказ целиком или никак (см. SqliteOrders.place)"""
+        check_quantities(items)
+        records = self.store.records
+        lines = {}
+        for record_id, quantity in items:
+            if int(record_id) in records.table:
+                lines[int(record_id)] = lines.get(int(record_id), 0) + quantity
+        if not lines:
+            return None
+        for record_id in sorted(lines):
+            if records.table[record_id]['retail_price_cents'] is None:
+                raise NoPrice(record_id)
+        prices = records.take_stock(list(lines.items()))
+        total = sum(prices[record_id] * quantity for record_id, quantity in lines.items())
+        row = {'id': self.store.next_id('orders'), 'user_id': user_id, 'created_at': _now(),
+               'total_cents': total, 'total': to_rubles(total), 'items': len(lines)}
+        self.table[row['id']] = row
+        self.lines[row['id']] = [
+            self.store.purchases.add(user_id, record_id, quantity, prices[record_id] * quantity,
+                                     order_id=row['id'])
+            for record_id, quantity in sorted(lines.items())]
+        return {'id': row['id'], 'total_cents': total, 'items': len(lines)}
+
+    def get(self, order_id, user_id):
+        order = self.table.get(int(order_id))
+        return order if order and order['user_id'] == user_id else None
+
+    def items(self, order):
+        purchases = self.store.purchases
+        return [purchases.with_record(purchase_id) for purchase_id in self.lines.get(order['id'], ())]
+
+
+class MemoryIdempotency:
+    """Ключи идемпотентности в памяти (в файл базы не записываются)"""
+
+    def __init__(self):
+        self.keys = {}
+
+    def _since(self, ttl):
+        return (datetime.now(timezone.utc) - timedelta(seconds=ttl)).strftime('%Y-%m-%d %H:%M:%S')
+
+    def get(self, user_id, key, ttl):
+        entry = self.keys.get((user_id, key))
+        return entry[1] if entry and entry[0] >= self._since(ttl) else None
+
+    def add(self, user_id, key, outcome):
+        self.keys[(user_id, key)] = (_now(), tuple(outcome))
+
+    def purge(self, ttl):
+        since = self._since(ttl)
+        expired = [name for name, (created_at, _) in self.keys.items() if created_at < since]
+        for name in expired:
+            del self.keys[name]
+        return len(expired)
+
+
+# Таблицы, загружаемые в память целиком
+MEMORY_TABLES = ['companies', 'musicians', 'ensembles', 'ensemble_members', 'compositions', 'performances',
+                 'records', 'record_tracks', 'users', 'cart', 'orders', 'purchases']
+
+
+class MemoryRepository:
+    """Хранилище в памяти процесса (для замеров и тестов)
+
+    Записи выполняются под блокировкой (run_write) без отката: операции
+    маршрутов сначала проверяют данные и только потом их меняют.
+    """
+
+    def __init__(self, tables):
+        self.lock = threading.RLock()
+        self.tables = tables
+        self._next_ids = {name: max(rows, default=0) + 1 for name, rows in tables.items()}
+        self.users = MemoryUsers(self)
+        self.records = MemoryRecords(self)
+        self.ensembles = MemoryEnsembles(self)
+        self.carts = MemoryCarts(self)
+        self.purchases = MemoryPurchases(self)
+        self.orders = MemoryOrders(self)
+        self.idempotency = MemoryIdempotency()
+
+    @classmethod
+    def load(cls, conn):
+        """Копия таблиц базы в памяти"""
+        tables = {}
+        for name in MEMORY_TABLES:
+            cursor = conn.execute(f'SELECT * FROM {name}')
+            columns = [column[0] for column in cursor.description]
+            tables[name] = {row[0]: dict(zip(columns, row)) for row in cursor}
+        return cls(tables)
+
+    def next_id(self, table):
+        value = self._next_ids[table]
+        self._next_ids[table] = value + 1
+        return value
+
+    def stats(self):
+        return {'total_ensembles': len(self.tables['ensembles']),
+                'total_compositions': len(self.tables['compositions']),
+                'total_records': len(self.tables['records']),
+                'total_musicians': len(self.tables['musicians'])}
+
+
+# --- Приложение ---
+
+_memory = {}
+_memory_lock = threading.Lock()
+
+
+def _memory_repository(app):
+    key = (os.getpid(), app.config['DATABASE'])
+    with _memory_lock:
+        if key not in _memory:
+            conn = db_pool.connect(app.config['DATABASE'], readonly=True)
+            try:
+                _memory[key] = MemoryRepository.load(conn)
+            finally:
+                conn.close()
+        return _memory[key]
+
+
+def reset_memory():
+    """Сброс хранилищ в памяти (следующее обращение загрузит их из файла заново)"""
+    with _memory_lock:
+        _memory.clear()
+
+
+def get_repository():
+    """Хранилище текущего контекста для чтения"""
+    if current_app.config['STORAGE'] == 'memory':
+        return _memory_repository(current_app)
+    if 'repository' not in g:
+        g.repository = SqliteRepository(db_pool.get_db(), current_app.config['DATABASE'],
+                                        current_app.config.get('ARCHIVE_DIR'))
+    return g.repository
+
+
+def run_write(fn):
+    """Выполнение fn(хранилище) в транзакции записи; возвращает результат fn"""
+    if current_app.config['STORAGE'] == 'memory':
+        repository = _memory_repository(current_app)
+        with repository.lock:
+            return fn(repository)
+    db_path, archive_dir = current_app.config['DATABASE'], current_app.config.get('ARCHIVE_DIR')
+    return db_pool.run_write(lambda conn: fn(SqliteRepository(conn, db_path, archive_dir)))
+
+
+def init_app(app):
+    """Выбор хранилища: STORAGE=sqlite (по умолчанию) или memory"""
+    app.config.setdefault('STORAGE', os.environ.get('STORAGE', 'sqlite'))
@@ -0,0 +1,85 @@
+"""
+Обслуживание счетчиков продаж records.sold_this_year / sold_last_year
+
+Счетчики ведутся триггерами по таблице purchases (миграция 0003).
+Здесь - перевод учетного года и полный пересчет из purchases;
+обе операции выполняются set-based запросами в одной транзакции.
+"""
+from datetime import datetime
+
+
+def current_period(conn):
+    """Текущий учетный год счетчиков"""
+    return conn.execute('SELECT year FROM sales_period WHERE id = 1').fetchone()[0]
+
+
+def rollover(conn, year=None):
+    """Перевод учетного года: продажи текущего года становятся продажами прошлого
+
+    Возвращает новый учетный год или None, если перевод не нужен.
+    """
+    year = year or datetime.now().year
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        period = current_period(conn)
+        if year <= period:
+            conn.rollback()
+            return None
+        if year == period + 1:
+            conn.execute('''
+                UPDATE records
+                SET sold_last_year = sold_this_year, sold_this_year = 0
+                WHERE sold_this_year != 0 OR sold_last_year != 0
+            ''')
+            # Покупки нового года, сделанные до перевода, триггер уже отнес
+            # к sold_this_year - возвращаем их из прошлого года в текущий
+            conn.execute('''
+                UPDATE records
+                SET sold_this_year = n.quantity,
+                    sold_last_year = sold_last_year - n.quantity
+                FROM (SELECT record_id, SUM(quantity) AS quantity
+                      FROM purchases
+                      WHERE purchase_date >= ?
+                      GROUP BY record_id) AS n
+                WHERE records.id = n.record_id
+            ''', (f'{year}-01-01',))
+            conn.execute('UPDATE sales_period SET year = ? WHERE id = 1', (year,))
+        else:
+            # Пропущено больше года - прошлогодние итоги берем из purchases
+            conn.execute('UPDATE sales_period SET year = ? WHERE id = 1', (year,))
+            _recount(conn, year)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return year
+
+
+def recount(conn):
+    """Полный пересчет счетчиков из purchases для текущего учетного года"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        _recount(conn, current_period(conn))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _recount(conn, year):
+    conn.execute('''
+        UPDATE records SET sold_this_year = 0, sold_last_year = 0
+        WHERE sold_this_year != 0 OR sold_last_year != 0
+    ''')
+    this_start, last_start = f'{year}-01-01', f'{year - 1}-01-01'
+    conn.execute('''
+        UPDATE records
+        SET sold_this_year = a.this_year, sold_last_year = a.last_year
+        FROM (SELECT record_id,
+                     SUM(CASE WHEN purchase_date >= ? THEN quantity ELSE 0 END) AS this_year,
+                     SUM(CASE WHEN purchase_date < ? THEN quantity ELSE 0 END) AS last_year
+              FROM purchases
+              WHERE purchase_date >= ?
+              GROUP BY record_id) AS a
+        WHERE records.id = a.record_id
+    ''', (this_start, this_start, last_start))
@@ -7,27 +7,22 @@ import sqlite3
 import os
 import sys
 
-def apply_migration(db_path):
-    """Применение миграции для добавления поля rating"""
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import migrations
+
+def apply_migrations(db_path):
+    """Применение неприменных миграций из schema/migrations"""
     try:
         conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Проверяем, существует ли уже поле rating
-        cursor.execute("PRAGMA table_info(records)")
-        columns = [row[1] for row in cursor.fetchall()]
-        
-        if 'rating' not in columns:
-            print("Применение миграции: добавление поля rating...")
-            cursor.execute("ALTER TABLE records ADD COLUMN rating DECIMAL(3,2) DEFAULT NULL")
-            conn.commit()
-            print("✅ Миграция применена успешно")
-        else:
-            print("ℹ️  Поле rating уже существует")
-        
+        done = migrations.upgrade(conn, log=print)
         conn.close()
+        if done:
+            print("✅ Миграции применены успешно")
+        else:
+            print("ℹ️  Схема актуальна")
     except Exception as e:
-        print(f"❌ Ошибка при применении миграции: {e}")
+        print(f"❌ Ошибка при применении миграций: {e}")
         sys.exit(1)
 
 def export_schema(db_path, output_file):
@@ -82,8 +77,8 @@ if __name__ == "__main__":
         print(f"❌ База данных не найдена: {db_path}")
         sys.exit(1)
     
-    # Применяем миграцию
-    apply_migration(db_path)
+    # Применяем миграции
+    apply_migrations(db_path)
     
     # Выгружаем схему
     output_file = os.path.join(os.path.dirname(__file__), 'schema.sql')
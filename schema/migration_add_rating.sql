@@ -1 +0,0 @@
-ALTER TABLE records ADD COLUMN rating DECIMAL(3, 2) DEFAULT 0.0;
@@ -1 +0,0 @@
-ALTER TABLE records ADD COLUMN test_field TEXT DEFAULT 'lab8_test';
@@ -0,0 +1,9 @@
+"""
+Добавление поля rating в records (если база создана до его появления)
+"""
+from migrations import column_exists
+
+
+def upgrade(conn):
+    if not column_exists(conn, 'records', 'rating'):
+        conn.execute('ALTER TABLE records ADD COLUMN rating DECIMAL(3,2) DEFAULT NULL')
@@ -0,0 +1,20 @@
+-- Вторичные индексы по внешним ключам и частым фильтрам.
+-- Идемпотентна: можно применять к существующей data/music_store.db без остановки приложения.
+CREATE INDEX IF NOT EXISTS idx_performances_ensemble ON performances (ensemble_id, composition_id);
+CREATE INDEX IF NOT EXISTS idx_performances_composition ON performances (composition_id);
+CREATE INDEX IF NOT EXISTS idx_record_tracks_record ON record_tracks (record_id, performance_id);
+CREATE INDEX IF NOT EXISTS idx_record_tracks_performance ON record_tracks (performance_id, record_id);
+CREATE INDEX IF NOT EXISTS idx_ensemble_members_ensemble ON ensemble_members (ensemble_id, musician_id);
+CREATE INDEX IF NOT EXISTS idx_ensemble_members_musician ON ensemble_members (musician_id);
+CREATE INDEX IF NOT EXISTS idx_compositions_composer ON compositions (composer_id);
+CREATE INDEX IF NOT EXISTS idx_records_company ON records (company_id);
+CREATE INDEX IF NOT EXISTS idx_records_title ON records (title);
+CREATE INDEX IF NOT EXISTS idx_records_in_stock_title ON records (title) WHERE current_stock > 0;
+CREATE INDEX IF NOT EXISTS idx_records_sold_this_year ON records (sold_this_year DESC) WHERE sold_this_year > 0;
+CREATE INDEX IF NOT EXISTS idx_purchases_user_date ON purchases (user_id, purchase_date DESC);
+CREATE INDEX IF NOT EXISTS idx_purchases_record ON purchases (record_id);
+CREATE INDEX IF NOT EXISTS idx_cart_user_record ON cart (user_id, record_id);
+CREATE INDEX IF NOT EXISTS idx_ensembles_name ON ensembles (name);
+CREATE INDEX IF NOT EXISTS idx_companies_name ON companies (name);
+CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at DESC);
+ANALYZE;
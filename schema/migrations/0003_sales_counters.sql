@@ -0,0 +1,62 @@
+-- Счетчики продаж records.sold_this_year / sold_last_year поддерживаются
+-- триггерами по таблице purchases. Текущий учетный год хранится в sales_period
+-- и переводится командой `python manage_db.py sales rollover`.
+
+CREATE TABLE IF NOT EXISTS sales_period (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    year INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO sales_period (id, year) VALUES (1, CAST(strftime('%Y', 'now') AS INTEGER));
+
+-- Покупки текущего (и еще не закрытого следующего) года идут в sold_this_year,
+-- покупки предыдущего года - в sold_last_year
+CREATE TRIGGER IF NOT EXISTS trg_purchases_sales_insert
+AFTER INSERT ON purchases
+BEGIN
+    UPDATE records
+    SET sold_this_year = sold_this_year + CASE
+            WHEN CAST(strftime('%Y', NEW.purchase_date) AS INTEGER) >= (SELECT year FROM sales_period)
+            THEN NEW.quantity ELSE 0 END,
+        sold_last_year = sold_last_year + CASE
+            WHEN CAST(strftime('%Y', NEW.purchase_date) AS INTEGER) = (SELECT year FROM sales_period) - 1
+            THEN NEW.quantity ELSE 0 END
+    WHERE id = NEW.record_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_purchases_sales_delete
+AFTER DELETE ON purchases
+BEGIN
+    UPDATE records
+    SET sold_this_year = sold_this_year - CASE
+            WHEN CAST(strftime('%Y', OLD.purchase_date) AS INTEGER) >= (SELECT year FROM sales_period)
+            THEN OLD.quantity ELSE 0 END,
+        sold_last_year = sold_last_year - CASE
+            WHEN CAST(strftime('%Y', OLD.purchase_date) AS INTEGER) = (SELECT year FROM sales_period) - 1
+            THEN OLD.quantity ELSE 0 END
+    WHERE id = OLD.record_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_purchases_sales_update
+AFTER UPDATE OF record_id, quantity, purchase_date ON purchases
+BEGIN
+    UPDATE records
+    SET sold_this_year = sold_this_year - CASE
+            WHEN CAST(strftime('%Y', OLD.purchase_date) AS INTEGER) >= (SELECT year FROM sales_period)
+            THEN OLD.quantity ELSE 0 END,
+        sold_last_year = sold_last_year - CASE
+            WHEN CAST(strftime('%Y', OLD.purchase_date) AS INTEGER) = (SELECT year FROM sales_period) - 1
+            THEN OLD.quantity ELSE 0 END
+    WHERE id = OLD.record_id;
+    UPDATE records
+    SET sold_this_year = sold_this_year + CASE
+            WHEN CAST(strftime('%Y', NEW.purchase_date) AS INTEGER) >= (SELECT year FROM sales_period)
+            THEN NEW.quantity ELSE 0 END,
+        sold_last_year = sold_last_year + CASE
+            WHEN CAST(strftime('%Y', NEW.purchase_date) AS INTEGER) = (SELECT year FROM sales_period) - 1
+            THEN NEW.quantity ELSE 0 END
+    WHERE id = NEW.record_id;
+END;
+
+-- Выборка покупок по дате для перевода года и пересчета
+CREATE INDEX IF NOT EXISTS idx_purchases_date ON purchases (purchase_date);
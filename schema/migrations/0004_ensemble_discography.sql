@@ -0,0 +1,97 @@
+-- Материализованная связь ансамбль -> пластинка для страницы ensemble_records.
+-- Поддерживается триггерами по record_tracks, performances, records и ensembles;
+-- полностью перестраивается командой `python manage_db.py discography rebuild`.
+
+CREATE TABLE IF NOT EXISTS ensemble_discography (
+    ensemble_id INTEGER NOT NULL,
+    record_id INTEGER NOT NULL,
+    PRIMARY KEY (ensemble_id, record_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_ensemble_discography_record
+    ON ensemble_discography (record_id, ensemble_id);
+
+INSERT OR IGNORE INTO ensemble_discography (ensemble_id, record_id)
+SELECT DISTINCT p.ensemble_id, rt.record_id
+FROM record_tracks rt
+JOIN performances p ON rt.performance_id = p.id;
+
+CREATE TRIGGER IF NOT EXISTS trg_record_tracks_discography_insert
+AFTER INSERT ON record_tracks
+BEGIN
+    INSERT OR IGNORE INTO ensemble_discography (ensemble_id, record_id)
+    SELECT ensemble_id, NEW.record_id FROM performances WHERE id = NEW.performance_id;
+END;
+
+-- Пара удаляется, только если у пластинки не осталось других треков этого ансамбля
+CREATE TRIGGER IF NOT EXISTS trg_record_tracks_discography_delete
+AFTER DELETE ON record_tracks
+BEGIN
+    DELETE FROM ensemble_discography
+    WHERE record_id = OLD.record_id
+      AND ensemble_id = (SELECT ensemble_id FROM performances WHERE id = OLD.performance_id)
+      AND NOT EXISTS (
+          SELECT 1 FROM record_tracks rt
+          JOIN performances p ON rt.performance_id = p.id
+          WHERE rt.record_id = OLD.record_id
+            AND p.ensemble_id = ensemble_discography.ensemble_id
+      );
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_record_tracks_discography_update
+AFTER UPDATE OF record_id, performance_id ON record_tracks
+BEGIN
+    DELETE FROM ensemble_discography
+    WHERE record_id = OLD.record_id
+      AND ensemble_id = (SELECT ensemble_id FROM performances WHERE id = OLD.performance_id)
+      AND NOT EXISTS (
+          SELECT 1 FROM record_tracks rt
+          JOIN performances p ON rt.performance_id = p.id
+          WHERE rt.record_id = OLD.record_id
+            AND p.ensemble_id = ensemble_discography.ensemble_id
+      );
+    INSERT OR IGNORE INTO ensemble_discography (ensemble_id, record_id)
+    SELECT ensemble_id, NEW.record_id FROM performances WHERE id = NEW.performance_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_performances_discography_update
+AFTER UPDATE OF ensemble_id ON performances
+BEGIN
+    DELETE FROM ensemble_discography
+    WHERE ensemble_id = OLD.ensemble_id
+      AND record_id IN (SELECT record_id FROM record_tracks WHERE performance_id = OLD.id)
+      AND NOT EXISTS (
+          SELECT 1 FROM record_tracks rt
+          JOIN performances p ON rt.performance_id = p.id
+          WHERE rt.record_id = ensemble_discography.record_id
+            AND p.ensemble_id = OLD.ensemble_id
+      );
+    INSERT OR IGNORE INTO ensemble_discography (ensemble_id, record_id)
+    SELECT NEW.ensemble_id, record_id FROM record_tracks WHERE performance_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_performances_discography_delete
+AFTER DELETE ON performances
+BEGIN
+    DELETE FROM ensemble_discography
+    WHERE ensemble_id = OLD.ensemble_id
+      AND record_id IN (SELECT record_id FROM record_tracks WHERE performance_id = OLD.id)
+      AND NOT EXISTS (
+          SELECT 1 FROM record_tracks rt
+          JOIN performances p ON rt.performance_id = p.id
+          WHERE rt.record_id = ensemble_discography.record_id
+            AND p.ensemble_id = OLD.ensemble_id
+      );
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_records_discography_delete
+AFTER DELETE ON records
+BEGIN
+    DELETE FROM ensemble_discography WHERE record_id = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_ensembles_discography_delete
+AFTER DELETE ON ensembles
+BEGIN
+    DELETE FROM ensemble_discography WHERE ensemble_id = OLD.id;
+END;
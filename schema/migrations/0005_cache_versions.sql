@@ -0,0 +1,59 @@
+-- Версии кэшируемых в памяти процесса результатов запросов (см. cache.py).
+-- Триггеры увеличивают версию при изменении исходных таблиц; каждый процесс
+-- сверяет ее перед использованием кэша, поэтому сброс виден всем процессам.
+
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+-- Количество произведений всех ансамблей: performances, ensemble_members, ensembles
+INSERT OR IGNORE INTO cache_versions (name) VALUES ('ensemble_composition_counts');
+
+CREATE TRIGGER IF NOT EXISTS trg_performances_cache_insert
+AFTER INSERT ON performances
+BEGIN
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'ensemble_composition_counts';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_performances_cache_update
+AFTER UPDATE OF ensemble_id, composition_id ON performances
+BEGIN
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'ensemble_composition_counts';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_performances_cache_delete
+AFTER DELETE ON performances
+BEGIN
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'ensemble_composition_counts';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_ensemble_members_cache_insert
+AFTER INSERT ON ensemble_members
+BEGIN
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'ensemble_composition_counts';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_ensemble_members_cache_delete
+AFTER DELETE ON ensemble_members
+BEGIN
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'ensemble_composition_counts';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_ensembles_cache_insert
+AFTER INSERT ON ensembles
+BEGIN
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'ensemble_composition_counts';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_ensembles_cache_update
+AFTER UPDATE ON ensembles
+BEGIN
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'ensemble_composition_counts';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_ensembles_cache_delete
+AFTER DELETE ON ensembles
+BEGIN
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'ensemble_composition_counts';
+END;
@@ -0,0 +1,21 @@
+-- Индексы для постраничного вывода по ключу (pagination.py, queries.KeysetQuery).
+-- Порядок "по убыванию, затем id по убыванию" читается обратным проходом по
+-- индексу с возрастанием, поэтому индексы с DESC пересоздаются без него.
+
+-- catalog: только товары в наличии
+CREATE INDEX IF NOT EXISTS idx_records_in_stock_price ON records (COALESCE(retail_price, 0)) WHERE current_stock > 0;
+CREATE INDEX IF NOT EXISTS idx_records_in_stock_release ON records (COALESCE(release_date, '')) WHERE current_stock > 0;
+CREATE INDEX IF NOT EXISTS idx_records_in_stock_popularity ON records (sold_this_year) WHERE current_stock > 0;
+
+-- manage_records: все пластинки
+CREATE INDEX IF NOT EXISTS idx_records_price ON records (COALESCE(retail_price, 0));
+CREATE INDEX IF NOT EXISTS idx_records_release ON records (COALESCE(release_date, ''));
+CREATE INDEX IF NOT EXISTS idx_records_popularity ON records (sold_this_year);
+
+-- personal_cabinet и manage_users
+DROP INDEX IF EXISTS idx_purchases_user_date;
+CREATE INDEX idx_purchases_user_date ON purchases (user_id, purchase_date);
+DROP INDEX IF EXISTS idx_users_created_at;
+CREATE INDEX idx_users_created_at ON users (created_at);
+
+ANALYZE;
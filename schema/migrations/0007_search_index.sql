@@ -0,0 +1,117 @@
+-- Полнотекстовый поиск (search.py): одна таблица FTS5 по названиям пластинок,
+-- произведений, имен музыкантов, ансамблей и компаний.
+-- rowid = id * 8 + вид (1 - пластинка, 2 - произведение, 3 - музыкант,
+-- 4 - ансамбль, 5 - компания), поэтому триггеры обновляют строку по rowid.
+-- unicode61 приводит регистр (и кириллицу); ё заменяется на е при записи
+-- и в запросе, так как токенизатор считает их разными буквами.
+
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    name,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+
+-- records.title
+INSERT INTO search_index (rowid, name) SELECT id * 8 + 1, replace(replace(title, 'ё', 'е'), 'Ё', 'Е') FROM records;
+
+CREATE TRIGGER IF NOT EXISTS trg_records_search_insert
+AFTER INSERT ON records
+BEGIN
+    INSERT INTO search_index (rowid, name) VALUES (NEW.id * 8 + 1, replace(replace(NEW.title, 'ё', 'е'), 'Ё', 'Е'));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_records_search_update
+AFTER UPDATE OF title ON records
+BEGIN
+    UPDATE search_index SET name = replace(replace(NEW.title, 'ё', 'е'), 'Ё', 'Е') WHERE rowid = NEW.id * 8 + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_records_search_delete
+AFTER DELETE ON records
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 1;
+END;
+
+-- compositions.title
+INSERT INTO search_index (rowid, name) SELECT id * 8 + 2, replace(replace(title, 'ё', 'е'), 'Ё', 'Е') FROM compositions;
+
+CREATE TRIGGER IF NOT EXISTS trg_compositions_search_insert
+AFTER INSERT ON compositions
+BEGIN
+    INSERT INTO search_index (rowid, name) VALUES (NEW.id * 8 + 2, replace(replace(NEW.title, 'ё', 'е'), 'Ё', 'Е'));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_compositions_search_update
+AFTER UPDATE OF title ON compositions
+BEGIN
+    UPDATE search_index SET name = replace(replace(NEW.title, 'ё', 'е'), 'Ё', 'Е') WHERE rowid = NEW.id * 8 + 2;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_compositions_search_delete
+AFTER DELETE ON compositions
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 2;
+END;
+
+-- musicians.name
+INSERT INTO search_index (rowid, name) SELECT id * 8 + 3, replace(replace(name, 'ё', 'е'), 'Ё', 'Е') FROM musicians;
+
+CREATE TRIGGER IF NOT EXISTS trg_musicians_search_insert
+AFTER INSERT ON musicians
+BEGIN
+    INSERT INTO search_index (rowid, name) VALUES (NEW.id * 8 + 3, replace(replace(NEW.name, 'ё', 'е'), 'Ё', 'Е'));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_musicians_search_update
+AFTER UPDATE OF name ON musicians
+BEGIN
+    UPDATE search_index SET name = replace(replace(NEW.name, 'ё', 'е'), 'Ё', 'Е') WHERE rowid = NEW.id * 8 + 3;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_musicians_search_delete
+AFTER DELETE ON musicians
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 3;
+END;
+
+-- ensembles.name
+INSERT INTO search_index (rowid, name) SELECT id * 8 + 4, replace(replace(name, 'ё', 'е'), 'Ё', 'Е') FROM ensembles;
+
+CREATE TRIGGER IF NOT EXISTS trg_ensembles_search_insert
+AFTER INSERT ON ensembles
+BEGIN
+    INSERT INTO search_index (rowid, name) VALUES (NEW.id * 8 + 4, replace(replace(NEW.name, 'ё', 'е'), 'Ё', 'Е'));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_ensembles_search_update
+AFTER UPDATE OF name ON ensembles
+BEGIN
+    UPDATE search_index SET name = replace(replace(NEW.name, 'ё', 'е'), 'Ё', 'Е') WHERE rowid = NEW.id * 8 + 4;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_ensembles_search_delete
+AFTER DELETE ON ensembles
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 4;
+END;
+
+-- companies.name
+INSERT INTO search_index (rowid, name) SELECT id * 8 + 5, replace(replace(name, 'ё', 'е'), 'Ё', 'Е') FROM companies;
+
+CREATE TRIGGER IF NOT EXISTS trg_companies_search_insert
+AFTER INSERT ON companies
+BEGIN
+    INSERT INTO search_index (rowid, name) VALUES (NEW.id * 8 + 5, replace(replace(NEW.name, 'ё', 'е'), 'Ё', 'Е'));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_companies_search_update
+AFTER UPDATE OF name ON companies
+BEGIN
+    UPDATE search_index SET name = replace(replace(NEW.name, 'ё', 'е'), 'Ё', 'Е') WHERE rowid = NEW.id * 8 + 5;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_companies_search_delete
+AFTER DELETE ON companies
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 5;
+END;
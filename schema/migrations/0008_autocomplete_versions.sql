@@ -0,0 +1,40 @@
+-- Версии индексов автодополнения (autocomplete.py): ансамбли и компании
+
+INSERT OR IGNORE INTO cache_versions (name) VALUES ('autocomplete_ensembles');
+INSERT OR IGNORE INTO cache_versions (name) VALUES ('autocomplete_companies');
+
+CREATE TRIGGER IF NOT EXISTS trg_ensembles_autocomplete_insert
+AFTER INSERT ON ensembles
+BEGIN
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'autocomplete_ensembles';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_ensembles_autocomplete_update
+AFTER UPDATE OF name, type ON ensembles
+BEGIN
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'autocomplete_ensembles';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_ensembles_autocomplete_delete
+AFTER DELETE ON ensembles
+BEGIN
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'autocomplete_ensembles';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_companies_autocomplete_insert
+AFTER INSERT ON companies
+BEGIN
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'autocomplete_companies';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_companies_autocomplete_update
+AFTER UPDATE OF name ON companies
+BEGIN
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'autocomplete_companies';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_companies_autocomplete_delete
+AFTER DELETE ON companies
+BEGIN
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'autocomplete_companies';
+END;
@@ -0,0 +1,48 @@
+-- Импорт прайс-листов (importers.py) обновляет пластинки целиком, поэтому
+-- UPDATE OF title срабатывает и при неизменном названии. Условие WHEN
+-- оставляет перезапись search_index только для реально измененных названий.
+
+DROP TRIGGER IF EXISTS trg_records_search_update;
+
+CREATE TRIGGER trg_records_search_update
+AFTER UPDATE OF title ON records
+WHEN NEW.title IS NOT OLD.title
+BEGIN
+    UPDATE search_index SET name = replace(replace(NEW.title, 'ё', 'е'), 'Ё', 'Е') WHERE rowid = NEW.id * 8 + 1;
+END;
+
+DROP TRIGGER IF EXISTS trg_compositions_search_update;
+
+CREATE TRIGGER trg_compositions_search_update
+AFTER UPDATE OF title ON compositions
+WHEN NEW.title IS NOT OLD.title
+BEGIN
+    UPDATE search_index SET name = replace(replace(NEW.title, 'ё', 'е'), 'Ё', 'Е') WHERE rowid = NEW.id * 8 + 2;
+END;
+
+DROP TRIGGER IF EXISTS trg_musicians_search_update;
+
+CREATE TRIGGER trg_musicians_search_update
+AFTER UPDATE OF name ON musicians
+WHEN NEW.name IS NOT OLD.name
+BEGIN
+    UPDATE search_index SET name = replace(replace(NEW.name, 'ё', 'е'), 'Ё', 'Е') WHERE rowid = NEW.id * 8 + 3;
+END;
+
+DROP TRIGGER IF EXISTS trg_ensembles_search_update;
+
+CREATE TRIGGER trg_ensembles_search_update
+AFTER UPDATE OF name ON ensembles
+WHEN NEW.name IS NOT OLD.name
+BEGIN
+    UPDATE search_index SET name = replace(replace(NEW.name, 'ё', 'е'), 'Ё', 'Е') WHERE rowid = NEW.id * 8 + 4;
+END;
+
+DROP TRIGGER IF EXISTS trg_companies_search_update;
+
+CREATE TRIGGER trg_companies_search_update
+AFTER UPDATE OF name ON companies
+WHEN NEW.name IS NOT OLD.name
+BEGIN
+    UPDATE search_index SET name = replace(replace(NEW.name, 'ё', 'е'), 'Ё', 'Е') WHERE rowid = NEW.id * 8 + 5;
+END;
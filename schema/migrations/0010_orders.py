@@ -0,0 +1,25 @@
+"""
+Заказы: заголовок orders и номер заказа у покупок (purchases.order_id)
+
+Строки заказа - покупки с его order_id: на них уже работают триггеры
+счетчиков продаж, история покупок и архив. У покупок, сделанных до
+появления заказов, order_id пустой.
+"""
+from migrations import column_exists
+
+
+def upgrade(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            total DECIMAL(10,2) NOT NULL,
+            items INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders (user_id, created_at)')
+    if not column_exists(conn, 'purchases', 'order_id'):
+        conn.execute('ALTER TABLE purchases ADD COLUMN order_id INTEGER REFERENCES orders (id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_purchases_order ON purchases (order_id)')
@@ -0,0 +1,16 @@
+-- Ключи идемпотентности покупки и оформления заказа (idempotency.py).
+-- Повтор запроса с тем же ключом возвращает сохраненный результат и не пишет
+-- покупки заново. Ключи живут IDEMPOTENCY_TTL секунд, просроченные удаляются
+-- приложением по индексу created_at.
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    category TEXT NOT NULL,
+    message TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, key)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys (created_at);
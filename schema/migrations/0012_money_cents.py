@@ -0,0 +1,83 @@
+"""
+Денежные суммы в целых копейках: records.retail_price_cents и
+wholesale_price_cents, purchases.price_cents, orders.total_cents
+
+Миграция онлайн: столбцы добавляются сразу, триггеры создаются до
+заполнения (записи, задающие только DECIMAL, - импорт, seed, старые
+скрипты, а также приложение во время миграции - получают копейки от них),
+существующие строки заполняются пакетами migrations.backfill(). Столбцы
+DECIMAL остаются зеркалом в рублях. Индексы сортировки по цене
+переводятся на копейки, файлы архива получают price_cents через
+archive.sync().
+"""
+import os
+
+import archive
+from migrations import backfill, column_exists
+
+# (таблица, столбец копеек, столбец DECIMAL)
+COLUMNS = [
+    ('records', 'retail_price_cents', 'retail_price'),
+    ('records', 'wholesale_price_cents', 'wholesale_price'),
+    ('purchases', 'price_cents', 'price'),
+    ('orders', 'total_cents', 'total'),
+]
+
+TRIGGERS = '''
+CREATE TRIGGER IF NOT EXISTS trg_records_money_insert
+AFTER INSERT ON records
+WHEN (NEW.retail_price_cents IS NULL AND NEW.retail_price IS NOT NULL)
+  OR (NEW.wholesale_price_cents IS NULL AND NEW.wholesale_price IS NOT NULL)
+BEGIN
+    UPDATE records
+    SET retail_price_cents = COALESCE(NEW.retail_price_cents, CAST(ROUND(NEW.retail_price * 100) AS INTEGER)),
+        wholesale_price_cents = COALESCE(NEW.wholesale_price_cents,
+                                         CAST(ROUND(NEW.wholesale_price * 100) AS INTEGER))
+    WHERE id = NEW.id;
+END;
+
+-- Изменены только цены DECIMAL: копейки пересчитываются из них
+CREATE TRIGGER IF NOT EXISTS trg_records_money_update
+AFTER UPDATE OF retail_price, wholesale_price ON records
+WHEN NEW.retail_price_cents IS OLD.retail_price_cents
+ AND NEW.wholesale_price_cents IS OLD.wholesale_price_cents
+BEGIN
+    UPDATE records
+    SET retail_price_cents = CAST(ROUND(NEW.retail_price * 100) AS INTEGER),
+        wholesale_price_cents = CAST(ROUND(NEW.wholesale_price * 100) AS INTEGER)
+    WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_purchases_money_insert
+AFTER INSERT ON purchases
+WHEN NEW.price_cents IS NULL AND NEW.price IS NOT NULL
+BEGIN
+    UPDATE purchases SET price_cents = CAST(ROUND(NEW.price * 100) AS INTEGER) WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_purchases_money_update
+AFTER UPDATE OF price ON purchases
+WHEN NEW.price_cents IS OLD.price_cents
+BEGIN
+    UPDATE purchases SET price_cents = CAST(ROUND(NEW.price * 100) AS INTEGER) WHERE id = NEW.id;
+END;
+'''
+
+
+def upgrade(conn):
+    for table, column, _ in COLUMNS:
+        if not column_exists(conn, table, column):
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} INTEGER')
+    conn.executescript(TRIGGERS)
+    for table, column, source in COLUMNS:
+        backfill(conn, f'0012_{table}_{column}', table, f'{column} = CAST(ROUND({source} * 100) AS INTEGER)',
+                 where=f'{column} IS NULL AND {source} IS NOT NULL')
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_records_in_stock_price_cents '
+                 'ON records (COALESCE(retail_price_cents, 0)) WHERE current_stock > 0')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_records_price_cents ON records (COALESCE(retail_price_cents, 0))')
+    conn.execute('DROP INDEX IF EXISTS idx_records_in_stock_price')
+    conn.execute('DROP INDEX IF EXISTS idx_records_price')
+    conn.commit()
+
+    archive.sync(conn, os.environ.get('ARCHIVE_DIR'))
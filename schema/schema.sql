@@ -59,6 +59,8 @@ CREATE TABLE records (
     sold_last_year INTEGER DEFAULT 0,
     sold_this_year INTEGER DEFAULT 0,
     rating DECIMAL(3,2) DEFAULT NULL,
+    retail_price_cents INTEGER,
+    wholesale_price_cents INTEGER,
     FOREIGN KEY (company_id) REFERENCES companies (id)
 );
 
@@ -111,7 +113,90 @@ CREATE TABLE purchases (
     price DECIMAL(10,2) NOT NULL,
     purchase_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     seller_id INTEGER,
+    order_id INTEGER REFERENCES orders (id),
+    price_cents INTEGER,
     FOREIGN KEY (user_id) REFERENCES users (id),
     FOREIGN KEY (record_id) REFERENCES records (id),
     FOREIGN KEY (seller_id) REFERENCES users (id)
 );
+
+CREATE TABLE orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    total DECIMAL(10,2) NOT NULL,
+    items INTEGER NOT NULL,
+    total_cents INTEGER,
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+
+CREATE TABLE idempotency_keys (
+    user_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    category TEXT NOT NULL,
+    message TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, key)
+) WITHOUT ROWID;
+
+CREATE TABLE sales_period (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    year INTEGER NOT NULL
+);
+
+-- Пары ансамбль - пластинка для ensemble_records (ведутся триггерами, миграция 0004)
+CREATE TABLE ensemble_discography (
+    ensemble_id INTEGER NOT NULL,
+    record_id INTEGER NOT NULL,
+    PRIMARY KEY (ensemble_id, record_id)
+) WITHOUT ROWID;
+
+-- Версии кэшей в памяти процесса (увеличиваются триггерами, миграция 0005)
+CREATE TABLE cache_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+-- Полнотекстовый поиск (ведется триггерами, миграция 0007)
+CREATE VIRTUAL TABLE search_index USING fts5(
+    name,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+
+-- Индексы
+CREATE INDEX IF NOT EXISTS idx_performances_ensemble ON performances (ensemble_id, composition_id);
+CREATE INDEX IF NOT EXISTS idx_performances_composition ON performances (composition_id);
+CREATE INDEX IF NOT EXISTS idx_record_tracks_record ON record_tracks (record_id, performance_id);
+CREATE INDEX IF NOT EXISTS idx_record_tracks_performance ON record_tracks (performance_id, record_id);
+CREATE INDEX IF NOT EXISTS idx_ensemble_members_ensemble ON ensemble_members (ensemble_id, musician_id);
+CREATE INDEX IF NOT EXISTS idx_ensemble_members_musician ON ensemble_members (musician_id);
+CREATE INDEX IF NOT EXISTS idx_compositions_composer ON compositions (composer_id);
+CREATE INDEX IF NOT EXISTS idx_records_company ON records (company_id);
+CREATE INDEX IF NOT EXISTS idx_records_title ON records (title);
+CREATE INDEX IF NOT EXISTS idx_records_price_cents ON records (COALESCE(retail_price_cents, 0));
+CREATE INDEX IF NOT EXISTS idx_records_release ON records (COALESCE(release_date, ''));
+CREATE INDEX IF NOT EXISTS idx_records_popularity ON records (sold_this_year);
+CREATE INDEX IF NOT EXISTS idx_records_in_stock_title ON records (title) WHERE current_stock > 0;
+CREATE INDEX IF NOT EXISTS idx_records_in_stock_price_cents ON records (COALESCE(retail_price_cents, 0)) WHERE current_stock > 0;
+CREATE INDEX IF NOT EXISTS idx_records_in_stock_release ON records (COALESCE(release_date, '')) WHERE current_stock > 0;
+CREATE INDEX IF NOT EXISTS idx_records_in_stock_popularity ON records (sold_this_year) WHERE current_stock > 0;
+CREATE INDEX IF NOT EXISTS idx_records_sold_this_year ON records (sold_this_year DESC) WHERE sold_this_year > 0;
+CREATE INDEX IF NOT EXISTS idx_purchases_user_date ON purchases (user_id, purchase_date);
+CREATE INDEX IF NOT EXISTS idx_purchases_record ON purchases (record_id);
+CREATE INDEX IF NOT EXISTS idx_purchases_date ON purchases (purchase_date);
+CREATE INDEX IF NOT EXISTS idx_purchases_order ON purchases (order_id);
+CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders (user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys (created_at);
+CREATE INDEX IF NOT EXISTS idx_cart_user_record ON cart (user_id, record_id);
+CREATE INDEX IF NOT EXISTS idx_ensembles_name ON ensembles (name);
+CREATE INDEX IF NOT EXISTS idx_ensemble_discography_record ON ensemble_discography (record_id, ensemble_id);
+CREATE INDEX IF NOT EXISTS idx_companies_name ON companies (name);
+CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at);
+
+-- Триггеры счетчиков продаж (см. schema/migrations/0003_sales_counters.sql):
+-- trg_purchases_sales_insert, trg_purchases_sales_delete, trg_purchases_sales_update
+
+-- Триггеры копеек по ценам DECIMAL (см. schema/migrations/0012_money_cents.py):
+-- trg_records_money_insert, trg_records_money_update, trg_purchases_money_insert, trg_purchases_money_update
@@ -0,0 +1,60 @@
+"""
+Полнотекстовый поиск по каталогу (FTS5, миграция 0007)
+
+Индекс search_index содержит названия пластинок и произведений, имена
+музыкантов, ансамблей и компаний. Каждое слово запроса ищется как префикс,
+все слова должны встретиться; результаты упорядочены по рангу bm25 и
+выводятся страницами по курсору (ранг, rowid) - как списки в pagination.py.
+"""
+import re
+
+import queries
+from pagination import Page, decode_cursor, encode_cursor
+
+RECORD, COMPOSITION, MUSICIAN, ENSEMBLE, COMPANY = 1, 2, 3, 4, 5
+
+KIND_LABELS = {
+    RECORD: 'Пластинка',
+    COMPOSITION: 'Произведение',
+    MUSICIAN: 'Музыкант',
+    ENSEMBLE: 'Ансамбль',
+    COMPANY: 'Компания',
+}
+
+DEFAULT_LIMIT = 20
+
+# Курсор поиска привязан к тексту запроса: чужой курсор дает первую страницу
+_CURSOR_KEY = 'search'
+
+_WORD = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Замена ё на е, как при записи в индекс"""
+    return text.replace('ё', 'е').replace('Ё', 'Е')
+
+
+def match_expression(text):
+    """Выражение MATCH: каждое слово - префикс в кавычках; None, если слов нет"""
+    words = _WORD.findall(normalize(text or ''))
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search(conn, text, cursor=None, limit=DEFAULT_LIMIT):
+    """Страница результатов поиска, лучшие совпадения первыми"""
+    expression = match_expression(text)
+    if expression is None:
+        return Page([], None, _CURSOR_KEY)
+    values = decode_cursor(cursor, _CURSOR_KEY, 3)
+    if values is None or values[0] != expression:
+        rows = queries.SEARCH.all(conn, (expression, limit + 1))
+    else:
+        rank, rowid = values[1], values[2]
+        rows = queries.SEARCH_AFTER.all(conn, (expression, rank, rank, rowid, limit + 1))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(_CURSOR_KEY, [expression, rows[-1]['_sort_0'], rows[-1]['_sort_1']])
+    return Page(rows, next_cursor, _CURSOR_KEY)
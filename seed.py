@@ -0,0 +1,395 @@
+"""
+Генератор синтетических данных большого объема (manage_db.py seed --scale N)
+
+Масштаб 1 - около 10 тыс. пластинок и 100 тыс. покупок, масштаб 100 -
+1 млн пластинок и 10 млн покупок. Популярность пластинок и активность
+покупателей распределены по Ципфу.
+
+Данные детерминированы: каждый пакет строк генерируется своим генератором
+случайных чисел, который зависит только от seed, таблицы и номера пакета,
+поэтому результат не зависит от числа процессов.
+
+Порядок загрузки:
+  1. вторичные индексы и триггеры удаляются (их SQL сохраняется);
+  2. пакеты строк генерируются в пуле процессов, а основной процесс
+     вставляет их executemany - одна транзакция на таблицу;
+  3. индексы создаются заново, производные данные (дискография, поисковый
+     индекс, счетчики продаж) пересчитываются set-based запросами,
+     триггеры возвращаются.
+
+Загрузка идет без журнала, поэтому прерванная загрузка оставляет файл в
+неопределенном состоянии. build() заполняет новый файл рядом с базой и
+заменяет ее только после успешной загрузки; seed() держит файл под
+монопольной блокировкой и отказывается заполнять базу, которая уже
+заполнялась, а удаленные индексы и триггеры возвращает и при ошибке.
+"""
+import itertools
+import multiprocessing
+import os
+import random
+import sqlite3
+import time
+from datetime import date, timedelta
+
+from werkzeug.security import generate_password_hash
+
+import materialized
+import sales
+
+CHUNK_SIZE = 50_000
+
+# Число строк на единицу масштаба
+BASE_SIZES = {
+    'companies': 10,
+    'musicians': 1_000,
+    'ensembles': 100,
+    'compositions': 2_000,
+    'performances': 10_000,
+    'records': 10_000,
+    'users': 5_000,
+    'purchases': 100_000,
+    'cart': 1_000,
+}
+
+ZIPF_EXPONENT = 1.1
+
+# Пароль всех сгенерированных пользователей (хэш считается один раз)
+SEED_PASSWORD = 'seed123'
+
+SYLLABLES = ['ба', 'ве', 'ги', 'до', 'ёж', 'жу', 'зо', 'ки', 'ла', 'ми', 'но', 'пе', 'ру', 'со',
+             'ти', 'фа', 'ха', 'це', 'ча', 'ша', 'юл', 'яр', 'ор', 'ан', 'ин', 'ст', 'ск', 'вл']
+FIRST_NAMES = ['Александр', 'Мария', 'Дмитрий', 'Анна', 'Сергей', 'Елена', 'Иван', 'Ольга',
+               'Михаил', 'Татьяна', 'Николай', 'Наталья', 'Андрей', 'Ирина', 'Алексей', 'Светлана']
+SURNAME_ENDINGS = ['ов', 'ев', 'ин', 'ский', 'енко', 'ян', 'ко', 'ук']
+COUNTRIES = ['Россия', 'Германия', 'Австрия', 'Италия', 'Франция', 'США', 'Великобритания',
+             'Чехия', 'Польша', 'Япония']
+GENRES = ['классика', 'джаз', 'камерная музыка', 'опера', 'хоровая музыка', 'барокко',
+          'романтизм', 'современная музыка']
+FORMS = ['Симфония', 'Концерт', 'Соната', 'Квартет', 'Сюита', 'Ноктюрн', 'Прелюдия', 'Фуга',
+         'Рапсодия', 'Увертюра', 'Месса', 'Серенада', 'Этюд', 'Вальс', 'Партита', 'Импровизация']
+INSTRUMENTS = ['фортепиано', 'скрипка', 'альт', 'виолончель', 'контрабас', 'флейта', 'гобой',
+               'кларнет', 'фагот', 'валторна', 'труба', 'тромбон', 'ударные', 'арфа', 'саксофон']
+MUSICIAN_ROLES = ['исполнитель'] * 14 + ['композитор'] * 3 + ['дирижер'] * 2 + ['руководитель']
+VENUES = ['Большой зал консерватории', 'Концертный зал им. Чайковского', 'Студия звукозаписи',
+          'Филармония', 'Оперный театр', 'Джаз-клуб']
+COMPANY_KINDS = ['Студия', 'Лейбл', 'Фирма', 'Records', 'Классика', 'Издательство']
+
+# Тип ансамбля и диапазон числа участников; тип вычисляется по id, чтобы
+# генератор участников знал его без обращения к базе
+ENSEMBLE_TYPES = [
+    ('оркестр', 60, 120), ('хор', 30, 80), ('квартет', 4, 4), ('трио', 3, 3),
+    ('квинтет', 5, 5), ('дуэт', 2, 2), ('ансамбль', 6, 15), ('квартет', 4, 4),
+    ('трио', 3, 3), ('оркестр', 40, 100),
+]
+
+# Таблицы в порядке загрузки: (таблица, от чего зависит число строк, SQL вставки)
+TABLES = [
+    ('companies', 'companies', '''INSERT INTO companies (id, name, address, phone, email, is_wholesaler)
+                                   VALUES (?, ?, ?, ?, ?, ?)'''),
+    ('musicians', 'musicians', '''INSERT INTO musicians (id, name, role, instruments, birth_year, country)
+                                   VALUES (?, ?, ?, ?, ?, ?)'''),
+    ('ensembles', 'ensembles', '''INSERT INTO ensembles (id, name, type, founded_year, country, description)
+                                   VALUES (?, ?, ?, ?, ?, ?)'''),
+    ('ensemble_members', 'ensembles', '''INSERT INTO ensemble_members
+                                           (ensemble_id, musician_id, role_in_ensemble, joined_year)
+                                           VALUES (?, ?, ?, ?)'''),
+    ('compositions', 'compositions', '''INSERT INTO compositions
+                                         (id, title, composer_id, genre, year_composed, duration_minutes)
+                                         VALUES (?, ?, ?, ?, ?, ?)'''),
+    ('performances', 'performances', '''INSERT INTO performances
+                                         (id, composition_id, ensemble_id, conductor_id, recording_date, venue)
+                                         VALUES (?, ?, ?, ?, ?, ?)'''),
+    # Цены - в копейках (money.py), зеркало DECIMAL вычисляется в SQL: триггеры копеек
+    # на время загрузки удалены
+    ('records', 'records', '''INSERT INTO records (id, catalog_number, title, company_id, release_date,
+                                                   wholesale_price_cents, retail_price_cents,
+                                                   wholesale_price, retail_price, current_stock)
+                               VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?6 / 100.0, ?7 / 100.0, ?8)'''),
+    ('record_tracks', 'records', '''INSERT INTO record_tracks (record_id, performance_id, track_number)
+                                     VALUES (?, ?, ?)'''),
+    ('users', 'users', '''INSERT INTO users (id, username, password_hash, role, full_name, email, phone,
+                                             created_at)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?)'''),
+    ('purchases', 'purchases', '''INSERT INTO purchases (user_id, record_id, quantity, price_cents, price,
+                                                         purchase_date)
+                                   VALUES (?1, ?2, ?3, ?4, ?4 / 100.0, ?5)'''),
+    ('cart', 'cart', '''INSERT INTO cart (user_id, record_id, quantity, added_at)
+                         VALUES (?, ?, ?, ?)'''),
+]
+
+
+def sizes_for(scale):
+    """Число строк каждой таблицы для масштаба (дробный масштаб - для проверок)"""
+    return {table: max(1, int(count * scale)) for table, count in BASE_SIZES.items()}
+
+
+# --- Вспомогательные генераторы (выполняются в процессах пула) ---
+
+def _word(rnd):
+    return ''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4)))
+
+
+def _person(rnd):
+    return f'{rnd.choice(FIRST_NAMES)} {_word(rnd).capitalize()}{rnd.choice(SURNAME_ENDINGS)}'
+
+
+def _ensemble_type(ensemble_id):
+    return ENSEMBLE_TYPES[(ensemble_id * 2654435761 >> 8) % len(ENSEMBLE_TYPES)]
+
+
+def _retail_price_cents(record_id):
+    """Цена пластинки в копейках по id - ее знают и генератор пластинок, и генератор покупок"""
+    return 499 + (record_id * 2654435761) % 2500
+
+
+_days = {}
+
+
+def _timestamp(rnd, until, days):
+    """Случайный момент за days дней до until включительно ('ГГГГ-ММ-ДД ЧЧ:ММ:СС')"""
+    dates = _days.get((until, days))
+    if dates is None:
+        dates = [(until - timedelta(days=day)).isoformat() for day in range(days + 1)]
+        _days[(until, days)] = dates
+    day, second = divmod(int(rnd.random() * (days + 1) * 86400), 86400)
+    return f'{dates[day]} {second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}'
+
+
+_zipf_weights = {}
+
+
+def _zipf(rnd, first, count, k):
+    """k id из first..first+count-1 по закону Ципфа
+
+    Ранги переставлены умножением на простое число по модулю count, чтобы
+    популярные строки не шли подряд с начала таблицы.
+    """
+    weights = _zipf_weights.get(count)
+    if weights is None:
+        weights = list(itertools.accumulate(1 / rank ** ZIPF_EXPONENT for rank in range(1, count + 1)))
+        _zipf_weights[count] = weights
+    step = 1_000_003 if count % 1_000_003 else 1_000_033
+    return [first + rank * step % count
+            for rank in rnd.choices(range(count), cum_weights=weights, k=k)]
+
+
+def _generate(task):
+    """Пакет строк таблицы: task = (таблица, номер пакета, первый id, число, контекст)"""
+    table, chunk, start, count, ctx = task
+    rnd = random.Random(f"{ctx['seed']}:{table}:{chunk}")
+    first, last = ctx['first'], ctx['last']
+    until = ctx['until']
+    rows = []
+
+    if table == 'companies':
+        for i in range(start, start + count):
+            word = _word(rnd).capitalize()
+            rows.append((i, f'{rnd.choice(COMPANY_KINDS)} «{word}»', f'г. {_word(rnd).capitalize()}',
+                         f'+7-{rnd.randint(100, 999)}-{rnd.randint(100, 999)}-{rnd.randint(1000, 9999)}',
+                         f'info{i}@{word.lower()}.example', rnd.random() < 0.3))
+    elif table == 'musicians':
+        for i in range(start, start + count):
+            role = rnd.choice(MUSICIAN_ROLES)
+            rows.append((i, _person(rnd), role,
+                         rnd.choice(INSTRUMENTS) if role == 'исполнитель' else None,
+                         rnd.randint(1700, 2005), rnd.choice(COUNTRIES)))
+    elif table == 'ensembles':
+        for i in range(start, start + count):
+            kind = _ensemble_type(i)[0]
+            rows.append((i, f'{kind.capitalize()} {_word(rnd).capitalize()}{rnd.choice(SURNAME_ENDINGS)}а',
+                         kind, rnd.randint(1850, 2020), rnd.choice(COUNTRIES), None))
+    elif table == 'ensemble_members':
+        for i in range(start, start + count):
+            _, low, high = _ensemble_type(i)
+            for musician_id in rnd.sample(range(first['musicians'], last['musicians'] + 1),
+                                          min(rnd.randint(low, high), ctx['sizes']['musicians'])):
+                rows.append((i, musician_id, rnd.choice(INSTRUMENTS), rnd.randint(1950, 2023)))
+    elif table == 'compositions':
+        for i in range(start, start + count):
+            rows.append((i, f'{rnd.choice(FORMS)} {_word(rnd)} №{rnd.randint(1, 40)}',
+                         rnd.randint(first['musicians'], last['musicians']), rnd.choice(GENRES),
+                         rnd.randint(1600, 2020), rnd.randint(3, 70)))
+    elif table == 'performances':
+        ensembles = _zipf(rnd, first['ensembles'], ctx['sizes']['ensembles'], count)
+        for i, ensemble_id in zip(range(start, start + count), ensembles):
+            rows.append((i, rnd.randint(first['compositions'], last['compositions']), ensemble_id,
+                         rnd.randint(first['musicians'], last['musicians']) if rnd.random() < 0.5 else None,
+                         _timestamp(rnd, until, 365 * 60)[:10], rnd.choice(VENUES)))
+    elif table == 'records':
+        for i in range(start, start + count):
+            retail = _retail_price_cents(i)
+            rows.append((i, f'SEED-{i:08d}', f'{rnd.choice(FORMS)} {_word(rnd)} {_word(rnd)}',
+                         rnd.randint(first['companies'], last['companies']),
+                         _timestamp(rnd, until, 365 * 40)[:10], retail * 6 // 10, retail,
+                         0 if rnd.random() < 0.1 else rnd.randint(1, 200)))
+    elif table == 'record_tracks':
+        for i in range(start, start + count):
+            for track in range(1, rnd.randint(1, 12) + 1):
+                rows.append((i, rnd.randint(first['performances'], last['performances']), track))
+    elif table == 'users':
+        for i in range(start, start + count):
+            rows.append((i, f'user{i}', ctx['password_hash'],
+                         'seller' if rnd.random() < 0.001 else 'buyer', _person(rnd),
+                         f'user{i}@example.com', f'+7-9{rnd.randint(10, 99)}-{rnd.randint(1000000, 9999999)}',
+                         _timestamp(rnd, until, 365 * 5)))
+    elif table == 'purchases':
+        users = _zipf(rnd, first['users'], ctx['sizes']['users'], count)
+        records = _zipf(rnd, first['records'], ctx['sizes']['records'], count)
+        for user_id, record_id in zip(users, records):
+            quantity = rnd.choice((1, 1, 1, 1, 2, 2, 3))
+            rows.append((user_id, record_id, quantity, _retail_price_cents(record_id) * quantity,
+                         _timestamp(rnd, until, 365 * 3)))
+    elif table == 'cart':
+        users = _zipf(rnd, first['users'], ctx['sizes']['users'], count)
+        records = _zipf(rnd, first['records'], ctx['sizes']['records'], count)
+        for user_id, record_id in zip(users, records):
+            rows.append((user_id, record_id, rnd.randint(1, 3), _timestamp(rnd, until, 30)))
+    return rows
+
+
+# --- Загрузка ---
+
+def _chunks(table, counted_by, ctx):
+    start, total = ctx['first'][counted_by], ctx['sizes'][counted_by]
+    for number, offset in enumerate(range(0, total, CHUNK_SIZE)):
+        yield table, number, start + offset, min(CHUNK_SIZE, total - offset), ctx
+
+
+def _drop_schema_objects(conn):
+    """Удаление вторичных индексов и триггеров; возвращает их SQL для восстановления"""
+    objects = conn.execute('''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND sql IS NOT NULL
+        ORDER BY type, name
+    ''').fetchall()
+    for kind, name, _ in objects:
+        conn.execute(f'DROP {kind.upper()} IF EXISTS {name}')
+    return objects
+
+
+def _restore_schema_objects(conn, saved, kind):
+    """Создание сохраненных объектов вида kind, которых еще нет в базе"""
+    existing = {row[0] for row in conn.execute('SELECT name FROM sqlite_master WHERE type = ?', (kind,))}
+    for object_kind, name, sql in saved:
+        if object_kind == kind and name not in existing:
+            conn.execute(sql)
+
+
+def seed(db_path, scale, seed=42, workers=None, until=None, log=None):
+    """Заполнение базы синтетическими данными; возвращает {таблица: число строк}
+
+    База должна быть создана init_database() и еще не заполняться (иначе
+    ValueError); файл, открытый другим соединением, тоже не заполняется.
+    """
+    log = log or (lambda message: None)
+    until = until or date.today()
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=0)
+    try:
+        # Монопольная блокировка до закрытия: без журнала читатели увидели бы
+        # недогруженные таблицы
+        conn.execute('PRAGMA locking_mode = EXCLUSIVE')
+        try:
+            conn.execute('BEGIN EXCLUSIVE')
+        except sqlite3.OperationalError:
+            raise ValueError(f'База {db_path} используется другим соединением') from None
+        conn.execute('COMMIT')
+        if conn.execute("SELECT 1 FROM records WHERE catalog_number LIKE 'SEED-%' LIMIT 1").fetchone():
+            raise ValueError(f'База {db_path} уже заполнена генератором; нужна новая база')
+    except BaseException:
+        conn.close()
+        raise
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -400000')
+    conn.execute('PRAGMA temp_store = MEMORY')
+
+    sizes = sizes_for(scale)
+    first = {}
+    for table in sizes:
+        if table != 'cart':
+            first[table] = conn.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {table}').fetchone()[0]
+    first['cart'] = 0
+    ctx = {
+        'seed': seed,
+        'sizes': sizes,
+        'first': first,
+        'last': {table: first[table] + sizes[table] - 1 for table in first},
+        'until': until,
+        'password_hash': generate_password_hash(SEED_PASSWORD),
+    }
+
+    saved = _drop_schema_objects(conn)
+    counts = {}
+    started = time.perf_counter()
+    try:
+        workers = workers or multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(workers) if workers > 1 else None
+        try:
+            mapper = pool.imap if pool else map
+            for table, counted_by, sql in TABLES:
+                table_started = time.perf_counter()
+                conn.execute('BEGIN')
+                rows = 0
+                for batch in mapper(_generate, _chunks(table, counted_by, ctx)):
+                    conn.executemany(sql, batch)
+                    rows += len(batch)
+                conn.execute('COMMIT')
+                counts[table] = rows
+                log(f'{table}: {rows} строк за {time.perf_counter() - table_started:.1f} с')
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+
+        step_started = time.perf_counter()
+        _restore_schema_objects(conn, saved, 'index')
+        log(f'индексы: {time.perf_counter() - step_started:.1f} с')
+
+        step_started = time.perf_counter()
+        materialized.rebuild_discography(conn)
+        materialized.rebuild_search_index(conn)
+        sales.recount(conn)
+        conn.execute('UPDATE cache_versions SET version = version + 1')
+        _restore_schema_objects(conn, saved, 'trigger')
+        conn.execute('ANALYZE')
+        log(f'производные данные и триггеры: {time.perf_counter() - step_started:.1f} с')
+    finally:
+        # При ошибке или Ctrl-C - тоже: без триггеров база молча перестала бы
+        # вести счетчики продаж, дискографию, поиск и версии кэша
+        if conn.in_transaction:
+            # Без журнала ROLLBACK не определен; загруженное до ошибки остается
+            conn.execute('COMMIT')
+        _restore_schema_objects(conn, saved, 'index')
+        _restore_schema_objects(conn, saved, 'trigger')
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.close()
+    log(f'всего: {time.perf_counter() - started:.1f} с')
+    return counts
+
+
+def build(db_path, scale, init, **kwargs):
+    """Новая база db_path с синтетическими данными; возвращает {таблица: число строк}
+
+    init(путь) создает пустую схему с демонстрационными данными
+    (init_database). Загрузка идет в отдельный файл рядом с db_path, который
+    заменяет базу только после успешного завершения; при ошибке или Ctrl-C
+    прежний файл не меняется.
+    """
+    building = f'{db_path}.seeding'
+    _remove_database(building)
+    try:
+        init(building)
+        counts = seed(building, scale, **kwargs)
+    except BaseException:
+        _remove_database(building)
+        raise
+    # Журнал прежней базы не должен примениться к новому файлу
+    _remove_database(db_path)
+    os.replace(building, db_path)
+    return counts
+
+
+def _remove_database(path):
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
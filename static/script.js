@@ -5,6 +5,7 @@ document.addEventListener('DOMContentLoaded', function() {
     initFlashMessages();
     initFormValidation();
     initTooltips();
+    initAutocomplete();
 });
 
 // Автоматическое скрытие flash сообщений
@@ -223,6 +224,101 @@ function sortTable(tableId, columnIndex) {
     table.setAttribute('data-sort-direction', isAscending ? 'asc' : 'desc');
 }
 
+// Автодополнение: поле .autocomplete-input запрашивает варианты у data-source
+// и записывает id выбранного варианта в скрытое поле data-target
+function initAutocomplete() {
+    document.querySelectorAll('.autocomplete-input').forEach(input => {
+        const hidden = document.getElementById(input.getAttribute('data-target'));
+        const list = input.parentNode.querySelector('.autocomplete-list');
+        let timer = null;
+        let lastQuery = null;
+        let active = -1;
+        
+        function close() {
+            list.hidden = true;
+            list.innerHTML = '';
+            active = -1;
+        }
+        
+        function choose(item) {
+            input.value = item.label;
+            hidden.value = item.id;
+            clearFieldError(hidden);
+            close();
+        }
+        
+        function highlight(index) {
+            const items = list.querySelectorAll('li');
+            if (!items.length) return;
+            active = (index + items.length) % items.length;
+            items.forEach((li, i) => li.classList.toggle('active', i === active));
+        }
+        
+        function render(items) {
+            list.innerHTML = '';
+            active = -1;
+            if (!items.length) {
+                close();
+                return;
+            }
+            items.forEach(item => {
+                const li = document.createElement('li');
+                li.textContent = item.label;
+                // mousedown срабатывает раньше blur поля
+                li.addEventListener('mousedown', e => {
+                    e.preventDefault();
+                    choose(item);
+                });
+                li.dataset.id = item.id;
+                li.dataset.label = item.label;
+                list.appendChild(li);
+            });
+            list.hidden = false;
+        }
+        
+        function fetchItems(query) {
+            lastQuery = query;
+            fetch(`${input.getAttribute('data-source')}?q=${encodeURIComponent(query)}`)
+                .then(response => response.json())
+                .then(items => {
+                    // Ответ на устаревший запрос не показываем
+                    if (query === lastQuery && input.value.trim() === query) {
+                        render(items);
+                    }
+                })
+                .catch(close);
+        }
+        
+        input.addEventListener('input', function() {
+            // Текст изменен - прежний выбор недействителен
+            hidden.value = '';
+            clearTimeout(timer);
+            const query = this.value.trim();
+            if (!query) {
+                close();
+                return;
+            }
+            timer = setTimeout(() => fetchItems(query), 150);
+        });
+        
+        input.addEventListener('keydown', function(e) {
+            if (list.hidden) return;
+            if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+                e.preventDefault();
+                highlight(active + (e.key === 'ArrowDown' ? 1 : -1));
+            } else if (e.key === 'Enter' && active >= 0) {
+                e.preventDefault();
+                const li = list.querySelectorAll('li')[active];
+                choose({id: li.dataset.id, label: li.dataset.label});
+            } else if (e.key === 'Escape') {
+                close();
+            }
+        });
+        
+        input.addEventListener('blur', close);
+    });
+}
+
 // Анимация загрузки
 function showLoading(element) {
     const loadingDiv = document.createElement('div');
@@ -5,6 +5,7 @@ import pytest
 import os
 import tempfile
 import sqlite3
+import db_pool
 from app import app, get_db_connection
 from database import init_database
 
@@ -24,11 +25,18 @@ def test_db_path():
     # Инициализируем тестовую БД
     init_database(force_recreate=True)
     
+    # Приложение работает с тестовой БД через пул соединений
+    original_app_db = app.config['DATABASE']
+    app.config['DATABASE'] = path
+    
     yield path
     
     # Очистка
-    if os.path.exists(path):
-        os.remove(path)
+    app.config['DATABASE'] = original_app_db
+    db_pool.close_pools()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
     
     # Восстанавливаем оригинальный путь
     if original_db:
@@ -87,3 +95,14 @@ def auth_director(client):
         sess['role'] = 'director'
     return client
 
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    """Отдельная новая БД с тестовыми данными (для тестов, меняющих общее состояние)"""
+    path = str(tmp_path / 'fresh.db')
+    monkeypatch.setenv('DATABASE_PATH', path)
+    init_database(force_recreate=True)
+    conn = db_pool.connect(path)
+    yield conn
+    conn.close()
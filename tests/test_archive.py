@@ -0,0 +1,160 @@
+"""
+Тесты архива покупок по годам
+"""
+import os
+from datetime import date
+
+import archive
+import db_pool
+import exports
+from pagination import encode_cursor
+
+OLD_PURCHASES = [
+    (3, 1, 1, 25.99, '2020-03-10 10:00:00'),
+    (3, 3, 2, 71.98, '2020-12-31 23:59:59'),
+    (1, 1, 1, 25.99, '2021-06-01 00:00:00'),
+    (3, 1, 3, 77.97, '2021-06-15 12:00:00'),
+]
+
+
+def add_purchases(conn):
+    conn.executemany('''
+        INSERT INTO purchases (user_id, record_id, quantity, price, purchase_date)
+        VALUES (?, ?, ?, ?, ?)
+    ''', OLD_PURCHASES)
+    conn.commit()
+
+
+def export_text(conn, name, archive_dir):
+    return ''.join(exports.stream(conn, name, 'csv', exports.parse_filters({}), archive_dir))
+
+
+class TestArchive:
+    """Тесты переноса покупок в архив"""
+
+    def test_move_by_year(self, fresh_db, tmp_path):
+        """Тест: старые покупки уходят в файлы годов, счетчики продаж не меняются"""
+        add_purchases(fresh_db)
+        counters = fresh_db.execute('SELECT SUM(sold_this_year), SUM(sold_last_year) FROM records').fetchone()
+        hot = fresh_db.execute('SELECT COUNT(*) FROM purchases').fetchone()[0]
+
+        moved = archive.archive(fresh_db, date(2022, 1, 1), str(tmp_path))
+
+        assert moved == {2020: 2, 2021: 2}
+        assert archive.years(str(tmp_path)) == [2020, 2021]
+        assert archive.years(str(tmp_path), '2021-01-01', '2021-02-01') == [2021]
+        assert fresh_db.execute('SELECT COUNT(*) FROM purchases').fetchone()[0] == hot - 4
+        assert tuple(fresh_db.execute(
+            'SELECT SUM(sold_this_year), SUM(sold_last_year) FROM records').fetchone()) == tuple(counters)
+        with archive.year_connection(archive.database_path(fresh_db), 2021, str(tmp_path)) as conn:
+            assert conn.execute('SELECT COUNT(*) FROM purchases').fetchone()[0] == 2
+            # Справочники читаются из подключенной рабочей базы
+            assert conn.execute('SELECT COUNT(*) FROM records').fetchone()[0] > 0
+
+        assert archive.archive(fresh_db, date(2022, 1, 1), str(tmp_path)) == {}
+
+    def test_cutoff_limit(self, fresh_db, tmp_path):
+        """Тест: покупки прошлого и текущего учетного года не архивируются"""
+        limit = archive.cutoff_limit(fresh_db)
+        try:
+            archive.archive(fresh_db, date(limit.year, 2, 1), str(tmp_path))
+        except ValueError as e:
+            assert limit.isoformat() in str(e)
+        else:
+            raise AssertionError('ожидалась ошибка')
+
+    def test_cutoff_rounded_to_month(self, fresh_db, tmp_path):
+        """Тест: граница внутри месяца округляется до его начала"""
+        add_purchases(fresh_db)
+        assert archive.archive(fresh_db, date(2021, 6, 10), str(tmp_path)) == {2020: 2}
+
+    def test_new_columns_follow(self, fresh_db, tmp_path):
+        """Тест: столбцы, добавленные в purchases позже, появляются в файле года"""
+        add_purchases(fresh_db)
+        archive.archive(fresh_db, date(2021, 1, 1), str(tmp_path))
+        fresh_db.execute('ALTER TABLE purchases ADD COLUMN note TEXT')
+        fresh_db.execute("UPDATE purchases SET note = 'старая' WHERE purchase_date < '2022-01-01'")
+        fresh_db.commit()
+
+        archive.archive(fresh_db, date(2022, 1, 1), str(tmp_path))
+        with archive.year_connection(archive.database_path(fresh_db), 2020, str(tmp_path)) as conn:
+            assert [row[0] for row in conn.execute('SELECT note FROM purchases')] == [None, None]
+        with archive.year_connection(archive.database_path(fresh_db), 2021, str(tmp_path)) as conn:
+            assert [row[0] for row in conn.execute('SELECT note FROM purchases')] == ['старая', 'старая']
+
+
+class TestArchiveReads:
+    """Тесты чтения рабочей базы вместе с архивом"""
+
+    def test_exports_unchanged(self, fresh_db, tmp_path):
+        """Тест: выгрузки покупок и сводки продаж одинаковы до и после архивирования"""
+        add_purchases(fresh_db)
+        directory = str(tmp_path)
+        before = {name: export_text(fresh_db, name, directory) for name in ('purchases', 'sales')}
+
+        archive.archive(fresh_db, date(2022, 1, 1), directory)
+
+        assert os.listdir(directory)
+        for name, text in before.items():
+            assert export_text(fresh_db, name, directory) == text
+
+    def test_user_history_pages(self, fresh_db, tmp_path):
+        """Тест: история покупок листается через рабочую базу и все архивные годы"""
+        add_purchases(fresh_db)
+        directory = str(tmp_path)
+        expected = [row[0] for row in fresh_db.execute(
+            'SELECT id FROM purchases WHERE user_id = 3 ORDER BY purchase_date DESC, id DESC')]
+        totals = fresh_db.execute(
+            'SELECT COUNT(*), SUM(price_cents) FROM purchases WHERE user_id = 3').fetchone()
+
+        archive.archive(fresh_db, date(2022, 1, 1), directory)
+
+        for limit in (1, 2, len(expected), len(expected) + 1):
+            ids, cursor = [], None
+            while True:
+                page = archive.user_purchases_page(fresh_db, 3, cursor=cursor, limit=limit,
+                                                   archive_dir=directory)
+                assert page.rows or not ids
+                ids += [row['id'] for row in page.rows]
+                cursor = page.next_cursor
+                if cursor is None:
+                    break
+            assert ids == expected
+        result = archive.user_purchase_totals(fresh_db, 3, directory)
+        assert result['total_purchases'] == totals[0]
+        assert result['total_spent_cents'] == totals[1]
+
+    def test_year_connections_pooled(self, fresh_db, tmp_path, monkeypatch):
+        """Тест: соединения годов переиспользуются, годы новее курсора не читаются"""
+        add_purchases(fresh_db)
+        directory = str(tmp_path)
+        archive.archive(fresh_db, date(2022, 1, 1), directory)
+        opened, used = [], []
+        connect, year_pool = db_pool.connect, archive.year_pool
+
+        def counted_connect(path, *args, **kwargs):
+            opened.append(path)
+            return connect(path, *args, **kwargs)
+
+        def counted_pool(db_path, year, archive_dir=None):
+            used.append(year)
+            return year_pool(db_path, year, archive_dir)
+
+        monkeypatch.setattr(db_pool, 'connect', counted_connect)
+        monkeypatch.setattr(archive, 'year_pool', counted_pool)
+
+        for _ in range(3):
+            archive.user_purchase_totals(fresh_db, 3, directory)
+            page = archive.user_purchases_page(fresh_db, 3, limit=100, archive_dir=directory)
+        # По соединению на год за все запросы
+        assert sorted(opened) == [archive.year_path(directory, 2020), archive.year_path(directory, 2021)]
+
+        last_2021 = next(row for row in page.rows if row['purchase_date'].startswith('2021'))
+        cursor = encode_cursor('date', [last_2021['purchase_date'], last_2021['id']])
+        used.clear()
+        archive.user_purchases_page(fresh_db, 3, cursor=cursor, limit=1, archive_dir=directory)
+        assert used == [2021, 2020]
+        cursor = encode_cursor('date', ['2020-12-31 23:59:59', 0])
+        used.clear()
+        archive.user_purchases_page(fresh_db, 3, cursor=cursor, limit=1, archive_dir=directory)
+        assert used == [2020]
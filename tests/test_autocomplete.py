@@ -0,0 +1,56 @@
+"""
+Тесты автодополнения ансамблей и компаний
+"""
+import autocomplete
+from autocomplete import PrefixIndex
+
+
+class TestPrefixIndex:
+    """Тесты индекса префиксов"""
+    
+    def test_word_prefix_case_and_yo(self):
+        """Тест: поиск по началу любого слова без учета регистра и ё/е"""
+        index = PrefixIndex([(1, 'Венский филармонический оркестр'), (2, 'Ёлочный хор'),
+                             (3, 'Оркестр Большого театра')])
+        assert [item['id'] for item in index.search('ОРК')] == [1, 3]
+        assert [item['id'] for item in index.search('филарм')] == [1]
+        assert [item['id'] for item in index.search('елоч')] == [2]
+        assert index.search('  ') == []
+        assert index.search('квартет') == []
+    
+    def test_limit_and_unique(self):
+        """Тест: каждый элемент не более одного раза, не больше limit"""
+        index = PrefixIndex([(i, f'Трио трио {i}') for i in range(30)])
+        found = [item['id'] for item in index.search('трио', limit=5)]
+        assert len(found) == len(set(found)) == 5
+
+
+class TestAutocompleteSources:
+    """Тесты источников с перестройкой по версии"""
+    
+    def test_rebuilt_after_insert(self, fresh_db):
+        """Тест: новый ансамбль виден в автодополнении сразу после вставки"""
+        assert autocomplete.complete(fresh_db, 'ensembles', 'Капелла', key='t') == []
+        fresh_db.execute("INSERT INTO ensembles (name, type) VALUES ('Капелла Юрлова', 'хор')")
+        fresh_db.commit()
+        assert autocomplete.complete(fresh_db, 'ensembles', 'юрл', key='t') == [
+            {'id': fresh_db.execute("SELECT id FROM ensembles WHERE name = 'Капелла Юрлова'").fetchone()[0],
+             'label': 'Капелла Юрлова (хор)'}]
+    
+    def test_endpoint(self, auth_seller, db_connection):
+        """Тест: эндпоинт возвращает JSON с id и названием"""
+        company = db_connection.execute('SELECT id, name FROM companies LIMIT 1').fetchone()
+        response = auth_seller.get('/autocomplete/companies', query_string={'q': company['name'][:3]})
+        assert response.status_code == 200
+        assert {'id': company['id'], 'label': company['name']} in response.get_json()
+    
+    def test_unknown_source(self, auth_seller):
+        """Тест: неизвестный источник - 404"""
+        assert auth_seller.get('/autocomplete/users?q=a').status_code == 404
+    
+    def test_page_without_full_dropdown(self, auth_buyer, db_connection):
+        """Тест: страница не выводит список всех ансамблей"""
+        response = auth_buyer.get('/ensemble_records')
+        html = response.get_data(as_text=True)
+        assert 'data-source="/autocomplete/ensembles"' in html
+        assert '<option' not in html
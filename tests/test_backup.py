@@ -0,0 +1,98 @@
+"""
+Тесты горячего резервного копирования
+"""
+import gzip
+import os
+import sqlite3
+import threading
+
+import backup
+import db_pool
+
+
+def db_path(conn):
+    return conn.execute('PRAGMA database_list').fetchone()[2]
+
+
+class TestBackup:
+    """Тесты копирования, проверки и ротации копий"""
+
+    def test_copy_verified(self, fresh_db, tmp_path):
+        """Тест: копия - отдельный файл без WAL с теми же данными"""
+        path = backup.backup(db_path(fresh_db), str(tmp_path / 'backups'), sleep=0)
+
+        assert os.path.basename(path).startswith(backup.PREFIX)
+        assert not os.path.exists(path + '.partial')
+        assert backup.verify(path) == []
+        copy = sqlite3.connect(path)
+        assert copy.execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+        assert copy.execute('SELECT COUNT(*) FROM records').fetchone()[0] == \
+            fresh_db.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+        copy.close()
+
+    def test_gzip(self, fresh_db, tmp_path):
+        """Тест: сжатая копия распаковывается в рабочую базу"""
+        path = backup.backup(db_path(fresh_db), str(tmp_path), sleep=0, compress=True)
+
+        assert path.endswith('.db.gz')
+        restored = tmp_path / 'restored.db'
+        with gzip.open(path, 'rb') as source:
+            restored.write_bytes(source.read())
+        assert backup.verify(str(restored)) == []
+
+    def test_rotation(self, tmp_path):
+        """Тест: остаются только последние keep копий"""
+        for day in range(1, 6):
+            (tmp_path / f'{backup.PREFIX}2025010{day}-120000.db').write_bytes(b'')
+        (tmp_path / f'{backup.PREFIX}20250106-120000.db.gz').write_bytes(b'')
+        (tmp_path / 'other.db').write_bytes(b'')
+
+        removed = backup.rotate(str(tmp_path), 3)
+
+        assert len(removed) == 3
+        assert sorted(os.listdir(tmp_path)) == [
+            f'{backup.PREFIX}20250104-120000.db', f'{backup.PREFIX}20250105-120000.db',
+            f'{backup.PREFIX}20250106-120000.db.gz', 'other.db']
+
+    def test_concurrent_writes(self, fresh_db, tmp_path):
+        """Тест: копирование малыми шагами завершается при одновременной записи"""
+        path = db_path(fresh_db)
+        steps = []
+        stop = threading.Event()
+
+        def writer():
+            conn = db_pool.connect(path)
+            while not stop.is_set():
+                conn.execute('UPDATE records SET current_stock = current_stock + 1 WHERE id = 1')
+                conn.commit()
+            conn.close()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            copy = backup.backup(path, str(tmp_path / 'backups'), pages=1, sleep=0.001,
+                                 log=steps.append)
+        finally:
+            stop.set()
+            thread.join()
+
+        assert backup.verify(copy) == []
+        assert 'проверка целостности: ok' in steps
+        # Снимок закреплен: копирование не начиналось заново после чужих записей,
+        # шагов ровно столько, сколько страниц в копии
+        conn = sqlite3.connect(copy)
+        pages = conn.execute('PRAGMA page_count').fetchone()[0]
+        conn.close()
+        assert steps[0].endswith(f'шагов: {pages}')
+
+    def test_failed_verification(self, fresh_db, tmp_path, monkeypatch):
+        """Тест: копия, не прошедшая проверку, удаляется"""
+        monkeypatch.setattr(backup, 'verify', lambda path: ['page 2 is never used'])
+        directory = tmp_path / 'backups'
+        try:
+            backup.backup(db_path(fresh_db), str(directory), sleep=0)
+        except RuntimeError as e:
+            assert 'page 2 is never used' in str(e)
+        else:
+            raise AssertionError('ожидалась ошибка')
+        assert os.listdir(directory) == []
@@ -0,0 +1,68 @@
+"""
+Тесты кэша с версиями и сводки произведений по ансамблям
+"""
+import queries
+from cache import VersionedCache
+
+
+def counts_by_ensemble(conn):
+    return {row['id']: row['compositions_count']
+            for row in queries.ENSEMBLE_COMPOSITION_COUNTS.all(conn)}
+
+
+class TestCompositionQueries:
+    """Тесты запросов количества произведений"""
+    
+    def test_counts_match_listing(self, fresh_db):
+        """Тест: сводка совпадает с числом строк списка по каждому ансамблю"""
+        counts = counts_by_ensemble(fresh_db)
+        assert counts
+        for ensemble_id, count in counts.items():
+            assert len(queries.ENSEMBLE_COMPOSITIONS.all(fresh_db, (ensemble_id,))) == count
+    
+    def test_members_do_not_multiply_rows(self, fresh_db):
+        """Тест: число участников не влияет на список"""
+        ensemble_id = fresh_db.execute('SELECT ensemble_id FROM ensemble_members LIMIT 1').fetchone()[0]
+        before = queries.ENSEMBLE_COMPOSITIONS.all(fresh_db, (ensemble_id,))
+        fresh_db.executemany('INSERT INTO ensemble_members (ensemble_id, musician_id) VALUES (?, 1)',
+                             [(ensemble_id,)] * 5)
+        assert len(queries.ENSEMBLE_COMPOSITIONS.all(fresh_db, (ensemble_id,))) == len(before)
+    
+    def test_ensemble_without_members_excluded(self, fresh_db):
+        """Тест: ансамбль без участников не попадает в сводку"""
+        ensemble_id = fresh_db.execute("INSERT INTO ensembles (name, type) VALUES ('Пустой', 'дуэт')").lastrowid
+        fresh_db.execute('INSERT INTO performances (composition_id, ensemble_id) VALUES (1, ?)', (ensemble_id,))
+        assert ensemble_id not in counts_by_ensemble(fresh_db)
+        assert queries.ENSEMBLE_COMPOSITIONS.all(fresh_db, (ensemble_id,)) == []
+
+
+class TestVersionedCache:
+    """Тесты сброса кэша по версии"""
+    
+    def test_hit_until_performance_changes(self, fresh_db):
+        """Тест: повторный запрос берется из кэша, изменение исполнений сбрасывает его"""
+        cache = VersionedCache('ensemble_composition_counts', counts_by_ensemble)
+        first = cache.get(fresh_db)
+        assert cache.get(fresh_db) is first
+        assert cache.hits == 1
+        
+        ensemble_id, count = next(iter(first.items()))
+        composition_id = fresh_db.execute('''
+            SELECT id FROM compositions
+            WHERE id NOT IN (SELECT composition_id FROM performances WHERE ensemble_id = ?)
+        ''', (ensemble_id,)).fetchone()[0]
+        fresh_db.execute('INSERT INTO performances (composition_id, ensemble_id) VALUES (?, ?)',
+                         (composition_id, ensemble_id))
+        fresh_db.commit()
+        assert cache.get(fresh_db)[ensemble_id] == count + 1
+        assert cache.misses == 2
+    
+    def test_page_shows_counts(self, auth_buyer, db_connection):
+        """Тест: без выбранного ансамбля страница показывает сводку"""
+        name = db_connection.execute('''
+            SELECT name FROM ensembles
+            WHERE id IN (SELECT ensemble_id FROM ensemble_members)
+        ''').fetchone()[0]
+        response = auth_buyer.get('/compositions_count')
+        assert response.status_code == 200
+        assert name in response.get_data(as_text=True)
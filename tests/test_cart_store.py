@@ -0,0 +1,216 @@
+"""
+Тесты отдельного хранилища корзин
+"""
+import threading
+import time
+
+import pytest
+
+import cart_store
+import db_pool
+from app import app
+
+BUYER_ID = 3
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def separate_store(request, auth_buyer, tmp_path, monkeypatch):
+    """Клиент покупателя с корзинами в отдельном файле или в памяти"""
+    monkeypatch.setitem(app.config, 'CART_STORE', request.param)
+    monkeypatch.setitem(app.config, 'CART_DB_PATH', str(tmp_path / 'carts.db'))
+    monkeypatch.setitem(app.config, 'CART_FLUSH_INTERVAL', 60)
+    yield auth_buyer
+    cart_store.close_stores()
+
+
+def in_stock(conn):
+    return conn.execute('SELECT id, current_stock FROM records WHERE current_stock > 1 LIMIT 1').fetchone()
+
+
+def file_rows(tmp_path):
+    conn = db_pool.connect(str(tmp_path / 'carts.db'))
+    try:
+        return conn.execute('SELECT user_id, record_id, quantity FROM cart ORDER BY id').fetchall()
+    finally:
+        conn.close()
+
+
+class TestSeparateCartStore:
+    """Тесты корзин вне рабочей базы"""
+
+    def test_existing_carts_moved(self, separate_store, db_connection, tmp_path):
+        """Тест: при первом открытии корзины переносятся из таблицы cart рабочей базы"""
+        expected = db_connection.execute('SELECT COUNT(*) FROM cart').fetchone()[0]
+        with app.app_context():
+            cart_store.get_store()
+        assert len(file_rows(tmp_path)) == expected
+
+    def test_cart_and_checkout(self, separate_store, db_connection):
+        """Тест: корзина меняется без рабочей базы, оформление пишет покупки и очищает корзину"""
+        record_id, stock = in_stock(db_connection)
+        main_cart = db_connection.execute('SELECT COUNT(*) FROM cart').fetchone()[0]
+        purchases = db_connection.execute('SELECT COUNT(*) FROM purchases').fetchone()[0]
+        separate_store.get('/clear_cart')
+
+        separate_store.post(f'/add_to_cart/{record_id}', data={'quantity': '2'})
+        with app.app_context():
+            item = next(item for item in cart_store.items(BUYER_ID) if item['record_id'] == record_id)
+        assert item['quantity'] == 2 and item['current_stock'] == stock
+        separate_store.get(f'/decrease_cart_item/{item["id"]}')
+        assert separate_store.get('/cart').status_code == 200
+        assert db_connection.execute('SELECT COUNT(*) FROM cart').fetchone()[0] == main_cart
+
+        response = separate_store.post('/checkout')
+        assert response.status_code == 302 and '/personal_cabinet' in response.location
+        with app.app_context():
+            assert cart_store.items(BUYER_ID) == []
+        assert db_connection.execute('SELECT COUNT(*) FROM purchases').fetchone()[0] == purchases + 1
+        assert db_connection.execute('SELECT current_stock FROM records WHERE id = ?',
+                                     (record_id,)).fetchone()[0] == stock - 1
+
+    def test_checkout_keeps_items_added_meanwhile(self, separate_store, db_connection):
+        """Тест: после оформления снимается только оформленное, добавленное во время оформления остается"""
+        record_id, other_id = [row[0] for row in db_connection.execute(
+            'SELECT id FROM records WHERE current_stock > 1 ORDER BY id LIMIT 2')]
+
+        def order(repo, items, placed):
+            # Покупатель добавляет пластинки, пока заказ пишется в рабочую базу
+            cart_store.add(BUYER_ID, record_id, 1)
+            cart_store.add(BUYER_ID, other_id, 1)
+            placed()
+            return 'success', '', 'personal_cabinet'
+
+        with app.test_request_context():
+            cart_store.clear(BUYER_ID)
+            cart_store.add(BUYER_ID, record_id, 2)
+            cart_store.checkout(BUYER_ID, order)
+            assert sorted((item['record_id'], item['quantity']) for item in cart_store.items(BUYER_ID)) == \
+                [(record_id, 1), (other_id, 1)]
+
+    def test_cart_not_blocked_by_writer(self, separate_store, db_connection):
+        """Тест: изменение корзины проходит, пока писатель рабочей базы занят"""
+        record_id, _ = in_stock(db_connection)
+        writer = db_pool.get_writer(app)
+        conn = writer.acquire()
+        done = threading.Event()
+
+        def add():
+            with app.test_client() as client:
+                with client.session_transaction() as sess:
+                    sess['user_id'] = BUYER_ID
+                    sess['role'] = 'buyer'
+                client.post(f'/add_to_cart/{record_id}', data={'quantity': '1'})
+            done.set()
+
+        try:
+            thread = threading.Thread(target=add)
+            thread.start()
+            assert done.wait(5)
+        finally:
+            writer.release(conn)
+            thread.join()
+
+    def test_lock_stats_separate(self, separate_store, db_connection):
+        """Тест: ожидание соединений файла корзин не попадает в статистику рабочей базы"""
+        record_id, _ = in_stock(db_connection)
+        with app.app_context():
+            cart_store.get_store()
+        main_writes = db_pool.WRITE_STATS.count
+        for _ in range(3):
+            separate_store.post(f'/add_to_cart/{record_id}', data={'quantity': '1'})
+        with app.app_context():
+            if app.config['CART_STORE'] == 'memory':
+                cart_store.get_store().flush()
+            carts = cart_store.lock_stats()
+        assert db_pool.WRITE_STATS.count == main_writes
+        assert carts['write']['count'] >= 1
+
+        with separate_store.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['role'] = 'director'
+        data = separate_store.get('/lock_stats').get_json()
+        assert set(data) == {'read', 'write', 'carts'}
+        assert data['carts']['write']['count'] == carts['write']['count']
+
+    def test_concurrent_first_open(self, db_connection, tmp_path, monkeypatch):
+        """Тест: одновременное первое открытие файла корзин переносит корзины один раз"""
+        expected = db_connection.execute('SELECT COUNT(*) FROM cart').fetchone()[0]
+        barrier = threading.Barrier(4)
+        connect = db_pool.connect
+
+        def slow_connect(path, *args, **kwargs):
+            # Чтение рабочей базы медленное: остальные открытия успевают проверить файл корзин
+            if kwargs.get('readonly'):
+                time.sleep(0.2)
+            return connect(path, *args, **kwargs)
+
+        monkeypatch.setattr(db_pool, 'connect', slow_connect)
+        stores, errors = [], []
+
+        def open_store():
+            barrier.wait()
+            try:
+                stores.append(cart_store.SqliteCartStore(str(tmp_path / 'carts.db'), app.config['DATABASE']))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=open_store) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for store in stores:
+            store.close()
+        assert errors == []
+        assert len(file_rows(tmp_path)) == expected
+
+
+class TestMemoryCartStore:
+    """Тесты отложенной записи корзин из памяти"""
+
+    def test_flush_and_reload(self, auth_buyer, db_connection, tmp_path, monkeypatch):
+        """Тест: корзины из памяти записываются в файл и загружаются при следующем запуске"""
+        monkeypatch.setitem(app.config, 'CART_STORE', 'memory')
+        monkeypatch.setitem(app.config, 'CART_DB_PATH', str(tmp_path / 'carts.db'))
+        monkeypatch.setitem(app.config, 'CART_FLUSH_INTERVAL', 60)
+        record_id, _ = in_stock(db_connection)
+        try:
+            with app.app_context():
+                cart_store.clear(BUYER_ID)
+                cart_store.add(BUYER_ID, record_id, 3)
+                assert (BUYER_ID, record_id, 3) not in [tuple(row) for row in file_rows(tmp_path)]
+                cart_store.get_store().flush()
+            assert (BUYER_ID, record_id, 3) in [tuple(row) for row in file_rows(tmp_path)]
+
+            cart_store.close_stores()
+            with app.app_context():
+                assert [(item['record_id'], item['quantity']) for item in cart_store.items(BUYER_ID)] == \
+                    [(record_id, 3)]
+        finally:
+            cart_store.close_stores()
+
+    def test_flush_error_logged(self, auth_buyer, db_connection, tmp_path, monkeypatch, caplog):
+        """Тест: ошибка фоновой записи попадает в журнал, корзина остается к следующей записи"""
+        monkeypatch.setitem(app.config, 'CART_STORE', 'memory')
+        monkeypatch.setitem(app.config, 'CART_DB_PATH', str(tmp_path / 'carts.db'))
+        monkeypatch.setitem(app.config, 'CART_FLUSH_INTERVAL', 0.05)
+        record_id, _ = in_stock(db_connection)
+        failed = threading.Event()
+
+        def fail(fn):
+            failed.set()
+            raise OSError('диск заполнен')
+
+        try:
+            with app.app_context(), monkeypatch.context() as patch:
+                store = cart_store.get_store()
+                patch.setattr(store.file, 'write', fail)
+                cart_store.add(BUYER_ID, record_id, 1)
+                assert failed.wait(5)
+                deadline = time.monotonic() + 5
+                while 'Корзины не записаны' not in caplog.text and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                assert 'диск заполнен' in caplog.text
+                assert BUYER_ID in store._dirty
+        finally:
+            cart_store.close_stores()
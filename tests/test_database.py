@@ -0,0 +1,75 @@
+"""
+Тесты схемы базы данных
+"""
+import sqlite3
+
+import pytest
+
+import migrations
+from database import INDEXES, create_indexes
+
+
+class TestIndexes:
+    """Тесты вторичных индексов"""
+    
+    def test_indexes_created(self, db_connection):
+        """Тест: init_database создает все индексы"""
+        names = {row['name'] for row in db_connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'")}
+        for name, _ in INDEXES:
+            assert name in names
+    
+    def test_create_indexes_idempotent(self, db_connection):
+        """Тест: повторное создание индексов не падает"""
+        create_indexes(db_connection)
+        db_connection.commit()
+    
+    def test_cabinet_query_uses_index(self, db_connection):
+        """Тест: история покупок читается по индексу"""
+        plan = db_connection.execute('''
+            EXPLAIN QUERY PLAN
+            SELECT * FROM purchases WHERE user_id = ? ORDER BY purchase_date DESC
+        ''', (3,)).fetchall()
+        details = ' '.join(row['detail'] for row in plan)
+        assert 'idx_purchases_user_date' in details
+
+
+class TestMigrations:
+    """Тесты версионированных миграций"""
+    
+    def test_fresh_database_fully_migrated(self, db_connection):
+        """Тест: новая база содержит все миграции"""
+        assert all(applied for _, applied in migrations.status(db_connection))
+    
+    def test_upgrade_noop_when_current(self, db_connection):
+        """Тест: повторный запуск не применяет ничего"""
+        assert migrations.upgrade(db_connection) == []
+    
+    def test_legacy_database_upgraded(self, tmp_path):
+        """Тест: база без schema_version доводится до актуальной версии"""
+        conn = sqlite3.connect(tmp_path / 'legacy.db')
+        conn.execute('CREATE TABLE records (id INTEGER PRIMARY KEY, title TEXT)')
+        conn.commit()
+        done = migrations.upgrade(conn, target=1)
+        assert [m.version for m in done] == [1]
+        assert migrations.column_exists(conn, 'records', 'rating')
+        conn.close()
+    
+    def test_backfill_batches_and_resumes(self, tmp_path):
+        """Тест: заполнение идет пакетами и продолжается с контрольной точки"""
+        conn = sqlite3.connect(tmp_path / 'backfill.db')
+        conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, value INTEGER, doubled INTEGER)')
+        conn.executemany('INSERT INTO items (value) VALUES (?)', [(i,) for i in range(1, 101)])
+        conn.commit()
+        
+        # Имитируем прерывание после первых 30 строк
+        migrations.ensure_version_table(conn)
+        conn.execute("INSERT INTO migration_progress (task, last_rowid, rows_done) VALUES ('t', 30, 30)")
+        conn.commit()
+        
+        rows = migrations.backfill(conn, 't', 'items', 'doubled = value * 2', batch_size=25)
+        assert rows == 100
+        assert conn.execute('SELECT COUNT(*) FROM items WHERE doubled IS NULL').fetchone()[0] == 30
+        assert conn.execute('SELECT COUNT(*) FROM items WHERE doubled = value * 2').fetchone()[0] == 70
+        assert not conn.in_transaction
+        conn.close()
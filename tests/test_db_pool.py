@@ -0,0 +1,112 @@
+"""
+Тесты пула соединений с базой данных
+"""
+import sqlite3
+import threading
+
+import pytest
+from flask import g
+
+import db_pool
+from app import app
+
+
+class TestConnectionPool:
+    """Тесты пула соединений"""
+    
+    def test_pragmas_applied(self, test_db_path):
+        """Тест: профиль PRAGMA применяется к новому соединению"""
+        conn = db_pool.connect(test_db_path)
+        try:
+            assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+            assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 5000
+            assert conn.execute('PRAGMA temp_store').fetchone()[0] == 2
+        finally:
+            conn.close()
+    
+    def test_connection_reused(self, test_db_path):
+        """Тест: освобожденное соединение переиспользуется"""
+        pool = db_pool.ConnectionPool(test_db_path, max_size=2)
+        conn = pool.acquire()
+        pool.release(conn)
+        assert pool.acquire() is conn
+        pool.close_all()
+    
+    def test_release_rolls_back(self, test_db_path):
+        """Тест: незавершенная транзакция откатывается при возврате в пул"""
+        pool = db_pool.ConnectionPool(test_db_path, max_size=1)
+        conn = pool.acquire()
+        conn.execute("UPDATE companies SET phone = 'x' WHERE id = 1")
+        assert conn.in_transaction
+        pool.release(conn)
+        assert not conn.in_transaction
+        assert conn.execute('SELECT phone FROM companies WHERE id = 1').fetchone()[0] != 'x'
+        pool.close_all()
+    
+    def test_app_context_lazy_and_released(self, test_db_path):
+        """Тест: соединение открывается лениво и возвращается при teardown"""
+        with app.app_context():
+            assert 'db' not in g
+            conn = db_pool.get_db()
+            assert db_pool.get_db() is conn
+        with app.app_context():
+            assert db_pool.get_db() is conn
+
+
+class TestReadWriteSplit:
+    """Тесты разделения соединений на чтение и запись"""
+    
+    def test_reader_is_readonly(self, test_db_path):
+        """Тест: соединение для чтения не может писать"""
+        with app.app_context():
+            conn = db_pool.get_db()
+            with pytest.raises(sqlite3.OperationalError):
+                conn.execute("UPDATE companies SET phone = 'x' WHERE id = 1")
+    
+    def test_writer_opens_immediate_transaction(self, test_db_path):
+        """Тест: пишущее соединение выдается с открытой транзакцией"""
+        with app.app_context():
+            assert db_pool.run_write(lambda conn: conn.in_transaction)
+
+    def test_writer_released_after_commit(self, test_db_path):
+        """Тест: писатель освобождается сразу после run_write, а не в конце запроса"""
+        def fail(conn):
+            conn.execute("UPDATE companies SET phone = 'x' WHERE id = 1")
+            raise ValueError('ошибка')
+
+        with app.app_context():
+            writer = db_pool.get_writer()
+            db_pool.run_write(lambda conn: conn.execute("UPDATE companies SET phone = phone WHERE id = 1"))
+            assert not writer._lock.locked()
+            with pytest.raises(ValueError):
+                db_pool.run_write(fail)
+            assert not writer._lock.locked()
+            assert db_pool.get_db().execute('SELECT phone FROM companies WHERE id = 1').fetchone()[0] != 'x'
+            # Следующая транзакция того же запроса не ждет саму себя
+            assert db_pool.write_transaction(lambda conn: conn.in_transaction)
+    
+    def test_writer_is_serialized(self, test_db_path):
+        """Тест: второй писатель ждет освобождения первого"""
+        writer = db_pool.Writer(test_db_path)
+        conn = writer.acquire()
+        acquired = threading.Event()
+        
+        def second():
+            writer.release(writer.acquire())
+            acquired.set()
+        
+        thread = threading.Thread(target=second)
+        thread.start()
+        assert not acquired.wait(0.1)
+        writer.release(conn)
+        assert acquired.wait(5)
+        thread.join()
+        writer.close_all()
+    
+    def test_lock_stats_reported_per_path(self, auth_director):
+        """Тест: статистика ожидания доступна по путям чтения и записи"""
+        response = auth_director.get('/lock_stats')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['read']['count'] > 0
+        assert set(data) == {'read', 'write'}
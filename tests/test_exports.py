@@ -0,0 +1,131 @@
+"""
+Тесты потоковой выгрузки данных
+"""
+import csv
+import io
+import json
+import types
+
+import exports
+import queries
+
+
+def add_purchases(conn):
+    conn.executemany('''
+        INSERT INTO purchases (user_id, record_id, quantity, price, purchase_date)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [
+        (3, 1, 1, 25.99, '2025-01-10 10:00:00'),
+        (3, 3, 2, 71.98, '2025-01-31 23:59:59'),
+        (1, 1, 1, 25.99, '2025-02-01 00:00:00'),
+        (3, 1, 3, 77.97, '2025-03-15 12:00:00'),
+    ])
+    conn.commit()
+
+
+def export_rows(conn, name, fmt='csv', **filters):
+    args = {key: str(value) for key, value in filters.items()}
+    text = ''.join(exports.stream(conn, name, fmt, exports.parse_filters(args)))
+    if fmt == 'csv':
+        return list(csv.DictReader(io.StringIO(text)))
+    return [json.loads(line) for line in text.splitlines()]
+
+
+class TestExports:
+    """Тесты содержимого выгрузок"""
+
+    def test_purchases_filters(self, fresh_db):
+        """Тест: фильтры по датам (конец включительно), покупателю и компании"""
+        add_purchases(fresh_db)
+
+        rows = export_rows(fresh_db, 'purchases', date_from='2025-01-01', date_to='2025-01-31')
+        assert [row['purchase_date'] for row in rows] == ['2025-01-10 10:00:00', '2025-01-31 23:59:59']
+        assert rows[1]['catalog_number'] == 'EMI-567-890'
+
+        rows = export_rows(fresh_db, 'purchases', date_from='2025-01-01', user_id=3, company_id=2)
+        assert [row['quantity'] for row in rows] == ['1', '3']
+
+    def test_records_jsonl(self, fresh_db):
+        """Тест: остатки в JSONL - по объекту на строку со всеми столбцами"""
+        rows = export_rows(fresh_db, 'records', 'jsonl')
+        total = fresh_db.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+        assert len(rows) == total
+        assert list(rows[0]) == exports.EXPORTS['records'][0]
+        assert rows[0]['catalog_number'] == 'DG-427-123'
+
+    def test_sales_by_month(self, fresh_db):
+        """Тест: сводка по месяцам и компаниям совпадает с итогами покупок"""
+        add_purchases(fresh_db)
+
+        rows = export_rows(fresh_db, 'sales', date_from='2025-01-01', date_to='2025-03-31')
+        summary = {(row['month'], row['company_name']): (int(row['quantity']), float(row['revenue']))
+                   for row in rows}
+        assert summary == {
+            ('2025-01', 'Deutsche Grammophon'): (1, 25.99),
+            ('2025-01', 'EMI Records'): (2, 71.98),
+            ('2025-02', 'Deutsche Grammophon'): (1, 25.99),
+            ('2025-03', 'Deutsche Grammophon'): (3, 77.97),
+        }
+
+    def test_money_exact(self, fresh_db):
+        """Тест: суммы выгружаются из копеек без погрешности float"""
+        fresh_db.executemany('INSERT INTO purchases (user_id, record_id, quantity, price, purchase_date) '
+                             'VALUES (3, 1, 1, 0.1, ?)', [(f'2024-05-0{day} 10:00:00',) for day in (1, 2, 3)])
+        fresh_db.commit()
+
+        rows = export_rows(fresh_db, 'sales', 'jsonl', date_from='2024-05-01', date_to='2024-05-31')
+        assert [row['revenue'] for row in rows] == ['0.30']
+        rows = export_rows(fresh_db, 'purchases', date_from='2024-05-01', date_to='2024-05-31')
+        assert [row['price'] for row in rows] == ['0.10'] * 3
+        record = export_rows(fresh_db, 'records', 'jsonl')[0]
+        assert record['retail_price'] == '%.2f' % fresh_db.execute(
+            'SELECT retail_price FROM records ORDER BY id LIMIT 1').fetchone()[0]
+
+    def test_streamed_in_batches(self, fresh_db, monkeypatch):
+        """Тест: выгрузка - генератор, строки читаются пакетами, статистика запроса пишется"""
+        add_purchases(fresh_db)
+        monkeypatch.setattr(exports, 'BATCH_SIZE', 1)
+        calls = queries.EXPORT_PURCHASES.calls
+
+        chunks = exports.stream(fresh_db, 'purchases', 'csv', exports.parse_filters({'date_from': '2025-01-01'}))
+        assert isinstance(chunks, types.GeneratorType)
+        # Заголовок и по куску на каждую покупку
+        assert len(list(chunks)) == 1 + 4
+        assert queries.EXPORT_PURCHASES.calls == calls + 1
+
+    def test_purchases_plan_without_sort(self, fresh_db):
+        """Тест: выгрузка покупок идет по индексу даты без временного B-дерева"""
+        plan = ' '.join(row[3] for row in fresh_db.execute(
+            'EXPLAIN QUERY PLAN ' + queries.EXPORT_PURCHASES.sql, ('', '9999-12-31', None, None)))
+        assert 'idx_purchases_date' in plan
+        assert 'TEMP B-TREE' not in plan
+
+
+class TestExportEndpoint:
+    """Тесты маршрута /export/<name>"""
+
+    def test_director_download(self, auth_director):
+        """Тест: директор получает потоковый CSV-файл"""
+        response = auth_director.get('/export/records?format=csv')
+
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.mimetype == 'text/csv'
+        assert 'attachment; filename=records_' in response.headers['Content-Disposition']
+        assert response.get_data(as_text=True).startswith('catalog_number,title,company_name')
+
+    def test_unknown_export(self, auth_director):
+        """Тест: неизвестная выгрузка или формат - 404"""
+        assert auth_director.get('/export/users').status_code == 404
+        assert auth_director.get('/export/records?format=xml').status_code == 404
+
+    def test_bad_filter(self, auth_director):
+        """Тест: некорректная дата - сообщение об ошибке"""
+        response = auth_director.get('/export/purchases?date_from=вчера', follow_redirects=True)
+        assert 'Ошибка в параметрах выгрузки' in response.get_data(as_text=True)
+
+    def test_seller_forbidden(self, auth_seller):
+        """Тест: продавец не может выгружать данные"""
+        response = auth_seller.get('/export/purchases')
+        assert response.status_code == 302
@@ -0,0 +1,94 @@
+"""
+Тесты групповой фиксации записей
+"""
+import threading
+
+import pytest
+
+import db_pool
+from app import app
+from group_commit import GroupCommitter
+
+
+@pytest.fixture
+def committer(test_db_path):
+    """Групповой фиксатор с окном 20 мс на тестовой БД"""
+    writer = db_pool.Writer(test_db_path)
+    yield GroupCommitter(writer, window=0.02)
+    writer.close_all()
+
+
+class TestGroupCommitter:
+    """Тесты объединения операций в общие транзакции"""
+    
+    def test_concurrent_operations_share_commit(self, committer, db_connection):
+        """Тест: параллельные операции фиксируются меньшим числом транзакций"""
+        def insert(i):
+            return lambda conn: conn.execute(
+                "INSERT INTO companies (name) VALUES (?)", (f'group-{i}',)).lastrowid
+        
+        results = {}
+        threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, committer.submit(insert(i))))
+                   for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        assert len(results) == 8 and all(results.values())
+        assert committer.operations == 8
+        assert committer.batches < 8
+        count = db_connection.execute("SELECT COUNT(*) FROM companies WHERE name LIKE 'group-%'").fetchone()[0]
+        assert count == 8
+        db_connection.execute("DELETE FROM companies WHERE name LIKE 'group-%'")
+        db_connection.commit()
+    
+    def test_failed_operation_isolated(self, committer, db_connection):
+        """Тест: ошибка одной операции не откатывает остальные"""
+        def ok(conn):
+            conn.execute("INSERT INTO companies (name) VALUES ('group-ok')")
+            return 'ok'
+        
+        def fail(conn):
+            conn.execute("INSERT INTO companies (name) VALUES ('group-fail')")
+            raise ValueError('отказ')
+        
+        outcome = {}
+        
+        def run(name, fn):
+            try:
+                outcome[name] = committer.submit(fn)
+            except ValueError as e:
+                outcome[name] = e
+        
+        threads = [threading.Thread(target=run, args=('ok', ok)),
+                   threading.Thread(target=run, args=('fail', fail))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        assert outcome['ok'] == 'ok'
+        assert isinstance(outcome['fail'], ValueError)
+        names = {row[0] for row in db_connection.execute(
+            "SELECT name FROM companies WHERE name LIKE 'group-%'")}
+        assert names == {'group-ok'}
+        db_connection.execute("DELETE FROM companies WHERE name LIKE 'group-%'")
+        db_connection.commit()
+
+
+class TestGroupCommitRoutes:
+    """Тесты маршрутов покупки при включенной групповой фиксации"""
+    
+    def test_buy_record_with_group_commit(self, auth_buyer, db_connection):
+        """Тест: покупка проходит через групповую фиксацию"""
+        before = db_connection.execute('SELECT current_stock FROM records WHERE id = 5').fetchone()[0]
+        app.config['GROUP_COMMIT_WINDOW_MS'] = 2
+        try:
+            response = auth_buyer.post('/buy_record/5', data={'quantity': '1'}, follow_redirects=True)
+        finally:
+            app.config['GROUP_COMMIT_WINDOW_MS'] = 0
+        assert response.status_code == 200
+        assert 'Покупка успешно оформлена'.encode('utf-8') in response.data
+        after = db_connection.execute('SELECT current_stock FROM records WHERE id = 5').fetchone()[0]
+        assert after == before - 1
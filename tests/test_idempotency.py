@@ -0,0 +1,148 @@
+"""
+Тесты ключей идемпотентности покупки и оформления заказа
+"""
+import threading
+
+import pytest
+
+import cart_store
+import db_pool
+import idempotency
+from app import app
+from repository import MemoryIdempotency, SqliteRepository
+
+BUYER_ID = 3
+
+
+def in_stock(conn):
+    return conn.execute('SELECT id, current_stock FROM records '
+                        'WHERE current_stock > 2 AND retail_price IS NOT NULL LIMIT 1').fetchone()
+
+
+def purchases_of(conn, record_id):
+    return conn.execute('SELECT COUNT(*) FROM purchases WHERE record_id = ?', (record_id,)).fetchone()[0]
+
+
+def flashes(client):
+    with client.session_transaction() as sess:
+        return sess.pop('_flashes', [])
+
+
+class TestRoutes:
+    """Тесты повторных запросов покупки и оформления"""
+
+    def test_buy_replayed(self, auth_buyer, db_connection):
+        """Тест: повтор покупки с тем же ключом возвращает тот же результат и не покупает заново"""
+        record_id, stock = in_stock(db_connection)
+        purchases = purchases_of(db_connection, record_id)
+        form = {'quantity': '1', 'idempotency_key': idempotency.new_key()}
+
+        first = auth_buyer.post(f'/buy_record/{record_id}', data=form)
+        message = flashes(auth_buyer)
+        second = auth_buyer.post(f'/buy_record/{record_id}', data=form)
+
+        assert second.location == first.location
+        assert flashes(auth_buyer) == message
+        assert purchases_of(db_connection, record_id) == purchases + 1
+        assert db_connection.execute('SELECT current_stock FROM records WHERE id = ?',
+                                     (record_id,)).fetchone()[0] == stock - 1
+
+    def test_without_key_not_deduplicated(self, auth_buyer, db_connection):
+        """Тест: запросы без ключа выполняются каждый"""
+        record_id, _ = in_stock(db_connection)
+        purchases = purchases_of(db_connection, record_id)
+        for _ in range(2):
+            auth_buyer.post(f'/buy_record/{record_id}', data={'quantity': '1'})
+        assert purchases_of(db_connection, record_id) == purchases + 2
+
+    def test_replay_from_table_without_writer(self, auth_buyer, db_connection):
+        """Тест: ключ, сохраненный другим процессом, читается из таблицы без транзакции записи"""
+        record_id, _ = in_stock(db_connection)
+        form = {'quantity': '1', 'idempotency_key': idempotency.new_key()}
+        auth_buyer.post(f'/buy_record/{record_id}', data=form)
+        purchases = purchases_of(db_connection, record_id)
+        idempotency.cache.clear()
+
+        writer = db_pool.get_writer(app)
+        conn = writer.acquire()
+        done = threading.Event()
+
+        def replay():
+            with app.test_client() as client:
+                with client.session_transaction() as sess:
+                    sess['user_id'] = BUYER_ID
+                    sess['role'] = 'buyer'
+                client.post(f'/buy_record/{record_id}', data=form)
+            done.set()
+
+        try:
+            thread = threading.Thread(target=replay)
+            thread.start()
+            assert done.wait(5)
+        finally:
+            writer.release(conn)
+            thread.join()
+        assert purchases_of(db_connection, record_id) == purchases
+
+    def test_checkout_replay_keeps_new_cart(self, auth_buyer, db_connection):
+        """Тест: повтор оформления не создает второй заказ и не трогает новую корзину"""
+        record_id, _ = in_stock(db_connection)
+        auth_buyer.get('/clear_cart')
+        auth_buyer.post(f'/add_to_cart/{record_id}', data={'quantity': '1'})
+        form = {'idempotency_key': idempotency.new_key()}
+        auth_buyer.post('/checkout', data=form)
+        orders = db_connection.execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+
+        auth_buyer.post(f'/add_to_cart/{record_id}', data={'quantity': '1'})
+        auth_buyer.post('/checkout', data=form)
+
+        assert db_connection.execute('SELECT COUNT(*) FROM orders').fetchone()[0] == orders
+        assert db_connection.execute('SELECT COUNT(*) FROM cart WHERE user_id = ?', (BUYER_ID,)).fetchone()[0] == 1
+
+    @pytest.mark.parametrize('store', ['main', 'memory'])
+    def test_checkout_replay_in_transaction_keeps_new_cart(self, auth_buyer, db_connection, monkeypatch,
+                                                           tmp_path, store):
+        """Тест: результат, найденный повторной проверкой в транзакции, не очищает новую корзину"""
+        monkeypatch.setitem(app.config, 'CART_STORE', store)
+        monkeypatch.setitem(app.config, 'CART_DB_PATH', str(tmp_path / 'carts.db'))
+        record_id, _ = in_stock(db_connection)
+        auth_buyer.get('/clear_cart')
+        auth_buyer.post(f'/add_to_cart/{record_id}', data={'quantity': '1'})
+        form = {'idempotency_key': idempotency.new_key()}
+        auth_buyer.post('/checkout', data=form)
+        orders = db_connection.execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+        auth_buyer.post(f'/add_to_cart/{record_id}', data={'quantity': '1'})
+
+        # Ключ сохранил другой процесс уже после чтения перед транзакцией
+        idempotency.cache.clear()
+        missed = type('Missed', (), {'idempotency': MemoryIdempotency()})()
+        monkeypatch.setattr(idempotency, 'get_repository', lambda: missed)
+        auth_buyer.post('/checkout', data=form)
+
+        assert db_connection.execute('SELECT COUNT(*) FROM orders').fetchone()[0] == orders
+        with app.app_context():
+            assert [item['record_id'] for item in cart_store.items(BUYER_ID)] == [record_id]
+        cart_store.close_stores()
+
+    def test_forms_carry_key(self, auth_buyer):
+        """Тест: форма покупки содержит ключ"""
+        assert b'name="idempotency_key"' in auth_buyer.get('/catalog').data
+
+
+class TestKeyStore:
+    """Тесты хранения ключей"""
+
+    @pytest.fixture(params=['sqlite', 'memory'])
+    def keys(self, request, fresh_db):
+        return SqliteRepository(fresh_db).idempotency if request.param == 'sqlite' else MemoryIdempotency()
+
+    def test_get_add_purge(self, keys):
+        """Тест: ключ виден только своему пользователю и до истечения срока"""
+        outcome = ('success', 'Покупка успешно оформлена!', 'personal_cabinet')
+        keys.add(BUYER_ID, 'k1', outcome)
+        assert keys.get(BUYER_ID, 'k1', 60) == outcome
+        assert keys.get(BUYER_ID + 1, 'k1', 60) is None
+        assert keys.purge(60) == 0
+        assert keys.get(BUYER_ID, 'k1', -60) is None
+        assert keys.purge(-60) == 1
+        assert keys.get(BUYER_ID, 'k1', 60) is None
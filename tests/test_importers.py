@@ -0,0 +1,216 @@
+"""
+Тесты импорта прайс-листов пластинок
+"""
+import io
+import json
+
+import importers
+import queries
+
+HEADER = 'catalog_number,title,company,release_date,wholesale_price,retail_price,current_stock\n'
+
+
+def run_import(conn, text, fmt='csv', **kwargs):
+    kwargs.setdefault('workers', 1)
+    return importers.import_records(io.StringIO(text), fmt, importers.connection_writer(conn),
+                                    queries.COMPANY_NAMES.all(conn), **kwargs)
+
+
+def record(conn, catalog_number):
+    return conn.execute('SELECT * FROM records WHERE catalog_number = ?', (catalog_number,)).fetchone()
+
+
+class TestImportRecords:
+    """Тесты синхронизации пластинок по catalog_number"""
+
+    def test_insert_update_unchanged(self, fresh_db):
+        """Тест: новые строки добавляются, измененные обновляются, остальные не трогаются"""
+        text = (HEADER
+                + 'NEW-1,"Шуберт: Квинтет ""Форель""",Deutsche Grammophon,2020-05-01,10,19.90,7\n'
+                + 'DG-427-123,,,,,27.50,\n'
+                + 'DG-427-124,Моцарт: Реквием,,,,29.99,30\n')
+        summary = run_import(fresh_db, text)
+
+        assert (summary['inserted'], summary['updated'], summary['unchanged']) == (1, 1, 1)
+        new = record(fresh_db, 'NEW-1')
+        assert new['title'] == 'Шуберт: Квинтет "Форель"'
+        assert (new['company_id'], new['retail_price'], new['current_stock']) == (2, 19.9, 7)
+        # Пустые поля сохраняют текущие значения
+        updated = record(fresh_db, 'DG-427-123')
+        assert (updated['retail_price'], updated['current_stock']) == (27.5, 50)
+
+        summary = run_import(fresh_db, text)
+        assert (summary['inserted'], summary['updated'], summary['unchanged']) == (0, 0, 3)
+
+    def test_jsonl(self, fresh_db):
+        """Тест: JSONL с company_id и числами"""
+        lines = [json.dumps({'catalog_number': 'J-1', 'title': 'Джаз', 'company_id': 4,
+                             'retail_price': 15, 'current_stock': 2}, ensure_ascii=False),
+                 '',
+                 json.dumps({'catalog_number': 'DG-427-123', 'current_stock': 0})]
+        summary = run_import(fresh_db, '\n'.join(lines) + '\n', 'jsonl')
+
+        assert (summary['inserted'], summary['updated'], summary['rejected']) == (1, 1, 0)
+        assert record(fresh_db, 'J-1')['company_id'] == 4
+        assert record(fresh_db, 'DG-427-123')['current_stock'] == 0
+
+    def test_rejected_rows(self, fresh_db):
+        """Тест: ошибочные строки отклоняются с номером строки, остальные загружаются"""
+        text = (HEADER
+                + 'BAD-1,Без компании,,,,10,1\n'
+                + 'BAD-2,Неизвестная,Нет такой,,,10,1\n'
+                + 'BAD-3,Цена,EMI Records,,,-5,1\n'
+                + 'BAD-4,Дата,EMI Records,31.12.2020,,10,1\n'
+                + 'OK-1,Хорошая,emi records,,,10,1\n')
+        summary = run_import(fresh_db, text)
+
+        assert summary['inserted'] == 1
+        assert summary['rejected'] == 4
+        assert [line_no for line_no, _ in summary['errors']] == [2, 3, 4, 5]
+        assert record(fresh_db, 'BAD-1') is None
+        assert record(fresh_db, 'OK-1')['company_id'] == 1
+
+    def test_chunks_keep_quoted_newlines(self, fresh_db):
+        """Тест: пакет не разрывает поле с переводом строки; результат не зависит от числа процессов"""
+        rows = ''.join(f'CH-{i},"Запись\n{i}",EMI Records,,,{i},1\n' for i in range(1, 8))
+        summary = run_import(fresh_db, HEADER + rows, chunk_size=2)
+        assert summary['inserted'] == 7
+        assert record(fresh_db, 'CH-5')['title'] == 'Запись\n5'
+
+        changed = rows.replace(',1\n', ',2\n')
+        summary = run_import(fresh_db, HEADER + changed, chunk_size=2, workers=2)
+        assert (summary['updated'], summary['rejected']) == (7, 0)
+
+    def test_missing_catalog_column(self, fresh_db):
+        """Тест: файл без столбца catalog_number не принимается"""
+        try:
+            run_import(fresh_db, 'title,retail_price\nX,1\n')
+        except ValueError as e:
+            assert 'catalog_number' in str(e)
+        else:
+            raise AssertionError('ожидалась ошибка')
+
+    def test_unchanged_title_skips_search_trigger(self, fresh_db):
+        """Тест: обновление цены без смены названия не переписывает поисковый индекс"""
+        before = fresh_db.total_changes
+        run_import(fresh_db, HEADER + 'DG-427-123,,,,,30,\n')
+        # total_changes учитывает и изменения триггеров: изменилась только сама строка
+        assert fresh_db.total_changes - before == 1
+
+        run_import(fresh_db, HEADER + 'DG-427-123,Бетховен: Девятая симфония,,,,,\n')
+        assert fresh_db.execute(
+            "SELECT COUNT(*) FROM search_index WHERE search_index MATCH 'девятая'").fetchone()[0] == 1
+
+
+class TestImportEndpoint:
+    """Тесты загрузки прайс-листа директором"""
+
+    def test_upload(self, auth_director, db_connection):
+        """Тест: директор загружает CSV и видит итог"""
+        data = {'file': (io.BytesIO((HEADER + 'UP-1,Загруженная,EMI Records,,,12,3\n').encode('utf-8-sig')),
+                         'price.csv')}
+        response = auth_director.post('/import_records', data=data, content_type='multipart/form-data',
+                                      follow_redirects=True)
+
+        assert response.status_code == 200
+        assert 'добавлено 1' in response.get_data(as_text=True)
+        assert record(db_connection, 'UP-1')['current_stock'] == 3
+
+    def test_unknown_format(self, auth_director):
+        """Тест: файл неизвестного формата отклоняется"""
+        data = {'file': (io.BytesIO(b'x'), 'price.xlsx')}
+        response = auth_director.post('/import_records', data=data, content_type='multipart/form-data',
+                                      follow_redirects=True)
+        assert 'Неизвестный формат' in response.get_data(as_text=True)
+
+    def test_seller_forbidden(self, auth_seller, db_connection):
+        """Тест: продавец не может загружать прайс-листы"""
+        data = {'file': (io.BytesIO((HEADER + 'UP-2,Нет,EMI Records,,,12,3\n').encode()), 'price.csv')}
+        auth_seller.post('/import_records', data=data, content_type='multipart/form-data')
+        assert record(db_connection, 'UP-2') is None
+
+
+def graph_lines(*objects):
+    return io.StringIO(''.join(json.dumps(obj, ensure_ascii=False) + '\n' for obj in objects))
+
+
+CATALOGUE = [
+    {'kind': 'record', 'catalog_number': 'LBL-1', 'title': 'Квартеты', 'company': 'Новый лейбл',
+     'wholesale_price': 0.29, 'retail_price': 19.99, 'current_stock': 5},
+    {'kind': 'company', 'name': 'Новый лейбл'},
+    {'kind': 'musician', 'name': 'Анна Первая', 'role': 'исполнитель', 'instruments': 'скрипка'},
+    {'kind': 'musician', 'name': 'Борис Второй', 'role': 'композитор'},
+    {'kind': 'ensemble', 'name': 'Квартет Нового лейбла', 'type': 'квартет'},
+    {'kind': 'member', 'ensemble': 'Квартет Нового лейбла', 'musician': 'Анна Первая'},
+    {'kind': 'composition', 'title': 'Квартет №1', 'composer': 'Борис Второй'},
+    {'kind': 'performance', 'key': 'p1', 'composition': 'Квартет №1', 'composer': 'Борис Второй',
+     'ensemble': 'Квартет Нового лейбла', 'recording_date': '2024-03-01'},
+    {'kind': 'track', 'record': 'LBL-1', 'performance': 'p1', 'track_number': 1},
+]
+
+
+class TestImportGraph:
+    """Тесты загрузки графа музыкальных данных"""
+
+    def test_load_in_dependency_order(self, fresh_db):
+        """Тест: ссылки разрешаются независимо от порядка строк в файле"""
+        summary = importers.import_graph(graph_lines(*CATALOGUE), importers.connection_writer(fresh_db))
+
+        assert summary['rejected'] == 0
+        assert all(summary['inserted'][kind] == count for kind, count in
+                   {'company': 1, 'musician': 2, 'ensemble': 1, 'member': 1, 'composition': 1,
+                    'performance': 1, 'record': 1, 'track': 1}.items())
+        row = fresh_db.execute('''
+            SELECT e.name AS ensemble, c.title, m.name AS composer, co.name AS company
+            FROM record_tracks rt
+            JOIN records r ON rt.record_id = r.id
+            JOIN companies co ON r.company_id = co.id
+            JOIN performances p ON rt.performance_id = p.id
+            JOIN ensembles e ON p.ensemble_id = e.id
+            JOIN compositions c ON p.composition_id = c.id
+            JOIN musicians m ON c.composer_id = m.id
+            WHERE r.catalog_number = 'LBL-1'
+        ''').fetchone()
+        assert tuple(row) == ('Квартет Нового лейбла', 'Квартет №1', 'Борис Второй', 'Новый лейбл')
+        # Цены пишутся в копейках вместе с зеркалом в рублях
+        assert tuple(fresh_db.execute('''
+            SELECT wholesale_price_cents, retail_price_cents, wholesale_price, retail_price
+            FROM records WHERE catalog_number = 'LBL-1'
+        ''').fetchone()) == (29, 1999, 0.29, 19.99)
+        # Триггеры производных данных срабатывают и при массовой загрузке
+        assert fresh_db.execute('''
+            SELECT COUNT(*) FROM ensemble_discography d JOIN ensembles e ON d.ensemble_id = e.id
+            WHERE e.name = 'Квартет Нового лейбла'
+        ''').fetchone()[0] == 1
+        # Один запрос поиска существующих и два на загрузку каждой таблицы
+        assert summary['statements'] <= 3 * len(importers.GRAPH_ORDER)
+
+    def test_existing_entities_reused(self, fresh_db):
+        """Тест: повторная загрузка и ссылки на уже существующие строки не создают дублей"""
+        write = importers.connection_writer(fresh_db)
+        importers.import_graph(graph_lines(*CATALOGUE), write)
+        summary = importers.import_graph(graph_lines(*[obj for obj in CATALOGUE if obj['kind'] != 'performance'],
+                                                     {'kind': 'record', 'catalog_number': 'LBL-2',
+                                                      'title': 'Старая компания', 'company': 'EMI Records'}),
+                                         write)
+
+        assert summary['inserted']['record'] == 1
+        assert summary['existing']['musician'] == 2
+        assert summary['existing']['record'] == 1
+        assert fresh_db.execute("SELECT COUNT(*) FROM musicians WHERE name = 'Анна Первая'").fetchone()[0] == 1
+        assert fresh_db.execute("SELECT company_id FROM records WHERE catalog_number = 'LBL-2'").fetchone()[0] == 1
+        # Дорожка ссылается на исполнение, которого нет в этом файле
+        assert summary['rejected'] == 1
+
+    def test_unresolved_references_rejected(self, fresh_db):
+        """Тест: строки с неразрешенными ссылками отклоняются, зависимые от них - тоже"""
+        summary = importers.import_graph(graph_lines(
+            {'kind': 'ensemble', 'name': 'Без типа'},
+            {'kind': 'member', 'ensemble': 'Без типа', 'musician': 'Никто'},
+            {'kind': 'record', 'catalog_number': 'X-1', 'title': 'X', 'company': 'Нет такой'},
+            {'kind': 'unknown'},
+        ), importers.connection_writer(fresh_db))
+
+        assert summary['rejected'] == 4
+        assert [line_no for line_no, _ in summary['errors']] == [1, 2, 3, 4]
+        assert sum(summary['inserted'].values()) == 0
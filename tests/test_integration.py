@@ -3,6 +3,8 @@
 """
 import pytest
 
+from money import format_money
+
 
 class TestIndexPage:
     """Интеграционные тесты для главной страницы"""
@@ -81,6 +83,12 @@ class TestEnsembleRecords:
         
         response = auth_buyer.get(f'/ensemble_records?ensemble_id={ensemble_id}')
         assert response.status_code == 200
+        # Цены пластинок выводятся из копеек
+        for (price_cents,) in conn.execute('''
+            SELECT r.retail_price_cents FROM ensemble_discography ed JOIN records r ON ed.record_id = r.id
+            WHERE ed.ensemble_id = ? AND r.retail_price_cents
+        ''', (ensemble_id,)):
+            assert f'{format_money(price_cents)} ₽' in response.get_data(as_text=True)
 
 
 class TestSalesLeaders:
@@ -0,0 +1,86 @@
+"""
+Тесты сводки о базе и команд обслуживания
+"""
+import maintenance
+
+
+def add_junk(conn, rows=500):
+    conn.execute('CREATE TABLE junk (payload TEXT)')
+    conn.executemany('INSERT INTO junk VALUES (?)', [('x' * 1000,)] * rows)
+    conn.commit()
+
+
+def db_path(conn):
+    return conn.execute('PRAGMA database_list').fetchone()[2]
+
+
+class TestStats:
+    """Тесты сводки manage_db.py status"""
+
+    def test_tables_and_indexes(self, fresh_db):
+        """Тест: строки таблиц, размеры индексов, теневые таблицы FTS не показываются"""
+        info = maintenance.stats(fresh_db, db_path(fresh_db))
+        tables = {table['name']: table for table in info['tables']}
+
+        assert info['page_size'] * info['page_count'] > 0
+        assert info['auto_vacuum'] == 'incremental'
+        assert tables['records']['rows'] == fresh_db.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+        assert not any(name.startswith('search_index_') for name in tables)
+        indexes = {index['name']: index for index in info['indexes']}
+        assert indexes['idx_records_company']['table'] == 'records'
+        assert indexes['idx_records_company']['bytes'] >= info['page_size']
+
+    def test_stale_statistics(self, fresh_db):
+        """Тест: статистика устаревает, когда таблица выросла больше чем в STALE_RATIO раз"""
+        maintenance.analyze(fresh_db)
+        assert maintenance.stale_tables(fresh_db) == []
+
+        rows = fresh_db.execute('SELECT COUNT(*) FROM musicians').fetchone()[0]
+        fresh_db.executemany("INSERT INTO musicians (name, role) VALUES (?, 'исполнитель')",
+                             [(f'Музыкант {i}',) for i in range(rows * maintenance.STALE_RATIO)])
+        fresh_db.commit()
+        assert maintenance.stale_tables(fresh_db) == ['musicians']
+
+        assert maintenance.optimize(fresh_db) == ['musicians']
+        assert maintenance.stale_tables(fresh_db) == []
+
+
+class TestMaintenance:
+    """Тесты VACUUM и проверки целостности"""
+
+    def test_incremental_vacuum(self, fresh_db):
+        """Тест: свободные страницы возвращаются по частям и целиком"""
+        add_junk(fresh_db)
+        fresh_db.execute('DROP TABLE junk')
+        fresh_db.commit()
+        free = fresh_db.execute('PRAGMA freelist_count').fetchone()[0]
+        assert free > 100
+
+        before, after = maintenance.vacuum(fresh_db, incremental=True, pages=50)
+        assert before - after == 50
+        maintenance.vacuum(fresh_db, incremental=True)
+        assert fresh_db.execute('PRAGMA freelist_count').fetchone()[0] == 0
+
+    def test_full_vacuum_enables_incremental(self, fresh_db):
+        """Тест: полный VACUUM переводит старую базу в режим incremental"""
+        fresh_db.execute('PRAGMA auto_vacuum = NONE')
+        fresh_db.execute('VACUUM')
+        try:
+            maintenance.vacuum(fresh_db, incremental=True)
+        except ValueError as e:
+            assert 'auto_vacuum' in str(e)
+        else:
+            raise AssertionError('ожидалась ошибка')
+
+        maintenance.vacuum(fresh_db)
+        assert fresh_db.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+
+    def test_integrity_check(self, fresh_db):
+        """Тест: целая база проходит проверку, висячая ссылка находится"""
+        assert maintenance.integrity_check(fresh_db) == []
+
+        fresh_db.execute("INSERT INTO cart (user_id, record_id, quantity) VALUES (3, 999, 1)")
+        fresh_db.commit()
+        problems = maintenance.integrity_check(fresh_db, quick=True)
+        assert len(problems) == 1
+        assert 'cart' in problems[0] and 'records' in problems[0]
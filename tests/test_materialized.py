@@ -0,0 +1,70 @@
+"""
+Тесты материализованной дискографии ансамблей
+"""
+import materialized
+
+
+def pairs(conn):
+    return set(map(tuple, conn.execute(
+        'SELECT ensemble_id, record_id FROM ensemble_discography').fetchall()))
+
+
+def expected_pairs(conn):
+    return set(map(tuple, conn.execute('''
+        SELECT DISTINCT p.ensemble_id, rt.record_id
+        FROM record_tracks rt
+        JOIN performances p ON rt.performance_id = p.id
+        JOIN records r ON rt.record_id = r.id
+    ''').fetchall()))
+
+
+def new_record(conn, catalog_number):
+    return conn.execute('''
+        INSERT INTO records (catalog_number, title, company_id, retail_price)
+        VALUES (?, 'Тест', 1, 10)
+    ''', (catalog_number,)).lastrowid
+
+
+class TestDiscographyTriggers:
+    """Тесты поддержки ensemble_discography триггерами"""
+    
+    def test_initial_fill(self, fresh_db):
+        """Тест: миграция заполняет таблицу по существующим трекам"""
+        assert pairs(fresh_db)
+        assert pairs(fresh_db) == expected_pairs(fresh_db)
+    
+    def test_track_insert_and_delete(self, fresh_db):
+        """Тест: пара появляется с первым треком и исчезает с последним"""
+        record_id = new_record(fresh_db, 'DISC-1')
+        ensemble_id = fresh_db.execute('SELECT ensemble_id FROM performances WHERE id = 1').fetchone()[0]
+        fresh_db.execute('INSERT INTO record_tracks (record_id, performance_id, track_number) VALUES (?, 1, 1)',
+                         (record_id,))
+        fresh_db.execute('INSERT INTO record_tracks (record_id, performance_id, track_number) VALUES (?, 1, 2)',
+                         (record_id,))
+        assert (ensemble_id, record_id) in pairs(fresh_db)
+        
+        fresh_db.execute('DELETE FROM record_tracks WHERE record_id = ? AND track_number = 1', (record_id,))
+        assert (ensemble_id, record_id) in pairs(fresh_db)
+        fresh_db.execute('DELETE FROM record_tracks WHERE record_id = ?', (record_id,))
+        assert (ensemble_id, record_id) not in pairs(fresh_db)
+    
+    def test_performance_changes(self, fresh_db):
+        """Тест: смена ансамбля исполнения и удаление исполнения"""
+        other = fresh_db.execute('SELECT MAX(id) FROM ensembles').fetchone()[0]
+        fresh_db.execute('UPDATE performances SET ensemble_id = ? WHERE id = 1', (other,))
+        assert pairs(fresh_db) == expected_pairs(fresh_db)
+        fresh_db.execute('DELETE FROM performances WHERE id = 1')
+        assert pairs(fresh_db) == expected_pairs(fresh_db)
+    
+    def test_record_delete(self, fresh_db):
+        """Тест: удаление пластинки удаляет ее пары"""
+        fresh_db.execute('DELETE FROM records WHERE id = 1')
+        assert all(record_id != 1 for _, record_id in pairs(fresh_db))
+    
+    def test_rebuild(self, fresh_db):
+        """Тест: полная перестройка восстанавливает потерянные пары"""
+        fresh_db.execute('DELETE FROM ensemble_discography')
+        fresh_db.commit()
+        count = materialized.rebuild_discography(fresh_db)
+        assert count == len(expected_pairs(fresh_db))
+        assert pairs(fresh_db) == expected_pairs(fresh_db)
@@ -0,0 +1,84 @@
+"""
+Тесты денежных сумм в копейках: разбор и вывод, триггеры зеркала DECIMAL, миграция 0012
+"""
+import pytest
+
+import migrations
+from money import format_money, to_cents
+from repository import SqliteRepository
+
+BUYER_ID = 3
+
+
+class TestMoney:
+    """Тесты разбора и вывода сумм"""
+
+    @pytest.mark.parametrize('value, cents', [
+        ('19.99', 1999), ('19,9', 1990), (' 7 ', 700), (0.29, 29), (1.005, 101), ('0.125', 13),
+        (None, None), ('', None),
+    ])
+    def test_to_cents(self, value, cents):
+        """Тест: строки и числа переводятся в копейки без погрешности float"""
+        assert to_cents(value) == cents
+
+    def test_to_cents_invalid(self):
+        """Тест: неверная сумма - ValueError"""
+        for value in ('abc', 'nan', 'inf'):
+            with pytest.raises(ValueError):
+                to_cents(value)
+
+    def test_format_money(self):
+        """Тест: копейки выводятся с двумя знаками"""
+        assert [format_money(cents) for cents in (123450, 5, 0, -250, None)] == \
+            ['1234.50', '0.05', '0.00', '-2.50', '']
+
+
+class TestCents:
+    """Тесты столбцов копеек в базе"""
+
+    def test_decimal_writers_get_cents(self, fresh_db):
+        """Тест: запись только цен DECIMAL заполняет копейки триггером"""
+        fresh_db.execute("INSERT INTO records (catalog_number, title, company_id, retail_price, wholesale_price) "
+                         "VALUES ('MONEY-1', 'Копейки', 1, 19.99, 0.29)")
+        record = "SELECT retail_price_cents, wholesale_price_cents FROM records WHERE catalog_number = 'MONEY-1'"
+        assert tuple(fresh_db.execute(record).fetchone()) == (1999, 29)
+
+        fresh_db.execute("UPDATE records SET retail_price = 20.1 WHERE catalog_number = 'MONEY-1'")
+        assert tuple(fresh_db.execute(record).fetchone()) == (2010, 29)
+        # Запись копеек вместе с зеркалом не пересчитывается
+        fresh_db.execute("UPDATE records SET retail_price_cents = 2500, retail_price = 25 "
+                         "WHERE catalog_number = 'MONEY-1'")
+        assert tuple(fresh_db.execute(record).fetchone()) == (2500, 29)
+
+    def test_totals_exact(self, fresh_db):
+        """Тест: сумма покупок по 0.10 - ровно 30 копеек, зеркало в рублях заполняется"""
+        fresh_db.execute('DELETE FROM purchases WHERE user_id = ?', (BUYER_ID,))
+        repo = SqliteRepository(fresh_db)
+        for _ in range(3):
+            repo.purchases.add(BUYER_ID, 1, 1, 10)
+        fresh_db.commit()
+
+        assert repo.purchases.totals(BUYER_ID)['total_spent_cents'] == 30
+        assert fresh_db.execute('SELECT SUM(price) FROM purchases WHERE user_id = ?',
+                                (BUYER_ID,)).fetchone()[0] == pytest.approx(0.3)
+
+    def test_migration_backfills(self, fresh_db, tmp_path, monkeypatch):
+        """Тест: миграция 0012 заполняет копейки существующих строк и переводит индексы цены"""
+        monkeypatch.setenv('ARCHIVE_DIR', str(tmp_path))
+        for trigger in ('records_money_insert', 'records_money_update',
+                        'purchases_money_insert', 'purchases_money_update'):
+            fresh_db.execute(f'DROP TRIGGER trg_{trigger}')
+        fresh_db.execute('DROP INDEX idx_records_price_cents')
+        fresh_db.execute('UPDATE records SET retail_price_cents = NULL, wholesale_price_cents = NULL')
+        fresh_db.execute('UPDATE purchases SET price_cents = NULL')
+        fresh_db.execute("DELETE FROM migration_progress WHERE task LIKE '0012_%'")
+        fresh_db.execute('DELETE FROM schema_version WHERE version = 12')
+        fresh_db.commit()
+
+        assert [m.version for m in migrations.upgrade(fresh_db)] == [12]
+
+        assert fresh_db.execute('SELECT COUNT(*) FROM records WHERE retail_price IS NOT NULL AND '
+                                'retail_price_cents != CAST(ROUND(retail_price * 100) AS INTEGER)').fetchone()[0] == 0
+        assert fresh_db.execute('SELECT COUNT(*) FROM purchases WHERE price_cents IS NULL').fetchone()[0] == 0
+        names = {row[0] for row in fresh_db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert 'idx_records_price_cents' in names and 'idx_records_price' not in names
@@ -0,0 +1,148 @@
+"""
+Тесты заказов: заголовок orders, покупки заказа и оформление корзины операторами над множеством
+"""
+import pytest
+
+import queries
+
+from repository import MemoryRepository, OutOfStock, SqliteRepository
+
+BUYER_ID = 3
+
+
+def add_stock(conn, count, stock=10):
+    """Пластинки ORDER-<N> с ценой N + 1 и остатком stock; возвращает их id"""
+    conn.executemany('''
+        INSERT INTO records (catalog_number, title, company_id, retail_price, current_stock)
+        VALUES (?, ?, 1, ?, ?)
+    ''', [(f'ORDER-{i}', f'Пластинка заказа {i}', i + 1, stock) for i in range(count)])
+    conn.commit()
+    rows = conn.execute("SELECT id FROM records WHERE catalog_number LIKE 'ORDER-%' ORDER BY id")
+    return [row[0] for row in rows]
+
+
+def stock_of(conn, ids):
+    placeholders = ', '.join('?' * len(ids))
+    return dict(conn.execute(f'SELECT id, current_stock FROM records WHERE id IN ({placeholders})', ids).fetchall())
+
+
+def count_queries(fn):
+    """Число выполнений запросов queries.py за время fn() (executemany - одно выполнение)"""
+    before = sum(query.calls for query in queries.REGISTRY.values())
+    fn()
+    return sum(query.calls for query in queries.REGISTRY.values()) - before
+
+
+class TestPlaceOrder:
+    """Тесты оформления заказа в SQLite"""
+
+    def test_order_and_purchases(self, fresh_db):
+        """Тест: один заголовок, покупки с его номером, списанные остатки и счетчики продаж"""
+        ids = add_stock(fresh_db, 3)
+        repo = SqliteRepository(fresh_db)
+
+        order = repo.orders.place(BUYER_ID, [(ids[0], 2), (ids[1], 1), (ids[0], 1), (ids[2], 4)])
+        fresh_db.commit()
+
+        assert order == {'id': order['id'], 'total_cents': (3 * 1 + 1 * 2 + 4 * 3) * 100, 'items': 3}
+        assert tuple(fresh_db.execute('SELECT user_id, total_cents, total, items FROM orders WHERE id = ?',
+                                      (order['id'],)).fetchone()) == (BUYER_ID, 1700, 17, 3)
+        rows = fresh_db.execute('SELECT record_id, quantity, price_cents FROM purchases '
+                                'WHERE order_id = ? ORDER BY record_id', (order['id'],)).fetchall()
+        assert [tuple(row) for row in rows] == [(ids[0], 3, 300), (ids[1], 1, 200), (ids[2], 4, 1200)]
+        assert stock_of(fresh_db, ids) == {ids[0]: 7, ids[1]: 9, ids[2]: 6}
+        assert fresh_db.execute('SELECT sold_this_year FROM records WHERE id = ?', (ids[2],)).fetchone()[0] == 4
+        assert [row['record_id'] for row in repo.orders.items(repo.orders.get(order['id'], BUYER_ID))] == ids
+        assert repo.orders.get(order['id'], BUYER_ID + 1) is None
+
+    def test_out_of_stock_changes_nothing(self, fresh_db):
+        """Тест: если одной пластинки не хватает, нет ни заказа, ни покупок, остатки прежние"""
+        ids = add_stock(fresh_db, 3)
+        repo = SqliteRepository(fresh_db)
+        orders = fresh_db.execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+
+        with pytest.raises(OutOfStock) as error:
+            repo.orders.place(BUYER_ID, [(ids[0], 1), (ids[1], 11), (ids[2], 1)])
+        fresh_db.commit()
+
+        assert error.value.record_id == ids[1]
+        assert stock_of(fresh_db, ids) == {record_id: 10 for record_id in ids}
+        assert fresh_db.execute('SELECT COUNT(*) FROM orders').fetchone()[0] == orders
+
+    def test_take_stock_sums_lines(self, fresh_db):
+        """Тест: несколько строк одной пластинки списываются суммой, а не одним вычитанием"""
+        ids = add_stock(fresh_db, 2)
+        fresh_db.execute('CREATE TEMP TABLE order_lines (record_id INTEGER, quantity INTEGER NOT NULL)')
+        fresh_db.executemany('INSERT INTO temp.order_lines VALUES (?, ?)',
+                             [(ids[0], 2), (ids[0], 3), (ids[1], 1), (ids[1], -4)])
+
+        # Четыре строки - две пластинки: первая списана суммой, сумма второй отрицательна
+        assert queries.ORDER_TAKE_STOCK.execute(fresh_db).rowcount == 1
+        assert stock_of(fresh_db, ids) == {ids[0]: 5, ids[1]: 10}
+        assert queries.ORDER_SHORTAGE.scalar(fresh_db) == ids[1]
+
+    def test_missing_records_skipped(self, fresh_db):
+        """Тест: товары удаленных пластинок пропускаются, заказ только из них - None"""
+        ids = add_stock(fresh_db, 2)
+        repo = SqliteRepository(fresh_db)
+
+        assert repo.orders.place(BUYER_ID, [(999999, 1), (999998, 2)]) is None
+        assert repo.orders.place(BUYER_ID, [(999999, 1)]) is None
+        assert repo.orders.place(BUYER_ID, [(999999, 1), (ids[0], 1), (ids[1], 1)])['items'] == 2
+
+    def test_constant_statements(self, fresh_db):
+        """Тест: число операторов заказа не зависит от числа товаров"""
+        ids = add_stock(fresh_db, 50)
+        repo = SqliteRepository(fresh_db)
+
+        small = count_queries(lambda: repo.orders.place(BUYER_ID, [(i, 1) for i in ids[:3]]))
+        large = count_queries(lambda: repo.orders.place(BUYER_ID, [(i, 1) for i in ids]))
+        assert small == large <= 10
+
+    def test_memory_matches_sqlite(self, fresh_db):
+        """Тест: заказ в памяти дает те же сумму, строки и остатки"""
+        ids = add_stock(fresh_db, 4)
+        stores = SqliteRepository(fresh_db), MemoryRepository.load(fresh_db)
+        results = []
+        for store in stores:
+            order = store.orders.place(BUYER_ID, [(ids[2], 2), (ids[0], 1), (999999, 1)])
+            with pytest.raises(OutOfStock):
+                store.orders.place(BUYER_ID, [(ids[1], 1), (ids[3], 11)])
+            items = store.orders.items(store.orders.get(order['id'], BUYER_ID))
+            results.append((order['total_cents'], order['items'],
+                            [(row['record_id'], row['quantity'], row['price_cents'], row['title']) for row in items],
+                            [store.records.get(i)['current_stock'] for i in ids]))
+        assert results[0] == results[1]
+
+
+class TestOrderRoutes:
+    """Тесты маршрутов оформления и просмотра заказа"""
+
+    def test_checkout_creates_order(self, auth_buyer, db_connection):
+        """Тест: оформление корзины создает заказ, страница заказа показывает его покупки"""
+        records = db_connection.execute(
+            'SELECT id FROM records WHERE current_stock > 2 AND retail_price IS NOT NULL LIMIT 2').fetchall()
+        auth_buyer.get('/clear_cart')
+        for (record_id,) in records:
+            auth_buyer.post(f'/add_to_cart/{record_id}', data={'quantity': '2'})
+
+        response = auth_buyer.post('/checkout')
+        assert response.status_code == 302 and '/personal_cabinet' in response.location
+
+        order_id, items = db_connection.execute(
+            'SELECT id, items FROM orders WHERE user_id = ? ORDER BY id DESC LIMIT 1', (BUYER_ID,)).fetchone()
+        assert items == len(records)
+        assert db_connection.execute('SELECT COUNT(*) FROM purchases WHERE order_id = ?',
+                                     (order_id,)).fetchone()[0] == len(records)
+        assert f'/order/{order_id}'.encode() in auth_buyer.get('/personal_cabinet').data
+        page = auth_buyer.get(f'/order/{order_id}')
+        assert page.status_code == 200
+        assert f'Заказ №{order_id}' in page.get_data(as_text=True)
+
+    def test_foreign_order_hidden(self, auth_buyer, db_connection):
+        """Тест: чужой заказ не открывается"""
+        db_connection.execute('INSERT INTO orders (user_id, total, items) VALUES (2, 1, 0)')
+        db_connection.commit()
+        order_id = db_connection.execute('SELECT MAX(id) FROM orders').fetchone()[0]
+        response = auth_buyer.get(f'/order/{order_id}')
+        assert response.status_code == 302 and '/personal_cabinet' in response.location
@@ -0,0 +1,126 @@
+"""
+Тесты постраничного вывода по ключу
+"""
+import pytest
+
+import queries
+from app import app
+from pagination import decode_cursor, encode_cursor
+
+
+def add_records(conn, count):
+    conn.executemany('''
+        INSERT INTO records (catalog_number, title, company_id, release_date,
+                             retail_price, current_stock, sold_this_year)
+        VALUES (?, ?, 1, ?, ?, ?, ?)
+    ''', [(f'PAGE-{i}', f'Пластинка {i % 7}', None if i % 5 == 0 else f'2020-01-{i % 28 + 1:02d}',
+           None if i % 6 == 0 else i % 4 * 10, i % 3, i % 5) for i in range(count)])
+    conn.commit()
+
+
+def all_pages(conn, query, sort, limit, params=()):
+    """Все строки, прочитанные страницами; возвращает (id, число страниц)"""
+    ids, cursor, pages = [], None, 0
+    while True:
+        page = query.page(conn, params, sort=sort, cursor=cursor, limit=limit)
+        ids.extend(row['id'] for row in page.rows)
+        pages += 1
+        cursor = page.next_cursor
+        if cursor is None:
+            return ids, pages
+
+
+class TestCursor:
+    """Тесты упаковки курсора"""
+    
+    def test_round_trip(self):
+        """Тест: значения курсора восстанавливаются"""
+        cursor = encode_cursor('title', ['Симфония №5', 12])
+        assert decode_cursor(cursor, 'title', 2) == ['Симфония №5', 12]
+    
+    @pytest.mark.parametrize('cursor', ['', 'не-base64', encode_cursor('price', [1, 2]),
+                                        encode_cursor('title', [1])])
+    def test_invalid_cursor(self, cursor):
+        """Тест: поврежденный или чужой курсор означает первую страницу"""
+        assert decode_cursor(cursor, 'title', 2) is None
+
+
+class TestKeysetQuery:
+    """Тесты запросов страниц"""
+    
+    @pytest.mark.parametrize('sort', list(queries.RECORDS_WITH_COMPANY.orders))
+    def test_pages_cover_all_rows(self, fresh_db, sort):
+        """Тест: страницы без пропусков и повторов, в порядке полной выборки"""
+        add_records(fresh_db, 60)
+        order = queries.RECORDS_WITH_COMPANY.orders[sort]
+        expected = [row['id'] for row in fresh_db.execute(f'''
+            SELECT r.id FROM records r JOIN companies comp ON r.company_id = comp.id
+            ORDER BY {order.order_by()}
+        ''')]
+        ids, pages = all_pages(fresh_db, queries.RECORDS_WITH_COMPANY, sort, 7)
+        assert ids == expected
+        assert pages == len(expected) // 7 + 1
+    
+    def test_catalog_only_in_stock(self, fresh_db):
+        """Тест: каталог выводит только товары в наличии"""
+        add_records(fresh_db, 30)
+        ids, _ = all_pages(fresh_db, queries.CATALOG, 'price', 4)
+        in_stock = {row[0] for row in fresh_db.execute('SELECT id FROM records WHERE current_stock > 0')}
+        assert sorted(ids) == sorted(in_stock)
+    
+    def test_purchases_filtered_by_user(self, fresh_db):
+        """Тест: история покупок - только покупки пользователя"""
+        ids, _ = all_pages(fresh_db, queries.USER_PURCHASES, None, 2, (3,))
+        expected = {row[0] for row in fresh_db.execute('SELECT id FROM purchases WHERE user_id = 3')}
+        assert sorted(ids) == sorted(expected)
+    
+    @pytest.mark.parametrize('name', ['catalog', 'records_with_company'])
+    def test_next_page_seeks_index(self, fresh_db, name):
+        """Тест: страница после курсора ищет по индексу, а не просматривает таблицу"""
+        for key in queries.RECORDS_WITH_COMPANY.orders:
+            sql = queries.REGISTRY[f'{name}:{key}:after'].sql
+            plan = fresh_db.execute('EXPLAIN QUERY PLAN ' + sql, (0,) * sql.count('?')).fetchall()
+            details = ' '.join(row['detail'] for row in plan)
+            assert 'SEARCH r USING INDEX' in details, (key, details)
+
+
+class TestPaginatedRoutes:
+    """Тесты страниц со списками"""
+    
+    @pytest.fixture
+    def small_pages(self):
+        app.config['PAGE_SIZE'] = 2
+        yield
+        app.config['PAGE_SIZE'] = 50
+    
+    def test_catalog_next_link(self, auth_buyer, small_pages):
+        """Тест: каталог выводит ссылку на следующую страницу, и она открывается"""
+        response = auth_buyer.get('/catalog?sort=popularity')
+        html = response.get_data(as_text=True)
+        assert 'after=' in html
+        cursor = html.split('after=')[1].split('"')[0]
+        response = auth_buyer.get(f'/catalog?sort=popularity&after={cursor}')
+        assert response.status_code == 200
+        assert 'В начало' in response.get_data(as_text=True)
+    
+    def test_composition_counts_paged(self, auth_buyer, small_pages):
+        """Тест: сводка по ансамблям без выбора ансамбля выводится страницами"""
+        html = auth_buyer.get('/compositions_count').get_data(as_text=True)
+        assert html.count('/compositions_count?ensemble_id=') == 2
+        cursor = html.split('after=')[1].split('"')[0]
+        response = auth_buyer.get(f'/compositions_count?after={cursor}')
+        assert response.status_code == 200
+        assert 'В начало' in response.get_data(as_text=True)
+    
+    @pytest.mark.parametrize('path, client_fixture', [
+        ('/manage_records', 'auth_seller'),
+        ('/manage_ensembles', 'auth_director'),
+        ('/manage_users', 'auth_director'),
+        ('/personal_cabinet', 'auth_buyer'),
+        ('/compositions_count', 'auth_buyer'),
+    ])
+    def test_list_pages(self, request, small_pages, path, client_fixture):
+        """Тест: списки открываются с неизвестной сортировкой и поврежденным курсором"""
+        client = request.getfixturevalue(client_fixture)
+        response = client.get(f'{path}?sort=unknown&after=broken')
+        assert response.status_code == 200
@@ -0,0 +1,43 @@
+"""
+Тесты реестра SQL-запросов
+"""
+import pytest
+
+import queries
+
+
+class TestQueryRegistry:
+    """Тесты статистики именованных запросов"""
+    
+    def test_stats_recorded(self, db_connection):
+        """Тест: вызовы, строки и время учитываются"""
+        query = queries.COMPANIES_LIST
+        query.reset()
+        rows = query.all(db_connection)
+        query.one(db_connection)
+        assert query.calls == 2
+        assert query.rows == len(rows) + 1
+        assert query.total_time >= query.max_time > 0
+    
+    def test_duplicate_name_rejected(self):
+        """Тест: имя запроса уникально"""
+        with pytest.raises(ValueError):
+            queries.Query('user_role', 'SELECT 1')
+    
+    def test_route_executes_through_registry(self, auth_buyer):
+        """Тест: маршрут выполняет запросы через реестр"""
+        queries.CATALOG.reset()
+        auth_buyer.get('/catalog')
+        assert queries.CATALOG.calls == 1
+    
+    def test_query_stats_endpoint(self, auth_director):
+        """Тест: директор получает статистику в JSON"""
+        response = auth_director.get('/query_stats')
+        assert response.status_code == 200
+        names = {item['name'] for item in response.get_json()}
+        assert 'user_role' in names
+    
+    def test_query_stats_requires_director(self, auth_buyer):
+        """Тест: статистика недоступна покупателю"""
+        response = auth_buyer.get('/query_stats', follow_redirects=True)
+        assert 'прав'.encode('utf-8') in response.data.lower()
@@ -0,0 +1,232 @@
+"""
+Тесты слоя хранилища: SQLite и хранилище в памяти отдают одно и то же
+"""
+import threading
+
+import pytest
+
+import db_pool
+import queries
+import repository
+from app import app
+from repository import MemoryRepository, NoPrice, OutOfStock, SqliteRepository
+from tests.test_pagination import add_records
+
+BUYER_ID = 3
+
+
+def all_ids(page_fn, sort, limit, *args):
+    """id всех строк, прочитанных страницами, и курсоры страниц"""
+    ids, cursors, cursor = [], [], None
+    while True:
+        page = page_fn(*args, sort=sort, cursor=cursor, limit=limit)
+        ids.extend(row['id'] for row in page.rows)
+        cursor = page.next_cursor
+        if cursor is None:
+            return ids, cursors
+        cursors.append(cursor)
+
+
+def plain(rows, keys):
+    return [{key: row[key] for key in keys} for row in rows]
+
+
+@pytest.fixture
+def stores(fresh_db):
+    """Хранилища SQLite и в памяти над одними и теми же данными"""
+    add_records(fresh_db, 40)
+    fresh_db.executemany('INSERT INTO purchases (user_id, record_id, quantity, price, purchase_date) '
+                         'VALUES (?, ?, 1, ?, ?)',
+                         [(BUYER_ID, i % 5 + 1, 10.5, f'2024-0{i % 3 + 1}-01 10:00:00') for i in range(12)])
+    fresh_db.commit()
+    return SqliteRepository(fresh_db), MemoryRepository.load(fresh_db)
+
+
+class TestParity:
+    """Тесты одинаковых результатов двух хранилищ"""
+
+    @pytest.mark.parametrize('sort', list(queries.CATALOG.orders))
+    def test_record_pages(self, stores, sort):
+        """Тест: страницы пластинок и каталога совпадают вместе с курсорами"""
+        sqlite, memory = stores
+        for name in ('page', 'catalog_page'):
+            expected = all_ids(getattr(sqlite.records, name), sort, 7)
+            assert all_ids(getattr(memory.records, name), sort, 7) == expected
+
+    def test_other_pages(self, stores):
+        """Тест: страницы пользователей, ансамблей и истории покупок совпадают"""
+        sqlite, memory = stores
+        assert all_ids(memory.users.page, None, 2) == all_ids(sqlite.users.page, None, 2)
+        assert all_ids(memory.ensembles.page, None, 2) == all_ids(sqlite.ensembles.page, None, 2)
+        assert (all_ids(memory.purchases.page, None, 5, BUYER_ID)
+                == all_ids(sqlite.purchases.page, None, 5, BUYER_ID))
+        assert memory.purchases.totals(BUYER_ID) == pytest.approx(sqlite.purchases.totals(BUYER_ID))
+
+    def test_cursor_shared(self, stores):
+        """Тест: курсор одного хранилища продолжает страницы другого"""
+        sqlite, memory = stores
+        cursor = sqlite.records.catalog_page('price', limit=5).next_cursor
+        assert ([row['id'] for row in memory.records.catalog_page('price', cursor, 5).rows]
+                == [row['id'] for row in sqlite.records.catalog_page('price', cursor, 5).rows])
+
+    def test_ensembles_and_stats(self, stores):
+        """Тест: произведения, дискография, сводки и лидеры продаж совпадают"""
+        sqlite, memory = stores
+        assert memory.stats() == sqlite.stats()
+        assert plain(memory.ensembles.composition_counts(), ('id', 'compositions_count')) == \
+            plain(sqlite.ensembles.composition_counts(), ('id', 'compositions_count'))
+        # Сводка постранично: все ансамбли по разу, курсоры общие с хранилищем в памяти
+        ids, cursors = all_ids(sqlite.ensembles.composition_counts_page, None, 2)
+        assert ids == [row['id'] for row in sqlite.ensembles.composition_counts()]
+        assert all_ids(memory.ensembles.composition_counts_page, None, 2) == (ids, cursors)
+        for ensemble_id in range(1, 5):
+            assert plain(memory.ensembles.compositions(ensemble_id), ('title', 'composer_name')) == \
+                plain(sqlite.ensembles.compositions(ensemble_id), ('title', 'composer_name'))
+            assert sorted(row['catalog_number'] for row in memory.ensembles.discography(ensemble_id)) == \
+                sorted(row['catalog_number'] for row in sqlite.ensembles.discography(ensemble_id))
+        assert [row['sold_this_year'] for row in memory.records.sales_leaders()] == \
+            [row['sold_this_year'] for row in sqlite.records.sales_leaders()]
+
+    def test_writes(self, stores):
+        """Тест: корзина, покупка и правка пластинки меняют оба хранилища одинаково"""
+        for store in stores:
+            store.carts.add(BUYER_ID, 1, 2)
+            store.carts.add(BUYER_ID, 1, 1)
+            store.carts.add(BUYER_ID, 2, 1)
+            item = next(row for row in store.carts.items(BUYER_ID) if row['record_id'] == 2)
+            assert store.carts.decrease(item['id'], BUYER_ID) == 0
+            assert store.carts.decrease(item['id'], BUYER_ID) is None
+            items = store.carts.checkout_items(BUYER_ID)
+            prices = store.records.take_stock([(row['record_id'], row['quantity']) for row in items])
+            for row in items:
+                store.purchases.add(BUYER_ID, row['record_id'], row['quantity'], prices[row['record_id']])
+            store.carts.clear(BUYER_ID)
+            record = store.records.get(1)
+            store.records.update(1, record['catalog_number'], 'Новое название', record['company_id'],
+                                 record['release_date'], record['wholesale_price_cents'], record['retail_price_cents'],
+                                 record['current_stock'])
+            assert store.users.toggle_active(2) is False
+
+        sqlite, memory = stores
+        assert memory.carts.items(BUYER_ID) == []
+        for key in ('title', 'current_stock', 'sold_this_year'):
+            assert memory.records.get(1)[key] == sqlite.records.get(1)[key]
+        assert all_ids(memory.records.page, 'title', 10) == all_ids(sqlite.records.page, 'title', 10)
+        assert memory.purchases.totals(BUYER_ID) == pytest.approx(sqlite.purchases.totals(BUYER_ID))
+        assert memory.users.active_by_username('seller1') is None
+
+
+class TestTakeStock:
+    """Тесты списания остатков условным UPDATE"""
+
+    def test_all_or_nothing(self, stores):
+        """Тест: если одной пластинки не хватает, остатки не меняются ни у одной"""
+        for store in stores:
+            stock = {record_id: store.records.get(record_id)['current_stock'] for record_id in (1, 2)}
+            with pytest.raises(OutOfStock) as error:
+                store.records.take_stock([(1, 1), (2, stock[2] + 1)])
+            assert error.value.record_id == 2
+            with pytest.raises(OutOfStock):
+                store.records.take_stock([(999999, 1)])
+            assert {record_id: store.records.get(record_id)['current_stock'] for record_id in (1, 2)} == stock
+
+            prices = store.records.take_stock([(1, 1), (2, stock[2])])
+            assert prices == {1: store.records.get(1)['retail_price_cents'],
+                              2: store.records.get(2)['retail_price_cents']}
+            assert store.records.get(2)['current_stock'] == 0
+
+    def test_price_not_set(self, fresh_db):
+        """Тест: пластинка без цены списывается (это не нехватка), но заказ с ней не оформляется"""
+        fresh_db.execute('UPDATE records SET retail_price = NULL WHERE id = 1')
+        fresh_db.commit()
+        for store in SqliteRepository(fresh_db), MemoryRepository.load(fresh_db):
+            stock = store.records.get(1)['current_stock']
+            assert store.records.take_stock([(1, 1)]) == {1: None}
+            assert store.records.get(1)['current_stock'] == stock - 1
+            for items in [(1, 1)], [(2, 1), (1, 1)]:
+                with pytest.raises(NoPrice) as error:
+                    store.orders.place(BUYER_ID, items)
+                assert error.value.record_id == 1
+        fresh_db.rollback()
+
+    def test_non_positive_quantity(self, stores):
+        """Тест: нулевое и отрицательное количество не списывается и не увеличивает остаток"""
+        sqlite, _ = stores
+        stock = sqlite.records.get(1)['current_stock']
+        assert queries.TAKE_STOCK.execute(sqlite.conn, (-5, 1)).rowcount == 0
+        for store in stores:
+            for quantity in (0, -5):
+                with pytest.raises(ValueError):
+                    store.records.take_stock([(1, quantity)])
+                with pytest.raises(ValueError):
+                    store.orders.place(BUYER_ID, [(2, 1), (1, quantity)])
+            assert store.records.get(1)['current_stock'] == stock
+
+    def test_non_positive_quantity_routes(self, auth_buyer, db_connection):
+        """Тест: покупка и корзина отклоняют количество меньше единицы"""
+        record_id, stock = db_connection.execute(
+            'SELECT id, current_stock FROM records WHERE current_stock > 0 LIMIT 1').fetchone()
+        auth_buyer.get('/clear_cart')
+
+        response = auth_buyer.post(f'/buy_record/{record_id}', data={'quantity': '-5'}, follow_redirects=True)
+        assert 'Количество должно быть больше нуля' in response.get_data(as_text=True)
+        response = auth_buyer.post(f'/add_to_cart/{record_id}', data={'quantity': '0'}, follow_redirects=True)
+        assert 'Количество должно быть больше нуля' in response.get_data(as_text=True)
+        assert db_connection.execute('SELECT current_stock FROM records WHERE id = ?',
+                                     (record_id,)).fetchone()[0] == stock
+
+    def test_no_oversell_across_writers(self, fresh_db):
+        """Тест: покупки из независимых соединений (как из разных процессов) не уводят остаток в минус"""
+        fresh_db.execute('UPDATE records SET current_stock = 5 WHERE id = 1')
+        fresh_db.commit()
+        path = fresh_db.execute('PRAGMA database_list').fetchone()[2]
+        sold, barrier = [], threading.Barrier(12)
+
+        def buyer():
+            conn = db_pool.connect(path, isolation_level='IMMEDIATE')
+            barrier.wait()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                SqliteRepository(conn, path).records.take_stock([(1, 1)])
+                sold.append(1)
+            except OutOfStock:
+                pass
+            conn.commit()
+            conn.close()
+
+        threads = [threading.Thread(target=buyer) for _ in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(sold) == 5
+        assert fresh_db.execute('SELECT current_stock FROM records WHERE id = 1').fetchone()[0] == 0
+
+
+class TestMemoryApp:
+    """Тесты маршрутов с STORAGE=memory"""
+
+    @pytest.fixture
+    def memory_app(self, auth_buyer, monkeypatch):
+        monkeypatch.setitem(app.config, 'STORAGE', 'memory')
+        repository.reset_memory()
+        yield auth_buyer
+        repository.reset_memory()
+
+    def test_buy_flow(self, memory_app, db_connection):
+        """Тест: покупка в памяти меняет остаток и историю, но не файл базы"""
+        record_id, stock = db_connection.execute(
+            'SELECT id, current_stock FROM records WHERE current_stock > 0 LIMIT 1').fetchone()
+
+        response = memory_app.post(f'/buy_record/{record_id}', data={'quantity': '1'})
+        assert response.status_code == 302
+
+        with app.app_context():
+            store = repository.get_repository()
+            assert store.records.get(record_id)['current_stock'] == stock - 1
+            assert store.purchases.page(BUYER_ID, limit=1).rows[0]['record_id'] == record_id
+        assert db_connection.execute('SELECT current_stock FROM records WHERE id = ?',
+                                     (record_id,)).fetchone()[0] == stock
+        assert memory_app.get('/catalog').status_code == 200
+        assert memory_app.get('/personal_cabinet').status_code == 200
@@ -0,0 +1,72 @@
+"""
+Тесты счетчиков продаж
+"""
+import pytest
+
+import sales
+
+
+def counters(conn, record_id):
+    row = conn.execute('SELECT sold_this_year, sold_last_year FROM records WHERE id = ?',
+                       (record_id,)).fetchone()
+    return row['sold_this_year'], row['sold_last_year']
+
+
+def add_purchase(conn, record_id, quantity, date=None):
+    conn.execute('''
+        INSERT INTO purchases (user_id, record_id, quantity, price, purchase_date)
+        VALUES (3, ?, ?, 10, COALESCE(?, CURRENT_TIMESTAMP))
+    ''', (record_id, quantity, date))
+    conn.commit()
+
+
+class TestSalesTriggers:
+    """Тесты триггеров по таблице purchases"""
+    
+    def test_purchase_increments_this_year(self, fresh_db):
+        """Тест: покупка увеличивает sold_this_year"""
+        before = counters(fresh_db, 1)
+        add_purchase(fresh_db, 1, 3)
+        assert counters(fresh_db, 1) == (before[0] + 3, before[1])
+    
+    def test_last_year_purchase_goes_to_last_year(self, fresh_db):
+        """Тест: покупка прошлого года учитывается в sold_last_year"""
+        year = sales.current_period(fresh_db)
+        before = counters(fresh_db, 1)
+        add_purchase(fresh_db, 1, 2, f'{year - 1}-06-01 12:00:00')
+        assert counters(fresh_db, 1) == (before[0], before[1] + 2)
+    
+    def test_delete_purchase_decrements(self, fresh_db):
+        """Тест: удаление покупки уменьшает счетчик"""
+        before = counters(fresh_db, 2)
+        add_purchase(fresh_db, 2, 4)
+        fresh_db.execute('DELETE FROM purchases WHERE record_id = 2')
+        fresh_db.commit()
+        assert counters(fresh_db, 2) == before
+    
+    def test_buy_route_uses_trigger(self, auth_buyer, db_connection):
+        """Тест: покупка через маршрут увеличивает счетчик ровно на количество"""
+        before = counters(db_connection, 6)
+        auth_buyer.post('/buy_record/6', data={'quantity': '2'})
+        assert counters(db_connection, 6)[0] == before[0] + 2
+
+
+class TestSalesMaintenance:
+    """Тесты перевода года и пересчета"""
+    
+    def test_rollover_moves_totals(self, fresh_db):
+        """Тест: перевод года переносит продажи текущего года в прошлый"""
+        year = sales.current_period(fresh_db)
+        this_year, _ = counters(fresh_db, 1)
+        assert sales.rollover(fresh_db, year + 1) == year + 1
+        assert counters(fresh_db, 1) == (0, this_year)
+        assert sales.rollover(fresh_db, year + 1) is None
+    
+    def test_recount_from_purchases(self, fresh_db):
+        """Тест: пересчет выравнивает счетчики по таблице purchases"""
+        fresh_db.execute('UPDATE records SET sold_this_year = 999, sold_last_year = 999')
+        fresh_db.commit()
+        add_purchase(fresh_db, 1, 5)
+        sales.recount(fresh_db)
+        assert counters(fresh_db, 1) == (5, 0)
+        assert counters(fresh_db, 2) == (0, 0)
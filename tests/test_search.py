@@ -0,0 +1,86 @@
+"""
+Тесты полнотекстового поиска
+"""
+import search
+from money import format_money
+
+
+def names(page):
+    return [row['name'] for row in page.rows]
+
+
+class TestSearchIndex:
+    """Тесты индекса search_index и триггеров"""
+    
+    def test_finds_all_kinds(self, fresh_db):
+        """Тест: поиск находит названия из всех исходных таблиц"""
+        for table, column in (('records', 'title'), ('compositions', 'title'),
+                              ('musicians', 'name'), ('ensembles', 'name'), ('companies', 'name')):
+            value = fresh_db.execute(f'SELECT {column} FROM {table} LIMIT 1').fetchone()[0]
+            assert value in names(search.search(fresh_db, value, limit=100)), table
+    
+    def test_case_and_yo_folding(self, fresh_db):
+        """Тест: регистр и ё/е не влияют на поиск"""
+        fresh_db.execute("INSERT INTO ensembles (name, type) VALUES ('Ёжики в тумане', 'трио')")
+        fresh_db.commit()
+        for text in ('ежики', 'ЁЖИКИ', 'Ежик', 'туман ёж'):
+            assert 'Ёжики в тумане' in names(search.search(fresh_db, text)), text
+    
+    def test_triggers_follow_changes(self, fresh_db):
+        """Тест: переименование и удаление видны в поиске сразу"""
+        record_id = fresh_db.execute('''
+            INSERT INTO records (catalog_number, title, company_id, retail_price)
+            VALUES ('FTS-1', 'Клавесинные сюиты', 1, 10)
+        ''').lastrowid
+        assert names(search.search(fresh_db, 'клавесин')) == ['Клавесинные сюиты']
+        fresh_db.execute("UPDATE records SET title = 'Органные хоралы' WHERE id = ?", (record_id,))
+        assert names(search.search(fresh_db, 'клавесин')) == []
+        assert names(search.search(fresh_db, 'хорал')) == ['Органные хоралы']
+        fresh_db.execute('DELETE FROM records WHERE id = ?', (record_id,))
+        assert names(search.search(fresh_db, 'хорал')) == []
+    
+    def test_pages_cover_all_matches(self, fresh_db):
+        """Тест: страницы результатов без пропусков и повторов"""
+        fresh_db.executemany('''
+            INSERT INTO records (catalog_number, title, company_id, retail_price)
+            VALUES (?, ?, 1, 10)
+        ''', [(f'FTS-{i}', f'Ноктюрн {"ре " * (i % 4)}{i}') for i in range(25)])
+        fresh_db.commit()
+        seen, cursor = [], None
+        while True:
+            page = search.search(fresh_db, 'ноктюрн', cursor=cursor, limit=4)
+            seen.extend(row['_sort_1'] for row in page.rows)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        assert len(seen) == len(set(seen)) == 25
+    
+    def test_query_syntax_escaped(self, fresh_db):
+        """Тест: операторы FTS5 во вводе считаются словами, запрос без слов пуст"""
+        assert search.match_expression('"бах*) OR (') == '"бах"* "OR"*'
+        assert search.match_expression('  ...  ') is None
+        assert search.search(fresh_db, '"*) NEAR(').rows == []
+
+
+class TestSearchRoute:
+    """Тесты страницы поиска"""
+    
+    def test_requires_auth(self, client):
+        """Тест: поиск требует авторизации"""
+        response = client.get('/search?q=бах', follow_redirects=True)
+        assert 'Необходимо войти в систему' in response.get_data(as_text=True)
+    
+    def test_search_page(self, auth_buyer, db_connection):
+        """Тест: результаты выводятся на странице"""
+        title, price_cents = db_connection.execute(
+            'SELECT title, retail_price_cents FROM records WHERE retail_price_cents IS NOT NULL LIMIT 1').fetchone()
+        response = auth_buyer.get('/search', query_string={'q': title})
+        assert response.status_code == 200
+        assert title in response.get_data(as_text=True)
+        # Цена выводится из копеек
+        assert f'- {format_money(price_cents)} ₽' in response.get_data(as_text=True)
+    
+    def test_nothing_found(self, auth_buyer):
+        """Тест: пустой результат"""
+        response = auth_buyer.get('/search?q=несуществующееслово')
+        assert 'Ничего не найдено' in response.get_data(as_text=True)
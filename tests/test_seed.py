@@ -0,0 +1,230 @@
+"""
+Тесты генератора синтетических данных
+"""
+import hashlib
+import os
+import sqlite3
+from datetime import date
+
+import pytest
+
+import db_pool
+import seed
+from database import init_database
+from repository import SqliteRepository
+
+SCALE = 0.01
+UNTIL = date(2026, 6, 30)
+
+
+def generate(tmp_path, monkeypatch, name, **kwargs):
+    path = str(tmp_path / name)
+    monkeypatch.setenv('DATABASE_PATH', path)
+    init_database(force_recreate=True)
+    counts = seed.seed(path, SCALE, until=UNTIL, **kwargs)
+    conn = sqlite3.connect(path)
+    return conn, counts
+
+
+def checksum(conn):
+    """Контрольная сумма сгенерированных строк (демо-данные содержат текущее время)"""
+    digest = hashlib.sha256()
+    for sql in ("SELECT * FROM records WHERE catalog_number LIKE 'SEED-%' ORDER BY id",
+                'SELECT * FROM record_tracks ORDER BY id',
+                'SELECT * FROM ensemble_members ORDER BY id',
+                "SELECT id, username, role, full_name, created_at FROM users WHERE username LIKE 'user%' ORDER BY id",
+                "SELECT * FROM purchases WHERE user_id IN (SELECT id FROM users WHERE username LIKE 'user%') ORDER BY id",
+                "SELECT * FROM cart WHERE user_id IN (SELECT id FROM users WHERE username LIKE 'user%') ORDER BY id"):
+        for row in conn.execute(sql):
+            digest.update(repr(row).encode())
+    return digest.hexdigest()
+
+
+@pytest.fixture
+def seeded(tmp_path, monkeypatch):
+    conn, counts = generate(tmp_path, monkeypatch, 'seed.db', workers=1)
+    yield conn, counts
+    conn.close()
+
+
+class TestSeed:
+    """Тесты manage_db.py seed"""
+
+    def test_sizes(self, seeded):
+        """Тест: число строк соответствует масштабу"""
+        conn, counts = seeded
+        sizes = seed.sizes_for(SCALE)
+        for table in ('records', 'purchases', 'users', 'cart'):
+            assert counts[table] == sizes[table]
+        assert counts['record_tracks'] >= sizes['records']
+        assert counts['ensemble_members'] >= 2 * sizes['ensembles']
+
+    def test_deterministic(self, seeded, tmp_path, monkeypatch):
+        """Тест: тот же seed дает те же данные независимо от числа процессов"""
+        conn, _ = seeded
+        other, _ = generate(tmp_path, monkeypatch, 'parallel.db', workers=2)
+        try:
+            assert checksum(other) == checksum(conn)
+        finally:
+            other.close()
+
+    def test_other_seed_differs(self, seeded, tmp_path, monkeypatch):
+        """Тест: другой seed дает другие данные"""
+        conn, _ = seeded
+        other, _ = generate(tmp_path, monkeypatch, 'other.db', workers=1, seed=7)
+        try:
+            assert checksum(other) != checksum(conn)
+        finally:
+            other.close()
+
+    def test_integrity(self, seeded):
+        """Тест: внешние ключи и даты корректны"""
+        conn, _ = seeded
+        assert conn.execute('PRAGMA foreign_key_check').fetchall() == []
+        assert conn.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+        latest = conn.execute('SELECT MAX(purchase_date) FROM purchases').fetchone()[0]
+        assert latest <= f'{UNTIL.isoformat()} 23:59:59'
+
+    def test_zipf_popularity(self, seeded):
+        """Тест: продажи сосредоточены на небольшой доле пластинок"""
+        conn, counts = seeded
+        top = conn.execute('''
+            SELECT SUM(quantity) FROM (
+                SELECT SUM(quantity) AS quantity FROM purchases
+                GROUP BY record_id ORDER BY quantity DESC LIMIT ?)
+        ''', (counts['records'] // 10,)).fetchone()[0]
+        total = conn.execute('SELECT SUM(quantity) FROM purchases').fetchone()[0]
+        assert top > total / 2
+
+    def test_schema_objects_restored(self, seeded, tmp_path, monkeypatch):
+        """Тест: индексы и триггеры восстановлены после загрузки"""
+        conn, _ = seeded
+        path = str(tmp_path / 'plain.db')
+        monkeypatch.setenv('DATABASE_PATH', path)
+        init_database(force_recreate=True)
+        plain = sqlite3.connect(path)
+        query = "SELECT type, name FROM sqlite_master WHERE type IN ('index', 'trigger') ORDER BY name"
+        try:
+            assert conn.execute(query).fetchall() == plain.execute(query).fetchall()
+        finally:
+            plain.close()
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+    def test_derived_data(self, seeded):
+        """Тест: дискография, поисковый индекс и счетчики продаж пересчитаны"""
+        conn, _ = seeded
+        assert conn.execute('''
+            SELECT COUNT(*) FROM (SELECT DISTINCT p.ensemble_id, rt.record_id
+                                  FROM record_tracks rt JOIN performances p ON rt.performance_id = p.id)
+        ''').fetchone()[0] == conn.execute('SELECT COUNT(*) FROM ensemble_discography').fetchone()[0]
+        names = sum(conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                    for _, table, _ in seed.materialized.SEARCH_SOURCES)
+        assert conn.execute('SELECT COUNT(*) FROM search_index').fetchone()[0] == names
+        year = conn.execute('SELECT year FROM sales_period').fetchone()[0]
+        assert conn.execute('SELECT SUM(sold_this_year) FROM records').fetchone()[0] == conn.execute(
+            'SELECT SUM(quantity) FROM purchases WHERE purchase_date >= ?', (f'{year}-01-01',)).fetchone()[0]
+
+    def test_triggers_active(self, seeded):
+        """Тест: после загрузки триггеры снова ведут производные данные"""
+        conn, _ = seeded
+        record_id, sold = conn.execute(
+            "SELECT id, sold_this_year FROM records WHERE catalog_number LIKE 'SEED-%' LIMIT 1").fetchone()
+        conn.execute("INSERT INTO purchases (user_id, record_id, quantity, price) VALUES (1, ?, 2, 10)",
+                     (record_id,))
+        assert conn.execute('SELECT sold_this_year FROM records WHERE id = ?',
+                            (record_id,)).fetchone()[0] == sold + 2
+
+    def test_money_cents(self, seeded):
+        """Тест: копейки заполнены при загрузке, заказы на сгенерированных данных оформляются"""
+        conn, _ = seeded
+        for table, column in (('records', 'retail_price_cents'), ('records', 'wholesale_price_cents'),
+                              ('purchases', 'price_cents')):
+            assert conn.execute(f'SELECT COUNT(*) FROM {table} WHERE {column} IS NULL').fetchone()[0] == 0
+        assert conn.execute('SELECT COUNT(*) FROM records '
+                            'WHERE retail_price != retail_price_cents / 100.0').fetchone()[0] == 0
+
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM records WHERE catalog_number LIKE 'SEED-%' AND current_stock > 1 ORDER BY id LIMIT 2")]
+        buyer = db_pool.connect(conn.execute('PRAGMA database_list').fetchone()[2])
+        try:
+            repo = SqliteRepository(buyer)
+            assert repo.orders.place(1, [(ids[0], 1)])['items'] == 1
+            order = repo.orders.place(1, [(ids[0], 1), (ids[1], 1)])
+            buyer.commit()
+        finally:
+            buyer.close()
+        assert order['total_cents'] == conn.execute(
+            'SELECT SUM(retail_price_cents) FROM records WHERE id IN (?, ?)', ids).fetchone()[0]
+
+
+class TestSeedSafety:
+    """Тесты прерванной загрузки и защиты существующей базы"""
+
+    def schema_objects(self, conn):
+        return conn.execute("SELECT type, name FROM sqlite_master "
+                            "WHERE type IN ('index', 'trigger') ORDER BY name").fetchall()
+
+    def test_interrupted_load_restores_objects(self, tmp_path, monkeypatch):
+        """Тест: при ошибке в середине загрузки индексы, триггеры и журнал WAL возвращаются"""
+        path = str(tmp_path / 'broken.db')
+        monkeypatch.setenv('DATABASE_PATH', path)
+        init_database(force_recreate=True)
+        conn = sqlite3.connect(path)
+        expected = self.schema_objects(conn)
+        conn.close()
+        generate_rows = seed._generate
+
+        def failing(task):
+            if task[0] == 'records':
+                raise KeyboardInterrupt
+            return generate_rows(task)
+
+        monkeypatch.setattr(seed, '_generate', failing)
+        with pytest.raises(KeyboardInterrupt):
+            seed.seed(path, SCALE, until=UNTIL, workers=1)
+
+        conn = sqlite3.connect(path)
+        try:
+            assert self.schema_objects(conn) == expected
+            assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        finally:
+            conn.close()
+
+    def test_refuses_seeded_or_open_database(self, seeded, tmp_path):
+        """Тест: заполненная или открытая другим соединением база не заполняется"""
+        conn, _ = seeded
+        path = conn.execute('PRAGMA database_list').fetchone()[2]
+        with pytest.raises(ValueError, match='уже заполнена'):
+            seed.seed(path, SCALE, until=UNTIL, workers=1)
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            with pytest.raises(ValueError, match='используется'):
+                seed.seed(path, SCALE, until=UNTIL, workers=1)
+        finally:
+            conn.rollback()
+
+    def test_build_replaces_only_on_success(self, tmp_path, monkeypatch):
+        """Тест: build заменяет базу новым файлом, а при ошибке оставляет прежний"""
+        path = str(tmp_path / 'target.db')
+
+        def init(building):
+            monkeypatch.setenv('DATABASE_PATH', building)
+            init_database(force_recreate=True)
+
+        with open(path, 'wb') as stream:
+            stream.write(b'old')
+        monkeypatch.setattr(seed, '_generate', lambda task: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            seed.build(path, SCALE, init, until=UNTIL, workers=1)
+        assert open(path, 'rb').read() == b'old'
+        assert sorted(os.listdir(tmp_path)) == ['target.db']
+
+        monkeypatch.undo()
+        counts = seed.build(path, SCALE, init, until=UNTIL, workers=1)
+        conn = sqlite3.connect(path)
+        try:
+            assert conn.execute("SELECT COUNT(*) FROM records WHERE catalog_number LIKE 'SEED-%'").fetchone()[0] \
+                == counts['records']
+        finally:
+            conn.close()